@@ -98,6 +98,7 @@ fn create_factory(
         },
         stop_at_timestamp: None,
         batch_write_timeout: None,
+        pre_aggregate: false,
     };
     Box::new(factory)
 }
@@ -46,6 +46,7 @@ pub fn consumer(
     stop_at_timestamp: Option<i64>,
     batch_write_timeout_ms: Option<u64>,
     max_dlq_buffer_length: Option<usize>,
+    pre_aggregate: bool,
 ) -> usize {
     py.allow_threads(|| {
         consumer_impl(
@@ -65,6 +66,7 @@ pub fn consumer(
             batch_write_timeout_ms,
             mutations_mode,
             max_dlq_buffer_length,
+            pre_aggregate,
         )
     })
 }
@@ -87,6 +89,7 @@ pub fn consumer_impl(
     batch_write_timeout_ms: Option<u64>,
     mutations_mode: bool,
     max_dlq_buffer_length: Option<usize>,
+    pre_aggregate: bool,
 ) -> usize {
     setup_logging();
 
@@ -275,6 +278,7 @@ pub fn consumer_impl(
             accountant_topic_config: consumer_config.accountant_topic,
             stop_at_timestamp,
             batch_write_timeout,
+            pre_aggregate,
         };
 
         StreamProcessor::with_kafka(config, factory, topic, dlq_policy)
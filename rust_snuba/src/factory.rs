@@ -9,6 +9,7 @@ use sentry_arroyo::backends::kafka::types::KafkaPayload;
 use sentry_arroyo::processing::strategies::commit_offsets::CommitOffsets;
 use sentry_arroyo::processing::strategies::healthcheck::HealthCheck;
 use sentry_arroyo::processing::strategies::reduce::Reduce;
+use sentry_arroyo::processing::strategies::run_task::RunTask;
 use sentry_arroyo::processing::strategies::run_task_in_threads::{
     ConcurrencyConfig, RunTaskInThreads,
 };
@@ -25,6 +26,7 @@ use crate::metrics::global_tags::set_global_tag;
 use crate::processors::{self, get_cogs_label};
 use crate::strategies::accountant::RecordCogs;
 use crate::strategies::clickhouse::batch::{BatchFactory, HttpBatch};
+use crate::strategies::clickhouse::preaggregate::{get_pre_aggregation, PreAggregatedBatch};
 use crate::strategies::clickhouse::ClickhouseWriterStep;
 use crate::strategies::commit_log::ProduceCommitLog;
 use crate::strategies::join_timeout::SetJoinTimeout;
@@ -57,6 +59,7 @@ pub struct ConsumerStrategyFactory {
     pub accountant_topic_config: config::TopicConfig,
     pub stop_at_timestamp: Option<i64>,
     pub batch_write_timeout: Option<Duration>,
+    pub pre_aggregate: bool,
 }
 
 impl ProcessingStrategyFactory<KafkaPayload> for ConsumerStrategyFactory {
@@ -122,33 +125,92 @@ impl ProcessingStrategyFactory<KafkaPayload> for ConsumerStrategyFactory {
             self.batch_write_timeout,
         );
 
-        let accumulator = Arc::new(
-            |batch: BytesInsertBatch<HttpBatch>,
-             small_batch: Message<BytesInsertBatch<RowData>>| {
-                Ok(batch.merge(small_batch.into_payload()))
-            },
-        );
+        let pre_aggregation = if self.pre_aggregate {
+            get_pre_aggregation(&self.storage_config.message_processor.python_class_name)
+        } else {
+            None
+        };
 
-        let next_step = Reduce::new(
-            next_step,
-            accumulator,
-            Arc::new(move || {
-                BytesInsertBatch::new(
-                    batch_factory.new_batch(),
-                    None,
-                    None,
-                    None,
-                    Default::default(),
-                    CogsData::default(),
-                )
-            }),
-            self.max_batch_size,
-            self.max_batch_time,
-            BytesInsertBatch::len,
-            // we need to enable this to deal with storages where we skip 100% of values, such as
-            // gen-metrics-gauges in s4s. we still need to commit there
-        )
-        .flush_empty_batches(true);
+        let next_step: Box<dyn ProcessingStrategy<BytesInsertBatch<RowData>>> =
+            match pre_aggregation {
+                Some(pre_aggregation) => {
+                    // Rows with the same key are combined while the batch is built and written
+                    // to the HTTP batch once it is flushed.
+                    let next_step = RunTask::new(
+                        |message: Message<BytesInsertBatch<PreAggregatedBatch>>| {
+                            Ok(message
+                                .try_map(|insert_batch| {
+                                    let (pre_aggregated, insert_batch) = insert_batch.take();
+                                    Ok::<_, ()>(insert_batch.with_rows(pre_aggregated.finish()))
+                                })
+                                .unwrap())
+                        },
+                        next_step,
+                    );
+
+                    let accumulator = Arc::new(
+                        |batch: BytesInsertBatch<PreAggregatedBatch>,
+                         small_batch: Message<BytesInsertBatch<RowData>>| {
+                            Ok(batch.merge(small_batch.into_payload()))
+                        },
+                    );
+
+                    Box::new(
+                        Reduce::new(
+                            next_step,
+                            accumulator,
+                            Arc::new(move || {
+                                BytesInsertBatch::new(
+                                    PreAggregatedBatch::new(
+                                        batch_factory.new_batch(),
+                                        pre_aggregation,
+                                    ),
+                                    None,
+                                    None,
+                                    None,
+                                    Default::default(),
+                                    CogsData::default(),
+                                )
+                            }),
+                            self.max_batch_size,
+                            self.max_batch_time,
+                            BytesInsertBatch::len,
+                        )
+                        .flush_empty_batches(true),
+                    )
+                }
+                None => {
+                    let accumulator = Arc::new(
+                        |batch: BytesInsertBatch<HttpBatch>,
+                         small_batch: Message<BytesInsertBatch<RowData>>| {
+                            Ok(batch.merge(small_batch.into_payload()))
+                        },
+                    );
+
+                    Box::new(
+                        Reduce::new(
+                            next_step,
+                            accumulator,
+                            Arc::new(move || {
+                                BytesInsertBatch::new(
+                                    batch_factory.new_batch(),
+                                    None,
+                                    None,
+                                    None,
+                                    Default::default(),
+                                    CogsData::default(),
+                                )
+                            }),
+                            self.max_batch_size,
+                            self.max_batch_time,
+                            BytesInsertBatch::len,
+                            // we need to enable this to deal with storages where we skip 100% of values, such as
+                            // gen-metrics-gauges in s4s. we still need to commit there
+                        )
+                        .flush_empty_batches(true),
+                    )
+                }
+            };
 
         // Transform messages
         let next_step = match (
@@ -14,6 +14,7 @@ use crate::strategies::clickhouse::batch::HttpBatch;
 use crate::types::BytesInsertBatch;
 
 pub mod batch;
+pub mod preaggregate;
 
 struct ClickhouseWriter {}
 
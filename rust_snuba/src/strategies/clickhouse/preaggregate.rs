@@ -0,0 +1,305 @@
+use std::collections::HashMap;
+
+use sentry_arroyo::{counter, timer};
+use serde_json::{Map, Number, Value};
+
+use crate::strategies::clickhouse::batch::HttpBatch;
+use crate::types::RowData;
+
+/// How the value column of rows with the same key is combined.
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum MergeStrategy {
+    /// The column is a number, the merged row gets the sum of the values.
+    Sum,
+    /// The column is an array of distinct values, the merged row gets the union of the values.
+    Union,
+    /// The column is an array, the merged row gets all the values.
+    Concat,
+}
+
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub struct PreAggregation {
+    pub column: &'static str,
+    pub strategy: MergeStrategy,
+}
+
+/// Returns how rows can be pre-aggregated for the storages that support it. Rows of these
+/// storages have no per-message columns (offset, partition...), so two rows that only differ in
+/// their value column can be combined into one before ClickHouse does it during merges.
+pub fn get_pre_aggregation(python_class_name: &str) -> Option<PreAggregation> {
+    match python_class_name {
+        "GenericCountersMetricsProcessor" => Some(PreAggregation {
+            column: "count_value",
+            strategy: MergeStrategy::Sum,
+        }),
+        "GenericSetsMetricsProcessor" => Some(PreAggregation {
+            column: "set_values",
+            strategy: MergeStrategy::Union,
+        }),
+        "GenericDistributionsMetricsProcessor" => Some(PreAggregation {
+            column: "distribution_values",
+            strategy: MergeStrategy::Concat,
+        }),
+        _ => None,
+    }
+}
+
+fn merge_values(strategy: MergeStrategy, into: &mut Value, from: &Value) -> bool {
+    match (strategy, into, from) {
+        (MergeStrategy::Sum, Value::Number(into), Value::Number(from)) => {
+            let sum = match (into.as_f64(), from.as_f64()) {
+                (Some(a), Some(b)) => Number::from_f64(a + b),
+                _ => None,
+            };
+            match sum {
+                Some(sum) => {
+                    *into = sum;
+                    true
+                }
+                None => false,
+            }
+        }
+        (MergeStrategy::Union | MergeStrategy::Concat, Value::Array(into), Value::Array(from)) => {
+            into.extend_from_slice(from);
+            true
+        }
+        _ => false,
+    }
+}
+
+/// Rows of a batch, combined by key. The key of a row is all of its columns except the value
+/// column.
+///
+/// Rows that cannot be parsed or merged are kept as they are, pre-aggregation is only an
+/// optimization and never drops data.
+#[derive(Debug)]
+pub struct AggregatedRows {
+    pre_aggregation: PreAggregation,
+    index: HashMap<Vec<u8>, usize>,
+    rows: Vec<Map<String, Value>>,
+    unmerged: RowData,
+    num_input_rows: usize,
+}
+
+impl AggregatedRows {
+    pub fn new(pre_aggregation: PreAggregation) -> Self {
+        AggregatedRows {
+            pre_aggregation,
+            index: HashMap::new(),
+            rows: Vec::new(),
+            unmerged: RowData::default(),
+            num_input_rows: 0,
+        }
+    }
+
+    pub fn num_input_rows(&self) -> usize {
+        self.num_input_rows
+    }
+
+    pub fn num_rows(&self) -> usize {
+        self.rows.len() + self.unmerged.num_rows
+    }
+
+    pub fn add(&mut self, data: &RowData) {
+        for line in data.encoded_rows.split(|&byte| byte == b'\n') {
+            if line.is_empty() {
+                continue;
+            }
+            self.num_input_rows += 1;
+            if !self.add_row(line) {
+                self.unmerged.encoded_rows.extend_from_slice(line);
+                self.unmerged.encoded_rows.push(b'\n');
+                self.unmerged.num_rows += 1;
+            }
+        }
+    }
+
+    fn add_row(&mut self, line: &[u8]) -> bool {
+        let PreAggregation { column, strategy } = self.pre_aggregation;
+        let Ok(mut row) = serde_json::from_slice::<Map<String, Value>>(line) else {
+            return false;
+        };
+        let Some(value) = row.remove(column) else {
+            return false;
+        };
+        let Ok(key) = serde_json::to_vec(&row) else {
+            return false;
+        };
+
+        if let Some(&position) = self.index.get(&key) {
+            let merged = &mut self.rows[position];
+            return merged
+                .get_mut(column)
+                .is_some_and(|into| merge_values(strategy, into, &value));
+        }
+
+        row.insert(column.to_owned(), value);
+        self.index.insert(key, self.rows.len());
+        self.rows.push(row);
+        true
+    }
+
+    pub fn into_row_data(mut self) -> RowData {
+        if self.pre_aggregation.strategy == MergeStrategy::Union {
+            for row in self.rows.iter_mut() {
+                if let Some(Value::Array(values)) = row.get_mut(self.pre_aggregation.column) {
+                    values.sort_by_key(Value::as_u64);
+                    values.dedup();
+                }
+            }
+        }
+
+        let mut data = RowData::from_rows(self.rows).expect("failed to encode pre-aggregated rows");
+        data.encoded_rows
+            .extend_from_slice(&self.unmerged.encoded_rows);
+        data.num_rows += self.unmerged.num_rows;
+        data
+    }
+}
+
+/// Accumulator of the Reduce step when pre-aggregation is enabled. Rows are combined as they are
+/// added and only written to the HTTP batch when the batch is flushed.
+pub struct PreAggregatedBatch {
+    http_batch: HttpBatch,
+    rows: AggregatedRows,
+}
+
+impl PreAggregatedBatch {
+    pub fn new(http_batch: HttpBatch, pre_aggregation: PreAggregation) -> Self {
+        PreAggregatedBatch {
+            http_batch,
+            rows: AggregatedRows::new(pre_aggregation),
+        }
+    }
+
+    pub fn write_rows(&mut self, data: &RowData) {
+        self.rows.add(data);
+    }
+
+    pub fn finish(self) -> HttpBatch {
+        let PreAggregatedBatch {
+            mut http_batch,
+            rows,
+        } = self;
+
+        let num_input_rows = rows.num_input_rows();
+        let num_rows = rows.num_rows();
+        if num_input_rows > 0 {
+            counter!(
+                "insertions.preaggregation.input_rows",
+                num_input_rows as i64
+            );
+            counter!("insertions.preaggregation.output_rows", num_rows as i64);
+            timer!(
+                "insertions.preaggregation.row_reduction_ratio",
+                1.0 - num_rows as f64 / num_input_rows as f64
+            );
+        }
+
+        http_batch
+            .write_rows(&rows.into_row_data())
+            .expect("failed to write rows to channel");
+        http_batch
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use serde_json::json;
+
+    use super::*;
+
+    fn rows(rows: &[Value]) -> RowData {
+        RowData::from_rows(rows).unwrap()
+    }
+
+    fn parse(data: RowData) -> Vec<Value> {
+        data.encoded_rows
+            .split(|&byte| byte == b'\n')
+            .filter(|line| !line.is_empty())
+            .map(|line| serde_json::from_slice(line).unwrap())
+            .collect()
+    }
+
+    #[test]
+    fn test_sum_counters() {
+        let mut aggregated =
+            AggregatedRows::new(get_pre_aggregation("GenericCountersMetricsProcessor").unwrap());
+        aggregated.add(&rows(&[
+            json!({"org_id": 1, "metric_id": 1, "tags.key": [1], "count_value": 1.0}),
+            json!({"org_id": 1, "metric_id": 2, "tags.key": [1], "count_value": 1.0}),
+        ]));
+        aggregated.add(&rows(&[
+            json!({"org_id": 1, "metric_id": 1, "tags.key": [1], "count_value": 2.5}),
+            json!({"org_id": 1, "metric_id": 1, "tags.key": [2], "count_value": 1.0}),
+        ]));
+
+        assert_eq!(aggregated.num_input_rows(), 4);
+        assert_eq!(aggregated.num_rows(), 3);
+        assert_eq!(
+            parse(aggregated.into_row_data()),
+            vec![
+                json!({"org_id": 1, "metric_id": 1, "tags.key": [1], "count_value": 3.5}),
+                json!({"org_id": 1, "metric_id": 2, "tags.key": [1], "count_value": 1.0}),
+                json!({"org_id": 1, "metric_id": 1, "tags.key": [2], "count_value": 1.0}),
+            ]
+        );
+    }
+
+    #[test]
+    fn test_union_sets() {
+        let mut aggregated =
+            AggregatedRows::new(get_pre_aggregation("GenericSetsMetricsProcessor").unwrap());
+        aggregated.add(&rows(&[
+            json!({"org_id": 1, "set_values": [3, 1]}),
+            json!({"org_id": 1, "set_values": [2, 3]}),
+        ]));
+
+        assert_eq!(
+            parse(aggregated.into_row_data()),
+            vec![json!({"org_id": 1, "set_values": [1, 2, 3]})]
+        );
+    }
+
+    #[test]
+    fn test_concat_distributions() {
+        let mut aggregated = AggregatedRows::new(
+            get_pre_aggregation("GenericDistributionsMetricsProcessor").unwrap(),
+        );
+        aggregated.add(&rows(&[
+            json!({"org_id": 1, "distribution_values": [1.0, 2.0]}),
+            json!({"org_id": 1, "distribution_values": [2.0]}),
+        ]));
+
+        assert_eq!(
+            parse(aggregated.into_row_data()),
+            vec![json!({"org_id": 1, "distribution_values": [1.0, 2.0, 2.0]})]
+        );
+    }
+
+    #[test]
+    fn test_unmergeable_rows_are_kept() {
+        let mut aggregated =
+            AggregatedRows::new(get_pre_aggregation("GenericCountersMetricsProcessor").unwrap());
+        aggregated.add(&rows(&[
+            json!({"org_id": 1, "count_value": 1.0}),
+            json!({"org_id": 1, "count_value": "not a number"}),
+            json!({"org_id": 1}),
+        ]));
+
+        assert_eq!(aggregated.num_input_rows(), 3);
+        assert_eq!(
+            parse(aggregated.into_row_data()),
+            vec![
+                json!({"org_id": 1, "count_value": 1.0}),
+                json!({"org_id": 1, "count_value": "not a number"}),
+                json!({"org_id": 1}),
+            ]
+        );
+    }
+
+    #[test]
+    fn test_unsupported_processor() {
+        assert_eq!(get_pre_aggregation("GenericGaugesMetricsProcessor"), None);
+    }
+}
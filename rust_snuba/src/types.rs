@@ -2,6 +2,7 @@ use std::cmp::min;
 use std::collections::BTreeMap;
 
 use crate::strategies::clickhouse::batch::HttpBatch;
+use crate::strategies::clickhouse::preaggregate::PreAggregatedBatch;
 
 use chrono::{DateTime, Utc};
 use sentry_arroyo::backends::kafka::types::KafkaPayload;
@@ -264,17 +265,46 @@ impl BytesInsertBatch<RowData> {
     }
 }
 
-impl BytesInsertBatch<HttpBatch> {
-    pub fn merge(mut self, other: BytesInsertBatch<RowData>) -> Self {
-        self.rows
-            .write_rows(&other.rows)
-            .expect("failed to write rows to channel");
+impl BytesInsertBatch<()> {
+    pub fn with_rows<R>(self, rows: R) -> BytesInsertBatch<R> {
+        BytesInsertBatch {
+            rows,
+            message_timestamp: self.message_timestamp,
+            origin_timestamp: self.origin_timestamp,
+            sentry_received_timestamp: self.sentry_received_timestamp,
+            commit_log_offsets: self.commit_log_offsets,
+            cogs_data: self.cogs_data,
+        }
+    }
+}
+
+impl<R> BytesInsertBatch<R> {
+    /// Merges everything but the rows of `other` into this batch and returns the rows.
+    fn merge_metadata(&mut self, other: BytesInsertBatch<RowData>) -> RowData {
         self.commit_log_offsets.merge(other.commit_log_offsets);
         self.message_timestamp.merge(other.message_timestamp);
         self.origin_timestamp.merge(other.origin_timestamp);
         self.sentry_received_timestamp
             .merge(other.sentry_received_timestamp);
         self.cogs_data.merge(other.cogs_data);
+        other.rows
+    }
+}
+
+impl BytesInsertBatch<HttpBatch> {
+    pub fn merge(mut self, other: BytesInsertBatch<RowData>) -> Self {
+        let rows = self.merge_metadata(other);
+        self.rows
+            .write_rows(&rows)
+            .expect("failed to write rows to channel");
+        self
+    }
+}
+
+impl BytesInsertBatch<PreAggregatedBatch> {
+    pub fn merge(mut self, other: BytesInsertBatch<RowData>) -> Self {
+        let rows = self.merge_metadata(other);
+        self.rows.write_rows(&rows);
         self
     }
 }
@@ -0,0 +1,512 @@
+"""
+Measures the throughput of the Python consumers end to end: messages are
+consumed from arroyo's in-memory broker, go through ``process_message``
+and the strategies built by ``KafkaConsumerStrategyFactory`` and are
+written by ``HTTPBatchWriter`` to a local HTTP server that stands in for
+ClickHouse and discards the rows.
+
+Each writable storage is fed with the examples of its topic from
+sentry-kafka-schemas, or with recorded payloads (one JSON message per
+line) with ``--payloads``. The report has, per storage:
+
+* messages/sec over the whole run,
+* CPU time per message, including the transform processes if any,
+* p99 of the time spent flushing a batch to ClickHouse,
+* the peak RSS of the consumer, without the transform processes.
+
+Each storage is benchmarked in a process of its own, so its peak RSS and
+CPU time do not include the other storages nor the stand-in ClickHouse.
+
+Redis is needed since the consumer reads the runtime config.
+
+``--save-baseline`` stores the results in a JSON file and ``--baseline``
+compares the results with a stored file: the command exits with an error
+if throughput dropped, or CPU per message or flush time grew, by more
+than ``--max-regression``.
+
+Usage::
+
+    python -m scripts.benchmarks.consumer_throughput --storage outcomes_raw
+    python -m scripts.benchmarks.consumer_throughput --processes 4 --save-baseline base.json
+    python -m scripts.benchmarks.consumer_throughput --baseline base.json --max-regression 0.15
+"""
+import functools
+import itertools
+import json
+import multiprocessing
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import (
+    Any,
+    Mapping,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Union,
+)
+
+import click
+import sentry_kafka_schemas
+from arroyo.backends.kafka import KafkaPayload
+from arroyo.backends.local.backend import LocalBroker
+from arroyo.backends.local.storages.memory import MemoryMessageStorage
+from arroyo.dlq import InvalidMessage
+from arroyo.processing import StreamProcessor
+from arroyo.types import BrokerValue, Message, Partition, Topic
+
+from snuba import settings
+from snuba.clickhouse.http import HTTPBatchWriter, InsertStatement
+from snuba.consumers.consumer import (
+    BytesInsertBatch,
+    InsertBatchWriter,
+    ProcessedMessageBatchWriter,
+    process_message,
+)
+from snuba.consumers.strategy_factory import KafkaConsumerStrategyFactory
+from snuba.datasets.storages.factory import (
+    get_writable_storage,
+    get_writable_storage_keys,
+)
+from snuba.datasets.storages.storage_key import StorageKey
+from snuba.environment import setup_logging
+from snuba.processor import MessageProcessor, ReplacementBatch
+from snuba.utils.metrics.backends.dummy import DummyMetricsBackend
+from snuba.utils.streams.topics import Topic as SnubaTopic
+
+CONSUMER_GROUP = "consumer-benchmark"
+
+
+class _ClickhouseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                self.rfile.read(size + 2)
+                if size == 0:
+                    break
+        else:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class StubClickhouse:
+    """
+    HTTP server accepting the inserts of ``HTTPBatchWriter`` and dropping
+    them, so the benchmark measures the consumer and not ClickHouse.
+    """
+
+    def __init__(self) -> None:
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), _ClickhouseHandler)
+        self.__server.daemon_threads = True
+        self.__thread = Thread(target=self.__server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.__server.server_address[1]
+
+    def __enter__(self) -> "StubClickhouse":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class _FlushStats:
+    def __init__(self, messages: int) -> None:
+        self.__lock = Lock()
+        self.__messages = messages
+        self.flushed_messages = 0
+        self.flush_ms: MutableSequence[float] = []
+        # Set, with the time it happened, once all the messages are flushed.
+        self.done = Event()
+        self.done_at = 0.0
+
+    def record(self, messages: int, duration_ms: float) -> None:
+        with self.__lock:
+            self.flushed_messages += messages
+            self.flush_ms.append(duration_ms)
+            if self.flushed_messages >= self.__messages and not self.done.is_set():
+                self.done_at = time.perf_counter()
+                self.done.set()
+
+
+class _TimedBatchWriter(ProcessedMessageBatchWriter):
+    def __init__(self, insert_batch_writer: InsertBatchWriter, stats: _FlushStats):
+        super().__init__(insert_batch_writer)
+        self.__stats = stats
+        self.__messages = 0
+
+    def submit(
+        self, message: Message[Union[None, BytesInsertBatch, ReplacementBatch]]
+    ) -> None:
+        self.__messages += 1
+        super().submit(message)
+
+    def close(self) -> None:
+        start = time.perf_counter()
+        super().close()
+        self.__stats.record(self.__messages, (time.perf_counter() - start) * 1000)
+
+
+@dataclass(frozen=True)
+class Options:
+    messages: int
+    partitions: int
+    max_batch_size: int
+    max_batch_time: float
+    processes: Optional[int]
+    input_block_size: Optional[int]
+    output_block_size: Optional[int]
+    timeout: float
+
+
+@dataclass(frozen=True)
+class Result:
+    messages: int
+    messages_per_sec: float
+    cpu_us_per_message: float
+    flush_p99_ms: float
+    peak_rss_mb: float
+
+
+def _refresh_timestamps(topic: str, data: Any) -> Any:
+    # Processors drop the messages that are too old, and the examples are
+    # as old as the schemas.
+    if not isinstance(data, dict):
+        return data
+    now = int(time.time())
+    if topic == "ingest-replay-events" and "start_time" in data:
+        data["start_time"] = now
+    elif topic == "processed-profiles" and "received" in data:
+        data["received"] = now
+    elif topic == "snuba-spans" and "start_timestamp_ms" in data:
+        data["start_timestamp_ms"] = now * 1000
+    return data
+
+
+def load_payloads(topic: SnubaTopic, path: Optional[str]) -> Sequence[bytes]:
+    if path is not None:
+        with open(path, "rb") as f:
+            return [line.strip() for line in f if line.strip()]
+    return [
+        json.dumps(_refresh_timestamps(topic.value, example.load())).encode("utf-8")
+        for example in sentry_kafka_schemas.iter_examples(topic.value)
+    ]
+
+
+def _insertable_payloads(
+    processor: MessageProcessor,
+    logical_topic: SnubaTopic,
+    payloads: Sequence[bytes],
+) -> Sequence[bytes]:
+    """
+    Drops the payloads that are rejected by the processor or that produce
+    replacements, which the benchmark does not write anywhere.
+    """
+    partition = Partition(Topic("validation"), 0)
+    insertable = []
+    for offset, payload in enumerate(payloads):
+        message = Message(
+            BrokerValue(
+                KafkaPayload(None, payload, []), partition, offset, datetime.now()
+            )
+        )
+        try:
+            result = process_message(
+                processor, CONSUMER_GROUP, logical_topic, False, message
+            )
+        except InvalidMessage:
+            continue
+        if not isinstance(result, ReplacementBatch):
+            insertable.append(payload)
+    return insertable
+
+
+def run_consumer(
+    processor: MessageProcessor,
+    logical_topic: SnubaTopic,
+    table_name: str,
+    payloads: Sequence[bytes],
+    clickhouse_port: int,
+    options: Options,
+) -> Result:
+    # Flushes are triggered by batch size only, so the run does not end
+    # waiting for the batch time of a partial batch.
+    messages = -(-options.messages // options.max_batch_size) * options.max_batch_size
+
+    broker: LocalBroker[KafkaPayload] = LocalBroker(MemoryMessageStorage())
+    topic = Topic("benchmark")
+    broker.create_topic(topic, options.partitions)
+    for index, payload in zip(range(messages), itertools.cycle(payloads)):
+        broker.produce(
+            Partition(topic, index % options.partitions),
+            KafkaPayload(None, payload, []),
+        )
+
+    metrics = DummyMetricsBackend()
+    writer = HTTPBatchWriter(
+        "127.0.0.1",
+        clickhouse_port,
+        "default",
+        "",
+        metrics,
+        InsertStatement(table_name).with_format("JSONEachRow"),
+        encoding=None,
+        options={"load_balancing": "in_order", "insert_distributed_sync": 1},
+        chunk_size=settings.CLICKHOUSE_HTTP_CHUNK_SIZE,
+    )
+    stats = _FlushStats(messages)
+    factory = KafkaConsumerStrategyFactory(
+        prefilter=None,
+        process_message=functools.partial(
+            process_message, processor, CONSUMER_GROUP, logical_topic, False
+        ),
+        collector=lambda: _TimedBatchWriter(InsertBatchWriter(writer, metrics), stats),
+        max_batch_size=options.max_batch_size,
+        max_batch_time=options.max_batch_time,
+        processes=options.processes,
+        input_block_size=options.input_block_size,
+        output_block_size=options.output_block_size,
+        max_insert_batch_size=None,
+        max_insert_batch_time=None,
+        metrics_tags={},
+    )
+    stream_processor = StreamProcessor(
+        broker.get_consumer(CONSUMER_GROUP), topic, factory
+    )
+
+    def stop() -> None:
+        stats.done.wait(options.timeout)
+        stream_processor.signal_shutdown()
+
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    stopper = Thread(target=stop, daemon=True)
+    stopper.start()
+    # The shutdown closes the strategy, which also terminates the transform
+    # processes, so their CPU time is accounted for in RUSAGE_CHILDREN.
+    stream_processor.run()
+    stopper.join()
+    if not stats.done.is_set():
+        raise TimeoutError(f"{stats.flushed_messages} of {messages} messages flushed")
+    elapsed = stats.done_at - start
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu_seconds = sum(
+        end - begin
+        for end, begin in (
+            (cpu_end.ru_utime, cpu_start.ru_utime),
+            (cpu_end.ru_stime, cpu_start.ru_stime),
+            (children_end.ru_utime, children_start.ru_utime),
+            (children_end.ru_stime, children_start.ru_stime),
+        )
+    )
+    flush_ms = sorted(stats.flush_ms)
+    return Result(
+        messages=messages,
+        messages_per_sec=messages / elapsed,
+        cpu_us_per_message=cpu_seconds / messages * 1_000_000,
+        flush_p99_ms=flush_ms[min(int(len(flush_ms) * 0.99), len(flush_ms) - 1)],
+        peak_rss_mb=cpu_end.ru_maxrss / 1024,
+    )
+
+
+def _median_result(results: Sequence[Result]) -> Result:
+    return Result(
+        messages=results[0].messages,
+        messages_per_sec=statistics.median(r.messages_per_sec for r in results),
+        cpu_us_per_message=statistics.median(r.cpu_us_per_message for r in results),
+        flush_p99_ms=statistics.median(r.flush_p99_ms for r in results),
+        peak_rss_mb=max(r.peak_rss_mb for r in results),
+    )
+
+
+def benchmark_storage(
+    storage_name: str,
+    payloads: Optional[str],
+    clickhouse_port: int,
+    options: Options,
+    rounds: int,
+) -> Optional[Result]:
+    """
+    Runs the rounds of a storage, or returns None if none of the payloads
+    can be inserted in it. Meant to run in a process of its own.
+    """
+    setup_logging("WARNING")
+    settings.DISCARD_OLD_EVENTS = False
+    table_writer = get_writable_storage(StorageKey(storage_name)).get_table_writer()
+    stream_loader = table_writer.get_stream_loader()
+    processor = stream_loader.get_processor()
+    logical_topic = stream_loader.get_default_topic_spec().topic
+
+    insertable = _insertable_payloads(
+        processor, logical_topic, load_payloads(logical_topic, payloads)
+    )
+    if not insertable:
+        return None
+
+    return _median_result(
+        [
+            run_consumer(
+                processor,
+                logical_topic,
+                table_writer.get_schema().get_table_name(),
+                insertable,
+                clickhouse_port,
+                options,
+            )
+            for _ in range(rounds)
+        ]
+    )
+
+
+def find_regressions(
+    results: Mapping[str, Result],
+    baseline: Mapping[str, Mapping[str, float]],
+    max_regression: float,
+) -> Sequence[str]:
+    regressions = []
+    for storage, result in results.items():
+        base = baseline.get(storage)
+        if base is None:
+            continue
+        if result.messages_per_sec < base["messages_per_sec"] * (1 - max_regression):
+            regressions.append(
+                f"{storage}: {result.messages_per_sec:.0f} msg/s, "
+                f"baseline {base['messages_per_sec']:.0f} msg/s"
+            )
+        for metric in ("cpu_us_per_message", "flush_p99_ms"):
+            value = getattr(result, metric)
+            if value > base[metric] * (1 + max_regression):
+                regressions.append(
+                    f"{storage}: {metric} {value:.3f}, baseline {base[metric]:.3f}"
+                )
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--storage",
+    "storage_names",
+    multiple=True,
+    help="Writable storages to benchmark. All of them by default.",
+)
+@click.option(
+    "--payloads",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Recorded payloads, one JSON message per line. Needs a single --storage.",
+)
+@click.option("--messages", type=int, default=20000)
+@click.option("--rounds", type=int, default=3)
+@click.option("--partitions", type=int, default=4)
+@click.option("--max-batch-size", type=int, default=1000)
+@click.option("--max-batch-time-ms", type=int, default=1000)
+@click.option("--processes", type=int)
+@click.option("--input-block-size", type=int)
+@click.option("--output-block-size", type=int)
+@click.option("--timeout", type=float, default=300.0, help="Seconds per round.")
+@click.option("--save-baseline", type=click.Path(dir_okay=False))
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False))
+@click.option("--max-regression", type=float, default=0.1)
+def main(
+    storage_names: Sequence[str],
+    payloads: Optional[str],
+    messages: int,
+    rounds: int,
+    partitions: int,
+    max_batch_size: int,
+    max_batch_time_ms: int,
+    processes: Optional[int],
+    input_block_size: Optional[int],
+    output_block_size: Optional[int],
+    timeout: float,
+    save_baseline: Optional[str],
+    baseline: Optional[str],
+    max_regression: float,
+) -> None:
+    setup_logging("WARNING")
+    if payloads is not None and len(storage_names) != 1:
+        raise click.UsageError("--payloads needs exactly one --storage")
+
+    storage_keys = (
+        [StorageKey(name) for name in storage_names]
+        if storage_names
+        else get_writable_storage_keys()
+    )
+    options = Options(
+        messages=messages,
+        partitions=partitions,
+        max_batch_size=max_batch_size,
+        max_batch_time=max_batch_time_ms / 1000.0,
+        processes=processes,
+        input_block_size=input_block_size,
+        output_block_size=output_block_size,
+        timeout=timeout,
+    )
+
+    results: MutableMapping[str, Result] = {}
+    with StubClickhouse() as clickhouse:
+        for storage_key in storage_keys:
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                storage_result = executor.submit(
+                    benchmark_storage,
+                    storage_key.value,
+                    payloads,
+                    clickhouse.port,
+                    options,
+                    rounds,
+                ).result()
+            if storage_result is None:
+                click.echo(f"{storage_key.value:<40} skipped, no usable payloads")
+                continue
+
+            result = results[storage_key.value] = storage_result
+            click.echo(
+                f"{storage_key.value:<40}"
+                f" {result.messages_per_sec:10.0f} msg/s"
+                f" {result.cpu_us_per_message:10.1f} us cpu/msg"
+                f"  flush p99 {result.flush_p99_ms:8.2f}ms"
+                f"  peak rss {result.peak_rss_mb:8.1f}MB"
+            )
+
+    if save_baseline is not None:
+        with open(save_baseline, "w") as f:
+            json.dump(
+                {storage: asdict(result) for storage, result in results.items()},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = find_regressions(results, json.load(f), max_regression)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}", err=True)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Measures the cost of running query processors over the query AST.
+
+Each processor calls ``transform_expressions`` on the whole query, so the
+workload applies a list of rules, each of them only rewriting a few node
+types, to an AST shaped like the ones produced by discover and metrics
+queries. The rules are applied either one traversal each, as the
+processors do, or fused into a single traversal with ``fuse_transforms``.
+
+Usage::
+
+    python -m scripts.benchmarks.expression_transform --iterations 2000
+"""
+from dataclasses import replace
+from typing import Callable, List, Sequence
+
+import click
+from scripts.benchmarks.utils import measure
+
+from snuba.query.dsl import CurriedFunctions as cf
+from snuba.query.dsl import Functions as f
+from snuba.query.dsl import and_cond, column, equals, in_cond, literal, or_cond
+from snuba.query.expressions import (
+    Argument,
+    Column,
+    Expression,
+    FunctionCall,
+    Lambda,
+    Literal,
+    SubscriptableReference,
+    fuse_transforms,
+)
+
+Rule = Callable[[Expression], Expression]
+
+
+def _tag(key: str) -> SubscriptableReference:
+    return SubscriptableReference(f"_snuba_tags[{key}]", column("tags"), literal(key))
+
+
+def discover_ast() -> List[Expression]:
+    """
+    Selected columns and condition of a discover table query with a few
+    tag filters, aggregates and a search condition.
+    """
+    selected: List[Expression] = [
+        f.count(alias="count"),
+        f.uniq(column("user"), alias="count_unique_user"),
+        cf.quantile(0.95)(column("duration"), alias="p95"),
+        f.avg(column("duration"), alias="avg_duration"),
+        f.divide(
+            f.countIf(f.greater(column("duration"), literal(300))),
+            f.count(),
+            alias="apdex",
+        ),
+        f.arrayExists(
+            Lambda(
+                None,
+                ("x",),
+                f.equals(Argument(None, "x"), literal("error")),
+            ),
+            column("tags.value"),
+            alias="has_error_tag",
+        ),
+        _tag("environment"),
+        _tag("release"),
+        column("transaction"),
+    ]
+    condition = and_cond(
+        f.greaterOrEquals(column("finish_ts"), literal("2024-01-01T00:00:00")),
+        f.less(column("finish_ts"), literal("2024-01-02T00:00:00")),
+        in_cond(
+            column("project_id"),
+            f.tuple(*[literal(project_id) for project_id in range(20)]),
+        ),
+        equals(_tag("environment"), literal("production")),
+        or_cond(
+            f.like(column("transaction"), literal("%/api/%")),
+            f.notLike(_tag("url"), literal("%/health%")),
+            f.has(column("tags.key"), literal("browser.name")),
+        ),
+        f.notEquals(column("transaction_op"), literal("http.server")),
+        f.greater(column("duration"), literal(100)),
+    )
+    return [*selected, condition]
+
+
+def metrics_ast() -> List[Expression]:
+    """
+    Selected columns and condition of a metrics query with one aggregate
+    per metric id and grouping by tags.
+    """
+    selected: List[Expression] = []
+    for metric_id in range(8):
+        selected.append(
+            f.sumIf(
+                column("value"),
+                equals(column("metric_id"), literal(metric_id)),
+                alias=f"metric_{metric_id}",
+            )
+        )
+        selected.append(
+            cf.quantilesIf(0.5, 0.75, 0.9, 0.95, 0.99)(
+                column("percentiles"),
+                equals(column("metric_id"), literal(metric_id)),
+                alias=f"percentiles_{metric_id}",
+            )
+        )
+    for tag_key in range(6):
+        selected.append(
+            f.arrayElement(
+                column("tags.raw_value"),
+                f.indexOf(column("tags.key"), literal(tag_key)),
+                alias=f"tags_raw[{tag_key}]",
+            )
+        )
+    condition = and_cond(
+        equals(column("org_id"), literal(1)),
+        in_cond(
+            column("project_id"),
+            f.tuple(*[literal(project_id) for project_id in range(10)]),
+        ),
+        in_cond(column("metric_id"), f.tuple(*[literal(i) for i in range(8)])),
+        f.greaterOrEquals(column("timestamp"), literal("2024-01-01T00:00:00")),
+        f.less(column("timestamp"), literal("2024-01-02T00:00:00")),
+        equals(column("granularity"), literal(60)),
+    )
+    return [*selected, condition]
+
+
+def rules() -> Sequence[Rule]:
+    """
+    Rules that look like what most processors do: match one kind of node
+    and leave everything else alone.
+    """
+
+    def rename_column(exp: Expression) -> Expression:
+        if isinstance(exp, Column) and exp.column_name == "finish_ts":
+            return replace(exp, column_name="timestamp")
+        return exp
+
+    def low_cardinality(exp: Expression) -> Expression:
+        if isinstance(exp, Column) and exp.column_name == "environment":
+            return FunctionCall(exp.alias, "cast", (exp, literal("Nullable(String)")))
+        return exp
+
+    def uniq_to_hll(exp: Expression) -> Expression:
+        if isinstance(exp, FunctionCall) and exp.function_name == "uniqHLL12":
+            return replace(exp, function_name="uniq")
+        return exp
+
+    def empty_literal(exp: Expression) -> Expression:
+        if isinstance(exp, Literal) and exp.value == "":
+            return Literal(exp.alias, None)
+        return exp
+
+    def tag_access(exp: Expression) -> Expression:
+        if isinstance(exp, SubscriptableReference) and exp.key.value == "user":
+            return column("user", alias=exp.alias)
+        return exp
+
+    def noop(exp: Expression) -> Expression:
+        return exp
+
+    return [
+        rename_column,
+        low_cardinality,
+        uniq_to_hll,
+        empty_literal,
+        tag_access,
+        noop,
+        noop,
+        noop,
+    ]
+
+
+def _run_separately(
+    expressions: Sequence[Expression], rules: Sequence[Rule]
+) -> Callable[[], None]:
+    def run() -> None:
+        current = expressions
+        for rule in rules:
+            current = [exp.transform(rule) for exp in current]
+
+    return run
+
+
+def _run_fused(
+    expressions: Sequence[Expression], rules: Sequence[Rule]
+) -> Callable[[], None]:
+    fused = fuse_transforms(*rules)
+
+    def run() -> None:
+        for exp in expressions:
+            exp.transform(fused)
+
+    return run
+
+
+@click.command()
+@click.option("--iterations", type=int, default=2000)
+@click.option("--rounds", type=int, default=5)
+def main(iterations: int, rounds: int) -> None:
+    all_rules = rules()
+    for name, expressions in (("discover", discover_ast()), ("metrics", metrics_ast())):
+        size = sum(exp.subtree_size for exp in expressions)
+        click.echo(f"{name}: {size} nodes, {len(all_rules)} rules")
+        for result in (
+            measure(
+                f"{name}, one traversal per rule",
+                _run_separately(expressions, all_rules),
+                iterations,
+                rounds,
+            ),
+            measure(
+                f"{name}, fused rules",
+                _run_fused(expressions, all_rules),
+                iterations,
+                rounds,
+            ),
+        ):
+            click.echo(result.format())
+
+
+if __name__ == "__main__":
+    main()
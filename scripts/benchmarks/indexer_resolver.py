@@ -0,0 +1,116 @@
+"""
+Measures the time spent resolving the indexer mappings of MQL formula
+queries.
+
+The formula adds up one timeseries per MRI, each filtered and grouped by
+tags, so the query joins one entity per MRI on the group by columns. The
+mappings are resolved with ``resolve_mappings``, which rewrites the tag
+keys, metric ids and tag values in a single traversal, and with the
+separate passes it replaced, one traversal per kind of reference.
+
+Each run resolves a shallow copy of the query since resolving replaces its
+expressions in place.
+
+Usage::
+
+    python -m scripts.benchmarks.indexer_resolver --terms 2 --terms 16
+"""
+from copy import copy
+from typing import Callable, Sequence, Tuple
+
+import click
+from scripts.benchmarks.utils import measure
+
+from snuba.datasets.dataset import Dataset
+from snuba.datasets.factory import get_dataset
+from snuba.query.composite import CompositeQuery
+from snuba.query.data_source.simple import Entity as QueryEntity
+from snuba.query.indexer.resolver import (
+    resolve_mappings,
+    resolve_metric_id_mapping,
+    resolve_tag_key_mappings,
+)
+from snuba.query.logical import Query as LogicalQuery
+from snuba.query.mql.parser import parse_mql_query_body, populate_query_from_mql_context
+
+Query = CompositeQuery[QueryEntity] | LogicalQuery
+Resolve = Callable[[Query, dict[str, str | int], Dataset], None]
+
+GROUP_BY = ("transaction", "status_code", "environment")
+
+
+def formula_query(terms: int, dataset: Dataset) -> Tuple[Query, dict[str, str | int]]:
+    """
+    A formula query adding up ``terms`` timeseries and the indexer mappings
+    of its MRIs and tags, before they are resolved.
+    """
+    mris = [f"d:transactions/metric_{term}@millisecond" for term in range(terms)]
+    group_by = ", ".join(GROUP_BY)
+    timeseries = [
+        f'sum(`{mri}`){{transaction:"t{term}" and status_code:200}} by ({group_by})'
+        for term, mri in enumerate(mris)
+    ]
+    body = timeseries[0]
+    for term in timeseries[1:]:
+        # The parser only keeps two operands of a flat sum.
+        body = f"({body}) + {term}"
+    mappings: dict[str, str | int] = {mri: 1000 + term for term, mri in enumerate(mris)}
+    mappings.update({tag: 2000 + index for index, tag in enumerate(GROUP_BY)})
+    mql_context = {
+        "start": "2024-01-01T00:00:00",
+        "end": "2024-01-02T00:00:00",
+        "rollup": {"granularity": 60, "interval": 60, "with_totals": "False"},
+        "scope": {"org_ids": [1], "project_ids": [1], "use_case_id": "transactions"},
+        "indexer_mappings": mappings,
+        "limit": None,
+        "offset": None,
+    }
+    query, _ = populate_query_from_mql_context(
+        parse_mql_query_body(body, dataset), mql_context
+    )
+    assert isinstance(query, (CompositeQuery, LogicalQuery))
+    return query, mappings
+
+
+def resolve_separately(
+    query: Query, mappings: dict[str, str | int], dataset: Dataset
+) -> None:
+    resolve_tag_key_mappings(query, mappings, dataset)
+    resolve_metric_id_mapping(query, mappings)
+
+
+def _run(
+    query: Query,
+    mappings: dict[str, str | int],
+    dataset: Dataset,
+    resolve: Resolve,
+) -> Callable[[], None]:
+    def run() -> None:
+        resolve(copy(query), mappings, dataset)
+
+    return run
+
+
+@click.command()
+@click.option("--terms", type=int, multiple=True, default=(2, 8, 32))
+@click.option("--iterations", type=int, default=200)
+@click.option("--rounds", type=int, default=5)
+def main(terms: Sequence[int], iterations: int, rounds: int) -> None:
+    dataset = get_dataset("generic_metrics")
+    for count in terms:
+        query, mappings = formula_query(count, dataset)
+        for name, resolve in (
+            ("one traversal per reference", resolve_separately),
+            ("single traversal", resolve_mappings),
+        ):
+            result = measure(
+                f"{count} terms, {name}",
+                _run(query, mappings, dataset, resolve),
+                iterations,
+                rounds,
+            )
+            click.echo(result.format())
+
+
+if __name__ == "__main__":
+    main()
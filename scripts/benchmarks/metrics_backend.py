@@ -0,0 +1,104 @@
+"""
+Compares the per call overhead of the metrics backends used in production.
+
+The workload mimics what a query does through ``Timer.send_metrics_to`` and
+the consumers through ``process_message``: a handful of timings and counters
+with a small, mostly static, set of tags. The timings are float latencies
+drawn from a log-normal distribution, so that no two of them are equal. Metrics are sent over UDP to a
+local port nobody listens on, so the cost measured is the client side cost
+only (formatting the packet and the ``sendto`` syscall).
+
+Usage::
+
+    python -m scripts.benchmarks.metrics_backend --iterations 20000
+"""
+import random
+from functools import partial
+from itertools import cycle
+from typing import Callable
+
+import click
+from datadog import DogStatsd
+from scripts.benchmarks.utils import measure
+
+from snuba.utils.metrics.backends.abstract import MetricsBackend
+from snuba.utils.metrics.backends.aggregating import AggregatingMetricsBackend
+from snuba.utils.metrics.backends.datadog import DatadogMetricsBackend
+from snuba.utils.metrics.wrapper import MetricsWrapper
+
+TAGS = {
+    "referrer": "api.discover.query-table",
+    "dataset": "discover",
+    "app_id": "default",
+    "status": "success",
+}
+MARKS = [
+    "validate_schema",
+    "build_request",
+    "execute",
+    "prepare_query",
+    "cache_get",
+    "execute_query",
+]
+# Latencies in milliseconds, a median around 20ms with a long tail.
+_random = random.Random(0)
+LATENCIES_MS = [_random.lognormvariate(3, 1) for _ in range(10007)]
+
+
+def _workload(backend: MetricsBackend) -> Callable[[], None]:
+    metrics = MetricsWrapper(backend, "api")
+    latencies = cycle(LATENCIES_MS)
+
+    def run() -> None:
+        metrics.timing("query", next(latencies), tags=TAGS)
+        for mark in MARKS:
+            metrics.timing(f"query.{mark}", next(latencies), tags=TAGS)
+        metrics.increment("query.result", tags=TAGS)
+        metrics.gauge("query.concurrent", 3)
+
+    return run
+
+
+@click.command()
+@click.option("--iterations", type=int, default=20000)
+@click.option("--rounds", type=int, default=5)
+@click.option("--port", type=int, default=18125, help="Local UDP port to send to.")
+def main(iterations: int, rounds: int, port: int) -> None:
+    def datadog() -> DatadogMetricsBackend:
+        return DatadogMetricsBackend(
+            partial(DogStatsd, host="127.0.0.1", port=port, namespace="snuba")
+        )
+
+    aggregating = AggregatingMetricsBackend(datadog(), autoflush=False)
+    results = [
+        measure("datadog", _workload(datadog()), iterations, rounds),
+        measure(
+            "aggregating(datadog), record only",
+            _workload(
+                AggregatingMetricsBackend(
+                    datadog(),
+                    flush_interval_sec=3600,
+                    max_buffer_size=2**31,
+                    autoflush=False,
+                )
+            ),
+            iterations,
+            rounds,
+        ),
+        measure(
+            "aggregating(datadog), with flushes",
+            _workload(aggregating),
+            iterations,
+            rounds,
+        ),
+    ]
+    aggregating.flush()
+
+    calls = 2 + len(MARKS) + 1
+    click.echo(f"{calls} metric calls per op")
+    for result in results:
+        click.echo(result.format())
+
+
+if __name__ == "__main__":
+    main()
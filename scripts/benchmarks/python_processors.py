@@ -0,0 +1,161 @@
+"""
+Measures the throughput and the memory use of the Python message
+processors of the errors and transactions storages.
+
+The processors are fed with the examples of their topic from
+sentry-kafka-schemas, or with recorded payloads (one JSON message per line)
+with ``--payloads``. The report has, per storage:
+
+* the time ``process_message`` takes per message,
+* the memory allocated while a message is processed (tracemalloc peak),
+* the memory held by the rows of a batch of ``--batch-size`` messages,
+  which is what the consumer keeps around until the batch is flushed.
+
+Redis is needed since the processors read the runtime config.
+
+Usage::
+
+    python -m scripts.benchmarks.python_processors --iterations 2000
+    python -m scripts.benchmarks.python_processors --storage errors --payloads events.jsonl
+"""
+import gc
+import itertools
+import json
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import click
+import sentry_kafka_schemas
+from scripts.benchmarks.utils import measure
+
+from snuba import settings
+from snuba.consumers.types import KafkaMessageMetadata
+from snuba.datasets.processors import DatasetMessageProcessor
+from snuba.datasets.processors.errors_processor import ErrorsProcessor
+from snuba.datasets.processors.transactions_processor import (
+    TransactionsMessageProcessor,
+)
+from snuba.processor import InsertBatch
+
+PROCESSORS: Sequence[Tuple[str, str, Callable[[], DatasetMessageProcessor]]] = [
+    ("errors", "events", ErrorsProcessor),
+    ("transactions", "transactions", TransactionsMessageProcessor),
+]
+
+
+def load_messages(topic: str, path: Optional[str]) -> Sequence[bytes]:
+    if path is not None:
+        with open(path, "rb") as f:
+            return [line.strip() for line in f if line.strip()]
+    return [
+        json.dumps(example.load()).encode("utf-8")
+        for example in sentry_kafka_schemas.iter_examples(topic)
+    ]
+
+
+def _insert_messages(
+    processor: DatasetMessageProcessor, payloads: Sequence[bytes]
+) -> Sequence[bytes]:
+    metadata = KafkaMessageMetadata(0, 0, datetime.now())
+    return [
+        payload
+        for payload in payloads
+        if isinstance(
+            processor.process_message(json.loads(payload), metadata), InsertBatch
+        )
+    ]
+
+
+def _peak_kb_per_message(
+    processor: DatasetMessageProcessor, payloads: Sequence[bytes], metadata: Any
+) -> float:
+    peaks: List[int] = []
+    for payload in payloads:
+        message = json.loads(payload)
+        tracemalloc.start()
+        try:
+            processor.process_message(message, metadata)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024
+
+
+def _retained_kb_per_message(
+    processor: DatasetMessageProcessor,
+    payloads: Sequence[bytes],
+    metadata: Any,
+    batch_size: int,
+) -> float:
+    messages = [
+        json.loads(payload)
+        for payload in itertools.islice(itertools.cycle(payloads), batch_size)
+    ]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        batch = [processor.process_message(message, metadata) for message in messages]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del batch
+    return retained / batch_size / 1024
+
+
+@click.command()
+@click.option(
+    "--storage",
+    "storages",
+    multiple=True,
+    type=click.Choice([name for name, _, _ in PROCESSORS]),
+    help="Storages to benchmark, all of them by default.",
+)
+@click.option("--payloads", help="File with one message per line.")
+@click.option("--iterations", type=int, default=1000, help="Messages per round.")
+@click.option("--batch-size", type=int, default=1000)
+def main(
+    storages: Sequence[str],
+    payloads: Optional[str],
+    iterations: int,
+    batch_size: int,
+) -> None:
+    # The examples are as old as the schemas, the processors would drop
+    # them for being past retention.
+    settings.DISCARD_OLD_EVENTS = False
+    metadata = KafkaMessageMetadata(0, 0, datetime.now())
+
+    for name, topic, processor_cls in PROCESSORS:
+        if storages and name not in storages:
+            continue
+        processor = processor_cls()
+        messages = _insert_messages(processor, load_messages(topic, payloads))
+        if not messages:
+            click.echo(f"{name}: no insertable messages")
+            continue
+
+        decoded = itertools.cycle([json.loads(payload) for payload in messages])
+
+        def copy_message() -> None:
+            json.loads(json.dumps(next(decoded)))
+
+        def process() -> None:
+            # The processors modify the message, so each call gets a copy.
+            message = json.loads(json.dumps(next(decoded)))
+            processor.process_message(message, metadata)
+
+        copy = measure(f"{name} (copy only)", copy_message, iterations)
+        result = measure(f"{name} (copy + process)", process, iterations)
+        click.echo(copy.format())
+        click.echo(result.format())
+        click.echo(
+            f"{name:<48} process  {result.median_us - copy.median_us:10.3f} us/msg"
+            f"  peak {_peak_kb_per_message(processor, messages, metadata):8.2f} KiB/msg"
+            f"  retained {_retained_kb_per_message(processor, messages, metadata, batch_size):8.2f} KiB/msg"
+        )
+
+
+if __name__ == "__main__":
+    main()
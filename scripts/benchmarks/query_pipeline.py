@@ -0,0 +1,159 @@
+"""
+Replays recorded SnQL/MQL requests through the query pipeline without
+running them on ClickHouse and reports how long each stage takes and
+which query processors dominate the processing time.
+
+The execution stage is replaced by the dry run path, which only formats
+the SQL, so ClickHouse is not needed. Redis is, since processors read the
+runtime config.
+
+The input is a file with one recorded request per line::
+
+    {"dataset": "events", "body": {"query": "MATCH (events) ...", "tenant_ids": {...}}}
+    {"dataset": "generic_metrics", "mql": true, "body": {"query": "sum(...)", "mql_context": {...}}}
+
+Usage::
+
+    python -m scripts.benchmarks.query_pipeline requests.jsonl --iterations 20
+"""
+import json
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Callable, List, Mapping, MutableMapping, Sequence, TypeVar
+
+import click
+
+from snuba.datasets.factory import get_dataset
+from snuba.environment import setup_logging
+from snuba.pipeline.profiling import processor_profiling
+from snuba.pipeline.query_pipeline import QueryPipelineResult
+from snuba.pipeline.stages.query_execution import _dry_run_query_runner
+from snuba.pipeline.stages.query_processing import (
+    EntityProcessingStage,
+    StorageProcessingStage,
+)
+from snuba.query.query_settings import HTTPQuerySettings
+from snuba.request.schema import RequestSchema
+from snuba.request.validation import build_request, parse_mql_query, parse_snql_query
+from snuba.utils.metrics.timer import Timer
+
+T = TypeVar("T")
+
+STAGES = ["parse", "entity_processing", "storage_processing", "format"]
+
+
+class _Timings:
+    def __init__(self) -> None:
+        self.stages: MutableMapping[str, List[float]] = defaultdict(list)
+        self.processors: MutableMapping[str, List[float]] = defaultdict(list)
+        self.errors: MutableMapping[str, int] = defaultdict(int)
+
+    def time(self, stage: str, function: Callable[[], T]) -> T:
+        start = time.perf_counter()
+        result = function()
+        self.stages[stage].append((time.perf_counter() - start) * 1000)
+        return result
+
+
+def _replay(record: Mapping[str, Any], timings: _Timings) -> None:
+    is_mql = bool(record.get("mql", False))
+    dataset = get_dataset(record.get("dataset", "discover"))
+    body = {
+        key: value
+        for key, value in record["body"].items()
+        if key not in ("dry_run", "debug")
+    }
+    referrer = body.get("tenant_ids", {}).get("referrer", "<unknown>")
+
+    schema = RequestSchema.build(HTTPQuerySettings, is_mql)
+    request = timings.time(
+        "parse",
+        lambda: build_request(
+            body,
+            parse_mql_query if is_mql else parse_snql_query,
+            HTTPQuerySettings,
+            schema,
+            dataset,
+            Timer("harness"),
+            referrer,
+        ),
+    )
+
+    with processor_profiling(referrer, force=True) as profiler:
+        entity_result = timings.time(
+            "entity_processing",
+            lambda: EntityProcessingStage().execute(
+                QueryPipelineResult(
+                    data=request,
+                    query_settings=request.query_settings,
+                    timer=Timer("harness"),
+                    error=None,
+                )
+            ),
+        )
+        storage_result = timings.time(
+            "storage_processing",
+            lambda: StorageProcessingStage().execute(entity_result),
+        )
+    if storage_result.error is not None:
+        raise storage_result.error
+    assert storage_result.data is not None
+    query = storage_result.data
+    timings.time("format", lambda: _dry_run_query_runner(query, "harness"))
+
+    assert profiler is not None
+    for name, duration in profiler.timings_ms.items():
+        timings.processors[name].append(duration)
+
+
+def _percentiles(values: Sequence[float]) -> str:
+    if len(values) > 1:
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+        p50, p90, p99 = cuts[49], cuts[89], cuts[98]
+    else:
+        p50 = p90 = p99 = values[0]
+    return (
+        f"p50 {p50:9.3f}ms  p90 {p90:9.3f}ms  p99 {p99:9.3f}ms  "
+        f"max {max(values):9.3f}ms  (n={len(values)})"
+    )
+
+
+@click.command()
+@click.argument("requests_file", type=click.File("r"))
+@click.option("--iterations", type=int, default=10, help="Replays per request.")
+@click.option("--top", type=int, default=15, help="Processors to report.")
+def main(requests_file: Any, iterations: int, top: int) -> None:
+    setup_logging("WARNING")
+    records = [json.loads(line) for line in requests_file if line.strip()]
+    timings = _Timings()
+
+    for _ in range(iterations):
+        for record in records:
+            try:
+                _replay(record, timings)
+            except Exception as e:
+                timings.errors[type(e).__name__] += 1
+
+    click.echo(f"{len(records)} requests x {iterations} iterations")
+    for stage in STAGES:
+        if timings.stages[stage]:
+            click.echo(f"{stage:<24} {_percentiles(timings.stages[stage])}")
+
+    click.echo("")
+    click.echo("Processors by total time:")
+    by_total = sorted(
+        timings.processors.items(), key=lambda item: sum(item[1]), reverse=True
+    )
+    for name, durations in by_total[:top]:
+        click.echo(
+            f"{name:<64} total {sum(durations):10.3f}ms  {_percentiles(durations)}"
+        )
+
+    if timings.errors:
+        click.echo("")
+        click.echo(f"Failed replays: {dict(timings.errors)}")
+
+
+if __name__ == "__main__":
+    main()
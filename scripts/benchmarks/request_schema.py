@@ -0,0 +1,125 @@
+"""
+Measures the time spent validating the body of a /snql or /mql request
+against its request schema.
+
+Each body is validated with ``validate_jsonschema``, the jsonschema
+validation every request went through before the validators were compiled,
+and with the validator ``RequestSchema`` compiles once per kind of request.
+Both build the error message of invalid bodies. Valid bodies are the common
+case, the invalid body shows the cost of a rejected request, which is
+validated again with jsonschema to get the same error message.
+
+Usage::
+
+    python -m scripts.benchmarks.request_schema --iterations 20000
+"""
+from typing import Any, MutableMapping, Sequence, Tuple
+
+import click
+import jsonschema
+from scripts.benchmarks.utils import measure
+
+from snuba.query.query_settings import HTTPQuerySettings
+from snuba.query.schema import MQL_QUERY_SCHEMA, SNQL_QUERY_SCHEMA
+from snuba.request.exceptions import JsonSchemaValidationException
+from snuba.request.schema import (
+    ATTRIBUTION_INFO_SCHEMA,
+    SETTINGS_SCHEMAS,
+    RequestSchema,
+)
+from snuba.schemas import Schema, validate_jsonschema
+
+SNQL_BODY: MutableMapping[str, Any] = {
+    "query": (
+        "MATCH (events) SELECT count() AS count BY project_id "
+        "WHERE project_id IN tuple(1, 2, 3) AND timestamp >= toDateTime('2024-01-01') "
+        "AND timestamp < toDateTime('2024-01-02')"
+    ),
+    "dataset": "events",
+    "tenant_ids": {"organization_id": 1, "referrer": "api.organization-events"},
+    "app_id": "sentry",
+    "parent_api": "/api/0/organizations/{organization_slug}/events/",
+}
+
+MQL_BODY: MutableMapping[str, Any] = {
+    "query": "sum(d:transactions/duration@millisecond){status_code:200} by transaction",
+    "mql_context": {
+        "entity": "generic_metrics_distributions",
+        "start": "2024-01-01T00:00:00+00:00",
+        "end": "2024-01-02T00:00:00+00:00",
+        "rollup": {"granularity": 60, "interval": 60, "with_totals": "False"},
+        "scope": {
+            "org_ids": [1],
+            "project_ids": [1, 2, 3],
+            "use_case_id": "transactions",
+        },
+        "indexer_mappings": {
+            "d:transactions/duration@millisecond": 9223372036854775909
+        },
+        "limit": None,
+        "offset": None,
+    },
+    "dataset": "generic_metrics",
+    "tenant_ids": {"organization_id": 1, "referrer": "api.ddm"},
+}
+
+INVALID_BODY: MutableMapping[str, Any] = {**SNQL_BODY, "turbo": "yes"}
+
+
+def composite_schema(query_schema: Schema) -> MutableMapping[str, Any]:
+    properties: MutableMapping[str, Any] = {}
+    schema: Any
+    for schema in (
+        query_schema,
+        SETTINGS_SCHEMAS[HTTPQuerySettings],
+        ATTRIBUTION_INFO_SCHEMA,
+    ):
+        properties.update(schema["properties"])
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": set(),
+        "definitions": {},
+        "additionalProperties": False,
+    }
+
+
+@click.command()
+@click.option("--iterations", type=int, default=20000)
+def main(iterations: int) -> None:
+    cases: Sequence[Tuple[str, Schema, bool, MutableMapping[str, Any]]] = [
+        ("snql", SNQL_QUERY_SCHEMA, False, SNQL_BODY),
+        ("mql", MQL_QUERY_SCHEMA, True, MQL_BODY),
+        ("invalid snql", SNQL_QUERY_SCHEMA, False, INVALID_BODY),
+    ]
+    for name, query_schema, is_mql, body in cases:
+        schema = composite_schema(query_schema)
+        request_schema = RequestSchema.build(HTTPQuerySettings, is_mql=is_mql)
+
+        def jsonschema_validate(
+            body: MutableMapping[str, Any] = body,
+            schema: MutableMapping[str, Any] = schema,
+        ) -> None:
+            try:
+                validate_jsonschema(body, schema)
+            except jsonschema.ValidationError as error:
+                str(error)
+
+        def compiled_validate(
+            body: MutableMapping[str, Any] = body,
+            request_schema: RequestSchema = request_schema,
+        ) -> None:
+            try:
+                request_schema.validate(body)
+            except JsonSchemaValidationException:
+                pass
+
+        baseline = measure(f"{name}: jsonschema", jsonschema_validate, iterations)
+        compiled = measure(f"{name}: compiled", compiled_validate, iterations)
+        click.echo(baseline.format())
+        click.echo(compiled.format())
+        click.echo(f"{name}: {baseline.median_us / compiled.median_us:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
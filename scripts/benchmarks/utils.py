@@ -0,0 +1,53 @@
+import gc
+import statistics
+import time
+from typing import Callable, List, NamedTuple
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    per_call_us: List[float]
+
+    @property
+    def median_us(self) -> float:
+        return statistics.median(self.per_call_us)
+
+    @property
+    def best_us(self) -> float:
+        return min(self.per_call_us)
+
+    def format(self) -> str:
+        return (
+            f"{self.name:<48} median {self.median_us:10.3f} us/op"
+            f"  best {self.best_us:10.3f} us/op"
+            f"  ({self.iterations} ops x {len(self.per_call_us)} rounds)"
+        )
+
+
+def measure(
+    name: str,
+    function: Callable[[], None],
+    iterations: int,
+    rounds: int = 5,
+) -> BenchmarkResult:
+    """
+    Run ``function`` ``iterations`` times per round and return the per call
+    wall time of each round. The garbage collector is disabled while a round
+    runs so the rounds are comparable with each other.
+    """
+    function()  # warm up caches before timing anything
+    per_call: List[float] = []
+    for _ in range(rounds):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                function()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        per_call.append(elapsed / iterations * 1_000_000)
+
+    return BenchmarkResult(name, iterations, per_call)
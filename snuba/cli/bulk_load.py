@@ -6,13 +6,28 @@ import click
 import progressbar
 
 from snuba import environment, settings
-from snuba.clickhouse.http import JSONRowEncoder
+from snuba.clickhouse.http import JSONRow, JSONRowEncoder
 from snuba.datasets.storages.factory import get_cdc_storage, get_cdc_storage_keys
 from snuba.datasets.storages.storage_key import StorageKey
 from snuba.environment import setup_logging, setup_sentry
 from snuba.snapshots.loaders import ProgressCallback
 from snuba.snapshots.postgres_snapshot import PostgresSnapshot
-from snuba.writer import BufferedWriterWrapper
+from snuba.writer import BufferedWriterWrapper, WriterTableRow
+
+
+def _build_writer(
+    storage_key: StorageKey, dest_table: Optional[str]
+) -> BufferedWriterWrapper[JSONRow, WriterTableRow]:
+    table_writer = get_cdc_storage(storage_key).get_table_writer()
+    return BufferedWriterWrapper(
+        table_writer.get_batch_writer(
+            environment.metrics,
+            table_name=dest_table,
+            chunk_size=settings.BULK_CLICKHOUSE_BUFFER,
+        ),
+        settings.BULK_CLICKHOUSE_BUFFER,
+        JSONRowEncoder(),
+    )
 
 
 @click.command()
@@ -48,6 +63,18 @@ from snuba.writer import BufferedWriterWrapper
     is_flag=True,
     help="Shows a progress bar.",
 )
+@click.option(
+    "--processes",
+    default=1,
+    type=int,
+    help="Number of processes loading chunks of the table in parallel, each with its own ClickHouse writer.",
+)
+@click.option(
+    "--chunk-size",
+    default=settings.BULK_PARALLEL_LOAD_CHUNK,
+    type=int,
+    help="Size in bytes of the table chunks loaded by each process.",
+)
 @click.option("--log-level", help="Logging level to use.")
 def bulk_load(
     *,
@@ -57,6 +84,8 @@ def bulk_load(
     ignore_existing_data: bool,
     pre_processed: bool,
     show_progress: bool,
+    processes: int,
+    chunk_size: int,
     log_level: Optional[str] = None,
 ) -> None:
     setup_logging(log_level)
@@ -107,16 +136,17 @@ def bulk_load(
         loader.load_preprocessed(
             writer, ignore_existing_data, progress_callback=progress_func
         )
-    else:
-        buffer_writer = BufferedWriterWrapper(
-            table_writer.get_batch_writer(
-                environment.metrics,
-                table_name=dest_table,
-                chunk_size=settings.BULK_CLICKHOUSE_BUFFER,
-            ),
-            settings.BULK_CLICKHOUSE_BUFFER,
-            JSONRowEncoder(),
+    elif processes > 1:
+        loader.load_parallel(
+            partial(_build_writer, StorageKey(storage_name), dest_table),
+            ignore_existing_data,
+            processes,
+            chunk_size,
+            progress_callback=progress_func,
         )
+    else:
         loader.load(
-            buffer_writer, ignore_existing_data, progress_callback=progress_func
+            _build_writer(StorageKey(storage_name), dest_table),
+            ignore_existing_data,
+            progress_callback=progress_func,
         )
@@ -0,0 +1,42 @@
+import os
+from typing import Optional, Union
+
+import click
+
+
+@click.command()
+@click.option("--bind", help="Address to listen on.")
+@click.option("--log-level", help="Logging level to use.")
+def rpc_api(*, bind: Optional[str], log_level: Optional[str]) -> None:
+    """
+    Serves the RPC endpoints from an asyncio event loop instead of uWSGI
+    workers. The endpoints run on a pool of RPC_ASYNC_THREADS threads.
+    Needs uvicorn.
+    """
+    from snuba import settings
+
+    port: Union[int, str]
+    if bind:
+        if ":" in bind:
+            host, port = bind.split(":", 1)
+            port = int(port)
+        else:
+            raise click.ClickException("bind can only be in the format <host>:<port>")
+    else:
+        host, port = settings.HOST, settings.PORT
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise click.ClickException("uvicorn is required to serve the RPC endpoints")
+
+    if log_level:
+        os.environ["LOG_LEVEL"] = log_level
+
+    uvicorn.run(
+        "snuba.web.asgi:application",
+        host=host,
+        port=port,
+        log_level=(log_level or "info").lower(),
+        lifespan="on",
+    )
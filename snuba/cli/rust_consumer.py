@@ -178,6 +178,12 @@ from snuba.datasets.storages.factory import get_writable_storage_keys
     default=None,
     help="Optional timeout for batch writer client connecting and sending request to Clickhouse",
 )
+@click.option(
+    "--pre-aggregate",
+    is_flag=True,
+    default=False,
+    help="Combine the rows with the same key within a batch before inserting them. Only has an effect on the generic metrics counters, sets and distributions storages.",
+)
 def rust_consumer(
     *,
     storage_names: Sequence[str],
@@ -208,7 +214,8 @@ def rust_consumer(
     stop_at_timestamp: Optional[int],
     batch_write_timeout_ms: Optional[int],
     mutations_mode: bool,
-    max_dlq_buffer_length: Optional[int]
+    max_dlq_buffer_length: Optional[int],
+    pre_aggregate: bool,
 ) -> None:
     """
     Experimental alternative to `snuba consumer`
@@ -261,6 +268,7 @@ def rust_consumer(
         stop_at_timestamp,
         batch_write_timeout_ms,
         max_dlq_buffer_length,
+        pre_aggregate,
     )
 
     sys.exit(exitcode)
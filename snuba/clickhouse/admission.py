@@ -0,0 +1,266 @@
+"""
+Local admission control of the queries a process sends to a cluster.
+
+Every reader has an admission controller bounding the number of queries it
+runs concurrently on its cluster. Past the limit queries wait in a bounded
+queue per priority and are admitted by priority as running queries finish.
+Interactive queries (from the Sentry API) go before the default ones, which
+go before the batch ones. Queries are shed, failing with
+``AdmissionRejected``, instead of waiting when their queue is full, when
+they waited too long, or when the deadline of their request would pass
+before they could complete.
+
+The limit adapts to the latency of the cluster (AIMD): it grows by one
+query per limit's worth of queries that complete no slower than
+``admission_latency_tolerance`` times the long term latency, and is
+multiplied by ``admission_backoff_ratio``, at most once per recent latency,
+when they get slower or when ClickHouse reports being overloaded. It stays
+between ``ADMISSION_CONTROL_MIN_LIMIT`` and the size of the connection pool.
+
+Admission control is opt-in and controlled by runtime config:
+
+* ``admission_control_enabled`` set to 1 enables it for every cluster,
+  ``admission_control_enabled:<host>:<port>`` for one cluster.
+* ``admission_priority:referrer:<referrer>`` sets the priority of the
+  queries of a referrer: 0 (interactive), 1 (default) or 2 (batch).
+* ``admission_max_queue_size`` (default 64) and
+  ``admission_max_queue_wait_ms`` (default 1000) bound each queue, they can
+  be overridden per priority with a ``:<priority>`` suffix.
+* ``admission_latency_tolerance`` (default 2.0) and
+  ``admission_backoff_ratio`` (default 0.9) tune the limit.
+"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from threading import Event, Lock
+from typing import Deque, Iterator, Mapping, Optional
+
+from clickhouse_driver.errors import ErrorCodes
+
+from snuba import environment, settings, state
+from snuba.attribution.attribution_info import AttributionInfo
+from snuba.clickhouse.errors import ClickhouseError
+from snuba.state.rate_limit import RateLimitExceeded
+from snuba.utils.cancellation import Cancellation
+from snuba.utils.metrics.wrapper import MetricsWrapper
+
+metrics = MetricsWrapper(environment.metrics, "clickhouse.admission")
+
+# Weights of the latest sample in the moving averages of the latency.
+RECENT_LATENCY_WEIGHT = 0.2
+BASELINE_LATENCY_WEIGHT = 0.01
+# How often a waiting query checks whether its request got cancelled.
+CANCELLATION_POLL_SEC = 0.05
+
+# Errors meaning ClickHouse is overloaded, rather than the query is wrong.
+OVERLOAD_ERROR_CODES = {
+    ErrorCodes.TOO_MANY_SIMULTANEOUS_QUERIES,
+    ErrorCodes.TIMEOUT_EXCEEDED,
+    ErrorCodes.SOCKET_TIMEOUT,
+}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    DEFAULT = 1
+    BATCH = 2
+
+
+class AdmissionRejected(RateLimitExceeded):
+    pass
+
+
+def get_priority(attribution_info: AttributionInfo) -> Priority:
+    referrer = attribution_info.referrer
+    override = state.get_int_config(f"admission_priority:referrer:{referrer}")
+    if override is not None and override in {p.value for p in Priority}:
+        return Priority(override)
+    if referrer.startswith(tuple(settings.ADMISSION_CONTROL_BATCH_REFERRER_PREFIXES)):
+        return Priority.BATCH
+    if (attribution_info.parent_api or "").startswith("/api/"):
+        return Priority.INTERACTIVE
+    return Priority.DEFAULT
+
+
+def is_admission_control_enabled(host: str, port: int) -> bool:
+    return bool(
+        state.get_int_config("admission_control_enabled", 0)
+        or state.get_int_config(f"admission_control_enabled:{host}:{port}", 0)
+    )
+
+
+def _get_queue_config(name: str, priority: Priority, default: int) -> int:
+    value = state.get_int_config(
+        f"{name}:{priority.name.lower()}", state.get_int_config(name, default)
+    )
+    assert value is not None
+    return value
+
+
+@dataclass
+class _Waiter:
+    priority: Priority
+    admitted: Event = field(default_factory=Event)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+    ) -> None:
+        self.__tags = {"cluster": name}
+        self.__min_limit = min_limit
+        self.__max_limit = max(max_limit, min_limit)
+        self.__limit = float(min(max(initial_limit, min_limit), self.__max_limit))
+        self.__in_flight = 0
+        self.__queues: Mapping[Priority, Deque[_Waiter]] = {
+            priority: deque() for priority in Priority
+        }
+        self.__recent_latency: Optional[float] = None
+        self.__baseline_latency: Optional[float] = None
+        self.__last_decrease = 0.0
+        self.__lock = Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self.__limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    @contextmanager
+    def admit(
+        self,
+        priority: Priority,
+        cancellation: Optional[Cancellation] = None,
+    ) -> Iterator[None]:
+        """
+        Waits for the query to be admitted, or raises ``AdmissionRejected``,
+        then runs the block and feeds its latency to the limit.
+        """
+        tags = {**self.__tags, "priority": priority.name.lower()}
+        queued_at = time.time()
+        self.__acquire(priority, cancellation, tags)
+        started = time.time()
+        metrics.timing("queue_wait_ms", (started - queued_at) * 1000, tags=tags)
+
+        latency: Optional[float] = None
+        overloaded = False
+        try:
+            yield
+            latency = time.time() - started
+        except ClickhouseError as e:
+            overloaded = e.code in OVERLOAD_ERROR_CODES
+            raise
+        finally:
+            self.__release(latency, overloaded)
+
+    def __acquire(
+        self,
+        priority: Priority,
+        cancellation: Optional[Cancellation],
+        tags: Mapping[str, str],
+    ) -> None:
+        queue = self.__queues[priority]
+        remaining = cancellation.remaining() if cancellation is not None else None
+        max_queue_size = _get_queue_config("admission_max_queue_size", priority, 64)
+        max_wait = _get_queue_config("admission_max_queue_wait_ms", priority, 1000)
+        with self.__lock:
+            if self.__in_flight < self.limit and not any(self.__queues.values()):
+                self.__in_flight += 1
+                return
+            if len(queue) >= max_queue_size:
+                self.__reject("queue_full", tags)
+            if (
+                remaining is not None
+                and self.__recent_latency is not None
+                and remaining < self.__recent_latency
+            ):
+                # It would not complete before the caller stops waiting.
+                self.__reject("deadline", tags)
+            waiter = _Waiter(priority)
+            queue.append(waiter)
+
+        wait_until = time.time() + max_wait / 1000.0
+        if remaining is not None:
+            wait_until = min(wait_until, time.time() + remaining)
+        while not waiter.admitted.wait(
+            max(min(wait_until - time.time(), CANCELLATION_POLL_SEC), 0.0)
+        ):
+            cancelled = cancellation is not None and cancellation.reason is not None
+            if cancelled or time.time() >= wait_until:
+                break
+
+        with self.__lock:
+            if waiter.admitted.is_set():
+                return
+            queue.remove(waiter)
+        if cancellation is not None:
+            cancellation.raise_if_cancelled()
+        self.__reject("queue_timeout", tags)
+
+    def __reject(self, reason: str, tags: Mapping[str, str]) -> None:
+        metrics.increment("rejected", tags={**tags, "reason": reason})
+        raise AdmissionRejected(
+            f"query rejected by admission control: {reason}",
+            scope="admission_control",
+            name=reason,
+        )
+
+    def __release(self, latency: Optional[float], overloaded: bool) -> None:
+        tolerance = state.get_float_config("admission_latency_tolerance", 2.0)
+        ratio = state.get_float_config("admission_backoff_ratio", 0.9)
+        assert tolerance is not None and ratio is not None
+        with self.__lock:
+            self.__in_flight -= 1
+            if latency is not None:
+                self.__record_latency(latency)
+            if overloaded or self.__is_slow(tolerance):
+                self.__decrease(ratio)
+            elif latency is not None:
+                self.__limit = min(self.__limit + 1 / self.__limit, self.__max_limit)
+            self.__dispatch()
+            limit, in_flight = self.limit, self.__in_flight
+        metrics.gauge("limit", limit, tags=self.__tags)
+        metrics.gauge("in_flight", in_flight, tags=self.__tags)
+
+    def __record_latency(self, latency: float) -> None:
+        if self.__recent_latency is None or self.__baseline_latency is None:
+            self.__recent_latency = self.__baseline_latency = latency
+            return
+        self.__recent_latency += RECENT_LATENCY_WEIGHT * (
+            latency - self.__recent_latency
+        )
+        self.__baseline_latency += BASELINE_LATENCY_WEIGHT * (
+            latency - self.__baseline_latency
+        )
+
+    def __is_slow(self, tolerance: float) -> bool:
+        if self.__recent_latency is None or self.__baseline_latency is None:
+            return False
+        return self.__recent_latency > self.__baseline_latency * tolerance
+
+    def __decrease(self, ratio: float) -> None:
+        # The queries running when the limit was decreased complete slowly
+        # too, they must not decrease it again.
+        now = time.time()
+        if now - self.__last_decrease < (self.__recent_latency or 0.0):
+            return
+        self.__limit = max(self.__limit * ratio, float(self.__min_limit))
+        self.__last_decrease = now
+        metrics.increment("limit_decreased", tags=self.__tags)
+
+    def __dispatch(self) -> None:
+        for priority in Priority:
+            queue = self.__queues[priority]
+            while queue and self.__in_flight < self.limit:
+                self.__in_flight += 1
+                queue.popleft().admitted.set()
@@ -0,0 +1,301 @@
+"""
+Speculative (hedged) reads.
+
+A hedged read sends a query to the usual query node and, if no result has
+arrived after a delay derived from the recent latency distribution of
+similar queries, sends a duplicate of the query to another replica. The
+first successful result wins and the other query is cancelled with
+``KILL QUERY``. This trades a bounded amount of extra load for a shorter
+tail latency when one replica is slow or overloaded.
+
+Hedging is opt-in and entirely controlled by runtime config:
+
+* ``hedged_reads:referrer:<referrer>`` / ``hedged_reads:dataset:<dataset>``
+  set to 1 enables hedging for the referrer/dataset.
+* ``hedge_hosts:<host>:<port>`` is a comma separated list of ``host:port``
+  replicas that can serve the queries normally sent to ``<host>:<port>``
+  (same format as ``fallback_hosts:<host>:<port>``).
+* ``hedged_reads_percentile`` (default 0.95) is the percentile of the recent
+  latencies of the referrer after which the hedge is sent, clamped between
+  ``hedged_reads_min_delay_ms`` and ``hedged_reads_max_delay_ms``. Until
+  enough samples are recorded ``hedged_reads_max_delay_ms`` is used.
+* ``hedged_reads_budget_ratio`` (default 0.05) caps the number of hedges to
+  that fraction of the hedge-eligible queries.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Deque, MutableMapping, Optional, Tuple, TypeVar
+
+from snuba import environment, settings, state
+from snuba.clickhouse.native import ClickhousePool, ClickhouseResult, kill_query
+from snuba.utils.metrics.wrapper import MetricsWrapper
+
+logger = logging.getLogger("snuba.clickhouse.hedging")
+metrics = MetricsWrapper(environment.metrics, "clickhouse.hedging")
+
+# Number of latency samples kept per hedge key.
+LATENCY_WINDOW_SIZE = 500
+# Below this number of samples the percentile is not considered reliable.
+MIN_LATENCY_SAMPLES = 20
+# The primary query, the hedge and the kill of the slower one.
+THREADS_PER_HEDGED_READ = 3
+# How many times, and how often, the losing query is killed until it returns.
+KILL_ATTEMPTS = 5
+KILL_RETRY_INTERVAL_SEC = 1.0
+
+T = TypeVar("T")
+
+ExecuteFunc = Callable[[ClickhousePool, Optional[str]], ClickhouseResult]
+
+
+def is_hedging_enabled(referrer: str, dataset: str) -> bool:
+    return bool(
+        state.get_int_config(f"hedged_reads:referrer:{referrer}", 0)
+        or state.get_int_config(f"hedged_reads:dataset:{dataset}", 0)
+    )
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent query latencies per key and computes percentiles
+    over them.
+    """
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE) -> None:
+        self.__window_size = window_size
+        self.__samples: MutableMapping[str, Deque[float]] = {}
+        self.__lock = Lock()
+
+    def record(self, key: str, latency_sec: float) -> None:
+        with self.__lock:
+            samples = self.__samples.get(key)
+            if samples is None:
+                samples = self.__samples[key] = deque(maxlen=self.__window_size)
+            samples.append(latency_sec)
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        with self.__lock:
+            samples = self.__samples.get(key)
+            if samples is None or len(samples) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(samples)
+
+        index = min(int(len(ordered) * percentile), len(ordered) - 1)
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    Token bucket that caps hedges to a fraction of the eligible queries.
+    Every eligible query adds ``ratio`` tokens (up to ``burst``) and every
+    hedge spends one.
+    """
+
+    def __init__(self, burst: float = 10.0) -> None:
+        self.__burst = burst
+        self.__tokens = burst
+        self.__lock = Lock()
+
+    def deposit(self, ratio: float) -> None:
+        with self.__lock:
+            self.__tokens = min(self.__tokens + ratio, self.__burst)
+
+    def try_spend(self) -> bool:
+        with self.__lock:
+            if self.__tokens >= 1.0:
+                self.__tokens -= 1.0
+                return True
+            return False
+
+
+class HedgedReadExecutor:
+    def __init__(self, max_concurrent_hedges: int) -> None:
+        # A hedged read runs its primary query, its hedge and the kill of
+        # the slower one on the executor, the number of hedged reads in
+        # flight is bounded so that they always find a thread. Reads beyond
+        # that run unhedged rather than queueing behind the others.
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_hedges * THREADS_PER_HEDGED_READ,
+            thread_name_prefix="hedged-reads",
+        )
+        self.__slots = BoundedSemaphore(max_concurrent_hedges)
+        self.__latencies = LatencyTracker()
+        self.__budget = HedgeBudget()
+        self.__pools: MutableMapping[Tuple[str, int, str, str], ClickhousePool] = {}
+        self.__pools_lock = Lock()
+
+    def __get_hedge_pool(self, primary: ClickhousePool) -> Optional[ClickhousePool]:
+        hosts = state.get_str_config(f"hedge_hosts:{primary.host}:{primary.port}")
+        if not hosts:
+            return None
+
+        host, port = random.choice(hosts.split(",")).strip().split(":")
+        key = (host, int(port), primary.user, primary.database)
+        with self.__pools_lock:
+            pool = self.__pools.get(key)
+            if pool is None:
+                pool = self.__pools[key] = ClickhousePool(
+                    host,
+                    int(port),
+                    primary.user,
+                    primary.password,
+                    primary.database,
+                    send_receive_timeout=primary.send_receive_timeout,
+                    client_settings=primary.client_settings,
+                )
+        return pool
+
+    def __get_delay(self, hedge_key: str) -> float:
+        percentile = state.get_float_config("hedged_reads_percentile", 0.95)
+        min_delay_ms = state.get_int_config("hedged_reads_min_delay_ms", 50)
+        max_delay_ms = state.get_int_config("hedged_reads_max_delay_ms", 5000)
+        assert percentile is not None
+        assert min_delay_ms is not None and max_delay_ms is not None
+        min_delay, max_delay = min_delay_ms / 1000.0, max_delay_ms / 1000.0
+        observed = self.__latencies.percentile(hedge_key, percentile)
+        if observed is None:
+            return max_delay
+        return min(max(observed, min_delay), max_delay)
+
+    def execute(
+        self,
+        hedge_key: str,
+        pool: ClickhousePool,
+        execute: ExecuteFunc,
+        query_id: Optional[str],
+    ) -> ClickhouseResult:
+        """
+        Run ``execute`` against ``pool`` with ``query_id`` and hedge it on
+        another replica if it is too slow. ``execute`` must run the query on
+        the pool it is given with the query id it is given.
+
+        The queries run on the executor while the calling thread waits for
+        the first one that succeeds, so a replica that does not answer
+        anymore does not hold the caller once the other one did. The other
+        query is killed in the background.
+        """
+        tags = {"hedge_key": hedge_key}
+        replica_pool = self.__get_hedge_pool(pool)
+        if replica_pool is None:
+            metrics.increment("skipped", tags={**tags, "reason": "no_hedge_hosts"})
+            return self.__execute_tracked(hedge_key, pool, execute, query_id)
+        hedge_pool: ClickhousePool = replica_pool
+
+        if not self.__slots.acquire(blocking=False):
+            metrics.increment("skipped", tags={**tags, "reason": "saturated"})
+            return self.__execute_tracked(hedge_key, pool, execute, query_id)
+
+        ratio = state.get_float_config("hedged_reads_budget_ratio", 0.05)
+        assert ratio is not None
+        self.__budget.deposit(ratio)
+
+        primary_query_id = query_id or uuid.uuid4().hex
+        hedge_query_id = f"{primary_query_id}-hedge"
+
+        # The slot is held by the calling thread and every task submitted
+        # for this read, and released once all of them are done.
+        holders = [1]
+        holders_lock = Lock()
+
+        def release() -> None:
+            with holders_lock:
+                holders[0] -= 1
+                done = holders[0] == 0
+            if done:
+                self.__slots.release()
+
+        def submit(fn: Callable[..., T], *args: Any) -> Future[T]:
+            with holders_lock:
+                holders[0] += 1
+            future = self.__executor.submit(fn, *args)
+            future.add_done_callback(lambda _: release())
+            return future
+
+        try:
+            primary = submit(
+                self.__execute_tracked, hedge_key, pool, execute, primary_query_id
+            )
+            done, _ = wait([primary], timeout=self.__get_delay(hedge_key))
+            if done:
+                return primary.result()
+            if not self.__budget.try_spend():
+                metrics.increment("skipped", tags={**tags, "reason": "budget"})
+                return primary.result()
+
+            metrics.increment("issued", tags=tags)
+            hedge = submit(
+                self.__execute_tracked, hedge_key, hedge_pool, execute, hedge_query_id
+            )
+            queries = {
+                primary: ("primary", pool, primary_query_id),
+                hedge: ("hedge", hedge_pool, hedge_query_id),
+            }
+            winner: Optional[Future[ClickhouseResult]] = None
+            pending = set(queries)
+            while winner is None and pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winner = next((f for f in done if f.exception() is None), None)
+
+            if winner is None:
+                # Both failed, the error of the primary query is the one the
+                # caller would have had without hedging.
+                metrics.increment("failed", tags=tags)
+                return primary.result()
+
+            for loser in pending:
+                _, loser_pool, loser_query_id = queries[loser]
+                submit(self.__kill, loser_pool, loser_query_id, loser)
+            metrics.increment("won", tags={**tags, "winner": queries[winner][0]})
+            return winner.result()
+        finally:
+            release()
+
+    def __kill(
+        self,
+        pool: ClickhousePool,
+        query_id: str,
+        future: Future[ClickhouseResult],
+    ) -> None:
+        # The kill can reach the replica before the query it cancels, it is
+        # sent again until the query returns.
+        for _ in range(KILL_ATTEMPTS):
+            kill_query(pool, query_id)
+            done, _ = wait([future], timeout=KILL_RETRY_INTERVAL_SEC)
+            if done:
+                return
+        logger.warning("Hedged read %s still running after being killed", query_id)
+
+    def __execute_tracked(
+        self,
+        hedge_key: str,
+        pool: ClickhousePool,
+        execute: ExecuteFunc,
+        query_id: Optional[str],
+    ) -> ClickhouseResult:
+        # Failed and killed queries are recorded as well, leaving out the
+        # slow ones would lower the percentile the hedges are sent after.
+        start = time.time()
+        try:
+            return execute(pool, query_id)
+        finally:
+            self.__latencies.record(hedge_key, time.time() - start)
+
+
+_executor: Optional[HedgedReadExecutor] = None
+_executor_lock = Lock()
+
+
+def get_hedged_read_executor() -> HedgedReadExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = HedgedReadExecutor(settings.HEDGED_READS_MAX_CONCURRENCY)
+    return _executor
@@ -2,17 +2,23 @@ from __future__ import annotations
 
 import logging
 import re
-from concurrent.futures import ThreadPoolExecutor
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from queue import Queue, SimpleQueue
+from threading import BoundedSemaphore, Lock
 from typing import (
     Any,
+    Callable,
     Iterable,
     Iterator,
     List,
     Mapping,
+    MutableMapping,
     Optional,
     Sequence,
+    Set,
+    TypeVar,
     Union,
     cast,
 )
@@ -35,6 +41,16 @@ from snuba.writer import BatchWriter, WriterTableRow
 
 logger = logging.getLogger(__name__)
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 
 CLICKHOUSE_ERROR_RE = re.compile(
     r"^Code: (?P<code>\d+), e.displayText\(\) = (?P<type>(?:\w+)::(?:\w+)): (?P<message>.+?(?: \(at row (?P<row>\d+)\))?)$",
@@ -49,6 +65,86 @@ CLICKHOUSE_ERROR_RE_V2 = re.compile(
 JSONRow = bytes  # a single row in JSONEachRow format
 
 
+class _LZ4FrameCompressor:
+    """
+    Adapts ``lz4.frame.LZ4FrameCompressor`` to the ``compress`` and
+    ``flush`` interface of the zlib compressors: the frame header goes out
+    with the first output and the frame end with ``flush``.
+    """
+
+    def __init__(self) -> None:
+        self.__compressor = lz4.frame.LZ4FrameCompressor()
+        self.__header: bytes = self.__compressor.begin()
+
+    def compress(self, data: bytes) -> bytes:
+        header, self.__header = self.__header, b""
+        return header + cast(bytes, self.__compressor.compress(data))
+
+    def flush(self) -> bytes:
+        header, self.__header = self.__header, b""
+        return header + cast(bytes, self.__compressor.flush())
+
+
+# Streaming compressors (with ``compress`` and ``flush``) for the request
+# body encodings ClickHouse decodes from the ``Content-Encoding`` header.
+# zstd and lz4 are only available with the zstandard and lz4 packages.
+_COMPRESSORS: MutableMapping[str, Callable[[], Any]] = {
+    "gzip": lambda: zlib.compressobj(wbits=zlib.MAX_WBITS | 16),
+    "deflate": lambda: zlib.compressobj(wbits=zlib.MAX_WBITS),
+}
+if zstandard is not None:
+    _COMPRESSORS["zstd"] = lambda: zstandard.ZstdCompressor().compressobj()
+if lz4 is not None:
+    _COMPRESSORS["lz4"] = _LZ4FrameCompressor
+
+INSERT_COMPRESSIONS = tuple(_COMPRESSORS)
+
+_rejected_compressions: Set[str] = set()
+
+
+def get_insert_compression() -> Optional[str]:
+    """
+    Returns the compression of the insert request bodies from the runtime
+    config or the settings. A compression that is not available here is
+    reported the first time it is seen and the inserts are not compressed.
+    """
+    compression = state.get_str_config(
+        "http_insert_compression", settings.CLICKHOUSE_HTTP_INSERT_COMPRESSION
+    )
+    if not compression:
+        return None
+    if compression not in _COMPRESSORS:
+        if compression not in _rejected_compressions:
+            _rejected_compressions.add(compression)
+            logger.error(
+                "Unsupported insert compression %r, inserts are not compressed",
+                compression,
+            )
+        return None
+    return compression
+
+
+def _chunk_by_size(
+    values: Iterable[bytes], chunk_bytes: int, max_values: int
+) -> Iterator[bytes]:
+    """
+    Joins values into chunks of at least `chunk_bytes` bytes, or of
+    `max_values` values if the values are small.
+    """
+    chunk: List[bytes] = []
+    size = 0
+    for value in values:
+        chunk.append(value)
+        size += len(value)
+        if size >= chunk_bytes or len(chunk) >= max_values:
+            yield b"".join(chunk)
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield b"".join(chunk)
+
+
 class JSONRowEncoder(Encoder[bytes, WriterTableRow]):
     def __default(self, value: Any) -> Any:
         if isinstance(value, datetime):
@@ -141,6 +237,13 @@ class HTTPWriteBatch:
     [ v1, v2, v3, v4]
     If chunk size is 2, these values will be sent:
     [v1, v2] [v3, v4]
+    If `chunk_bytes` is set, a chunk is also sent as soon as it holds that
+    many bytes, so the chunks stay about the same size whatever the size of
+    the rows is.
+
+    With `compression`, each chunk goes through a streaming compressor and
+    the request is sent with the matching ``Content-Encoding``. This does
+    not apply if the data is already encoded (`encoding`).
 
     Batches can be partially or entirely buffered locally. This behavior
     is controlled by `buffer_size`.
@@ -171,6 +274,8 @@ class HTTPWriteBatch:
         chunk_size: Optional[int] = None,
         buffer_size: int = 0,  # 0 means unbounded
         debug_buffer_size_bytes: Optional[int] = None,  # None means disabled
+        chunk_bytes: Optional[int] = None,  # None means chunk_size values per chunk
+        compression: Optional[str] = None,
     ) -> None:
         if chunk_size is None:
             chunk_size = settings.CLICKHOUSE_HTTP_CHUNK_SIZE
@@ -180,10 +285,22 @@ class HTTPWriteBatch:
         ] = (Queue(buffer_size) if buffer_size else SimpleQueue())
 
         body = self.__read_until_eof()
-        if chunk_size > 1:
-            body = (b"".join(chunk) for chunk in chunked(body, chunk_size))
-        elif not chunk_size > 0:
+        if not chunk_size > 0:
             raise ValueError("chunk size must be greater than zero")
+        elif chunk_bytes:
+            body = _chunk_by_size(body, chunk_bytes, chunk_size)
+        elif chunk_size > 1:
+            body = (b"".join(chunk) for chunk in chunked(body, chunk_size))
+
+        self.__wire_size = 0
+        self.__compression: Optional[str] = None
+        if compression and not encoding:
+            if compression not in _COMPRESSORS:
+                raise ValueError(f"Unsupported insert compression {compression!r}")
+            body = self.__compress(body, _COMPRESSORS[compression]())
+            encoding = self.__compression = compression
+        if self.__compression is None:
+            body = self.__count_wire_size(body)
 
         headers = {
             "X-ClickHouse-User": user,
@@ -216,6 +333,21 @@ class HTTPWriteBatch:
             f"<{type(self).__name__}: {self.__debug_buffer} rows ({self.__size} bytes)>"
         )
 
+    def __compress(self, body: Iterable[bytes], compressor: Any) -> Iterator[bytes]:
+        for chunk in body:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                self.__wire_size += len(compressed)
+                yield compressed
+        compressed = compressor.flush()
+        self.__wire_size += len(compressed)
+        yield compressed
+
+    def __count_wire_size(self, body: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in body:
+            self.__wire_size += len(chunk)
+            yield chunk
+
     def __read_until_eof(self) -> Iterator[bytes]:
         while True:
             value = self.__queue.get()
@@ -255,6 +387,14 @@ class HTTPWriteBatch:
             self.__size,
             tags={"table": str(self.__statement.get_qualified_table())},
         )
+        self.__metrics.timing(
+            "http_batch.wire_size",
+            self.__wire_size,
+            tags={
+                "table": str(self.__statement.get_qualified_table()),
+                "compression": self.__compression or "none",
+            },
+        )
 
         if response.status != 200:
             # XXX: This should be switched to just parse the JSON body after
@@ -286,6 +426,93 @@ class HTTPWriteBatch:
                 )
 
 
+T = TypeVar("T")
+
+
+class InsertExecutor(ThreadPoolExecutor):
+    """
+    Runs the inserts of a node, each on its own worker.
+
+    An insert streams the values appended to its batch, and ``append``
+    blocks once the buffer of the batch is full until the insert reads
+    from it. An insert queued behind busy workers does not read, and the
+    inserts holding the workers may be waiting for values from the very
+    thread blocked in ``append``. The executor only accepts as many
+    inserts as it has workers: ``submit`` waits for one of them to finish,
+    and raises ``TimeoutError`` if none does within the time a batch is
+    given to complete.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "") -> None:
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.__slots = BoundedSemaphore(max_workers)
+
+    def submit(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> Future[T]:
+        timeout = state.get_config(
+            "http_batch_join_timeout", settings.BATCH_JOIN_TIMEOUT
+        )
+        assert timeout is not None
+        if not self.__slots.acquire(timeout=float(timeout)):
+            raise TimeoutError("No insert finished to make room for a new one")
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self.__slots.release()
+            raise
+        future.add_done_callback(lambda _: self.__slots.release())
+        return future
+
+
+class HTTPInsertClient:
+    """
+    Sends the inserts to a ClickHouse node over HTTP. A client is meant to
+    be shared by all the batch writers of the node so the connections are
+    kept alive across batches and writers.
+
+    Each table gets its own pool of `max_connections` keep-alive
+    connections, so inserts into one table do not take the connections of
+    another. The number of inserts in flight across all the tables is
+    bounded by `max_concurrency`.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int = 1,
+        block_connections: bool = False,
+        max_concurrency: Optional[int] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.__max_connections = max_connections
+        self.__block_connections = block_connections
+        self.__pools: MutableMapping[str, HTTPConnectionPool] = {}
+        self.__lock = Lock()
+        self.__executor = InsertExecutor(
+            max_workers=max_concurrency
+            or settings.CLICKHOUSE_HTTP_INSERT_MAX_CONCURRENCY,
+            thread_name_prefix=f"clickhouse-insert-{host}:{port}",
+        )
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.host}:{self.port}>"
+
+    def get_executor(self) -> InsertExecutor:
+        return self.__executor
+
+    def get_pool(self, table: str) -> HTTPConnectionPool:
+        with self.__lock:
+            if table not in self.__pools:
+                self.__pools[table] = HTTPConnectionPool(
+                    self.host,
+                    self.port,
+                    maxsize=self.__max_connections,
+                    block=self.__block_connections,
+                )
+            return self.__pools[table]
+
+
 class HTTPBatchWriter(BatchWriter[bytes]):
     def __init__(
         self,
@@ -301,11 +528,13 @@ class HTTPBatchWriter(BatchWriter[bytes]):
         buffer_size: int = 0,
         max_connections: int = 1,
         block_connections: bool = False,
+        client: Optional[HTTPInsertClient] = None,
     ):
-        self.__pool = HTTPConnectionPool(
-            host, port, maxsize=max_connections, block=block_connections
+        self.__client = client or HTTPInsertClient(
+            host, port, max_connections, block_connections
         )
-        self.__executor = ThreadPoolExecutor()
+        self.__pool = self.__client.get_pool(statement.get_qualified_table())
+        self.__executor = self.__client.get_executor()
         self.__metrics = metrics
 
         self.__options = options if options is not None else {}
@@ -324,7 +553,7 @@ class HTTPBatchWriter(BatchWriter[bytes]):
         )
 
     def __repr__(self) -> str:
-        return f"<{type(self).__name__}: {self.__statement.get_qualified_table()} on {self.__pool.host}:{self.__pool.port}>"
+        return f"<{type(self).__name__}: {self.__statement.get_qualified_table()} on {self.__client.host}:{self.__client.port}>"
 
     def write(self, values: Iterable[bytes]) -> None:
         """
@@ -347,6 +576,10 @@ class HTTPBatchWriter(BatchWriter[bytes]):
             self.__chunk_size,
             self.__buffer_size,
             self.__debug_buffer_size_bytes,
+            chunk_bytes=state.get_int_config(
+                "http_insert_chunk_bytes", settings.CLICKHOUSE_HTTP_CHUNK_BYTES
+            ),
+            compression=get_insert_compression(),
         )
 
         for value in values:
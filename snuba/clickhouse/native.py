@@ -1,19 +1,22 @@
 from __future__ import annotations
 
 import logging
+import math
 import queue
 import random
 import re
 import time
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass, field
 from datetime import date, datetime
 from io import StringIO
 from typing import (
     Any,
+    ContextManager,
     Dict,
     Generator,
     Mapping,
+    MutableMapping,
     Optional,
     Sequence,
     Tuple,
@@ -21,16 +24,23 @@ from typing import (
     Union,
     cast,
 )
-from uuid import UUID
+from uuid import UUID, uuid4
 
 import sentry_sdk
 from clickhouse_driver import Client, errors
 from dateutil.tz import tz
 
 from snuba import environment, settings, state
+from snuba.clickhouse.admission import (
+    AdmissionController,
+    Priority,
+    is_admission_control_enabled,
+)
 from snuba.clickhouse.errors import ClickhouseError
+from snuba.clickhouse.escaping import escape_string
 from snuba.clickhouse.formatter.nodes import FormattedQuery
 from snuba.reader import Reader, Result, build_result_transformer
+from snuba.utils.cancellation import Cancellation, get_current_cancellation
 from snuba.utils.metrics.gauge import ThreadSafeGauge
 from snuba.utils.metrics.wrapper import MetricsWrapper
 
@@ -447,6 +457,12 @@ class NativeDriverReader(Reader):
             query_settings_prefix=query_settings_prefix,
         )
         self.__client = client
+        self.__admission = AdmissionController(
+            f"{client.host}:{client.port}",
+            settings.ADMISSION_CONTROL_INITIAL_LIMIT,
+            settings.ADMISSION_CONTROL_MIN_LIMIT,
+            client.pool.maxsize,
+        )
 
     def __transform_result(self, result: ClickhouseResult, with_totals: bool) -> Result:
         """
@@ -501,6 +517,29 @@ class NativeDriverReader(Reader):
         with_totals: bool = False,
         robust: bool = False,
         capture_trace: bool = False,
+        hedge_key: Optional[str] = None,
+        priority: Optional[Priority] = None,
+    ) -> Result:
+        if not is_admission_control_enabled(self.__client.host, self.__client.port):
+            return self.__execute(
+                query, settings, with_totals, robust, capture_trace, hedge_key
+            )
+        with self.__admission.admit(
+            priority if priority is not None else Priority.DEFAULT,
+            get_current_cancellation(),
+        ):
+            return self.__execute(
+                query, settings, with_totals, robust, capture_trace, hedge_key
+            )
+
+    def __execute(
+        self,
+        query: FormattedQuery,
+        settings: Optional[Mapping[str, str]],
+        with_totals: bool,
+        robust: bool,
+        capture_trace: bool,
+        hedge_key: Optional[str],
     ) -> Result:
         settings = {**settings} if settings is not None else {}
 
@@ -508,17 +547,83 @@ class NativeDriverReader(Reader):
         if "query_id" in settings:
             query_id = settings.pop("query_id")
 
+        cancellation = get_current_cancellation()
+        if cancellation is not None:
+            # The query has to be identifiable to be killed.
+            query_id = query_id or uuid4().hex
+            _cap_execution_time(settings, cancellation)
+
+        def running(pool: ClickhousePool, pool_query_id: str) -> ContextManager[None]:
+            if cancellation is None:
+                return nullcontext()
+            return cancellation.running(
+                lambda: kill_query(pool, pool_query_id),
+                {"host": pool.host},
+            )
+
+        if hedge_key is not None and not robust and not capture_trace:
+            # Imported here since the hedging module depends on this one.
+            from snuba.clickhouse.hedging import get_hedged_read_executor
+
+            sql = query.get_sql()
+
+            def execute_on(
+                pool: ClickhousePool, pool_query_id: Optional[str]
+            ) -> ClickhouseResult:
+                with running(pool, pool_query_id or ""):
+                    return pool.execute(
+                        sql,
+                        with_column_types=True,
+                        query_id=pool_query_id,
+                        settings=settings,
+                    )
+
+            return self.__transform_result(
+                get_hedged_read_executor().execute(
+                    hedge_key, self.__client, execute_on, query_id
+                ),
+                with_totals=with_totals,
+            )
+
         execute_func = (
             self.__client.execute_robust if robust is True else self.__client.execute
         )
 
-        return self.__transform_result(
-            execute_func(
+        with running(self.__client, query_id or ""):
+            result = execute_func(
                 query.get_sql(),
                 with_column_types=True,
                 query_id=query_id,
                 settings=settings,
                 capture_trace=capture_trace,
-            ),
-            with_totals=with_totals,
+            )
+        return self.__transform_result(result, with_totals=with_totals)
+
+
+def kill_query(pool: ClickhousePool, query_id: str) -> None:
+    """
+    Asks ClickHouse to stop a query without waiting for it to stop.
+    """
+    try:
+        pool.execute(
+            f"KILL QUERY WHERE query_id = {escape_string(query_id)} ASYNC",
+            retryable=False,
         )
+    except Exception:
+        logger.warning("Failed to kill query %s", query_id, exc_info=True)
+
+
+def _cap_execution_time(
+    settings: MutableMapping[str, Any], cancellation: Cancellation
+) -> None:
+    """
+    Lowers max_execution_time to the time left before the deadline of the
+    request so ClickHouse stops the query once the caller stopped waiting.
+    """
+    remaining = cancellation.remaining()
+    if remaining is None:
+        return
+    cap = max(math.ceil(remaining), 1)
+    current = settings.get("max_execution_time")
+    if current is None or float(current) > cap:
+        settings["max_execution_time"] = cap
@@ -20,7 +20,12 @@ import structlog
 
 from snuba import settings
 from snuba.clickhouse.escaping import escape_string
-from snuba.clickhouse.http import HTTPBatchWriter, InsertStatement, JSONRow
+from snuba.clickhouse.http import (
+    HTTPBatchWriter,
+    HTTPInsertClient,
+    InsertStatement,
+    JSONRow,
+)
 from snuba.clickhouse.native import ClickhousePool, NativeDriverReader
 from snuba.clusters.storage_sets import (
     DEV_STORAGE_SETS,
@@ -254,6 +259,8 @@ class ClickhouseCluster(Cluster[ClickhouseWriterOptions]):
         self.__connection_cache = connection_cache
         self.__cache_partition_id = cache_partition_id
         self.__query_settings_prefix = query_settings_prefix
+        self.__insert_client: Optional[HTTPInsertClient] = None
+        self.__insert_client_lock = Lock()
 
     def __str__(self) -> str:
         return str(self.__query_node)
@@ -315,6 +322,20 @@ class ClickhouseCluster(Cluster[ClickhouseWriterOptions]):
             )
         return self.__reader
 
+    def get_insert_client(self) -> HTTPInsertClient:
+        """
+        Returns the HTTP client shared by all the batch writers of the cluster.
+        """
+        with self.__insert_client_lock:
+            if self.__insert_client is None:
+                self.__insert_client = HTTPInsertClient(
+                    self.__query_node.host_name,
+                    self.__http_port,
+                    max_connections=self.__max_connections,
+                    block_connections=self.__block_connections,
+                )
+            return self.__insert_client
+
     def get_batch_writer(
         self,
         metrics: MetricsBackend,
@@ -337,6 +358,7 @@ class ClickhouseCluster(Cluster[ClickhouseWriterOptions]):
             options=options,
             chunk_size=chunk_size,
             buffer_size=buffer_size,
+            client=self.get_insert_client(),
         )
 
     def is_single_node(self) -> bool:
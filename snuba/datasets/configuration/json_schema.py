@@ -613,6 +613,26 @@ DELETION_SETTINGS_SCHEMA = {
     "required": ["is_enabled", "tables"],
     "additionalProperties": False,
 }
+ROLLUP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "time_column": {
+            "type": "string",
+            "description": "The column of the storage holding the start of the time buckets",
+        },
+        "granularity": {
+            "type": "integer",
+            "description": "The size of the time buckets in seconds",
+        },
+        "aggregate_functions": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "The aggregate functions, after translation, that are correct on the pre-aggregated rows",
+        },
+    },
+    "required": ["time_column", "granularity", "aggregate_functions"],
+    "additionalProperties": False,
+}
 DELETION_PROCESSORS_SCHEMA = registered_class_array_schema(
     "processor",
     "DeletionProcessor",
@@ -641,6 +661,7 @@ V1_READABLE_STORAGE_SCHEMA = {
             "type": ["string", "null"],
             "description": "The name of the required time column specifed in schema",
         },
+        "rollup": ROLLUP_SCHEMA,
     },
     "required": [
         "version",
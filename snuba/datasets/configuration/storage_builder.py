@@ -17,6 +17,7 @@ from snuba.datasets.deletion_settings import DeletionSettings
 from snuba.datasets.message_filters import StreamMessageFilter
 from snuba.datasets.processors import DatasetMessageProcessor
 from snuba.datasets.readiness_state import ReadinessState
+from snuba.datasets.rollup_settings import RollupSettings
 from snuba.datasets.schemas.tables import TableSchema, WritableTableSchema
 from snuba.datasets.storage import ReadableTableStorage, WritableTableStorage
 from snuba.datasets.storages.storage_key import register_storage_key
@@ -53,6 +54,7 @@ REPLACER_PROCESSOR = "replacer_processor"
 ALLOCATION_POLICIES = "allocation_policies"
 DELETE_ALLOCATION_POLICIES = "delete_allocation_policies"
 REQUIRED_TIME_COLUMN = "required_time_column"
+ROLLUP = "rollup"
 
 
 def build_storage_from_config(
@@ -62,7 +64,10 @@ def build_storage_from_config(
 
     storage_kwargs = __build_readable_storage_kwargs(config)
     if config[KIND] == READABLE_STORAGE:
-        return ReadableTableStorage(**storage_kwargs)
+        return ReadableTableStorage(
+            **storage_kwargs,
+            rollup=RollupSettings(**config[ROLLUP]) if ROLLUP in config else None,
+        )
 
     storage_kwargs = {**storage_kwargs, **__build_writable_storage_kwargs(config)}
     if config[KIND] == WRITABLE_STORAGE:
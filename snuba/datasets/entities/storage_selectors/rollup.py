@@ -0,0 +1,247 @@
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+from snuba import state
+from snuba.clickhouse.query import Query as ClickhouseQuery
+from snuba.datasets.entities.storage_selectors import QueryStorageSelector
+from snuba.datasets.entities.storage_selectors.selector import QueryStorageSelectorError
+from snuba.datasets.plans.translator.query import QueryTranslator
+from snuba.datasets.rollup_settings import RollupSettings
+from snuba.datasets.storage import EntityStorageConnection, ReadableTableStorage
+from snuba.query.conditions import ConditionFunctions
+from snuba.query.expressions import (
+    Argument,
+    Column,
+    CurriedFunctionCall,
+    Expression,
+    FunctionCall,
+    Lambda,
+    Literal,
+    SubscriptableReference,
+)
+from snuba.query.functions import is_aggregation_function
+from snuba.query.logical import Query
+from snuba.query.query_settings import QuerySettings
+
+# The key of the query experiments, and of the query stats, the coverage
+# decisions are recorded under.
+ROLLUP_COVERAGE = "rollup_coverage"
+
+# Functions turning a time into the start of a bucket of a fixed size.
+_BUCKET_FUNCTIONS = {
+    "toStartOfMinute": 60,
+    "toStartOfFiveMinute": 300,
+    "toStartOfFiveMinutes": 300,
+    "toStartOfTenMinutes": 600,
+    "toStartOfFifteenMinutes": 900,
+    "toStartOfHour": 3600,
+    "toStartOfDay": 86400,
+    "toDate": 86400,
+}
+# Functions turning a time into the start of a bucket aligned to days.
+_DAY_ALIGNED_FUNCTIONS = {
+    "toMonday",
+    "toStartOfWeek",
+    "toStartOfMonth",
+    "toStartOfQuarter",
+    "toStartOfYear",
+}
+_INTERVAL_SECONDS = {
+    "toIntervalSecond": 1,
+    "toIntervalMinute": 60,
+    "toIntervalHour": 3600,
+    "toIntervalDay": 86400,
+}
+
+
+def _bucket_size(function: FunctionCall) -> Optional[int]:
+    """
+    The size in seconds of the buckets a time bucketing function produces
+    from its first parameter, or None if it is not one.
+    """
+    name = function.function_name
+    if name in _BUCKET_FUNCTIONS:
+        return _BUCKET_FUNCTIONS[name]
+    if name in _DAY_ALIGNED_FUNCTIONS:
+        return 86400
+    if name == "toStartOfInterval" and len(function.parameters) >= 2:
+        interval = function.parameters[1]
+        if (
+            isinstance(interval, FunctionCall)
+            and interval.function_name in _INTERVAL_SECONDS
+            and len(interval.parameters) == 1
+            and isinstance(interval.parameters[0], Literal)
+            and isinstance(interval.parameters[0].value, int)
+        ):
+            return (
+                _INTERVAL_SECONDS[interval.function_name] * interval.parameters[0].value
+            )
+    # toDateTime(intDiv(toUInt32(column), size) * size) built for the
+    # granularities the time series processor has no function for.
+    if (
+        name == "intDiv"
+        and len(function.parameters) == 2
+        and isinstance(function.parameters[0], FunctionCall)
+        and function.parameters[0].function_name == "toUInt32"
+        and isinstance(function.parameters[1], Literal)
+        and isinstance(function.parameters[1].value, int)
+    ):
+        return function.parameters[1].value
+    return None
+
+
+def _is_time_column(expression: Expression, rollup: RollupSettings) -> bool:
+    if isinstance(expression, FunctionCall) and expression.function_name == "toUInt32":
+        expression = expression.parameters[0] if expression.parameters else expression
+    return (
+        isinstance(expression, Column) and expression.column_name == rollup.time_column
+    )
+
+
+def _is_aligned(literal: Expression, granularity: int) -> bool:
+    if not isinstance(literal, Literal) or not isinstance(literal.value, datetime):
+        return False
+    value = literal.value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.microsecond == 0 and int(value.timestamp()) % granularity == 0
+
+
+def _uses_covered_time(expression: Expression, rollup: RollupSettings) -> bool:
+    """
+    True if every reference to the time column of the rollup in the
+    expression gets the same result on the buckets as on the raw times:
+    it is bucketed by a multiple of the granularity, or compared, with
+    >= or <, to a time aligned on the granularity.
+    """
+    if isinstance(expression, Column):
+        return expression.column_name != rollup.time_column
+    if isinstance(expression, FunctionCall):
+        parameters = expression.parameters
+        if parameters and _is_time_column(parameters[0], rollup):
+            size = _bucket_size(expression)
+            if size is not None and size % rollup.granularity == 0:
+                return True
+        comparisons = (ConditionFunctions.GTE, ConditionFunctions.LT)
+        if expression.function_name in comparisons and len(parameters) == 2:
+            lhs, rhs = parameters
+            if _is_time_column(lhs, rollup) and _is_aligned(rhs, rollup.granularity):
+                return True
+        return all(_uses_covered_time(p, rollup) for p in parameters)
+    if isinstance(expression, CurriedFunctionCall):
+        return _uses_covered_time(expression.internal_function, rollup) and all(
+            _uses_covered_time(p, rollup) for p in expression.parameters
+        )
+    if isinstance(expression, SubscriptableReference):
+        return _uses_covered_time(expression.column, rollup)
+    if isinstance(expression, Lambda):
+        return _uses_covered_time(expression.transformation, rollup)
+    assert isinstance(expression, (Literal, Argument))
+    return True
+
+
+def get_rollup_miss(
+    query: Query, storage_connection: EntityStorageConnection
+) -> Optional[str]:
+    """
+    Returns why the query cannot be answered from the rollup storage of the
+    connection, or None if it is covered: once translated with the mappers
+    of the storage, the query only references columns of the rollup, only
+    aggregates with the aggregate functions it declares, and only uses the
+    time column in ways the granularity of the rollup can answer. A rollup
+    row stands for all the raw rows of its bucket, so a query that neither
+    aggregates nor groups is never covered.
+    """
+    storage = storage_connection.storage
+    assert isinstance(storage, ReadableTableStorage)
+    rollup = storage.get_rollup()
+    assert rollup is not None
+
+    if query.get_sample() is not None:
+        return "sample"
+
+    translated: ClickhouseQuery = QueryTranslator(
+        storage_connection.translation_mappers
+    ).translate(query)
+    columns = storage.get_schema().get_columns()
+    aggregated = bool(translated.get_groupby())
+    for expression in translated.get_all_expressions():
+        if isinstance(expression, Column) and expression.column_name not in columns:
+            return f"column={expression.column_name}"
+        if isinstance(expression, FunctionCall) and is_aggregation_function(
+            expression.function_name
+        ):
+            if expression.function_name not in rollup.aggregate_functions:
+                return f"aggregate={expression.function_name}"
+            aggregated = True
+    if not aggregated:
+        return "not_aggregated"
+
+    limitby = translated.get_limitby()
+    clauses = [
+        *(selected.expression for selected in translated.get_selected_columns()),
+        *(translated.get_arrayjoin() or []),
+        *translated.get_groupby(),
+        *(order.expression for order in translated.get_orderby()),
+        *(limitby.columns if limitby is not None else []),
+    ]
+    for clause in [translated.get_condition(), translated.get_having(), *clauses]:
+        if clause is not None and not _uses_covered_time(clause, rollup):
+            return "granularity"
+    return None
+
+
+class RollupQueryStorageSelector(QueryStorageSelector):
+    """
+    Answers queries from a rollup storage of the entity (a readable storage
+    declaring ``rollup`` in its configuration) when the query is covered by
+    it, and from the raw storage otherwise. Rollups are tried from the
+    coarsest granularity, which has the fewest rows to read, to the finest.
+
+    The raw storage is the first storage of the entity that is not a
+    rollup. The decisions are recorded in the query experiments and end up
+    in the query stats.
+    """
+
+    def select_storage(
+        self,
+        query: Query,
+        query_settings: QuerySettings,
+        storage_connections: Sequence[EntityStorageConnection],
+    ) -> EntityStorageConnection:
+        raw_connections = []
+        rollups = []
+        for storage_connection in storage_connections:
+            storage = storage_connection.storage
+            rollup = (
+                storage.get_rollup()
+                if isinstance(storage, ReadableTableStorage)
+                else None
+            )
+            if rollup is None:
+                raw_connections.append(storage_connection)
+            else:
+                rollups.append((rollup.granularity, storage_connection))
+        if not raw_connections:
+            raise QueryStorageSelectorError("The entity has no raw storage.")
+
+        if not rollups or not state.get_int_config(
+            "rollup_storage_selection_enabled", 1
+        ):
+            return raw_connections[0]
+
+        selected = raw_connections[0]
+        decisions = []
+        for _, storage_connection in sorted(
+            rollups, key=lambda rollup: rollup[0], reverse=True
+        ):
+            storage = storage_connection.storage
+            assert isinstance(storage, ReadableTableStorage)
+            miss = get_rollup_miss(query, storage_connection)
+            decisions.append(f"{storage.get_storage_key().value}:{miss or 'covered'}")
+            if miss is None:
+                selected = storage_connection
+                break
+
+        query.add_experiment(ROLLUP_COVERAGE, ",".join(decisions))
+        return selected
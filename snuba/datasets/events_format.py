@@ -1,3 +1,4 @@
+import sys
 from datetime import datetime, timedelta
 from typing import (
     Any,
@@ -53,6 +54,62 @@ def extract_http(output: MutableMapping[str, Any], request: Mapping[str, Any]) -
     output["http_url"] = _unicodify(request.get("url", None))
 
 
+# Tag and context keys come from a small vocabulary that repeats across
+# messages, while every message decodes them into new strings. Keys are
+# normalized once and the same string object is shared by all the rows, so
+# the rows of a batch do not hold a copy of each key. Only the keys are
+# shared: the rows are still the dicts of lists InsertBatch carries to the
+# JSON encoder. Both caches together hold at most _INTERNED_KEYS_MAX_SIZE
+# keys, keys seen after that are normalized on every message.
+_INTERNED_KEYS_MAX_SIZE = 20000
+_interned_keys: MutableMapping[str, str] = {}
+_interned_context_keys: MutableMapping[Tuple[str, str], str] = {}
+
+
+def _interned_keys_full() -> bool:
+    return len(_interned_keys) + len(_interned_context_keys) >= _INTERNED_KEYS_MAX_SIZE
+
+
+def intern_key(key: Any) -> str:
+    """
+    Returns the normalized form of a tag or context key, shared with all the
+    other rows that have the same key.
+    """
+    if type(key) is str:
+        interned = _interned_keys.get(key)
+        if interned is not None:
+            return interned
+
+    unicode_key = _unicodify(key)
+    assert isinstance(unicode_key, str)
+    if type(key) is not str or _interned_keys_full():
+        return unicode_key
+
+    interned = sys.intern(unicode_key)
+    _interned_keys[key] = interned
+    return interned
+
+
+def _intern_context_key(ctx_name: str, inner_ctx_name: str) -> str:
+    key = (ctx_name, inner_ctx_name)
+    interned = _interned_context_keys.get(key)
+    if interned is not None:
+        return interned
+
+    unicode_key = _unicodify(f"{ctx_name}.{inner_ctx_name}")
+    assert isinstance(unicode_key, str)
+    if (
+        type(ctx_name) is not str
+        or type(inner_ctx_name) is not str
+        or _interned_keys_full()
+    ):
+        return unicode_key
+
+    interned = sys.intern(unicode_key)
+    _interned_context_keys[key] = interned
+    return interned
+
+
 def extract_extra_tags(
     nested_col: Mapping[str, Any],
 ) -> Tuple[Sequence[str], Sequence[str]]:
@@ -67,9 +124,7 @@ def extract_nested(
     for key, value in sorted(nested_col.items()):
         value = val_processor(value)
         if value is not None:
-            unicode_key = _unicodify(key)
-            assert isinstance(unicode_key, str)
-            keys.append(unicode_key)
+            keys.append(intern_key(key))
             values.append(value)
 
     return (keys, values)
@@ -95,15 +150,10 @@ def extract_extra_contexts(
                 if isinstance(ctx_value, valid_types):
                     value = _unicodify(ctx_value)
                     if value:
-                        ctx_key = f"{ctx_name}.{inner_ctx_name}"
-                        unicode_key = _unicodify(ctx_key)
-                        unicode_value = _unicodify(ctx_value)
-
-                        assert isinstance(unicode_key, str)
-                        assert isinstance(unicode_value, str)
-
-                        context_keys.append(unicode_key)
-                        context_values.append(unicode_value)
+                        context_keys.append(
+                            _intern_context_key(ctx_name, inner_ctx_name)
+                        )
+                        context_values.append(value)
 
     return (context_keys, context_values)
 
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterable, Mapping, MutableMapping, Optional, Sequence
 
 from snuba import state
 from snuba.clickhouse.query import Query as ClickhouseQuery
@@ -61,6 +62,24 @@ def _should_use_mega_cluster(
     return False
 
 
+def group_org_ids_by_slice(
+    storage_set: StorageSetKey, org_ids: Iterable[int]
+) -> Optional[Mapping[int, Sequence[int]]]:
+    """
+    Groups the org ids of a query by the slice their data lives in. Returns
+    None if the data of any of them can be in more than one slice, in which
+    case the query needs the mega cluster.
+    """
+    slices: MutableMapping[int, list[int]] = {}
+    for org_id in sorted(org_ids):
+        logical_partition = map_org_id_to_logical_partition(org_id)
+        if _should_use_mega_cluster(storage_set, logical_partition):
+            return None
+        slice_id = map_logical_partition_to_slice(storage_set, logical_partition)
+        slices.setdefault(slice_id, []).append(org_id)
+    return slices
+
+
 class ColumnBasedStorageSliceSelector(StorageClusterSelector):
     """
     Storage slice selector based on a specific column of the query. This is
@@ -84,27 +103,34 @@ class ColumnBasedStorageSliceSelector(StorageClusterSelector):
         self.storage_set = storage_set
         self.partition_key_column_name = partition_key_column_name
 
+    def select_slices(
+        self, query: LogicalQuery | ClickhouseQuery
+    ) -> Optional[Mapping[int, Sequence[int]]]:
+        """
+        Returns the ids of the partition key column in the query grouped by
+        the slice they live in, or None if the query has to run on the mega
+        cluster.
+        """
+        org_ids = get_object_ids_in_query_ast(query, self.partition_key_column_name)
+        assert org_ids
+        return group_org_ids_by_slice(self.storage_set, org_ids)
+
     def select_cluster(
         self, query: LogicalQuery | ClickhouseQuery, query_settings: QuerySettings
     ) -> ClickhouseCluster:
         """
         Selects the cluster to use for a query if the storage set is sliced.
         If the storage set is not sliced, it returns the default cluster.
+
+        Queries on ids that live in more than one slice go to the mega
+        cluster. Executors which can merge the results of the slices use
+        `select_slices` to run them on each slice instead.
         """
         if not is_storage_set_sliced(self.storage_set):
             return get_cluster(self.storage_set)
 
-        org_ids = get_object_ids_in_query_ast(query, self.partition_key_column_name)
-        assert org_ids is not None
-        assert len(org_ids) == 1
-        org_id = org_ids.pop()
-
-        logical_partition = map_org_id_to_logical_partition(org_id)
-        if _should_use_mega_cluster(self.storage_set, logical_partition):
+        slices = self.select_slices(query)
+        if slices is None or len(slices) != 1:
             return get_cluster(self.storage_set)
-        else:
-            slice_id = map_logical_partition_to_slice(
-                self.storage_set, logical_partition
-            )
-            cluster = get_cluster(self.storage_set, slice_id)
-            return cluster
+        (slice_id,) = slices
+        return get_cluster(self.storage_set, slice_id)
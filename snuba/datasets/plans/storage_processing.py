@@ -14,7 +14,6 @@ from snuba.clickhouse.translators.snuba.mapping import (
 from snuba.datasets.plans.query_plan import ClickhouseQueryPlan
 from snuba.datasets.schemas import RelationalSource
 from snuba.datasets.schemas.tables import TableSource
-from snuba.datasets.slicing import is_storage_set_sliced
 from snuba.datasets.storage import (
     ReadableStorage,
     ReadableTableStorage,
@@ -22,6 +21,7 @@ from snuba.datasets.storage import (
 )
 from snuba.datasets.storages.factory import get_storage
 from snuba.datasets.storages.storage_key import StorageKey
+from snuba.pipeline.profiling import profile_processor
 from snuba.pipeline.utils.storage_finder import StorageKeyFinder
 from snuba.query import ProcessableQuery
 from snuba.query import Query as AbstractQuery
@@ -128,9 +128,6 @@ def apply_storage_processors(
     # storage selection should not be done through the entity anymore.
     storage_key = StorageKeyFinder().visit(query_plan.query)
     storage = get_storage(storage_key)
-    if is_storage_set_sliced(storage.get_storage_set_key()):
-        raise NotImplementedError("sliced storages not supported in new pipeline")
-
     check_storage_readiness(storage)
 
     with sentry_sdk.start_span(
@@ -149,7 +146,7 @@ def apply_storage_processors(
     for processor in query_plan.db_query_processors:
         with sentry_sdk.start_span(
             description=type(processor).__name__, op="processor"
-        ):
+        ), profile_processor("storage", processor):
             if settings.get_dry_run():
                 with explain_meta.with_query_differ(
                     "storage_processor", type(processor).__name__, query_plan.query
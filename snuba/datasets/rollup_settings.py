@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Sequence
+
+
+@dataclass(frozen=True)
+class RollupSettings:
+    """
+    Declares a readable storage as a rollup (a table pre-aggregated by a
+    materialized view) of the raw storage of its entity. ``time_column`` is
+    bucketed by ``granularity`` seconds and ``aggregate_functions`` are the
+    aggregates that give correct results on its rows once the query is
+    translated with the mappers of the storage.
+    """
+
+    time_column: str
+    granularity: int
+    aggregate_functions: Sequence[str]
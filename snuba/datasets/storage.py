@@ -13,6 +13,7 @@ from snuba.clusters.cluster import (
 from snuba.clusters.storage_sets import StorageSetKey
 from snuba.datasets.deletion_settings import DeletionSettings
 from snuba.datasets.readiness_state import ReadinessState
+from snuba.datasets.rollup_settings import RollupSettings
 from snuba.datasets.schemas import Schema
 from snuba.datasets.schemas.tables import WritableTableSchema, WriteFormat
 from snuba.datasets.storages.storage_key import StorageKey
@@ -137,6 +138,7 @@ class ReadableTableStorage(ReadableStorage):
         allocation_policies: Optional[list[AllocationPolicy]] = None,
         delete_allocation_policies: Optional[list[AllocationPolicy]] = None,
         required_time_column: Optional[str] = None,
+        rollup: Optional[RollupSettings] = None,
     ) -> None:
         self.__storage_key = storage_key
         self.__query_processors = query_processors or []
@@ -145,6 +147,7 @@ class ReadableTableStorage(ReadableStorage):
         self.__mandatory_condition_checkers = mandatory_condition_checkers or []
         self.__allocation_policies = allocation_policies or []
         self.__delete_allocation_policies = delete_allocation_policies or []
+        self.__rollup = rollup
         super().__init__(
             storage_set_key,
             schema,
@@ -173,6 +176,13 @@ class ReadableTableStorage(ReadableStorage):
     def get_deletion_processors(self) -> Sequence[ClickhouseQueryProcessor]:
         return self.__deletion_processors
 
+    def get_rollup(self) -> Optional[RollupSettings]:
+        """
+        The rollup this storage is, if it pre-aggregates the rows of the raw
+        storage of the entity.
+        """
+        return self.__rollup
+
 
 class WritableTableStorage(ReadableTableStorage, WritableStorage):
     def __init__(
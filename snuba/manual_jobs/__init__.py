@@ -65,6 +65,14 @@ class Job(ABC, metaclass=RegisteredClass):
     def async_finished_check(cls, job_id: str) -> bool:
         raise NotImplementedError
 
+    @classmethod
+    def is_resumable(cls) -> bool:
+        """
+        Whether a job that failed can be run again, for jobs that keep track
+        of their progress and pick up where they stopped.
+        """
+        return False
+
 
 import_submodules_in_directory(
     os.path.dirname(os.path.realpath(__file__)), "snuba.manual_jobs"
@@ -0,0 +1,287 @@
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    List,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from snuba.clickhouse.native import ClickhousePool
+from snuba.manual_jobs import JobLogger
+from snuba.manual_jobs.redis import _get_completed_chunks, _record_chunk_completed
+from snuba.utils.serializable_exception import SerializableException
+
+DEFAULT_CHUNK_WINDOW = timedelta(days=1)
+DEFAULT_IDS_PER_CHUNK = 100
+
+MARKER_PREFIX = "snuba_manual_job:"
+
+
+class MutationLostException(SerializableException):
+    pass
+
+
+@dataclass(frozen=True)
+class MutationChunk:
+    """
+    A slice of the data a manual job mutates: the ids (project or
+    organization ids) and the time range the mutation is limited to.
+    """
+
+    ids: Sequence[int]
+    start: datetime
+    end: datetime
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the chunk in the progress of the job. Chunks are built
+        deterministically from the job params, so a job that is run again
+        finds the chunks it already mutated.
+        """
+        ids = f"{self.ids[0]}-{self.ids[-1]}:{len(self.ids)}" if self.ids else "-"
+        return f"{self.start.isoformat()}/{self.end.isoformat()}/{ids}"
+
+
+def split_into_chunks(
+    ids: Sequence[int],
+    start: datetime,
+    end: datetime,
+    ids_per_chunk: Optional[int] = DEFAULT_IDS_PER_CHUNK,
+    window: timedelta = DEFAULT_CHUNK_WINDOW,
+) -> Sequence[MutationChunk]:
+    """
+    Splits the ids and the time range of a job into chunks. Windows are
+    aligned to midnight, with the default window each chunk only touches
+    the parts of a single day, which is finer than the partitions of the
+    tables the jobs mutate. If ``ids_per_chunk`` is None all the ids go in
+    each chunk.
+    """
+    sorted_ids = sorted(ids)
+    size = ids_per_chunk or max(len(sorted_ids), 1)
+    id_groups = [
+        sorted_ids[index : index + size] for index in range(0, len(sorted_ids), size)
+    ] or [[]]
+
+    chunks = []
+    window_start = start
+    while window_start < end:
+        window_end = datetime.combine(
+            window_start.date(), datetime.min.time(), window_start.tzinfo
+        )
+        while window_end <= window_start:
+            window_end += window
+        window_end = min(window_end, end)
+        for group in id_groups:
+            chunks.append(MutationChunk(group, window_start, window_end))
+        window_start = window_end
+    return chunks
+
+
+@dataclass
+class _SubmittedChunk:
+    index: int
+    chunk: MutationChunk
+    marker: str
+    rows: Optional[int]
+    submitted_at: float
+    # Whether its mutation was seen in system.mutations.
+    seen: bool = False
+
+
+class MutationExecutor:
+    """
+    Runs the mutation of a manual job one chunk at a time instead of as one
+    ``ALTER TABLE`` over the whole range.
+
+    Before each chunk the executor waits until the table has fewer than
+    ``max_pending_mutations`` unfinished mutations of the job and fewer than
+    ``max_running_merges`` merges, so the job does not flood the mutation
+    queue. The mutation of every chunk carries a marker in its conditions
+    which finds it in ``system.mutations``. A chunk is recorded as completed
+    with the job in Redis once its mutation is done. A job that is run again
+    skips the completed chunks and waits for the mutations it already
+    submitted instead of submitting them again.
+
+    Counting the rows a chunk matches is a scan of the chunk, it is only
+    done if ``count_rows`` is set.
+
+    Mutations, merges and rows are only counted on the node the job is
+    connected to, mutations sent ON CLUSTER are expected to progress
+    similarly on the other nodes.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        connection: ClickhousePool,
+        table: str,
+        logger: JobLogger,
+        max_pending_mutations: int = 1,
+        max_running_merges: int = 16,
+        poll_interval: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.time,
+        visible_timeout: float = 300.0,
+    ) -> None:
+        self.__job_id = job_id
+        self.__connection = connection
+        self.__table = table
+        self.__logger = logger
+        self.__max_pending_mutations = max_pending_mutations
+        self.__max_running_merges = max_running_merges
+        self.__poll_interval = poll_interval
+        self.__sleep = sleep
+        self.__clock = clock
+        self.__visible_timeout = visible_timeout
+
+    def __count(self, query: str) -> int:
+        return int(self.__connection.execute(query).results[0][0])
+
+    def __get_marker(self, chunk: Optional[MutationChunk] = None) -> str:
+        marker = f"{MARKER_PREFIX}{self.__job_id}/{chunk.key if chunk else ''}"
+        return re.sub(r"[^\w:./+-]", "_", marker)
+
+    def __get_mutations(self, marker: str) -> Tuple[int, int, str]:
+        """
+        The number of unfinished and finished mutations whose command
+        contains the marker, and why the last one failed if it did.
+        """
+        [(pending, done, fail_reason)] = self.__connection.execute(
+            "SELECT countIf(is_done = 0), countIf(is_done = 1), "
+            "anyIf(latest_fail_reason, latest_fail_reason != '') "
+            "FROM system.mutations "
+            f"WHERE database = currentDatabase() AND table = '{self.__table}' "
+            f"AND position(command, '{marker}') > 0"
+        ).results
+        return int(pending), int(done), str(fail_reason)
+
+    def __collect(self, in_flight: MutableSequence[_SubmittedChunk]) -> None:
+        """
+        Records the chunks whose mutation is done as completed and removes
+        them from the submitted ones.
+        """
+        for submitted in list(in_flight):
+            pending, done, fail_reason = self.__get_mutations(submitted.marker)
+            if pending == 0 and done > 0:
+                in_flight.remove(submitted)
+                _record_chunk_completed(
+                    self.__job_id, submitted.chunk.key, submitted.rows
+                )
+                self.__logger.info(
+                    f"chunk {submitted.index} {submitted.chunk.key} done"
+                    + (
+                        f", {submitted.rows} rows affected"
+                        if submitted.rows is not None
+                        else ""
+                    )
+                )
+            elif pending > 0:
+                submitted.seen = True
+                if fail_reason:
+                    self.__logger.warning(
+                        f"mutation of chunk {submitted.chunk.key} is failing: "
+                        f"{fail_reason}"
+                    )
+            elif submitted.seen:
+                raise MutationLostException(
+                    f"mutation of chunk {submitted.chunk.key} was removed "
+                    "before it was done"
+                )
+            elif self.__clock() - submitted.submitted_at > self.__visible_timeout:
+                raise MutationLostException(
+                    f"mutation of chunk {submitted.chunk.key} is not visible in "
+                    "system.mutations"
+                )
+
+    def __wait_for_capacity(self, in_flight: MutableSequence[_SubmittedChunk]) -> None:
+        while True:
+            self.__collect(in_flight)
+            pending_mutations, _, _ = self.__get_mutations(self.__get_marker())
+            running_merges = self.__count(
+                "SELECT count() FROM system.merges "
+                f"WHERE database = currentDatabase() AND table = '{self.__table}'"
+            )
+            if (
+                pending_mutations < self.__max_pending_mutations
+                and running_merges < self.__max_running_merges
+            ):
+                return
+            self.__logger.info(
+                f"waiting for {self.__table}: {pending_mutations} pending mutations, "
+                f"{running_merges} running merges"
+            )
+            self.__sleep(self.__poll_interval)
+
+    def run(
+        self,
+        chunks: Sequence[MutationChunk],
+        get_mutation: Callable[[str], str],
+        get_conditions: Callable[[MutationChunk], str],
+        settings: Optional[Mapping[str, Any]] = None,
+        count_rows: bool = False,
+    ) -> Optional[int]:
+        """
+        Runs ``get_mutation(conditions)`` for every chunk that was not
+        completed yet, where ``conditions`` are ``get_conditions(chunk)``
+        and the marker of the chunk, to be used as the WHERE clause of the
+        mutation. Returns once all the mutations are done, with the number
+        of rows matched by all the chunks if they were counted.
+        """
+        completed = _get_completed_chunks(self.__job_id)
+        rows_matched = list(completed.values())
+        if completed:
+            self.__logger.info(
+                f"resuming, {len(completed)} of {len(chunks)} chunks already done"
+            )
+
+        in_flight: List[_SubmittedChunk] = []
+        for index, chunk in enumerate(chunks, start=1):
+            if chunk.key in completed:
+                continue
+
+            marker = self.__get_marker(chunk)
+            conditions = get_conditions(chunk)
+            rows: Optional[int] = None
+            pending, done, _ = self.__get_mutations(marker)
+            if pending or done:
+                self.__logger.info(f"chunk {index} {chunk.key} was already submitted")
+            else:
+                self.__wait_for_capacity(in_flight)
+                if count_rows:
+                    rows = self.__count(
+                        f"SELECT count() FROM {self.__table} WHERE {conditions}"
+                    )
+                self.__connection.execute(
+                    query=get_mutation(f"({conditions})\nAND '{marker}' != ''"),
+                    settings=settings,
+                )
+                self.__logger.info(f"chunk {index}/{len(chunks)} {chunk.key} submitted")
+            in_flight.append(
+                _SubmittedChunk(index, chunk, marker, rows, self.__clock())
+            )
+            rows_matched.append(rows)
+
+        while True:
+            self.__collect(in_flight)
+            if not in_flight:
+                break
+            self.__sleep(self.__poll_interval)
+
+        rows_total = (
+            None
+            if None in rows_matched
+            else sum(rows for rows in rows_matched if rows is not None)
+        )
+        self.__logger.info(
+            f"{len(chunks)} chunks done"
+            + (f", {rows_total} rows affected" if rows_total is not None else "")
+        )
+        return rows_total
@@ -1,6 +1,6 @@
 import typing
 from datetime import datetime
-from typing import List, Sequence
+from typing import List, Mapping, Optional, Sequence
 
 from snuba.manual_jobs.job_status import JobStatus
 from snuba.redis import RedisClientKey, get_redis_client
@@ -29,10 +29,54 @@ def _build_job_type_key(job_id: str) -> str:
     return f"snuba:manual_jobs:{job_id}:job_type"
 
 
-def _acquire_job_lock(job_id: str) -> bool:
+def _build_job_progress_key(job_id: str) -> str:
+    return f"snuba:manual_jobs:{job_id}:progress"
+
+
+# The lock of a running job is refreshed by the runner every third of it,
+# a job whose lock expired is not running anymore.
+JOB_LOCK_TTL_SEC = 60
+
+
+def _acquire_job_lock(job_id: str, owner: str = "1") -> bool:
     return bool(
         _redis_client.set(
-            name=_build_job_lock_key(job_id), value=1, nx=True, ex=(24 * 60 * 60)
+            name=_build_job_lock_key(job_id),
+            value=owner,
+            nx=True,
+            ex=JOB_LOCK_TTL_SEC,
+        )
+    )
+
+
+# Checking the owner and extending or deleting the lock happen atomically,
+# otherwise the lock could expire and be taken by another runner in between.
+_REFRESH_JOB_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_JOB_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def _refresh_job_lock(job_id: str, owner: str) -> bool:
+    """
+    Extends the lock if it is still held by the owner.
+    """
+    return bool(
+        _redis_client.eval(
+            _REFRESH_JOB_LOCK_SCRIPT,
+            1,
+            _build_job_lock_key(job_id),
+            owner,
+            JOB_LOCK_TTL_SEC,
         )
     )
 
@@ -41,8 +85,11 @@ def _push_job_log_line(job_id: str, line: str) -> bool:
     return bool(_redis_client.rpush(_build_job_log_key(job_id), line))
 
 
-def _release_job_lock(job_id: str) -> None:
-    _redis_client.delete(_build_job_lock_key(job_id))
+def _release_job_lock(job_id: str, owner: str) -> None:
+    """
+    Releases the lock if it is still held by the owner.
+    """
+    _redis_client.eval(_RELEASE_JOB_LOCK_SCRIPT, 1, _build_job_lock_key(job_id), owner)
 
 
 def _record_start_time(job_id: str) -> None:
@@ -79,3 +126,22 @@ def _get_job_status_multi(job_ids_keys: Sequence[str]) -> List[JobStatus]:
         redis_status.decode() if redis_status is not None else JobStatus.NOT_STARTED
         for redis_status in _redis_client.mget(job_ids_keys)
     ]
+
+
+def _record_chunk_completed(job_id: str, chunk_key: str, rows: Optional[int]) -> None:
+    _redis_client.hset(
+        _build_job_progress_key(job_id), chunk_key, "" if rows is None else rows
+    )
+
+
+def _get_completed_chunks(job_id: str) -> Mapping[str, Optional[int]]:
+    """
+    The chunks completed by the job, with the number of rows they matched
+    if they were counted.
+    """
+    return {
+        chunk_key.decode(): int(rows) if rows else None
+        for chunk_key, rows in _redis_client.hgetall(
+            _build_job_progress_key(job_id)
+        ).items()
+    }
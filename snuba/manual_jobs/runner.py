@@ -1,6 +1,8 @@
 import logging
 import os
 import traceback
+import uuid
+from threading import Event, Thread
 from typing import Any, Mapping, Sequence, Union
 
 import simplejson
@@ -10,6 +12,7 @@ from snuba.manual_jobs.job_loader import _JobLoader
 from snuba.manual_jobs.job_logging import get_job_logger
 from snuba.manual_jobs.job_status import JobStatus
 from snuba.manual_jobs.redis import (
+    JOB_LOCK_TTL_SEC,
     _acquire_job_lock,
     _build_job_log_key,
     _build_job_status_key,
@@ -17,6 +20,7 @@ from snuba.manual_jobs.redis import (
     _get_job_type,
     _record_start_time,
     _redis_client,
+    _refresh_job_lock,
     _release_job_lock,
     _set_job_status,
 )
@@ -110,15 +114,37 @@ def list_job_specs_with_status(
     }
 
 
+def _keep_job_lock(job_id: str, owner: str, stopped: Event) -> None:
+    while not stopped.wait(JOB_LOCK_TTL_SEC / 3):
+        try:
+            if not _refresh_job_lock(job_id, owner):
+                logger.warning(f"Job {job_id} lost its lock")
+                return
+        except Exception:
+            logger.warning(f"Failed to refresh the lock of job {job_id}", exc_info=True)
+
+
 def run_job(job_spec: JobSpec) -> JobStatus:
+    """
+    Runs a job that was not started yet. A resumable job can also be run
+    again after it failed, or if it is still running but its runner is
+    gone, which is when nothing refreshes its lock anymore.
+    """
     current_job_status = get_job_status(job_spec.job_id)
     job_logger = get_job_logger(logger, job_spec.job_id)
     if current_job_status is not None and current_job_status != JobStatus.NOT_STARTED:
-        raise JobStatusException(job_id=job_spec.job_id, status=current_job_status)
-
-    have_lock = _acquire_job_lock(job_spec.job_id)
+        if not (
+            current_job_status in (JobStatus.FAILED, JobStatus.RUNNING)
+            and Job.get_from_name(job_spec.job_type).is_resumable()
+        ):
+            raise JobStatusException(job_id=job_spec.job_id, status=current_job_status)
+
+    owner = uuid.uuid4().hex
+    have_lock = _acquire_job_lock(job_spec.job_id, owner)
     if not have_lock:
         raise JobLockedException(job_spec.job_id)
+    if current_job_status != JobStatus.NOT_STARTED:
+        job_logger.info(f"[runner] resuming job, status was {current_job_status}")
 
     current_job_status = _set_job_status(job_spec.job_id, JobStatus.NOT_STARTED)
 
@@ -127,6 +153,10 @@ def run_job(job_spec: JobSpec) -> JobStatus:
     running_status_type = (
         JobStatus.ASYNC_RUNNING_BACKGROUND if job_spec.is_async else JobStatus.RUNNING
     )
+    stopped = Event()
+    Thread(
+        target=_keep_job_lock, args=(job_spec.job_id, owner, stopped), daemon=True
+    ).start()
     try:
         current_job_status = _set_job_status(job_spec.job_id, running_status_type)
         _record_start_time(job_spec.job_id)
@@ -139,7 +169,8 @@ def run_job(job_spec: JobSpec) -> JobStatus:
         job_logger.error(f"[runner] job execution failed {e}")
         job_logger.info(f"[runner] exception {traceback.format_exc()}")
     finally:
-        _release_job_lock(job_spec.job_id)
+        stopped.set()
+        _release_job_lock(job_spec.job_id, owner)
 
     return current_job_status
 
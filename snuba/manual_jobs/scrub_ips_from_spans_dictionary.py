@@ -1,10 +1,16 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any, Mapping, Optional
 
 from snuba.clusters.cluster import ClickhouseClientSettings, get_cluster
 from snuba.clusters.storage_sets import StorageSetKey
 from snuba.manual_jobs import Job, JobLogger, JobSpec
+from snuba.manual_jobs.mutations import (
+    MutationChunk,
+    MutationExecutor,
+    split_into_chunks,
+)
 
+_TABLE = "spans_local"
 _DICTIONARY_NAME = "default.project_ids_to_scrub"
 
 
@@ -21,17 +27,33 @@ class ScrubIpFromSentryTagsDictionary(Job):
         self._start_datetime = datetime.fromisoformat(params["start_datetime"])
         self._end_datetime = datetime.fromisoformat(params["end_datetime"])
         self._mutations_sync = params.get("mutations_sync", 0)
+        self._chunk_window = timedelta(hours=params.get("chunk_window_hours", 24))
+        self._max_pending_mutations = params.get("max_pending_mutations", 1)
+        self._count_rows = bool(params.get("count_rows", False))
 
-    def _get_query(self, cluster_name: str | None) -> str:
-        start_datetime = self._start_datetime.strftime("%Y-%m-%dT%H:%M:%S")
-        end_datetime = self._end_datetime.strftime("%Y-%m-%dT%H:%M:%S")
+    @classmethod
+    def is_resumable(cls) -> bool:
+        return True
+
+    def _get_conditions(self, chunk: Optional[MutationChunk] = None) -> str:
+        # The projects are in the dictionary, chunks only split the time range.
+        chunk = chunk or MutationChunk(
+            self._project_ids, self._start_datetime, self._end_datetime
+        )
+        start_datetime = chunk.start.strftime("%Y-%m-%dT%H:%M:%S")
+        end_datetime = chunk.end.strftime("%Y-%m-%dT%H:%M:%S")
+        return f"""dictHas('{_DICTIONARY_NAME}', project_id)
+AND end_timestamp >= toDateTime('{start_datetime}')
+AND end_timestamp < toDateTime('{end_datetime}')"""
+
+    def _get_query(
+        self, cluster_name: str | None, conditions: Optional[str] = None
+    ) -> str:
         on_cluster = f"ON CLUSTER '{cluster_name}'" if cluster_name else ""
-        return f"""ALTER TABLE spans_local
+        return f"""ALTER TABLE {_TABLE}
 {on_cluster}
 UPDATE `sentry_tags.value` = arrayMap((k, v) -> if(k = 'user.ip', 'scrubbed', v), `sentry_tags.key`, `sentry_tags.value`)
-WHERE dictHas('{_DICTIONARY_NAME}', project_id)
-AND end_timestamp >= toDateTime('{start_datetime}')
-AND end_timestamp < toDateTime('{end_datetime}')"""
+WHERE {conditions or self._get_conditions()}"""
 
     def _dictionary_query(self, cluster_name: str | None) -> str:
         project_ids_str = ",".join([str(p) for p in self._project_ids])
@@ -65,14 +87,27 @@ AND end_timestamp < toDateTime('{end_datetime}')"""
         connection.execute(
             query=self._dictionary_query(cluster_name), settings={"mutations_sync": 2}
         )
-        query = self._get_query(cluster_name)
-        logger.info("Executing query: {query}")
-        result = connection.execute(
-            query=query,
+        logger.info(f"Executing query: {self._get_query(cluster_name)}")
+        MutationExecutor(
+            self.job_spec.job_id,
+            connection,
+            _TABLE,
+            logger,
+            max_pending_mutations=self._max_pending_mutations,
+        ).run(
+            split_into_chunks(
+                self._project_ids,
+                self._start_datetime,
+                self._end_datetime,
+                None,
+                self._chunk_window,
+            ),
+            lambda conditions: self._get_query(cluster_name, conditions),
+            self._get_conditions,
             settings={
                 "mutations_sync": self._mutations_sync,
                 "allow_nondeterministic_mutations": True,
             },
+            count_rows=self._count_rows,
         )
         logger.info("complete")
-        logger.info(repr(result))
@@ -1,10 +1,17 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any, Mapping, Optional
 
 from snuba.clusters.cluster import ClickhouseClientSettings, get_cluster
 from snuba.clusters.storage_sets import StorageSetKey
 from snuba.manual_jobs import Job, JobLogger, JobSpec
+from snuba.manual_jobs.mutations import (
+    DEFAULT_IDS_PER_CHUNK,
+    MutationChunk,
+    MutationExecutor,
+    split_into_chunks,
+)
 
+_TABLE = "spans_local"
 _IP_PREFIX = "ip:"
 _SCRUBBED = "scrubbed"
 
@@ -22,13 +29,31 @@ class ScrubUserFromSentryTags(Job):
         self._start_datetime = datetime.fromisoformat(params["start_datetime"])
         self._end_datetime = datetime.fromisoformat(params["end_datetime"])
         self._mutations_sync = params.get("mutations_sync", 0)
+        self._ids_per_chunk = params.get("ids_per_chunk", DEFAULT_IDS_PER_CHUNK)
+        self._chunk_window = timedelta(hours=params.get("chunk_window_hours", 24))
+        self._max_pending_mutations = params.get("max_pending_mutations", 1)
+        self._count_rows = bool(params.get("count_rows", False))
 
-    def _get_query(self, cluster_name: str | None) -> str:
-        project_ids = ",".join([str(p) for p in self._project_ids])
-        start_datetime = self._start_datetime.isoformat()
-        end_datetime = self._end_datetime.isoformat()
+    @classmethod
+    def is_resumable(cls) -> bool:
+        return True
+
+    def _get_conditions(self, chunk: Optional[MutationChunk] = None) -> str:
+        chunk = chunk or MutationChunk(
+            self._project_ids, self._start_datetime, self._end_datetime
+        )
+        project_ids = ",".join([str(p) for p in chunk.ids])
+        start_datetime = chunk.start.isoformat()
+        end_datetime = chunk.end.isoformat()
+        return f"""project_id IN [{project_ids}]
+AND end_timestamp >= toDateTime('{start_datetime}')
+AND end_timestamp < toDateTime('{end_datetime}')"""
+
+    def _get_query(
+        self, cluster_name: str | None, conditions: Optional[str] = None
+    ) -> str:
         on_cluster = f"ON CLUSTER '{cluster_name}'" if cluster_name else ""
-        return f"""ALTER TABLE spans_local
+        return f"""ALTER TABLE {_TABLE}
 {on_cluster}
 UPDATE
     `sentry_tags.value` = arrayMap(
@@ -59,9 +84,7 @@ UPDATE
         ),
         user
     )
-WHERE project_id IN [{project_ids}]
-AND end_timestamp >= toDateTime('{start_datetime}')
-AND end_timestamp < toDateTime('{end_datetime}')"""
+WHERE {conditions or self._get_conditions()}"""
 
     def execute(self, logger: JobLogger) -> None:
         cluster = get_cluster(StorageSetKey.SPANS)
@@ -73,10 +96,24 @@ AND end_timestamp < toDateTime('{end_datetime}')"""
             cluster_name = cluster.get_clickhouse_cluster_name()
         else:
             cluster_name = None
-        query = self._get_query(cluster_name)
-        logger.info("Executing query: {query}")
-        result = connection.execute(
-            query=query, settings={"mutations_sync": self._mutations_sync}
+        logger.info(f"Executing query: {self._get_query(cluster_name)}")
+        MutationExecutor(
+            self.job_spec.job_id,
+            connection,
+            _TABLE,
+            logger,
+            max_pending_mutations=self._max_pending_mutations,
+        ).run(
+            split_into_chunks(
+                self._project_ids,
+                self._start_datetime,
+                self._end_datetime,
+                self._ids_per_chunk,
+                self._chunk_window,
+            ),
+            lambda conditions: self._get_query(cluster_name, conditions),
+            self._get_conditions,
+            settings={"mutations_sync": self._mutations_sync},
+            count_rows=self._count_rows,
         )
         logger.info("complete")
-        logger.info(repr(result))
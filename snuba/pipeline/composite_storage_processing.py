@@ -12,6 +12,7 @@ from snuba.datasets.plans.query_plan import (
     SubqueryProcessors,
 )
 from snuba.datasets.plans.storage_processing import build_best_plan
+from snuba.pipeline.profiling import profile_processor
 from snuba.query import ProcessableQuery
 from snuba.query.composite import CompositeQuery
 from snuba.query.data_source.join import IndividualNode, JoinClause, JoinVisitor
@@ -44,15 +45,16 @@ def apply_composite_storage_processors(
     )
     composite_processors = [SemiJoinOptimizer()]
     for p in composite_processors:
-        if settings.get_dry_run():
-            with explain_meta.with_query_differ(
-                "composite_storage_processor",
-                type(p).__name__,
-                query_plan.translated_source,
-            ):
+        with profile_processor("composite_storage", p):
+            if settings.get_dry_run():
+                with explain_meta.with_query_differ(
+                    "composite_storage_processor",
+                    type(p).__name__,
+                    query_plan.translated_source,
+                ):
+                    p.process_query(query_plan.translated_source, settings)
+            else:
                 p.process_query(query_plan.translated_source, settings)
-        else:
-            p.process_query(query_plan.translated_source, settings)
 
     return query_plan.translated_source
 
@@ -282,7 +284,7 @@ class ProcessorsExecutor(DataSourceVisitor[None, Table], JoinVisitor[None, Table
         for clickhouse_processor in processors:
             with sentry_sdk.start_span(
                 description=type(clickhouse_processor).__name__, op="processor"
-            ):
+            ), profile_processor("storage", clickhouse_processor):
                 clickhouse_processor.process_query(clickhouse_query, self.__settings)
 
     def _visit_simple_source(self, data_source: Table) -> None:
@@ -1,6 +1,7 @@
 import sentry_sdk
 
 from snuba.datasets.entities.factory import get_entity
+from snuba.pipeline.profiling import profile_processor
 from snuba.query.logical import EntityQuery
 from snuba.query.query_settings import QuerySettings
 from snuba.state import explain_meta
@@ -16,7 +17,7 @@ def execute_entity_processors(query: EntityQuery, settings: QuerySettings) -> No
     for processor in entity.get_query_processors():
         with sentry_sdk.start_span(
             description=type(processor).__name__, op="processor"
-        ):
+        ), profile_processor("entity", processor):
             if settings.get_dry_run():
                 with explain_meta.with_query_differ(
                     "entity_processor", type(processor).__name__, query
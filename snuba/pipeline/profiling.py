@@ -0,0 +1,187 @@
+"""
+Opt-in profiling of the query processors.
+
+The pipeline stages only record coarse ``Timer`` marks, which do not tell
+which query processor dominates the processing time of a query. When a
+query is sampled for profiling every processor run by the pipeline is
+timed and, optionally, the whole processing is captured with cProfile.
+The results are added to the query stats, so they end up in the querylog.
+
+Everything is controlled by runtime config:
+
+* ``processor_profiling_sample_rate`` (default 0) is the fraction of the
+  queries whose processors are timed.
+* ``processor_profiling:referrer:<referrer>`` set to 1 times every query
+  of the referrer.
+* ``processor_cprofile_sample_rate`` (default 0) is the fraction of the
+  timed queries that are also captured with cProfile. cProfile slows down
+  the processing a lot so this should stay small.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, MutableMapping, Optional
+
+from snuba import state
+
+logger = logging.getLogger(__name__)
+
+# Number of functions kept in the cProfile report attached to the stats.
+CPROFILE_TOP_FUNCTIONS = 20
+
+
+class ProcessorProfiler:
+    """
+    Collects the time spent in each processor for one query. Processors
+    that run more than once for the same query (composite queries) are
+    accumulated.
+    """
+
+    def __init__(self, capture_cprofile: bool = False) -> None:
+        self.__capture_cprofile = capture_cprofile
+        self.__timings_ms: MutableMapping[str, float] = {}
+        self.__cprofile: Optional[cProfile.Profile] = None
+
+    @property
+    def timings_ms(self) -> MutableMapping[str, float]:
+        return self.__timings_ms
+
+    def record(self, stage: str, name: str, duration_ms: float) -> None:
+        key = f"{stage}.{name}"
+        self.__timings_ms[key] = self.__timings_ms.get(key, 0.0) + duration_ms
+
+    @contextmanager
+    def capture(self) -> Iterator[None]:
+        """
+        Runs cProfile over the block if this query was sampled for it.
+        """
+        if not self.__capture_cprofile:
+            yield
+            return
+
+        profile = self.__cprofile or cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.__cprofile = profile
+
+    def get_cprofile_report(self) -> Optional[str]:
+        if self.__cprofile is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(self.__cprofile, stream=output).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(CPROFILE_TOP_FUNCTIONS)
+        return output.getvalue()
+
+    def to_stats(self) -> MutableMapping[str, Any]:
+        stats: MutableMapping[str, Any] = {
+            "processor_timings_ms": {
+                name: round(duration, 3) for name, duration in self.__timings_ms.items()
+            }
+        }
+        report = self.get_cprofile_report()
+        if report is not None:
+            stats["processor_cprofile"] = report
+        return stats
+
+
+_current_profiler: ContextVar[Optional[ProcessorProfiler]] = ContextVar(
+    "processor_profiler", default=None
+)
+
+
+def _should_profile(referrer: str) -> bool:
+    if state.get_int_config(f"processor_profiling:referrer:{referrer}", 0):
+        return True
+    sample_rate = state.get_float_config("processor_profiling_sample_rate", 0.0)
+    return sample_rate is not None and random.random() < sample_rate
+
+
+@contextmanager
+def processor_profiling(
+    referrer: str, force: bool = False
+) -> Iterator[Optional[ProcessorProfiler]]:
+    """
+    Decides whether the query is profiled and, if so, makes the profiler
+    available to the processor hooks for the duration of the block.
+    ``force`` skips the sampling and is used by offline tools.
+    """
+    if not force and not _should_profile(referrer):
+        yield None
+        return
+
+    cprofile_sample_rate = state.get_float_config("processor_cprofile_sample_rate", 0.0)
+    profiler = ProcessorProfiler(
+        capture_cprofile=cprofile_sample_rate is not None
+        and random.random() < cprofile_sample_rate
+    )
+    token = _current_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _current_profiler.reset(token)
+
+
+def get_current_profiler() -> Optional[ProcessorProfiler]:
+    return _current_profiler.get()
+
+
+@contextmanager
+def profile_processor(stage: str, processor: object) -> Iterator[None]:
+    """
+    Times the processor run in the block if the current query is profiled.
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(
+            stage,
+            type(processor).__name__,
+            (time.perf_counter() - start) * 1000,
+        )
+
+
+@contextmanager
+def capture_cprofile() -> Iterator[None]:
+    """
+    Runs cProfile over the block if the current query was sampled for it.
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+
+    with profiler.capture():
+        yield
+
+
+def get_profiling_stats() -> MutableMapping[str, Any]:
+    """
+    Stats to add to the query stats for the current query. Empty if the
+    query is not profiled.
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        return {}
+    return profiler.to_stats()
@@ -2,21 +2,31 @@ from __future__ import annotations
 
 import logging
 import textwrap
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
 from dataclasses import replace
+from functools import partial
 from math import floor
-from typing import Any, MutableMapping, Optional
+from typing import Any, Callable, MutableMapping, Optional, Sequence, Tuple
 
 import sentry_sdk
 
 from snuba import environment
 from snuba import settings as snuba_settings
+from snuba import state
 from snuba.attribution.attribution_info import AttributionInfo
 from snuba.clickhouse.formatter.query import format_query
 from snuba.clickhouse.query import Query as ClickhouseQuery
 from snuba.clickhouse.query_inspector import TablesCollector
 from snuba.clusters.cluster import ClickhouseCluster
+from snuba.datasets.entities.storage_selectors.rollup import ROLLUP_COVERAGE
+from snuba.datasets.plans.cluster_selector import ColumnBasedStorageSliceSelector
 from snuba.datasets.slicing import is_storage_set_sliced
+from snuba.datasets.storage import ReadableStorage
 from snuba.datasets.storages.factory import get_storage
+from snuba.pipeline.profiling import get_profiling_stats
 from snuba.pipeline.query_pipeline import QueryPipelineData, QueryPipelineStage
 from snuba.pipeline.utils.storage_finder import StorageKeyFinder
 from snuba.query.composite import CompositeQuery
@@ -29,6 +39,12 @@ from snuba.querylog.query_metadata import (
 )
 from snuba.reader import Reader
 from snuba.settings import MAX_QUERY_SIZE_BYTES
+from snuba.utils.cancellation import (
+    DEADLINE_EXCEEDED,
+    Cancellation,
+    cancellable,
+    get_current_cancellation,
+)
 from snuba.utils.metrics.gauge import Gauge
 from snuba.utils.metrics.timer import Timer
 from snuba.utils.metrics.wrapper import MetricsWrapper
@@ -40,10 +56,24 @@ from snuba.web import (
     transform_column_names,
 )
 from snuba.web.db_query import db_query, update_query_metadata_and_stats
+from snuba.web.scatter_gather import (
+    MergePlan,
+    build_merge_plan,
+    build_slice_query,
+    merge_results,
+    merge_stats,
+)
 
 metrics = MetricsWrapper(environment.metrics, "api")
 logger = logging.getLogger("snuba.pipeline.stages.query_execution")
 
+scatter_gather_executor = ThreadPoolExecutor(
+    max_workers=snuba_settings.SCATTER_GATHER_MAX_WORKERS,
+    thread_name_prefix="scatter-gather",
+)
+
+SliceTargets = Sequence[Tuple[int, ClickhouseCluster, Sequence[int]]]
+
 
 class ExecutionStage(
     QueryPipelineStage[ClickhouseQuery | CompositeQuery[Table], QueryResult]
@@ -54,6 +84,7 @@ class ExecutionStage(
         query_metadata: SnubaQueryMetadata,
         robust: bool = False,
         concurrent_queries_gauge: Optional[Gauge] = None,
+        partition_key_column_name: Optional[str] = None,
     ):
         self._attribution_info = attribution_info
         self._query_metadata = query_metadata
@@ -61,6 +92,24 @@ class ExecutionStage(
         self._robust = robust
         # NOTE (Volo): this should probably exist by default or not at all
         self._concurrent_queries_gauge = concurrent_queries_gauge
+        # The column the data of sliced storages is partitioned by, it is
+        # defined by the entity the query was made on.
+        self._partition_key_column_name = partition_key_column_name
+
+    def _get_slice_selector(
+        self, query: ClickhouseQuery | CompositeQuery[Table], storage: ReadableStorage
+    ) -> ColumnBasedStorageSliceSelector:
+        if self._partition_key_column_name is None or not isinstance(
+            query, ClickhouseQuery
+        ):
+            raise NotImplementedError(
+                "sliced storages are only supported for entity queries with a partition key"
+            )
+        return ColumnBasedStorageSliceSelector(
+            storage=storage.get_storage_key(),
+            storage_set=storage.get_storage_set_key(),
+            partition_key_column_name=self._partition_key_column_name,
+        )
 
     def get_cluster(
         self, query: ClickhouseQuery | CompositeQuery[Table], settings: QuerySettings
@@ -68,12 +117,64 @@ class ExecutionStage(
         storage_key = StorageKeyFinder().visit(query)
         storage = get_storage(storage_key)
         if is_storage_set_sliced(storage.get_storage_set_key()):
-            raise NotImplementedError("sliced storages not supported in new pipeline")
+            selector = self._get_slice_selector(query, storage)
+            assert isinstance(query, ClickhouseQuery)
+            return selector.select_cluster(query, settings)
         return storage.get_cluster()
 
+    def get_scatter_gather_targets(
+        self, query: ClickhouseQuery | CompositeQuery[Table]
+    ) -> Optional[Tuple[MergePlan, SliceTargets]]:
+        """
+        Returns the slices to run the query on and how to merge their
+        results if the query filters on ids living in several slices and
+        its results can be merged. Otherwise the query runs on a single
+        cluster picked by `get_cluster`.
+        """
+        storage = get_storage(StorageKeyFinder().visit(query))
+        storage_set = storage.get_storage_set_key()
+        if not is_storage_set_sliced(storage_set) or not state.get_int_config(
+            "scatter_gather_enabled", 1
+        ):
+            return None
+
+        selector = self._get_slice_selector(query, storage)
+        assert isinstance(query, ClickhouseQuery)
+        slices = selector.select_slices(query)
+        if slices is None or len(slices) < 2:
+            return None
+        plan = build_merge_plan(query, selector.partition_key_column_name)
+        if plan is None:
+            metrics.increment(
+                "scatter_gather.unmergeable", tags={"storage_set": storage_set.value}
+            )
+            return None
+        return plan, [
+            (slice_id, storage.get_cluster(slice_id), ids)
+            for slice_id, ids in slices.items()
+        ]
+
     def _process_data(
         self, pipe_input: QueryPipelineData[ClickhouseQuery | CompositeQuery[Table]]
     ) -> QueryResult:
+        if not pipe_input.query_settings.get_dry_run():
+            targets = self.get_scatter_gather_targets(pipe_input.data)
+            if targets is not None:
+                plan, slices = targets
+                assert isinstance(pipe_input.data, ClickhouseQuery)
+                assert self._partition_key_column_name is not None
+                return _scatter_gather_and_run(
+                    timer=pipe_input.timer,
+                    query_metadata=self._query_metadata,
+                    attribution_info=self._attribution_info,
+                    robust=self._robust,
+                    clickhouse_query=pipe_input.data,
+                    query_settings=pipe_input.query_settings,
+                    plan=plan,
+                    partition_key_column_name=self._partition_key_column_name,
+                    slices=slices,
+                )
+
         cluster = self.get_cluster(pipe_input.data, pipe_input.query_settings)
         if pipe_input.query_settings.get_dry_run():
             return _dry_run_query_runner(
@@ -147,7 +248,13 @@ def _run_and_apply_column_names(
         concurrent_queries_gauge,
         cluster_name,
     )
+    _apply_column_names(clickhouse_query, result)
+    return result
+
 
+def _apply_column_names(
+    clickhouse_query: ClickhouseQuery | CompositeQuery[Table], result: QueryResult
+) -> None:
     alias_name_mapping: MutableMapping[str, list[str]] = {}
     for select_col in clickhouse_query.get_selected_columns():
         alias = select_col.expression.alias
@@ -167,6 +274,131 @@ def _run_and_apply_column_names(
             alias_name_mapping[alias] = [name]
 
     transform_column_names(result, alias_name_mapping)
+
+
+def _in_slice_context(
+    function: Callable[[], QueryResult], cancellation: Cancellation
+) -> Callable[[], QueryResult]:
+    """
+    Binds the function to the current context and runs it under the
+    cancellation of its slice, which is also cancelled with the request.
+    """
+    context = copy_context()
+    request_cancellation = get_current_cancellation()
+
+    def run() -> QueryResult:
+        with cancellable(cancellation), (
+            request_cancellation.linked(cancellation)
+            if request_cancellation is not None
+            else nullcontext()
+        ):
+            return function()
+
+    return lambda: context.run(run)
+
+
+def _scatter_gather_and_run(
+    timer: Timer,
+    query_metadata: SnubaQueryMetadata,
+    attribution_info: AttributionInfo,
+    robust: bool,
+    clickhouse_query: ClickhouseQuery,
+    query_settings: QuerySettings,
+    plan: MergePlan,
+    partition_key_column_name: str,
+    slices: SliceTargets,
+) -> QueryResult:
+    """
+    Runs the query on each slice concurrently, restricted to the ids of the
+    slice, and merges the results.
+
+    All the slices share the `scatter_gather_slice_timeout_sec` deadline,
+    which caps the time ClickHouse is allowed to spend on their queries. A
+    slice still running past it is killed. If a slice fails or times out
+    the query fails, unless `scatter_gather_allow_partial_results` is set,
+    in which case the results of the other slices are returned and the
+    failed slices are reported in the stats.
+    """
+    timeout = state.get_config(
+        "scatter_gather_slice_timeout_sec",
+        snuba_settings.SCATTER_GATHER_SLICE_TIMEOUT_SEC,
+    )
+    assert isinstance(timeout, (int, float))
+    deadline = time.time() + timeout
+    request_cancellation = get_current_cancellation()
+    request_remaining = (
+        request_cancellation.remaining() if request_cancellation is not None else None
+    )
+    if request_remaining is not None:
+        deadline = min(deadline, time.time() + request_remaining)
+
+    futures: list[tuple[int, Cancellation, Future[QueryResult]]] = []
+    for slice_id, cluster, ids in slices:
+        run_slice = partial(
+            _format_storage_query_and_run,
+            timer,
+            query_metadata,
+            attribution_info,
+            build_slice_query(clickhouse_query, plan, partition_key_column_name, ids),
+            query_settings,
+            cluster.get_reader(),
+            robust,
+            cluster_name=cluster.get_clickhouse_cluster_name() or "",
+        )
+        cancellation = Cancellation(deadline)
+        futures.append(
+            (
+                slice_id,
+                cancellation,
+                scatter_gather_executor.submit(
+                    _in_slice_context(run_slice, cancellation)
+                ),
+            )
+        )
+
+    results = []
+    failed_slices = []
+    error: Optional[Exception] = None
+    for slice_id, cancellation, future in futures:
+        try:
+            results.append(future.result(timeout=max(deadline - time.time(), 0)))
+        except Exception as e:
+            if not future.cancel():
+                cancellation.cancel(DEADLINE_EXCEEDED)
+            failed_slices.append(slice_id)
+            error = error or e
+            metrics.increment(
+                "scatter_gather.slice_failed",
+                tags={"slice_id": str(slice_id), "error": type(e).__name__},
+            )
+    if error is not None and (
+        not results
+        or not state.get_int_config("scatter_gather_allow_partial_results", 0)
+    ):
+        raise error
+
+    metrics.increment(
+        "scatter_gather.query",
+        tags={"slices": str(len(slices)), "partial": str(bool(failed_slices))},
+    )
+    merged = merge_results(plan, [r.result for r in results])
+    extra = results[0].extra
+    result = QueryResult(
+        merged,
+        {
+            "stats": {
+                **merge_stats([r.extra["stats"] for r in results], merged),
+                "scatter_gather": {
+                    "slices": [slice_id for slice_id, _, _ in slices],
+                    "failed_slices": failed_slices,
+                    "partial": bool(failed_slices),
+                },
+            },
+            "sql": extra["sql"],
+            "experiments": extra["experiments"],
+        },
+    )
+    _apply_column_names(clickhouse_query, result)
     return result
 
 
@@ -218,7 +450,11 @@ def _format_storage_query_and_run(
         "referrer": attribution_info.referrer,
         "sample": visitor.get_sample_rate(),
         "cluster_name": cluster_name,
+        **get_profiling_stats(),
     }
+    rollup_coverage = clickhouse_query.get_experiment_value(ROLLUP_COVERAGE)
+    if rollup_coverage is not None:
+        stats[ROLLUP_COVERAGE] = rollup_coverage
 
     if query_size_bytes > MAX_QUERY_SIZE_BYTES:
         cause = QueryTooLongException(
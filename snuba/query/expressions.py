@@ -1,9 +1,19 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, replace
+from dataclasses import dataclass, fields, replace
 from datetime import date, datetime
-from typing import Callable, Generic, Iterator, Optional, Tuple, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from snuba import settings
 
@@ -17,6 +27,11 @@ TVisited = TypeVar("TVisited")
 # Sometimes however, we want the raw data, and this allows us to print that out
 _AUTO_REPR = not settings.PRETTY_FORMAT_EXPRESSIONS
 
+# Expressions are immutable so values derived from the whole subtree are
+# computed once and stored on the instance under these attributes.
+_CACHED_HASH = "_cached_hash"
+_CACHED_SUBTREE_SIZE = "_cached_subtree_size"
+
 
 # This is a workaround for a mypy bug, found here: https://github.com/python/mypy/issues/5374
 @dataclass(frozen=True, repr=_AUTO_REPR)
@@ -47,6 +62,12 @@ class Expression(_Expression, ABC):
         All expressions are frozen dataclasses. This means they are immutable and
         format will either return self or a new instance. It cannot transform the
         expression in place.
+
+        Intermediate nodes whose children are all returned unchanged (the same
+        instance) by the transformation are not copied, the original node is
+        passed to the function instead. So a transformation that changes nothing
+        returns the original tree and one that changes a few nodes only copies
+        the path from those nodes to the root.
         """
         raise NotImplementedError
 
@@ -86,6 +107,75 @@ class Expression(_Expression, ABC):
         """
         raise NotImplementedError
 
+    @property
+    def subtree_size(self) -> int:
+        """
+        Number of nodes in the subtree rooted in this expression, including
+        the expression itself.
+        """
+        size = self.__dict__.get(_CACHED_SUBTREE_SIZE)
+        if size is None:
+            size = sum(1 for _ in self)
+            self.__dict__[_CACHED_SUBTREE_SIZE] = size
+        return size
+
+    def _get_cached_hash(self) -> int:
+        """
+        Hashing a dataclass hashes all its fields, so hashing an intermediate
+        node hashes its whole subtree. Intermediate nodes call this from
+        __hash__ to only do it once.
+        """
+        cached = self.__dict__.get(_CACHED_HASH)
+        if cached is None:
+            cached = hash(tuple(getattr(self, field.name) for field in fields(self)))
+            self.__dict__[_CACHED_HASH] = cached
+        return cached
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # String hashes are randomized per process, the cached hash must not
+        # be carried over when the expression is pickled.
+        return {
+            key: value
+            for key, value in self.__dict__.items()
+            if key not in (_CACHED_HASH, _CACHED_SUBTREE_SIZE)
+        }
+
+
+def fuse_transforms(
+    *funcs: Callable[[Expression], Expression]
+) -> Callable[[Expression], Expression]:
+    """
+    Combines several transformation functions into one so they can be
+    applied with a single traversal of the tree instead of one each:
+    ``exp.transform(fuse_transforms(f, g))``.
+
+    Each node is passed through the functions in order. This is equivalent
+    to ``exp.transform(f).transform(g)`` as long as ``f`` does not depend on
+    what ``g`` does to the children of the nodes it processes, which is the
+    case for functions that only look at the node they are given.
+    """
+
+    def fused(exp: Expression) -> Expression:
+        for func in funcs:
+            exp = func(exp)
+        return exp
+
+    return fused
+
+
+def _transform_parameters(
+    parameters: Tuple[Expression, ...], func: Callable[[Expression], Expression]
+) -> Tuple[Expression, ...]:
+    """
+    Transforms all the parameters and returns the original tuple if all of
+    them were returned unchanged.
+    """
+    transformed = tuple([child.transform(func) for child in parameters])
+    for new, old in zip(transformed, parameters):
+        if new is not old:
+            return transformed
+    return parameters
+
 
 class ExpressionVisitor(ABC, Generic[TVisited]):
     """
@@ -360,13 +450,16 @@ class SubscriptableReference(Expression):
         return visitor.visit_subscriptable_reference(self)
 
     def transform(self, func: Callable[[Expression], Expression]) -> Expression:
-        transformed = replace(
-            self,
-            column=self.column.transform(func),
-            key=self.key.transform(func),
-        )
+        column = self.column.transform(func)
+        key = self.key.transform(func)
+        if column is self.column and key is self.key:
+            return func(self)
+        transformed = replace(self, column=column, key=key)
         return func(transformed)
 
+    def __hash__(self) -> int:
+        return self._get_cached_hash()
+
     def __iter__(self) -> Iterator[Expression]:
         # Since column is a column and key is a literal and since none of
         # them is a composite expression we would achieve the same result by yielding
@@ -415,12 +508,15 @@ class FunctionCall(Expression):
         transformation function and we do not run that same function over the
         new children.
         """
-        transformed = replace(
-            self,
-            parameters=tuple(map(lambda child: child.transform(func), self.parameters)),
-        )
+        parameters = _transform_parameters(self.parameters, func)
+        if parameters is self.parameters:
+            return func(self)
+        transformed = replace(self, parameters=parameters)
         return func(transformed)
 
+    def __hash__(self) -> int:
+        return self._get_cached_hash()
+
     def __iter__(self) -> Iterator[Expression]:
         """
         Traverse the subtree in a postfix order.
@@ -475,13 +571,23 @@ class CurriedFunctionCall(Expression):
         one transforms the internal function before applying the function to the
         parameters.
         """
+        internal_function = self.internal_function.transform(func)
+        parameters = _transform_parameters(self.parameters, func)
+        if (
+            internal_function is self.internal_function
+            and parameters is self.parameters
+        ):
+            return func(self)
         transformed = replace(
             self,
-            internal_function=self.internal_function.transform(func),
-            parameters=tuple(map(lambda child: child.transform(func), self.parameters)),
+            internal_function=internal_function,
+            parameters=parameters,
         )
         return func(transformed)
 
+    def __hash__(self) -> int:
+        return self._get_cached_hash()
+
     def __iter__(self) -> Iterator[Expression]:
         """
         Traverse the subtree in a postfix order.
@@ -550,9 +656,15 @@ class Lambda(Expression):
         Applies the transformation to the inner expression but not to the parameters
         declaration.
         """
-        transformed = replace(self, transformation=self.transformation.transform(func))
+        transformation = self.transformation.transform(func)
+        if transformation is self.transformation:
+            return func(self)
+        transformed = replace(self, transformation=transformation)
         return func(transformed)
 
+    def __hash__(self) -> int:
+        return self._get_cached_hash()
+
     def __iter__(self) -> Iterator[Expression]:
         """
         Traverse the subtree in a postfix order.
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from dataclasses import replace
+from typing import Callable
 
 from snuba.datasets.dataset import Dataset
 from snuba.datasets.factory import get_dataset_name
 from snuba.query.composite import CompositeQuery
-from snuba.query.conditions import build_match
+from snuba.query.conditions import ConditionFunctions, build_match
 from snuba.query.data_source.join import (
     JoinClause,
     JoinCondition,
@@ -13,7 +14,13 @@ from snuba.query.data_source.join import (
 )
 from snuba.query.data_source.simple import Entity as QueryEntity
 from snuba.query.exceptions import InvalidQueryException
-from snuba.query.expressions import Column, Expression, FunctionCall, Literal
+from snuba.query.expressions import (
+    Column,
+    Expression,
+    FunctionCall,
+    Literal,
+    fuse_transforms,
+)
 from snuba.query.logical import Query as LogicalQuery
 
 
@@ -37,62 +44,27 @@ def resolve_tag_column_name(
         return f"tags_raw[{resolve(value, mapping)}]"
 
 
-def resolve_tag_key_mappings(
-    query: CompositeQuery[QueryEntity] | LogicalQuery,
-    indexer_mapping: dict[str, str | int],
-    dataset: Dataset,
-) -> None:
-    def resolve_tag_column(exp: Expression) -> Expression:
-        if isinstance(exp, Column) and exp.column_name in indexer_mapping:
-            column_name = resolve_tag_column_name(
-                exp.column_name, indexer_mapping, dataset
-            )
-            return replace(exp, column_name=column_name)
-        return exp
-
-    def resolve_join_conditions(
-        join_clause: JoinClause[QueryEntity],
-    ) -> JoinClause[QueryEntity]:
-        # If MQL query is a formula query contain group bys, then the groupby columns will be
-        # pushed into the join conditions. Therefore, they must be resolved.
-        if isinstance(join_clause.left_node, JoinClause):
-            join_clause = replace(
-                join_clause, left_node=resolve_join_conditions(join_clause.left_node)
-            )
-        keys = []
-        for join_cond in join_clause.keys:
-            left = join_cond.left
-            right = join_cond.right
-            if left.column in indexer_mapping:
-                resolved_name = resolve_tag_column_name(
-                    left.column, indexer_mapping, dataset
-                )
-                left = JoinConditionExpression(left.table_alias, resolved_name)
-            if right.column in indexer_mapping:
-                resolved_name = resolve_tag_column_name(
-                    right.column, indexer_mapping, dataset
-                )
-                right = JoinConditionExpression(right.table_alias, resolved_name)
-            new_join_cond = JoinCondition(left, right)
-            keys.append(new_join_cond)
-        return replace(join_clause, keys=keys)
-
-    query.transform_expressions(resolve_tag_column)
-    if isinstance(query, CompositeQuery):
-        from_clause = query.get_from_clause()
-        if isinstance(from_clause, JoinClause):
-            join_clause = resolve_join_conditions(from_clause)
-            query.set_from_clause(join_clause)
+def _get_tags_column(dataset: Dataset) -> str:
+    return "tags" if get_dataset_name(dataset) == "metrics" else "tags_raw"
 
 
-METRIC_ID_MATCH = build_match(col="metric_id", param_type=str)
+class IndexerLookup:
+    """
+    Lookup tables built once from the indexer mapping of a query, so the
+    rules resolving its expressions do not resolve the same names for each
+    node they look at.
+    """
 
+    def __init__(
+        self, mapping: dict[str, str | int], tags_column: str = "tags_raw"
+    ) -> None:
+        self.mapping = mapping
+        self.tag_columns = {
+            key: f"{tags_column}[{value}]" for key, value in mapping.items()
+        }
+        self.__metric_ids: dict[str, int] = {}
 
-def resolve_metric_id_mapping(
-    query: CompositeQuery[QueryEntity] | LogicalQuery,
-    indexer_mapping: dict[str, str | int],
-) -> None:
-    def full_resolve(value: str, mappings: dict[str, str | int]) -> int:
+    def metric_id(self, value: str) -> int:
         # We support passing in either public_name or mri in MQL.
         # The indexer_mapping follows the order: public_name -> mri -> metric_id
         # For exmaple: {
@@ -100,25 +72,63 @@ def resolve_metric_id_mapping(
         #     "d:transactions/duration@millisecond": 100001,
         # }
         # Therefore, we need to resolve the string down to the integer metric_id
-        mapping = resolve(value, mappings)
-        if isinstance(mapping, str):
-            return full_resolve(mapping, mappings)
-        return mapping
+        metric_id = self.__metric_ids.get(value)
+        if metric_id is None:
+            mapping = resolve(value, self.mapping)
+            if isinstance(mapping, str):
+                metric_id = self.metric_id(mapping)
+            else:
+                metric_id = mapping
+            self.__metric_ids[value] = metric_id
+        return metric_id
+
+
+def tag_key_rule(lookup: IndexerLookup) -> Callable[[Expression], Expression]:
+    def resolve_tag_column(exp: Expression) -> Expression:
+        if isinstance(exp, Column):
+            column_name = lookup.tag_columns.get(exp.column_name)
+            if column_name is not None:
+                return replace(exp, column_name=column_name)
+        return exp
+
+    return resolve_tag_column
+
+
+METRIC_ID_MATCH = build_match(col="metric_id", param_type=str)
+
+
+def _may_match_metric_id(exp: Expression) -> bool:
+    """
+    Cheaper than matching METRIC_ID_MATCH, which is only worth trying on the
+    few nodes this accepts.
+    """
+    if not isinstance(exp, FunctionCall) or exp.function_name not in (
+        ConditionFunctions.EQ,
+        ConditionFunctions.IN,
+    ):
+        return False
+    lhs = exp.parameters[0] if exp.parameters else None
+    return isinstance(lhs, Column) and lhs.column_name == "metric_id"
+
+
+def metric_id_rule(lookup: IndexerLookup) -> Callable[[Expression], Expression]:
+    mapping = lookup.mapping
 
     def resolve_metric_id(exp: Expression) -> Expression:
+        if not _may_match_metric_id(exp):
+            return exp
         if match := METRIC_ID_MATCH.match(exp):
             rhs = match.expression("rhs")
             lhs = match.expression("column")
             new_rhs: Expression | None = None
-            if isinstance(rhs, Literal) and rhs.value in indexer_mapping:
-                mapping = full_resolve(str(rhs.value), indexer_mapping)
-                new_rhs = replace(rhs, value=mapping)
+            if isinstance(rhs, Literal) and rhs.value in mapping:
+                new_rhs = replace(rhs, value=lookup.metric_id(str(rhs.value)))
             elif isinstance(rhs, FunctionCall):  # Array with an IN operator
                 new_parameters: list[Expression] = []
                 for param in rhs.parameters:
-                    if isinstance(param, Literal) and param.value in indexer_mapping:
-                        mapping = full_resolve(str(param.value), indexer_mapping)
-                        new_parameters.append(replace(param, value=mapping))
+                    if isinstance(param, Literal) and param.value in mapping:
+                        metric_id = lookup.metric_id(str(param.value))
+                        new_parameters.append(replace(param, value=metric_id))
                     else:
                         new_parameters.append(param)
                 new_rhs = replace(rhs, parameters=tuple(new_parameters))
@@ -135,7 +145,70 @@ def resolve_metric_id_mapping(
 
         return exp
 
-    query.transform_expressions(resolve_metric_id)
+    return resolve_metric_id
+
+
+def tag_value_rule(lookup: IndexerLookup) -> Callable[[Expression], Expression]:
+    mapping = lookup.mapping
+
+    def resolve_tag_value(exp: Expression) -> Expression:
+        if isinstance(exp, Literal) and exp.value in mapping:
+            return Literal(None, mapping[str(exp.value)])
+        return exp
+
+    return resolve_tag_value
+
+
+def _resolve_join_conditions(
+    join_clause: JoinClause[QueryEntity], lookup: IndexerLookup
+) -> JoinClause[QueryEntity]:
+    # If MQL query is a formula query contain group bys, then the groupby columns will be
+    # pushed into the join conditions. Therefore, they must be resolved.
+    if isinstance(join_clause.left_node, JoinClause):
+        join_clause = replace(
+            join_clause,
+            left_node=_resolve_join_conditions(join_clause.left_node, lookup),
+        )
+    keys = []
+    for join_cond in join_clause.keys:
+        left = join_cond.left
+        right = join_cond.right
+        if left.column in lookup.tag_columns:
+            left = JoinConditionExpression(
+                left.table_alias, lookup.tag_columns[left.column]
+            )
+        if right.column in lookup.tag_columns:
+            right = JoinConditionExpression(
+                right.table_alias, lookup.tag_columns[right.column]
+            )
+        keys.append(JoinCondition(left, right))
+    return replace(join_clause, keys=keys)
+
+
+def _resolve_join_clause(
+    query: CompositeQuery[QueryEntity] | LogicalQuery, lookup: IndexerLookup
+) -> None:
+    if isinstance(query, CompositeQuery):
+        from_clause = query.get_from_clause()
+        if isinstance(from_clause, JoinClause):
+            query.set_from_clause(_resolve_join_conditions(from_clause, lookup))
+
+
+def resolve_tag_key_mappings(
+    query: CompositeQuery[QueryEntity] | LogicalQuery,
+    indexer_mapping: dict[str, str | int],
+    dataset: Dataset,
+) -> None:
+    lookup = IndexerLookup(indexer_mapping, _get_tags_column(dataset))
+    query.transform_expressions(tag_key_rule(lookup))
+    _resolve_join_clause(query, lookup)
+
+
+def resolve_metric_id_mapping(
+    query: CompositeQuery[QueryEntity] | LogicalQuery,
+    indexer_mapping: dict[str, str | int],
+) -> None:
+    query.transform_expressions(metric_id_rule(IndexerLookup(indexer_mapping)))
 
 
 def resolve_tag_value_mappings(
@@ -147,14 +220,7 @@ def resolve_tag_value_mappings(
 
     The metrics (release-health) dataset indexes both tag keys and tag values.
     """
-
-    def resolve_tag_value(exp: Expression) -> Expression:
-        if isinstance(exp, Literal) and exp.value in indexer_mappings:
-            mapping = resolve(str(exp.value), indexer_mappings)
-            return Literal(None, mapping)
-        return exp
-
-    query.transform_expressions(resolve_tag_value)
+    query.transform_expressions(tag_value_rule(IndexerLookup(indexer_mappings)))
 
 
 def resolve_mappings(
@@ -167,8 +233,17 @@ def resolve_mappings(
     This might be subjected to change in the future. As a result, this function
     mimics the behavior of the indexer to resolve the metric_id and tag filters
     by using the indexer_mapping provided by the client.
+
+    The tag keys, metric ids and tag values are resolved in a single traversal
+    of the query. The tag values of a metric id condition are resolved before
+    the condition itself, this gives the same metric id since the mapping
+    chains public names to MRIs to metric ids.
     """
-    resolve_tag_key_mappings(query, mappings, dataset)
-    resolve_metric_id_mapping(query, mappings)
+    lookup = IndexerLookup(mappings, _get_tags_column(dataset))
+    rules = [tag_key_rule(lookup), metric_id_rule(lookup)]
+    # The metrics (release-health) dataset indexes both tag keys and tag
+    # values, the other ones only tag keys.
     if get_dataset_name(dataset) == "metrics":
-        resolve_tag_value_mappings(query, mappings)
+        rules.append(tag_value_rule(lookup))
+    query.transform_expressions(fuse_transforms(*rules))
+    _resolve_join_clause(query, lookup)
@@ -1,5 +1,6 @@
+import time
 from dataclasses import replace
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import MutableMapping, Optional, Set
 
 from snuba import environment, settings
@@ -8,11 +9,21 @@ from snuba.clickhouse.query_dsl.accessors import (
     get_object_ids_in_query_ast,
     get_time_range,
 )
-from snuba.query.conditions import not_in_condition
+from snuba.query.conditions import (
+    ConditionFunctions,
+    binary_condition,
+    not_in_condition,
+)
 from snuba.query.expressions import Column, FunctionCall, Literal
 from snuba.query.processors.physical import ClickhouseQueryProcessor
 from snuba.query.query_settings import QuerySettings, SubscriptionQuerySettings
 from snuba.replacers.projects_query_flags import ProjectsQueryFlags
+from snuba.replacers.replaced_groups_dictionary import (
+    DICTIONARY_NAME,
+    get_groups_not_loaded,
+    get_min_groups,
+    is_dictionary_enabled,
+)
 from snuba.replacers.replacer_processor import ReplacerState
 from snuba.state import get_config
 from snuba.utils.metrics.wrapper import MetricsWrapper
@@ -20,6 +31,8 @@ from snuba.utils.metrics.wrapper import MetricsWrapper
 metrics = MetricsWrapper(environment.metrics, "processors.replaced_groups")
 FINAL_METRIC = "final"
 CONSISTENCY_DENYLIST_METRIC = "post_replacement_consistency_projects_denied"
+DICTIONARY_METRIC = "dictionary_exclusion"
+EXCLUSION_MARGIN_SEC = 60
 
 
 class PostReplacementConsistencyEnforcer(ClickhouseQueryProcessor):
@@ -97,8 +110,6 @@ class PostReplacementConsistencyEnforcer(ClickhouseQueryProcessor):
             )
             set_final = True
         elif flags.group_ids_to_exclude:
-            # If the number of groups to exclude exceeds our limit, the query
-            # should just use final instead of the exclusion set.
             max_group_ids_exclude = get_config(
                 "max_group_ids_exclude",
                 settings.REPLACER_MAX_GROUP_IDS_TO_EXCLUDE,
@@ -107,10 +118,38 @@ class PostReplacementConsistencyEnforcer(ClickhouseQueryProcessor):
             groups_to_exclude = self._groups_to_exclude(
                 query, flags.group_ids_to_exclude
             )
+            # Redis drops the oldest groups past twice the limit, it no
+            # longer holds all the groups to exclude then, nor tells whether
+            # the dictionary holds them.
+            truncated = len(flags.group_ids_to_exclude) > 2 * max_group_ids_exclude
+            groups_not_loaded = (
+                get_groups_not_loaded(list(project_ids), self.__replacer_state_name)
+                if not truncated
+                and len(groups_to_exclude) >= get_min_groups()
+                and is_dictionary_enabled()
+                else None
+            )
+            if groups_not_loaded is not None:
+                groups_not_loaded &= groups_to_exclude
             if (
-                len(flags.group_ids_to_exclude) > 2 * max_group_ids_exclude
-                or len(groups_to_exclude) > max_group_ids_exclude
+                groups_not_loaded is not None
+                and len(groups_not_loaded) <= max_group_ids_exclude
             ):
+                # The size of the query does not depend on the number of
+                # groups, the dictionary is also used past the limit. The
+                # groups it may not have loaded yet are still inlined.
+                metrics.increment(name=DICTIONARY_METRIC, tags=tags)
+                query.add_condition_to_ast(self._not_in_dictionary_condition())
+                if groups_not_loaded:
+                    query.add_condition_to_ast(
+                        not_in_condition(
+                            self._groups_column(),
+                            [Literal(None, p) for p in groups_not_loaded],
+                        )
+                    )
+            elif truncated or len(groups_to_exclude) > max_group_ids_exclude:
+                # If the number of groups to exclude exceeds our limit, the
+                # query should just use final instead of the exclusion set.
                 tags["cause"] = "max_groups"
                 metrics.increment(
                     name=FINAL_METRIC,
@@ -120,11 +159,7 @@ class PostReplacementConsistencyEnforcer(ClickhouseQueryProcessor):
             elif groups_to_exclude:
                 query.add_condition_to_ast(
                     not_in_condition(
-                        FunctionCall(
-                            None,
-                            "assumeNotNull",
-                            (Column(None, None, self.__groups_column),),
-                        ),
+                        self._groups_column(),
                         [Literal(None, p) for p in groups_to_exclude],
                     )
                 )
@@ -178,6 +213,45 @@ class PostReplacementConsistencyEnforcer(ClickhouseQueryProcessor):
             else True
         )
 
+    def _groups_column(self) -> FunctionCall:
+        return FunctionCall(
+            None,
+            "assumeNotNull",
+            (Column(None, None, self.__groups_column),),
+        )
+
+    def _not_in_dictionary_condition(self) -> FunctionCall:
+        """
+        Excludes the groups of the dictionary replaced more recently than
+        the replacements are excluded for, the ones Redis lists.
+        """
+        # The dictionary records the replacements slightly before Redis.
+        excluded_since = datetime.fromtimestamp(
+            time.time() - settings.REPLACER_KEY_TTL - EXCLUSION_MARGIN_SEC,
+            timezone.utc,
+        )
+        return binary_condition(
+            ConditionFunctions.LT,
+            FunctionCall(
+                None,
+                "dictGetOrDefault",
+                (
+                    Literal(None, DICTIONARY_NAME),
+                    Literal(None, "replaced_at"),
+                    FunctionCall(
+                        None,
+                        "tuple",
+                        (
+                            Column(None, None, self.__project_column),
+                            self._groups_column(),
+                        ),
+                    ),
+                    FunctionCall(None, "toDateTime", (Literal(None, 0),)),
+                ),
+            ),
+            Literal(None, excluded_since),
+        )
+
     def _groups_to_exclude(
         self, query: Query, group_ids_to_exclude: Set[int]
     ) -> Set[int]:
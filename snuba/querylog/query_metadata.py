@@ -20,6 +20,7 @@ from snuba.request import Request
 from snuba.request.exceptions import InvalidJsonRequestException
 from snuba.state.cache.abstract import ExecutionTimeoutError
 from snuba.state.rate_limit import TABLE_RATE_LIMIT_NAME, RateLimitExceeded
+from snuba.utils.cancellation import CLIENT_DISCONNECTED, RequestCancelled
 from snuba.utils.metrics.timer import Timer
 from snuba.web import QueryTooLongException
 
@@ -77,6 +78,10 @@ class RequestStatus(Enum):
     MEMORY_EXCEEDED = "memory-exceeded"
     # Clickhouse exceeded max_concurrent_queries limit
     CLICKHOUSE_MAX_QUERIES_EXCEEDED = "clickhouse-max-queries-exceeded"
+    # The deadline the caller sent passed before the request completed
+    DEADLINE_EXCEEDED = "deadline-exceeded"
+    # The caller disconnected before the request completed
+    CANCELLED = "cancelled"
     # Any other error
     ERROR = "error"
 
@@ -104,6 +109,7 @@ SLO_FOR = {
     RequestStatus.QUERY_TIMEOUT,
     RequestStatus.PREDICTED_TIMEOUT,
     RequestStatus.MEMORY_EXCEEDED,
+    RequestStatus.CANCELLED,
 }
 
 
@@ -141,6 +147,12 @@ def get_request_status(cause: Exception | None = None) -> Status:
         slo_status = RequestStatus.QUERY_TIMEOUT
     elif isinstance(cause, ExecutionTimeoutError):
         slo_status = RequestStatus.CACHE_WAIT_TIMEOUT
+    elif isinstance(cause, RequestCancelled):
+        slo_status = (
+            RequestStatus.CANCELLED
+            if cause.extra_data.get("reason") == CLIENT_DISCONNECTED
+            else RequestStatus.DEADLINE_EXCEEDED
+        )
     elif isinstance(
         cause, (StorageNotAvailable, InvalidJsonRequestException, InvalidQueryException)
     ):
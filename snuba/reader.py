@@ -4,6 +4,7 @@ import itertools
 import re
 from abc import ABC, abstractmethod
 from typing import (
+    TYPE_CHECKING,
     Any,
     Callable,
     Dict,
@@ -20,6 +21,9 @@ from typing import (
 
 from snuba.clickhouse.formatter.nodes import FormattedQuery
 
+if TYPE_CHECKING:
+    from snuba.clickhouse.admission import Priority
+
 Column = TypedDict("Column", {"name": str, "type": str}, total=False)
 Row = Dict[str, Any]
 
@@ -132,8 +136,17 @@ class Reader(ABC):
         with_totals: bool = False,
         robust: bool = False,
         capture_trace: bool = False,
+        hedge_key: Optional[str] = None,
+        priority: Optional[Priority] = None,
     ) -> Result:
-        """Execute a query."""
+        """
+        Execute a query.
+
+        If ``hedge_key`` is provided the reader may hedge the query on another
+        replica when it is slower than the recent queries with the same key.
+        ``priority`` orders the query against the others waiting for the
+        cluster when the reader limits its concurrency.
+        """
         raise NotImplementedError
 
     @property
@@ -447,6 +447,13 @@ class ReplacerWorker:
         for message_metadata, replacement in batch:
             start_time = datetime.now()
 
+            if isinstance(
+                replacement, ErrorReplacement
+            ) and self._should_skip_project_over_time_limit(
+                replacement.get_project_id(), start_time
+            ):
+                continue
+
             table_name = self.__replacer_processor.get_schema().get_table_name()
             count_query = replacement.get_count_query(table_name)
 
@@ -572,6 +579,26 @@ class ReplacerWorker:
             ]
         )
 
+    def _should_skip_project_over_time_limit(
+        self, project_id: int, now: datetime
+    ) -> bool:
+        """
+        Projects exceeding the processing time limit are added to the auto
+        bypass list, which stops their replacements from being parsed. The
+        replacements already in the batch are only skipped here when
+        `skip_replacements_over_time_limit` is set.
+        """
+        if not get_int_config("skip_replacements_over_time_limit", default=0):
+            return False
+        if not self.__processing_time_counter.is_over_limit(project_id, now):
+            return False
+        logger.info(
+            "Skipping replacement for project %s over the processing time limit",
+            project_id,
+        )
+        self.metrics.increment("replacement_skipped_over_time_limit")
+        return True
+
     def _attempt_emitting_metric_for_projects_exceeding_limit(
         self,
         start_time: datetime,
@@ -591,6 +618,8 @@ class ReplacerWorker:
         projects_exceeding_limit = (
             self.__processing_time_counter.get_projects_exceeding_limit()
         )
+        if not projects_exceeding_limit:
+            return
         set_config_auto_replacements_bypass_projects(projects_exceeding_limit, end_time)
         logger.info(
             "projects_exceeding_limit = {}".format(
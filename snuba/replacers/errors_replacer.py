@@ -46,6 +46,7 @@ from snuba.processor import (
     _hashify,
 )
 from snuba.replacers.projects_query_flags import ProjectsQueryFlags
+from snuba.replacers.replaced_groups_dictionary import sync_exclude_groups
 from snuba.replacers.replacements_and_expiry import (
     get_config_auto_replacements_bypass_projects,
 )
@@ -258,6 +259,11 @@ class ErrorsReplacer(ReplacerProcessor[Replacement]):
                 )
 
             elif isinstance(query_time_flags, ExcludeGroups):
+                # The dictionary must hold the groups before queries can
+                # find them in Redis.
+                sync_exclude_groups(
+                    project_id, query_time_flags.group_ids, self.__state_name
+                )
                 ProjectsQueryFlags.set_project_exclude_groups(
                     project_id,
                     query_time_flags.group_ids,
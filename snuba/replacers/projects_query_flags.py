@@ -318,6 +318,19 @@ class ProjectsQueryFlags:
         key = f"project_needs_final:{f'{state_name.value}:' if state_name else ''}{project_id}"
         return key, f"{key}-type"
 
+    @staticmethod
+    def get_exclude_groups_key(
+        project_id: int, state_name: Optional[ReplacerState]
+    ) -> str:
+        """
+        The key of the ZSET of the groups excluded for the project, scored by
+        the time of their replacement.
+        """
+        key, _ = ProjectsQueryFlags._build_project_exclude_groups_key_and_type_key(
+            project_id, state_name
+        )
+        return key
+
     @staticmethod
     def _build_project_exclude_groups_key_and_type_key(
         project_id: int, state_name: Optional[ReplacerState]
@@ -0,0 +1,175 @@
+"""
+Exclusion of the replaced groups of a project through a ClickHouse dictionary.
+
+Until ClickHouse merges a replacement, the errors queries exclude the groups
+it touched, listed in Redis by ``ProjectsQueryFlags``, by inlining them in a
+``NOT IN`` condition. Projects with many replaced groups get large queries,
+slow to format, send and parse. The replacer can also write the groups to
+the ``replaced_groups`` table, which the ``replaced_groups_dict`` dictionary
+of every node reloads on its own every ``DICTIONARY_LIFETIME_SEC`` at most,
+so the queries look the groups up in the dictionary instead of listing them.
+
+The dictionary is only used for a project when it holds every group Redis
+excludes for it, but the ones replaced in the last
+``replaced_groups_dictionary_load_delay_sec``, which it may not have loaded
+yet and which the queries still inline. Redis keeps, per project, since
+when the groups of all its replacements were written: a sync sets it,
+unless it is already set, once the groups are written to the table and
+before they are added to Redis. The groups of the replacements before it
+are older than it, the project uses the inline list until they expire.
+Replacements that are not synced, because syncing is disabled or failed,
+reset it.
+
+Queries excluding more groups than ``max_group_ids_exclude`` use the
+dictionary rather than FINAL, as long as Redis holds all of their groups:
+past twice that limit it drops the oldest ones, which could be older than
+the sync, and the queries use FINAL.
+
+Controlled by runtime config:
+
+* ``replaced_groups_dictionary_enabled`` set to 1 syncs the groups and lets
+  the queries use the dictionary.
+* ``replaced_groups_dictionary_min_groups`` (default 100): queries
+  excluding fewer groups still inline them.
+* ``replaced_groups_dictionary_sync_timeout_sec`` (default 5) bounds the
+  time a sync holds up the replacement. A sync that takes longer fails,
+  which falls back to the inline list.
+* ``replaced_groups_dictionary_load_delay_sec`` (default 30): how long
+  after they are written the groups are inlined rather than looked up. It
+  covers the lifetime of the dictionary, the time a reload takes and the
+  replication of the table.
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional, Sequence, Set
+
+from snuba import environment, settings, state
+from snuba.clusters.cluster import ClickhouseClientSettings, get_cluster
+from snuba.clusters.storage_sets import StorageSetKey
+from snuba.redis import RedisClientKey, get_redis_client
+from snuba.replacers.projects_query_flags import ProjectsQueryFlags
+from snuba.replacers.replacer_processor import ReplacerState
+from snuba.utils.metrics.wrapper import MetricsWrapper
+
+logger = logging.getLogger(__name__)
+metrics = MetricsWrapper(environment.metrics, "replacer.replaced_groups_dictionary")
+redis_client = get_redis_client(RedisClientKey.REPLACEMENTS_STORE)
+
+DICTIONARY_NAME = "replaced_groups_dict"
+# The longest time between two reloads of the dictionary, it is the MAX of
+# its LIFETIME.
+DICTIONARY_LIFETIME_SEC = 10
+
+
+def is_dictionary_enabled() -> bool:
+    return bool(state.get_int_config("replaced_groups_dictionary_enabled", 0))
+
+
+def get_min_groups() -> int:
+    min_groups = state.get_int_config("replaced_groups_dictionary_min_groups", 100)
+    assert min_groups is not None
+    return min_groups
+
+
+def get_sync_timeout_sec() -> int:
+    timeout = state.get_int_config("replaced_groups_dictionary_sync_timeout_sec", 5)
+    assert timeout is not None
+    return timeout
+
+
+def get_load_delay_sec() -> int:
+    delay = state.get_int_config(
+        "replaced_groups_dictionary_load_delay_sec", 3 * DICTIONARY_LIFETIME_SEC
+    )
+    assert delay is not None
+    return delay
+
+
+def _build_synced_since_key(
+    project_id: int, state_name: Optional[ReplacerState]
+) -> str:
+    return f"project_exclude_groups_synced_since:{f'{state_name.value}:' if state_name else ''}{project_id}"
+
+
+def _write_groups(project_id: int, group_ids: Sequence[int], now: float) -> None:
+    """
+    Writes the groups to the table, within the sync timeout. The insert is
+    not retried.
+    """
+    timeout = get_sync_timeout_sec()
+    cluster = get_cluster(StorageSetKey.EVENTS)
+    connection = cluster.get_query_connection(ClickhouseClientSettings.REPLACE)
+    table = (
+        "replaced_groups_local" if cluster.is_single_node() else "replaced_groups_dist"
+    )
+    replaced_at = datetime.fromtimestamp(now, timezone.utc)
+    connection.execute(
+        f"INSERT INTO {cluster.get_database()}.{table} (project_id, group_id, replaced_at) VALUES",
+        [(project_id, group_id, replaced_at) for group_id in group_ids],
+        settings={
+            "insert_distributed_sync": 1,
+            "insert_distributed_timeout": timeout,
+            "max_execution_time": timeout,
+        },
+        retryable=False,
+    )
+
+
+def sync_exclude_groups(
+    project_id: int, group_ids: Sequence[int], state_name: Optional[ReplacerState]
+) -> None:
+    """
+    Writes the groups a replacement excludes to the table the dictionary is
+    loaded from. Must be called before they are added to Redis.
+    """
+    if not group_ids:
+        return
+    key = _build_synced_since_key(project_id, state_name)
+    if not is_dictionary_enabled():
+        redis_client.delete(key)
+        return
+    now = time.time()
+    try:
+        _write_groups(project_id, group_ids, now)
+    except Exception:
+        logger.warning("Failed to sync the replaced groups", exc_info=True)
+        metrics.increment("sync_failed")
+        redis_client.delete(key)
+        return
+    metrics.timing("sync", (time.time() - now) * 1000)
+
+    p = redis_client.pipeline()
+    p.set(key, now, nx=True, ex=settings.REPLACER_KEY_TTL)
+    p.expire(key, settings.REPLACER_KEY_TTL)
+    p.execute()
+
+
+def get_groups_not_loaded(
+    project_ids: Sequence[int], state_name: Optional[ReplacerState]
+) -> Optional[Set[int]]:
+    """
+    Returns the groups excluded for the projects that the dictionary may not
+    have loaded yet, which have to be inlined, or None if the dictionary
+    may also miss older groups and cannot be used.
+    """
+    loaded_before = time.time() - get_load_delay_sec()
+    p = redis_client.pipeline()
+    for project_id in project_ids:
+        key = ProjectsQueryFlags.get_exclude_groups_key(project_id, state_name)
+        p.get(_build_synced_since_key(project_id, state_name))
+        p.zrange(key, 0, 0, withscores=True)
+        p.zrangebyscore(key, f"({loaded_before}", "+inf")
+    results = p.execute()
+
+    groups_not_loaded: Set[int] = set()
+    for synced_since, oldest_exclusion, latest_groups in zip(
+        results[::3], results[1::3], results[2::3]
+    ):
+        if not oldest_exclusion:
+            continue
+        [(_, replaced_at)] = oldest_exclusion
+        if synced_since is None or float(synced_since) > replaced_at:
+            return None
+        groups_not_loaded.update(int(group_id) for group_id in latest_groups)
+    return groups_not_loaded
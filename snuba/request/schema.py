@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import itertools
-from typing import Any, Mapping, MutableMapping, NamedTuple, Type
+from typing import Any, Mapping, MutableMapping, NamedTuple, Tuple, Type
 
 import jsonschema
 
@@ -13,12 +13,17 @@ from snuba.query.query_settings import (
 )
 from snuba.query.schema import DELETE_QUERY_SCHEMA, MQL_QUERY_SCHEMA, SNQL_QUERY_SCHEMA
 from snuba.request.exceptions import JsonSchemaValidationException
-from snuba.schemas import Schema, validate_jsonschema
+from snuba.schemas import Schema, compile_jsonschema
 from snuba.utils.metrics.wrapper import MetricsWrapper
 
 metrics = MetricsWrapper(environment.metrics, "parser")
 
 
+_BUILT_SCHEMAS: MutableMapping[
+    Tuple[Type[RequestSchema], Type[QuerySettings], bool, bool], RequestSchema
+] = {}
+
+
 class BadRequestSchemaException(Exception):
     pass
 
@@ -80,6 +85,7 @@ class RequestSchema:
                 ] = definition_schema
 
         self.__composite_schema["required"] = set(self.__composite_schema["required"])
+        self.__validator = compile_jsonschema(self.__composite_schema)
 
     @classmethod
     def build(
@@ -92,12 +98,19 @@ class RequestSchema:
             generic_schema = DELETE_QUERY_SCHEMA
         else:
             generic_schema = SNQL_QUERY_SCHEMA if not is_mql else MQL_QUERY_SCHEMA
-        settings_schema = SETTINGS_SCHEMAS[settings_class]
-        return cls(generic_schema, settings_schema, ATTRIBUTION_INFO_SCHEMA)
+        key = (cls, settings_class, generic_schema is MQL_QUERY_SCHEMA, is_delete)
+        schema = _BUILT_SCHEMAS.get(key)
+        if schema is None:
+            # Compiling the validator is expensive, it is only done the first
+            # time a kind of request is validated.
+            settings_schema = SETTINGS_SCHEMAS[settings_class]
+            schema = cls(generic_schema, settings_schema, ATTRIBUTION_INFO_SCHEMA)
+            _BUILT_SCHEMAS[key] = schema
+        return schema
 
     def validate(self, value: MutableMapping[str, Any]) -> RequestParts:
         try:
-            value = validate_jsonschema(value, self.__composite_schema)
+            value = self.__validator(value)
         except jsonschema.ValidationError as error:
             raise JsonSchemaValidationException(str(error)) from error
 
@@ -1,10 +1,39 @@
 import copy
-from typing import Any, Generator, Mapping, MutableMapping
+from typing import Any, Callable, Generator, Mapping, MutableMapping
 
+import fastjsonschema
 import jsonschema
 
 Schema = Mapping[str, Any]  # placeholder for JSON schema
 
+Validator = Callable[[MutableMapping[str, Any]], MutableMapping[str, Any]]
+
+
+def _validate_and_default(
+    validator: object,
+    properties: Mapping[str, Any],
+    instance: MutableMapping[str, Any],
+    schema: Mapping[str, Any],
+) -> Generator[Exception, None, None]:
+    for property, subschema in properties.items():
+        if property not in instance and "default" in subschema:
+            if callable(subschema["default"]):
+                default_value = subschema["default"]()
+            else:
+                default_value = copy.deepcopy(subschema["default"])
+            instance[property] = default_value
+
+    for error in jsonschema.Draft6Validator.VALIDATORS["properties"](
+        validator, properties, instance, schema
+    ):
+        yield error
+
+
+_DefaultingValidator = jsonschema.validators.extend(
+    jsonschema.Draft4Validator, {"properties": _validate_and_default}
+)
+_FORMAT_CHECKER = jsonschema.FormatChecker()
+
 
 def validate_jsonschema(
     value: MutableMapping[str, Any],
@@ -16,42 +45,88 @@ def validate_jsonschema(
     value if the value conforms to the schema, otherwise raising a
     ``jsonschema.ValidationError``.
     """
-    orig = jsonschema.Draft6Validator.VALIDATORS["properties"]
-
-    def validate_and_default(
-        validator: object,
-        properties: Mapping[str, Any],
-        instance: MutableMapping[str, Any],
-        schema: Mapping[str, Any],
-    ) -> Generator[Exception, None, None]:
-        for property, subschema in properties.items():
-            if property not in instance and "default" in subschema:
-                if callable(subschema["default"]):
-                    default_value = subschema["default"]()
-                else:
-                    default_value = copy.deepcopy(subschema["default"])
-                instance[property] = default_value
-
-        for error in orig(validator, properties, instance, schema):
-            yield error
-
     # Using schema defaults during validation will cause the input value to be
     # mutated, so to be on the safe side we create a deep copy of that value to
     # avoid unwanted side effects for the calling function.
     if set_defaults:
         value = copy.deepcopy(value)
 
-    validator_cls = (
-        jsonschema.validators.extend(
-            jsonschema.Draft4Validator, {"properties": validate_and_default}
-        )
-        if set_defaults
-        else jsonschema.Draft6Validator
-    )
+    validator_cls = _DefaultingValidator if set_defaults else jsonschema.Draft6Validator
 
-    validator_cls(
-        schema,
-        format_checker=jsonschema.FormatChecker(),
-    ).validate(value, schema)
+    validator_cls(schema, format_checker=_FORMAT_CHECKER).validate(value, schema)
 
     return value
+
+
+def _walk_defaults(
+    schema: Any, depth: int = 0
+) -> Generator[tuple[int, Any], None, None]:
+    """
+    Yields the default of every property of the schema with the depth of
+    the object it is filled in, 0 being the validated value itself.
+    """
+    if isinstance(schema, Mapping):
+        for subschema in schema.get("properties", {}).values():
+            if isinstance(subschema, Mapping) and "default" in subschema:
+                yield depth, subschema["default"]
+            yield from _walk_defaults(subschema, depth + 1)
+        for key in ("items", "additionalProperties"):
+            yield from _walk_defaults(schema.get(key), depth + 1)
+        for definition in schema.get("definitions", {}).values():
+            yield from _walk_defaults(definition, depth)
+    elif isinstance(schema, list):
+        for subschema in schema:
+            yield from _walk_defaults(subschema, depth)
+
+
+def _to_compilable(schema: Any) -> Any:
+    # fastjsonschema wants JSON types, ``required`` can be a set in the
+    # schemas built at runtime.
+    if isinstance(schema, Mapping):
+        return {
+            key: sorted(value)
+            if key == "required" and isinstance(value, (set, frozenset))
+            else _to_compilable(value)
+            for key, value in schema.items()
+        }
+    if isinstance(schema, list):
+        return [_to_compilable(item) for item in schema]
+    return schema
+
+
+def compile_jsonschema(schema: MutableMapping[str, Any]) -> Validator:
+    """
+    Compiles the schema once into a function that behaves like
+    ``validate_jsonschema(value, schema)``: it fills the defaults on a copy
+    of the value and returns it.
+
+    Valid values go through the validator generated by fastjsonschema. When
+    it rejects a value, the value is validated again with ``jsonschema`` so
+    the ``jsonschema.ValidationError`` raised, and its message, are the same
+    as the ones of ``validate_jsonschema``. Schemas with callable defaults
+    cannot be compiled and fall back to ``validate_jsonschema``.
+    """
+    defaults = list(_walk_defaults(schema))
+    if any(callable(default) for _, default in defaults):
+        return lambda value: validate_jsonschema(value, schema)
+
+    compiled: Callable[[Any], Any] = fastjsonschema.compile(
+        {
+            **_to_compilable(schema),
+            "$schema": "http://json-schema.org/draft-04/schema#",
+        },
+        use_default=True,
+    )
+    # Defaults are only ever added to the objects they belong to, a shallow
+    # copy protects the caller's value if they all belong to the top level.
+    shallow_copy = all(depth == 0 for depth, _ in defaults)
+
+    def validate(value: MutableMapping[str, Any]) -> MutableMapping[str, Any]:
+        copied = copy.copy(value) if shallow_copy else copy.deepcopy(value)
+        try:
+            validated: MutableMapping[str, Any] = compiled(copied)
+        except fastjsonschema.JsonSchemaException:
+            return validate_jsonschema(value, schema)
+        return validated
+
+    return validate
@@ -80,6 +80,19 @@ DISABLED_DATASETS: Set[str] = set()
 
 # Clickhouse Options
 CLICKHOUSE_MAX_POOL_SIZE = 25
+# Maximum number of hedged queries in flight per process. See
+# snuba/clickhouse/hedging.py
+HEDGED_READS_MAX_CONCURRENCY = 16
+# Bounds of the number of queries a process runs concurrently on a cluster
+# when admission control is enabled, the upper bound is the pool size. See
+# snuba/clickhouse/admission.py
+ADMISSION_CONTROL_INITIAL_LIMIT = 10
+ADMISSION_CONTROL_MIN_LIMIT = 2
+# Queries of referrers starting with one of these have the batch priority.
+ADMISSION_CONTROL_BATCH_REFERRER_PREFIXES: Sequence[str] = [
+    "tasks.",
+    "subscriptions_executor",
+]
 
 CLUSTERS: Sequence[Mapping[str, Any]] = [
     {
@@ -129,6 +142,17 @@ DOGSTATSD_SAMPLING_RATES = {
     "metrics.processor.distribution.size": 0.1,
 }
 DDM_METRICS_SAMPLE_RATE = float(os.environ.get("SNUBA_DDM_METRICS_SAMPLE_RATE", 0.01))
+# Pre-aggregate metrics in memory and flush them in batches instead of sending
+# one statsd packet per call. See AggregatingMetricsBackend.
+METRICS_AGGREGATION_ENABLED = (
+    os.environ.get("SNUBA_METRICS_AGGREGATION_ENABLED", "0") == "1"
+)
+METRICS_AGGREGATION_FLUSH_INTERVAL_SEC = float(
+    os.environ.get("SNUBA_METRICS_AGGREGATION_FLUSH_INTERVAL_SEC", 10.0)
+)
+METRICS_AGGREGATION_MAX_BUFFER_SIZE = int(
+    os.environ.get("SNUBA_METRICS_AGGREGATION_MAX_BUFFER_SIZE", 10000)
+)
 
 CLICKHOUSE_READONLY_USER = os.environ.get("CLICKHOUSE_READONLY_USER", "default")
 CLICKHOUSE_READONLY_PASSWORD = os.environ.get("CLICKHOUSE_READONLY_PASSWORD", "")
@@ -213,8 +237,20 @@ STARFISH_SLACK_CHANNEL_ID = os.environ.get("STARFISH_SLACK_CHANNEL_ID")
 SNUBA_PROFILES_SAMPLE_RATE = float(os.environ.get("SNUBA_PROFILES_SAMPLE_RATE", 0.0))
 SNAPSHOT_LOAD_PRODUCT = "snuba"
 
+# When set, /health is served from the result of a background thread that
+# checks the ClickHouse clusters every HEALTH_PROBE_INTERVAL_SEC seconds
+# (plus up to HEALTH_PROBE_JITTER_SEC), instead of querying every cluster on
+# each request. Results older than HEALTH_PROBE_MAX_STALENESS_SEC are not
+# used. 0 disables the prober.
+HEALTH_PROBE_INTERVAL_SEC = float(os.environ.get("HEALTH_PROBE_INTERVAL_SEC", 0))
+HEALTH_PROBE_JITTER_SEC = float(os.environ.get("HEALTH_PROBE_JITTER_SEC", 5))
+HEALTH_PROBE_MAX_STALENESS_SEC = float(
+    os.environ.get("HEALTH_PROBE_MAX_STALENESS_SEC", 60)
+)
+
 BULK_CLICKHOUSE_BUFFER = 10000
 BULK_BINARY_LOAD_CHUNK = 2**22  # 4 MB
+BULK_PARALLEL_LOAD_CHUNK = 2**26  # 64 MB, table chunk loaded by each process
 
 # Processor/Writer Options
 
@@ -243,6 +279,14 @@ DEFAULT_QUEUED_MAX_MESSAGE_KBYTES = 10000
 DEFAULT_QUEUED_MIN_MESSAGES = 10000
 DISCARD_OLD_EVENTS = True
 CLICKHOUSE_HTTP_CHUNK_SIZE = 8192
+# Inserts are streamed in chunks of this many bytes, or of
+# CLICKHOUSE_HTTP_CHUNK_SIZE rows if the rows are small. 0 disables it.
+CLICKHOUSE_HTTP_CHUNK_BYTES = 1024 * 1024
+# Compression of the insert request bodies: None, "gzip", "deflate", "zstd"
+# or "lz4" (zstd needs the zstandard package and lz4 the lz4 package).
+CLICKHOUSE_HTTP_INSERT_COMPRESSION: Optional[str] = None
+# Inserts in flight at once per ClickHouse node.
+CLICKHOUSE_HTTP_INSERT_MAX_CONCURRENCY = 16
 HTTP_WRITER_BUFFER_SIZE = 1
 BATCH_JOIN_TIMEOUT = os.environ.get("BATCH_JOIN_TIMEOUT", 10)
 
@@ -289,6 +333,10 @@ RAISE_ON_READTHROUGH_CACHE_REDIS_FAILURES = False
 # require live and up to date data, so caching should be avoided entirely.
 BYPASS_CACHE_REFERRERS = ["subscriptions_executor"]
 
+# Number of threads used to refresh stale values of the readthrough cache in
+# the background (stale-while-revalidate).
+CACHE_REVALIDATION_WORKERS = 4
+
 # (logical topic name, # of partitions)
 TOPIC_PARTITION_COUNTS: Mapping[str, int] = {}
 
@@ -398,6 +446,20 @@ SLICED_STORAGE_SETS: Mapping[str, int] = {}
 # to slice id
 LOGICAL_PARTITION_MAPPING: Mapping[str, Mapping[int, int]] = {}
 
+# Queries filtering on ids from several slices run on each slice concurrently
+# when their results can be merged. These bound the threads running them and
+# how long the slowest slice is waited for.
+SCATTER_GATHER_MAX_WORKERS = 16
+SCATTER_GATHER_SLICE_TIMEOUT_SEC = 30
+
+# The asyncio serving mode of the RPC endpoints (snuba rpc-api) runs the
+# endpoints on a pool of threads and rejects requests to an endpoint that
+# already has as many requests in flight as its limit.
+RPC_ASYNC_THREADS = 64
+RPC_ASYNC_ENDPOINT_CONCURRENCY = 32
+# Overrides of the limit by endpoint name, e.g. {"EndpointTraceItemTable": 8}
+RPC_ASYNC_ENDPOINT_CONCURRENCY_OVERRIDES: Mapping[str, int] = {}
+
 # From testing, the max query size that can be sent to clickhouse is 131535 bytes (~128.452 KiB)
 MAX_QUERY_SIZE_BYTES = 128 * 1024  # 128 KiB
 
@@ -1,4 +1,5 @@
-from typing import Any, Mapping, MutableMapping
+from importlib.util import find_spec
+from typing import Any, Mapping, MutableMapping, Optional
 
 from snuba.datasets.slicing import SENTRY_LOGICAL_PARTITIONS
 
@@ -7,6 +8,15 @@ class InvalidTopicError(ValueError):
     pass
 
 
+# Insert compressions and the package each of them needs.
+INSERT_COMPRESSION_PACKAGES: Mapping[str, Optional[str]] = {
+    "gzip": None,
+    "deflate": None,
+    "zstd": "zstandard",
+    "lz4": "lz4",
+}
+
+
 slice_count_validation_msg = """physical slice for storage set {0}'s logical partition {1} is {2},
             but only {3} physical slices are assigned to {0}"""
 
@@ -28,6 +38,16 @@ def validate_settings(locals: Mapping[str, Any]) -> None:
             "DEFAULT_STORAGE_BROKERS is deprecated. Use KAFKA_BROKER_CONFIG instead."
         )
 
+    compression = locals.get("CLICKHOUSE_HTTP_INSERT_COMPRESSION")
+    if compression:
+        if compression not in INSERT_COMPRESSION_PACKAGES:
+            raise ValueError(f"Unsupported insert compression {compression!r}")
+        package = INSERT_COMPRESSION_PACKAGES[compression]
+        if package is not None and find_spec(package) is None:
+            raise ValueError(
+                f"Insert compression {compression!r} needs the {package} package"
+            )
+
     # Validate cluster configuration
     from snuba.clusters.storage_sets import StorageSetKey
 
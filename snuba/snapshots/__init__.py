@@ -4,10 +4,12 @@ from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Generator, Iterator, Mapping, NewType, Optional, Sequence
+from typing import Any, Generator, Iterator, Mapping, NewType, Optional, Sequence, Tuple
 
 SnapshotId = NewType("SnapshotId", str)
 SnapshotTableRow = Mapping[str, Any]
+# Range of bytes [start, end) of a table file that contains whole rows.
+TableChunk = Tuple[int, int]
 
 
 @dataclass(frozen=True)
@@ -114,3 +116,19 @@ class BulkLoadSource(ABC):
         self, table: str
     ) -> Generator[Iterator[bytes], None, None]:
         raise NotImplementedError
+
+    @abstractmethod
+    def get_table_chunks(self, table: str, chunk_size: int) -> Sequence[TableChunk]:
+        """
+        Splits the file of a table into ranges of about ``chunk_size`` bytes
+        that start and end on row boundaries, so they can be parsed
+        independently of each other.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    @contextmanager
+    def get_parsed_table_chunk(
+        self, table: str, chunk: TableChunk
+    ) -> Generator[Iterator[SnapshotTableRow], None, None]:
+        raise NotImplementedError
@@ -5,6 +5,9 @@ from snuba.clickhouse.http import JSONRow
 from snuba.writer import BatchWriter, BufferedWriterWrapper, WriterTableRow
 
 ProgressCallback = Callable[[int], None]
+# Builds the writer of a loading process. It is sent to the worker processes,
+# so it has to be picklable: a module level function or a partial of one.
+WriterFactory = Callable[[], BufferedWriterWrapper[JSONRow, WriterTableRow]]
 
 
 class BulkLoader(ABC):
@@ -33,3 +36,14 @@ class BulkLoader(ABC):
         progress_callback: Optional[ProgressCallback],
     ) -> None:
         raise NotImplementedError
+
+    @abstractmethod
+    def load_parallel(
+        self,
+        writer_factory: WriterFactory,
+        ignore_existing_data: bool,
+        processes: int,
+        chunk_size: int,
+        progress_callback: Optional[ProgressCallback],
+    ) -> None:
+        raise NotImplementedError
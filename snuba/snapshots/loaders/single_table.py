@@ -1,16 +1,38 @@
 import logging
-from typing import Iterable, Optional
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Optional, Tuple
 
 from snuba.clickhouse.http import JSONRow
 from snuba.clickhouse.native import ClickhousePool
 from snuba.datasets.cdc.row_processors import CdcRowProcessor
-from snuba.snapshots import BulkLoadSource
-from snuba.snapshots.loaders import BulkLoader, ProgressCallback
+from snuba.snapshots import BulkLoadSource, TableChunk
+from snuba.snapshots.loaders import BulkLoader, ProgressCallback, WriterFactory
 from snuba.writer import BatchWriter, BufferedWriterWrapper, WriterTableRow
 
 logger = logging.getLogger("snuba.bulk-loader")
 
 
+def _load_chunk(
+    source: BulkLoadSource,
+    source_table: str,
+    row_processor: CdcRowProcessor,
+    writer_factory: WriterFactory,
+    chunk: TableChunk,
+) -> Tuple[int, int]:
+    """
+    Loads one chunk of the table file, runs in the worker processes. Returns
+    the number of rows and bytes loaded.
+    """
+    row_count = 0
+    with source.get_parsed_table_chunk(source_table, chunk) as table:
+        with writer_factory() as buffer_writer:
+            for row in table:
+                buffer_writer.write(row_processor.process(row))
+                row_count += 1
+    return row_count, chunk[1] - chunk[0]
+
+
 class SingleTableBulkLoader(BulkLoader):
     """
     Load data from a source table into one clickhouse destination table.
@@ -84,3 +106,61 @@ class SingleTableBulkLoader(BulkLoader):
             logger.info("Loading preprocessed table %s from file", self.__source_table)
             writer.write(iterate_on_source(table))
             logger.info("Load complete")
+
+    def load_parallel(
+        self,
+        writer_factory: WriterFactory,
+        ignore_existing_data: bool,
+        processes: int,
+        chunk_size: int,
+        progress_callback: Optional[ProgressCallback],
+    ) -> None:
+        """
+        Splits the table file in chunks that are parsed, processed and
+        written by a pool of processes, each of them with its own writer, so
+        the chunks are inserted concurrently.
+        """
+        self.__validate_table(ignore_existing_data)
+        descriptor = self.__source.get_descriptor()
+        logger.info("Loading snapshot %s", descriptor.id)
+
+        chunks = self.__source.get_table_chunks(self.__source_table, chunk_size)
+        logger.info(
+            "Loading table %s in %d chunks with %d processes",
+            self.__source_table,
+            len(chunks),
+            processes,
+        )
+
+        start = time.time()
+        row_count = 0
+        loaded_bytes = 0
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(
+                    _load_chunk,
+                    self.__source,
+                    self.__source_table,
+                    self.__row_processor,
+                    writer_factory,
+                    chunk,
+                )
+                for chunk in chunks
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                rows, size = future.result()
+                row_count += rows
+                loaded_bytes += size
+                if progress_callback is not None:
+                    progress_callback(loaded_bytes)
+                elapsed = max(time.time() - start, 1e-6)
+                logger.info(
+                    "Loaded %d/%d chunks, %d records, %.0f records/s, %.2f MB/s",
+                    done,
+                    len(chunks),
+                    row_count,
+                    row_count / elapsed,
+                    loaded_bytes / elapsed / 2**20,
+                )
+
+        logger.info("Load complete %d records loaded", row_count)
@@ -6,7 +6,7 @@ import logging
 import os.path
 from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Generator, Iterable, Iterator, NewType, Sequence
+from typing import Generator, Iterable, Iterator, List, NewType, Sequence
 
 import jsonschema
 
@@ -15,11 +15,15 @@ from snuba.snapshots import (
     BulkLoadSource,
     SnapshotDescriptor,
     SnapshotTableRow,
+    TableChunk,
     TableConfig,
 )
 
 Xid = NewType("Xid", int)
 
+# Bytes read at once when looking for the row boundaries of a table file.
+_SCAN_BLOCK_SIZE = 1 << 20
+
 SNAPSHOT_METADATA_SCHEMA = {
     "type": "object",
     "properties": {
@@ -158,6 +162,36 @@ class PostgresSnapshot(BulkLoadSource):
         path = self.__get_table_path(table_name)
         return os.stat(path).st_size
 
+    def __validate_columns(self, table: str, columns: Sequence[str] | None) -> None:
+        descriptor_columns = self.__descriptor.get_table(table).columns
+        assert (
+            descriptor_columns is not None
+        ), "Cannot import a snapshot that does not provide a columns list"
+        expected_columns = [c.name for c in descriptor_columns]
+        if expected_columns:
+            expected_set = set(expected_columns)
+            assert isinstance(columns, Iterable)
+            existing_set = set(columns)
+            if not expected_set <= existing_set:
+                raise ValueError(
+                    "The table %s is missing columns %r "
+                    % (
+                        table,
+                        expected_set - existing_set,
+                    )
+                )
+
+            if len(existing_set) != len(expected_set):
+                logger.warning(
+                    "The table %s contains more columns than expected %r",
+                    table,
+                    existing_set - expected_set,
+                )
+        else:
+            logger.info(
+                "Won't pre-validate snapshot columns. There is nothing in the descriptor"
+            )
+
     @contextmanager
     def get_parsed_table_file(
         self,
@@ -170,38 +204,91 @@ class PostgresSnapshot(BulkLoadSource):
         try:
             with open(table_path, "r") as table_file:
                 csv_file = csv.DictReader(table_file)
-                columns = csv_file.fieldnames
-
-                descriptor_columns = self.__descriptor.get_table(table).columns
-                assert (
-                    descriptor_columns is not None
-                ), "Cannot import a snapshot that does not provide a columns list"
-                expected_columns = [c.name for c in descriptor_columns]
-                if expected_columns:
-                    expected_set = set(expected_columns)
-                    assert isinstance(columns, Iterable)
-                    existing_set = set(columns)
-                    if not expected_set <= existing_set:
-                        raise ValueError(
-                            "The table %s is missing columns %r "
-                            % (
-                                table,
-                                expected_set - existing_set,
+                self.__validate_columns(table, csv_file.fieldnames)
+                yield csv_file
+
+        except FileNotFoundError:
+            raise ValueError(
+                "The snapshot does not contain the requested table %s" % table,
+            )
+
+    def get_table_chunks(self, table: str, chunk_size: int) -> Sequence[TableChunk]:
+        """
+        Chunks end at the first row boundary after ``chunk_size`` bytes. A
+        newline is a row boundary when it is not inside a quoted value,
+        which is the case when an even number of quotes precede it since an
+        escaped quote is written twice.
+        """
+        table_desc = self.__descriptor.get_table(table)
+        assert not table_desc.zip, "Cannot split a gzip table file"
+
+        chunks: List[TableChunk] = []
+        try:
+            with open(self.__get_table_path(table), "rb") as table_file:
+                start = len(table_file.readline())
+                boundary = start + chunk_size
+                # Offset in the file of the block being scanned.
+                position = start
+                quoted = False
+                for block in iter(lambda: table_file.read(_SCAN_BLOCK_SIZE), b""):
+                    offset = 0
+                    while True:
+                        # The quotes before the boundary only count for
+                        # whether the next newline is quoted.
+                        scan_from = min(len(block), max(offset, boundary - position))
+                        quoted ^= block.count(b'"', offset, scan_from) % 2 == 1
+                        newline = block.find(b"\n", scan_from)
+                        if newline == -1:
+                            quoted ^= block.count(b'"', scan_from) % 2 == 1
+                            break
+                        quoted ^= block.count(b'"', scan_from, newline) % 2 == 1
+                        offset = newline + 1
+                        if not quoted:
+                            chunks.append((start, position + offset))
+                            start = position + offset
+                            boundary = start + chunk_size
+                    position += len(block)
+                if start < position:
+                    chunks.append((start, position))
+        except FileNotFoundError:
+            raise ValueError(
+                "The snapshot does not contain the requested table %s" % table,
+            )
+        return chunks
+
+    @contextmanager
+    def get_parsed_table_chunk(
+        self, table: str, chunk: TableChunk
+    ) -> Generator[Iterator[SnapshotTableRow], None, None]:
+        table_desc = self.__descriptor.get_table(table)
+        assert not table_desc.zip, "Cannot parse a gzip table file on the fly"
+
+        start, end = chunk
+        try:
+            with open(self.__get_table_path(table), "rb") as table_file:
+                columns = next(csv.reader([table_file.readline().decode("utf-8")]))
+                self.__validate_columns(table, columns)
+
+                def lines() -> Iterator[str]:
+                    position = start
+                    table_file.seek(start)
+                    while position < end:
+                        line = table_file.readline()
+                        if not line:
+                            return
+                        position += len(line)
+                        yield line.decode("utf-8")
+
+                def rows() -> Iterator[SnapshotTableRow]:
+                    for values in csv.reader(lines()):
+                        if len(values) != len(columns):
+                            raise ValueError(
+                                "Row of table %s in chunk %r has %d values, expected %d"
+                                % (table, chunk, len(values), len(columns))
                             )
-                        )
-
-                    if len(existing_set) != len(expected_set):
-                        logger.warning(
-                            "The table %s contains more columns than expected %r",
-                            table,
-                            existing_set - expected_set,
-                        )
-                else:
-                    logger.info(
-                        "Won't pre-validate snapshot columns. There is nothing in the descriptor"
-                    )
+                        yield dict(zip(columns, values))
 
-                yield csv_file
+                yield rows()
 
         except FileNotFoundError:
             raise ValueError(
@@ -0,0 +1,115 @@
+from typing import List, Sequence
+
+from snuba.clickhouse.columns import Column, DateTime, UInt
+from snuba.clusters.cluster import get_cluster
+from snuba.clusters.storage_sets import StorageSetKey
+from snuba.migrations import migration, operations, table_engines
+from snuba.migrations.columns import MigrationModifiers as Modifiers
+from snuba.migrations.operations import OperationTarget, SqlOperation
+
+columns: List[Column[Modifiers]] = [
+    Column("project_id", UInt(64)),
+    Column("group_id", UInt(64)),
+    Column("replaced_at", DateTime()),
+]
+
+DICTIONARY_NAME = "replaced_groups_dict"
+
+
+def _create_dictionary_sql() -> str:
+    cluster = get_cluster(StorageSetKey.EVENTS)
+    source_table = (
+        "replaced_groups_local" if cluster.is_single_node() else "replaced_groups_dist"
+    )
+    # A group replaced again has one row per replacement until they are
+    # merged, the dictionary keeps the latest one. The table only holds the
+    # groups of the last day, reloading it every few seconds is cheap.
+    source_query = (
+        "SELECT project_id, group_id, max(replaced_at) AS replaced_at "
+        f"FROM {cluster.get_database()}.{source_table} "
+        "GROUP BY project_id, group_id"
+    )
+    return f"""
+        CREATE DICTIONARY IF NOT EXISTS {DICTIONARY_NAME}
+        (
+            project_id UInt64,
+            group_id UInt64,
+            replaced_at DateTime
+        )
+        PRIMARY KEY project_id, group_id
+        SOURCE(CLICKHOUSE(QUERY '{source_query}'))
+        LAYOUT(COMPLEX_KEY_HASHED())
+        LIFETIME(MIN 5 MAX 10)
+    """
+
+
+class Migration(migration.ClickhouseNodeMigration):
+    """
+    Groups excluded from the errors queries after a replacement, looked up
+    through the replaced_groups_dict dictionary instead of being inlined in
+    the queries. The dictionary reloads the table every 10 seconds at most,
+    the queries inline the groups written more recently than that.
+    """
+
+    blocking = False
+
+    def forwards_ops(self) -> Sequence[SqlOperation]:
+        return [
+            operations.CreateTable(
+                storage_set=StorageSetKey.EVENTS,
+                table_name="replaced_groups_local",
+                columns=columns,
+                engine=table_engines.ReplacingMergeTree(
+                    storage_set=StorageSetKey.EVENTS,
+                    order_by="(project_id, group_id)",
+                    version_column="replaced_at",
+                    ttl="replaced_at + toIntervalDay(1)",
+                ),
+                target=OperationTarget.LOCAL,
+            ),
+            operations.CreateTable(
+                storage_set=StorageSetKey.EVENTS,
+                table_name="replaced_groups_dist",
+                columns=columns,
+                engine=table_engines.Distributed(
+                    local_table_name="replaced_groups_local",
+                    # The groups of a replacement are written to one shard
+                    # at once.
+                    sharding_key="cityHash64(project_id)",
+                ),
+                target=OperationTarget.DISTRIBUTED,
+            ),
+            operations.RunSql(
+                storage_set=StorageSetKey.EVENTS,
+                statement=_create_dictionary_sql(),
+                target=OperationTarget.LOCAL,
+            ),
+            operations.RunSql(
+                storage_set=StorageSetKey.EVENTS,
+                statement=_create_dictionary_sql(),
+                target=OperationTarget.DISTRIBUTED,
+            ),
+        ]
+
+    def backwards_ops(self) -> Sequence[SqlOperation]:
+        return [
+            *(
+                operations.RunSql(
+                    storage_set=StorageSetKey.EVENTS,
+                    statement=f"DROP DICTIONARY IF EXISTS {DICTIONARY_NAME}",
+                    target=target,
+                )
+                for target in (OperationTarget.DISTRIBUTED, OperationTarget.LOCAL)
+            ),
+            *(
+                operations.DropTable(
+                    storage_set=StorageSetKey.EVENTS,
+                    table_name=params[0],
+                    target=params[1],
+                )
+                for params in [
+                    ("replaced_groups_dist", OperationTarget.DISTRIBUTED),
+                    ("replaced_groups_local", OperationTarget.LOCAL),
+                ]
+            ),
+        ]
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Callable, Generic, Optional, TypeVar
 
 from snuba.utils.metrics.timer import Timer
@@ -15,6 +16,21 @@ class ExecutionTimeoutError(ExecutionError):
     pass
 
 
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    Describes how long a value stays in the cache.
+
+    A value is fresh for ``ttl_sec`` seconds. After that it can still be
+    served for ``stale_ttl_sec`` seconds while it is revalidated in the
+    background (stale-while-revalidate). A ``stale_ttl_sec`` of 0 disables
+    serving stale values.
+    """
+
+    ttl_sec: int
+    stale_ttl_sec: int = 0
+
+
 class Cache(Generic[TValue], ABC):
     @abstractmethod
     def get(self, key: str) -> Optional[TValue]:
@@ -37,6 +53,8 @@ class Cache(Generic[TValue], ABC):
         function: Callable[[], TValue],
         record_cache_hit_type: Callable[[int], None],
         timer: Optional[Timer] = None,
+        policy: Optional[CachePolicy] = None,
+        revalidate: Optional[Callable[[], TValue]] = None,
     ) -> TValue:
         """
         Implements a read-through caching pattern for the value at the given
@@ -68,5 +86,13 @@ class Cache(Generic[TValue], ABC):
         will be blocked -- they will likely get a result or throw a
         ``ExecutionTimeoutError`` in a time window substantially shorter than
         the full timeout duration.
+
+        ``policy`` controls the expiration of the value, the implementation
+        picks a default when it is not provided. When the policy allows
+        serving stale values and ``revalidate`` is provided, a stale value is
+        returned immediately and ``revalidate`` is used to refresh it in the
+        background. Only one refresh runs at a time for a given key.
+        ``revalidate`` must not share mutable state with the caller as it
+        may run after the caller returned.
         """
         raise NotImplementedError
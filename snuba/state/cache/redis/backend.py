@@ -1,12 +1,22 @@
 import logging
-from typing import Callable, Optional
+import math
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Callable, Mapping, MutableMapping, Optional
 
 from redis.exceptions import ConnectionError, ReadOnlyError
 from redis.exceptions import TimeoutError as RedisTimeoutError
 from snuba import environment, settings
 from snuba.redis import RedisClientType
-from snuba.state import get_config
-from snuba.state.cache.abstract import Cache, TValue
+from snuba.state import get_config, get_int_config
+from snuba.state.cache.abstract import Cache, CachePolicy, TValue
+from snuba.utils.cancellation import (
+    Cancellation,
+    RequestCancelled,
+    get_current_cancellation,
+)
 from snuba.utils.codecs import ExceptionAwareCodec
 from snuba.utils.metrics.timer import Timer
 from snuba.utils.metrics.wrapper import MetricsWrapper
@@ -19,6 +29,29 @@ RESULT_VALUE = 0
 RESULT_EXECUTE = 1
 RESULT_WAIT = 2
 SIMPLE_READTHROUGH = 3
+RESULT_STALE = 4
+
+# Upper bound on how long a background revalidation holds the lock of a key.
+# If the process dies while revalidating, another one can take over after
+# this delay.
+REVALIDATION_LOCK_TTL_SEC = 60
+
+revalidation_executor = ThreadPoolExecutor(
+    max_workers=settings.CACHE_REVALIDATION_WORKERS,
+    thread_name_prefix="cache-revalidation",
+)
+
+
+def _raise_if_cancelled(
+    cancellation: Cancellation, metric_tags: Mapping[str, str], scope: str
+) -> None:
+    try:
+        cancellation.raise_if_cancelled()
+    except RequestCancelled:
+        metrics.increment(
+            "single_flight.cancelled", tags={**metric_tags, "scope": scope}
+        )
+        raise
 
 
 class RedisCache(Cache[TValue]):
@@ -31,6 +64,10 @@ class RedisCache(Cache[TValue]):
         self.__client = client
         self.__prefix = prefix
         self.__codec = codec
+        # Queries being executed by this process, used to coalesce identical
+        # queries running concurrently on different threads.
+        self.__in_flight: MutableMapping[str, Future[TValue]] = {}
+        self.__in_flight_lock = Lock()
 
     def __build_key(
         self, key: str, prefix: Optional[str] = None, suffix: Optional[str] = None
@@ -53,46 +90,272 @@ class RedisCache(Cache[TValue]):
             ex=get_config("cache_expiry_sec", 1),
         )
 
+    def __set_with_policy(self, key: str, value: TValue, policy: CachePolicy) -> None:
+        encoded = self.__codec.encode(value)
+        if not policy.stale_ttl_sec:
+            self.__client.set(self.__build_key(key), encoded, ex=policy.ttl_sec)
+            return
+
+        # The value outlives its freshness marker by the stale period. A value
+        # without its marker is stale and can be served while revalidating.
+        pipe = self.__client.pipeline(transaction=False)
+        pipe.set(
+            self.__build_key(key),
+            encoded,
+            ex=policy.ttl_sec + policy.stale_ttl_sec,
+        )
+        pipe.set(self.__build_key(key, suffix="fresh"), 1, ex=policy.ttl_sec)
+        pipe.execute()
+
+    def __revalidate(
+        self,
+        key: str,
+        revalidate: Callable[[], TValue],
+        policy: CachePolicy,
+        metric_tags: Mapping[str, str],
+    ) -> None:
+        lock_key = self.__build_key(key, suffix="revalidating")
+        if not self.__client.set(lock_key, 1, nx=True, ex=REVALIDATION_LOCK_TTL_SEC):
+            # Someone else is already refreshing this value.
+            metrics.increment("revalidate_skipped", tags=metric_tags)
+            return
+
+        def run() -> None:
+            try:
+                self.__set_with_policy(key, revalidate(), policy)
+            except Exception:
+                metrics.increment("revalidate_error", tags=metric_tags)
+                logger.warning("Failed to revalidate cache key %s", key, exc_info=True)
+            finally:
+                self.__client.delete(lock_key)
+
+        metrics.increment("revalidate_started", tags=metric_tags)
+        revalidation_executor.submit(run)
+
     def __get_value_with_simple_readthrough(
         self,
         key: str,
         function: Callable[[], TValue],
         record_cache_hit_type: Callable[[int], None],
         timer: Optional[Timer] = None,
+        policy: Optional[CachePolicy] = None,
+        revalidate: Optional[Callable[[], TValue]] = None,
     ) -> TValue:
         record_cache_hit_type(SIMPLE_READTHROUGH)
         result_key = self.__build_key(key)
+        if policy is None:
+            ttl_sec = get_int_config("cache_expiry_sec", 1)
+            assert ttl_sec is not None
+            policy = CachePolicy(ttl_sec=ttl_sec)
+        allow_stale = bool(policy.stale_ttl_sec) and revalidate is not None
 
-        cached_value = self.__client.get(result_key)
+        is_fresh = True
+        if allow_stale:
+            cached_value, is_fresh = self.__client.mget(
+                [result_key, self.__build_key(key, suffix="fresh")]
+            )
+        else:
+            cached_value = self.__client.get(result_key)
         if timer is not None:
             timer.mark("cache_get")
         metric_tags = timer.tags if timer is not None else {}
 
         if cached_value is not None:
-            record_cache_hit_type(RESULT_VALUE)
+            if not is_fresh:
+                assert revalidate is not None
+                record_cache_hit_type(RESULT_STALE)
+                self.__revalidate(key, revalidate, policy, metric_tags or {})
+            else:
+                record_cache_hit_type(RESULT_VALUE)
             return self.__codec.decode(cached_value)
+        elif get_int_config("single_flight_enabled", 0):
+            return self.__execute_single_flight(
+                key, function, record_cache_hit_type, timer, policy, metric_tags or {}
+            )
         else:
+            return self.__execute_and_set(
+                key, function, record_cache_hit_type, timer, policy, metric_tags
+            )
+
+    def __execute_and_set(
+        self,
+        key: str,
+        function: Callable[[], TValue],
+        record_cache_hit_type: Callable[[int], None],
+        timer: Optional[Timer],
+        policy: CachePolicy,
+        metric_tags: Optional[Mapping[str, str]],
+    ) -> TValue:
+        try:
+            value = function()
+            self.__set_with_policy(key, value, policy)
+            record_cache_hit_type(RESULT_EXECUTE)
+            if timer is not None:
+                timer.mark("cache_set")
+        except Exception as e:
+            metrics.increment("execute_error", tags=metric_tags)
+            raise e
+        return value
+
+    def __execute_single_flight(
+        self,
+        key: str,
+        function: Callable[[], TValue],
+        record_cache_hit_type: Callable[[int], None],
+        timer: Optional[Timer],
+        policy: CachePolicy,
+        metric_tags: Mapping[str, str],
+    ) -> TValue:
+        """
+        Makes sure only one of the identical queries running concurrently
+        actually hits ClickHouse. Threads of the same process wait on the
+        query of the first thread (the leader). Across processes the leader
+        holds a lock in Redis and the other processes poll for its result.
+
+        Followers wait up to ``single_flight_wait_timeout_sec``. If the
+        leader does not produce a result by then, or if it fails or gives up
+        without a result, followers execute the query themselves. A follower stops
+        waiting as soon as its own request is cancelled, the cancellation
+        of the leader releases the followers which then run the query.
+        """
+        wait_timeout = get_int_config("single_flight_wait_timeout_sec", 30)
+        assert wait_timeout is not None
+
+        with self.__in_flight_lock:
+            future = self.__in_flight.get(key)
+            is_leader = future is None
+            if future is None:
+                future = self.__in_flight[key] = Future()
+
+        if not is_leader:
             try:
-                value = function()
-                self.__client.set(
-                    result_key,
-                    self.__codec.encode(value),
-                    ex=get_config("cache_expiry_sec", 1),
-                )
-                record_cache_hit_type(RESULT_EXECUTE)
-                if timer is not None:
-                    timer.mark("cache_set")
+                # If the leader failed this raises the same error.
+                value = self.__wait_for_leader(future, wait_timeout, metric_tags)
             except Exception as e:
-                metrics.increment("execute_error", tags=metric_tags)
-                raise e
+                if isinstance(e, RequestCancelled) and not future.done():
+                    # The caller of this follower gave up.
+                    raise
+                # The leader timed out, failed, or its own caller gave up on
+                # it. Its error may not be the one this request would get.
+                metrics.increment(
+                    "single_flight.fallback", tags={**metric_tags, "scope": "local"}
+                )
+                return self.__execute_and_set(
+                    key, function, record_cache_hit_type, timer, policy, metric_tags
+                )
+            record_cache_hit_type(RESULT_WAIT)
+            metrics.increment(
+                "single_flight.saved", tags={**metric_tags, "scope": "local"}
+            )
             return value
 
+        try:
+            value = self.__execute_with_redis_lock(
+                key,
+                function,
+                record_cache_hit_type,
+                timer,
+                policy,
+                metric_tags,
+                wait_timeout,
+            )
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self.__in_flight_lock:
+                del self.__in_flight[key]
+
+    def __wait_for_leader(
+        self,
+        future: Future[TValue],
+        wait_timeout: int,
+        metric_tags: Mapping[str, str],
+    ) -> TValue:
+        """
+        Waits for the result of the leader, giving up early if the request
+        of the follower gets cancelled.
+        """
+        cancellation = get_current_cancellation()
+        if cancellation is None:
+            return future.result(timeout=wait_timeout)
+
+        poll_interval_ms = get_int_config("single_flight_poll_interval_ms", 50)
+        assert poll_interval_ms is not None
+        deadline = time.time() + wait_timeout
+        while True:
+            try:
+                return future.result(
+                    timeout=min(
+                        poll_interval_ms / 1000.0, max(deadline - time.time(), 0.0)
+                    )
+                )
+            except FutureTimeoutError:
+                if time.time() >= deadline:
+                    raise
+            _raise_if_cancelled(cancellation, metric_tags, "local")
+
+    def __execute_with_redis_lock(
+        self,
+        key: str,
+        function: Callable[[], TValue],
+        record_cache_hit_type: Callable[[int], None],
+        timer: Optional[Timer],
+        policy: CachePolicy,
+        metric_tags: Mapping[str, str],
+        wait_timeout: int,
+    ) -> TValue:
+        result_key = self.__build_key(key)
+        lock_key = self.__build_key(key, suffix="executing")
+
+        if self.__client.set(lock_key, 1, nx=True, ex=wait_timeout):
+            try:
+                return self.__execute_and_set(
+                    key, function, record_cache_hit_type, timer, policy, metric_tags
+                )
+            finally:
+                self.__client.delete(lock_key)
+
+        # Another process is running the same query, wait for its result.
+        poll_interval_ms = get_int_config("single_flight_poll_interval_ms", 50)
+        assert poll_interval_ms is not None
+        polls = math.ceil(wait_timeout * 1000 / max(poll_interval_ms, 1))
+        cancellation = get_current_cancellation()
+        for _ in range(polls):
+            if cancellation is None:
+                time.sleep(poll_interval_ms / 1000.0)
+            elif cancellation.wait(poll_interval_ms / 1000.0):
+                _raise_if_cancelled(cancellation, metric_tags, "redis")
+            cached_value, executing = self.__client.mget([result_key, lock_key])
+            if cached_value is not None:
+                record_cache_hit_type(RESULT_WAIT)
+                metrics.increment(
+                    "single_flight.saved", tags={**metric_tags, "scope": "redis"}
+                )
+                return self.__codec.decode(cached_value)
+            if executing is None:
+                # The leader is gone without storing a result, most likely
+                # because the query failed.
+                break
+
+        metrics.increment(
+            "single_flight.fallback", tags={**metric_tags, "scope": "redis"}
+        )
+        return self.__execute_and_set(
+            key, function, record_cache_hit_type, timer, policy, metric_tags
+        )
+
     def get_readthrough(
         self,
         key: str,
         function: Callable[[], TValue],
         record_cache_hit_type: Callable[[int], None],
         timer: Optional[Timer] = None,
+        policy: Optional[CachePolicy] = None,
+        revalidate: Optional[Callable[[], TValue]] = None,
     ) -> TValue:
         # in case something is wrong with redis, we want to be able to
         # disable the read_through_cache but still serve traffic.
@@ -102,7 +365,7 @@ class RedisCache(Cache[TValue]):
         try:
             # set disable_lua_scripts to use the simple read-through cache without queueing.
             return self.__get_value_with_simple_readthrough(
-                key, function, record_cache_hit_type, timer
+                key, function, record_cache_hit_type, timer, policy, revalidate
             )
         except (ConnectionError, ReadOnlyError, RedisTimeoutError, ValueError):
             if settings.RAISE_ON_READTHROUGH_CACHE_REDIS_FAILURES:
@@ -18,7 +18,7 @@ from arroyo.processing.strategies.abstract import ProcessingStrategyFactory
 from arroyo.processing.strategies.commit import CommitOffsets
 from arroyo.processing.strategies.healthcheck import Healthcheck
 from arroyo.processing.strategies.produce import Produce
-from arroyo.types import Commit
+from arroyo.types import Commit, Value
 
 from snuba import state
 from snuba.clickhouse.errors import ClickhouseError
@@ -30,6 +30,7 @@ from snuba.datasets.factory import get_dataset
 from snuba.datasets.table_storage import KafkaTopicSpec
 from snuba.reader import Result
 from snuba.subscriptions.codecs import (
+    SubscriptionScheduledTaskBatchEncoder,
     SubscriptionScheduledTaskEncoder,
     SubscriptionTaskResultEncoder,
 )
@@ -216,6 +217,11 @@ class ExecuteQuery(ProcessingStrategy[KafkaPayload]):
     """
     Decodes a scheduled subscription task from the Kafka payload, builds
     the request and executes the ClickHouse query.
+
+    Payloads produced in batches by the scheduler contain several tasks.
+    Each of them is executed and produces its own result, only the result
+    of the last one carries the offset of the payload so it is committed
+    once every task of the batch was handled.
     """
 
     def __init__(
@@ -236,11 +242,17 @@ class ExecuteQuery(ProcessingStrategy[KafkaPayload]):
         self.__next_step = next_step
 
         self.__encoder = SubscriptionScheduledTaskEncoder()
+        self.__batch_encoder = SubscriptionScheduledTaskBatchEncoder()
         self.__result_encoder = SubscriptionTaskResultEncoder()
 
         self.__queue: Deque[
             Tuple[Message[KafkaPayload], SubscriptionTaskResultFuture]
         ] = deque()
+        # The last message rejected because its batch did not fit, with its
+        # decoded tasks.
+        self.__rejected: Optional[
+            Tuple[Message[KafkaPayload], Sequence[ScheduledSubscriptionTask]]
+        ] = None
 
         self.__closed = False
 
@@ -319,32 +331,43 @@ class ExecuteQuery(ProcessingStrategy[KafkaPayload]):
         if len(self.__queue) >= max_queue_size:
             raise MessageRejected
 
-        task = self.__encoder.decode(message.payload)
-
-        tick_upper_offset = task.task.tick_upper_offset
-
-        entity = task.task.entity
-        entity_name = entity.value
+        # The consumer submits a rejected message again, its tasks are only
+        # decoded once.
+        tasks: Sequence[ScheduledSubscriptionTask]
+        if self.__rejected is not None and self.__rejected[0] is message:
+            tasks = self.__rejected[1]
+        elif self.__batch_encoder.is_batch(message.payload):
+            tasks = self.__batch_encoder.decode(message.payload)
+        else:
+            tasks = [self.__encoder.decode(message.payload)]
+        self.__rejected = None
+
+        # A batch is queued at once so it has to fit entirely, unless the
+        # queue is empty, a batch larger than the queue would never be
+        # accepted otherwise.
+        if self.__queue and len(self.__queue) + len(tasks) > max_queue_size:
+            self.__rejected = (message, tasks)
+            raise MessageRejected
 
-        should_execute = entity_name in self.__entity_names
+        tasks_to_execute = [task for task in tasks if self.__should_execute(task)]
 
-        # Don't execute stale subscriptions
-        if (
-            self.__stale_threshold_seconds is not None
-            and time.time() - datetime.timestamp(task.timestamp)
-            >= self.__stale_threshold_seconds
-        ):
-            should_execute = False
+        for i, task in enumerate(tasks_to_execute):
+            if i == len(tasks_to_execute) - 1:
+                task_message = message
+            else:
+                # Only the last task of a batch commits the offset.
+                task_message = Message(Value(message.payload, {}, message.timestamp))
 
-        if should_execute:
             try:
                 self.__queue.append(
                     (
-                        message,
+                        task_message,
                         SubscriptionTaskResultFuture(
                             task,
                             self.__executor.submit(
-                                self.__execute_query, task, tick_upper_offset
+                                self.__execute_query,
+                                task,
+                                task.task.tick_upper_offset,
                             ),
                         ),
                     )
@@ -356,9 +379,25 @@ class ExecuteQuery(ProcessingStrategy[KafkaPayload]):
                         logger.exception("Error running subscription query %r", exc)
                     else:
                         raise exc
-        else:
+
+    def __should_execute(self, task: ScheduledSubscriptionTask) -> bool:
+        entity_name = task.task.entity.value
+
+        should_execute = entity_name in self.__entity_names
+
+        # Don't execute stale subscriptions
+        if (
+            self.__stale_threshold_seconds is not None
+            and time.time() - datetime.timestamp(task.timestamp)
+            >= self.__stale_threshold_seconds
+        ):
+            should_execute = False
+
+        if not should_execute:
             self.__metrics.increment("skipped_execution", tags={"entity": entity_name})
 
+        return should_execute
+
     def close(self) -> None:
         self.__closed = True
 
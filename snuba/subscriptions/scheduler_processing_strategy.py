@@ -12,6 +12,7 @@ from typing import (
     MutableMapping,
     NamedTuple,
     Optional,
+    Sequence,
     Tuple,
     cast,
 )
@@ -22,12 +23,20 @@ from arroyo.backends.kafka import KafkaPayload
 from arroyo.processing.strategies import MessageRejected, ProcessingStrategy
 from arroyo.types import BrokerValue, Commit
 
+from snuba import state
 from snuba.datasets.entities.entity_key import EntityKey
 from snuba.datasets.entities.factory import get_entity_name
 from snuba.datasets.table_storage import KafkaTopicSpec
 from snuba.query.exceptions import InvalidQueryException
-from snuba.subscriptions.codecs import SubscriptionScheduledTaskEncoder
-from snuba.subscriptions.data import SnQLSubscriptionData, SubscriptionScheduler
+from snuba.subscriptions.codecs import (
+    SubscriptionScheduledTaskBatchEncoder,
+    SubscriptionScheduledTaskEncoder,
+)
+from snuba.subscriptions.data import (
+    ScheduledSubscriptionTask,
+    SnQLSubscriptionData,
+    SubscriptionScheduler,
+)
 from snuba.subscriptions.utils import SchedulingWatermarkMode, Tick
 from snuba.utils.metrics import MetricsBackend
 
@@ -386,6 +395,11 @@ class ProduceScheduledSubscriptionMessage(ProcessingStrategy[CommittableTick]):
     On each call to poll(), we remove completed futures from the queue.
     If all scheduled subscription messages for that tick were succesfully
     produced and the tick indicates it should be committed, we commit offsets.
+
+    If the `scheduled_subscription_batch_size` runtime config is greater
+    than 1, the subscriptions of a tick are grouped by entity and produced
+    as batches of up to that many subscriptions per message instead. The
+    executor must be able to decode batches before this is enabled.
     """
 
     def __init__(
@@ -400,6 +414,7 @@ class ProduceScheduledSubscriptionMessage(ProcessingStrategy[CommittableTick]):
     ) -> None:
         self.__schedulers = schedulers
         self.__encoder = SubscriptionScheduledTaskEncoder()
+        self.__batch_encoder = SubscriptionScheduledTaskBatchEncoder()
         self.__producer = producer
         self.__scheduled_topic = Topic(
             scheduled_topic_spec.get_physical_topic_name(slice_id)
@@ -458,23 +473,11 @@ class ProduceScheduledSubscriptionMessage(ProcessingStrategy[CommittableTick]):
             encoded_tasks: List[KafkaPayload] = []
         else:
             tasks = [task for task in self.__schedulers[tick.partition].find(tick)]
-            encoded_tasks = []
-
-            for task in tasks:
-                try:
-                    encoded_task = self.__encoder.encode(task)
-                    encoded_tasks.append(encoded_task)
-                except InvalidQueryException:
-                    entity = task.task.subscription.data.entity
-                    if get_entity_name(entity) == EntityKey.GENERIC_METRICS_GAUGES:
-                        if isinstance(
-                            task.task.subscription.data, SnQLSubscriptionData
-                        ):
-                            logger.warning(
-                                "Skipping malformed subscription query %r in scheduler",
-                                task.task.subscription.data.query,
-                            )
-                        continue
+            batch_size = state.get_int_config("scheduled_subscription_batch_size", 0)
+            if batch_size is not None and batch_size > 1:
+                encoded_tasks = self.__encode_batches(tasks, batch_size)
+            else:
+                encoded_tasks = self.__encode_tasks(tasks)
 
         # Record the amount of time between the message timestamp and when scheduling
         # for that timestamp occurs
@@ -501,6 +504,47 @@ class ProduceScheduledSubscriptionMessage(ProcessingStrategy[CommittableTick]):
             ),
         )
 
+    def __encode_tasks(
+        self, tasks: Sequence[ScheduledSubscriptionTask]
+    ) -> List[KafkaPayload]:
+        encoded_tasks = []
+
+        for task in tasks:
+            try:
+                encoded_task = self.__encoder.encode(task)
+                encoded_tasks.append(encoded_task)
+            except InvalidQueryException:
+                entity = task.task.subscription.data.entity
+                if get_entity_name(entity) == EntityKey.GENERIC_METRICS_GAUGES:
+                    if isinstance(task.task.subscription.data, SnQLSubscriptionData):
+                        logger.warning(
+                            "Skipping malformed subscription query %r in scheduler",
+                            task.task.subscription.data.query,
+                        )
+                    continue
+
+        return encoded_tasks
+
+    def __encode_batches(
+        self, tasks: Sequence[ScheduledSubscriptionTask], batch_size: int
+    ) -> List[KafkaPayload]:
+        tasks_by_entity: MutableMapping[EntityKey, List[ScheduledSubscriptionTask]] = {}
+        for task in tasks:
+            tasks_by_entity.setdefault(task.task.entity, []).append(task)
+
+        encoded_batches = []
+        for entity_tasks in tasks_by_entity.values():
+            for i in range(0, len(entity_tasks), batch_size):
+                batch = entity_tasks[i : i + batch_size]
+                try:
+                    encoded_batches.append(self.__batch_encoder.encode(batch))
+                except InvalidQueryException:
+                    # Fall back to one message per task so only the malformed
+                    # subscriptions are skipped.
+                    encoded_batches.extend(self.__encode_tasks(batch))
+
+        return encoded_batches
+
     def close(self) -> None:
         self.__closed = True
 
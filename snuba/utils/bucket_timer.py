@@ -1,9 +1,8 @@
 from __future__ import annotations
 
 import typing
-from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import List, MutableMapping
+from typing import Dict, List, Mapping, Optional
 
 from snuba import environment, state
 from snuba.state import get_int_config
@@ -22,20 +21,37 @@ def ceil_minute(time: datetime) -> datetime:
     return floor_minute(time + timedelta(minutes=1))
 
 
-Buckets = MutableMapping[datetime, MutableMapping[int, timedelta]]
+Buckets = Mapping[datetime, Mapping[int, timedelta]]
+
+_ZERO = timedelta(0)
+
+
+class _Slot:
+    """
+    The time spent per project during one minute of the window.
+    """
+
+    __slots__ = ("minute", "projects")
+
+    def __init__(self) -> None:
+        self.minute: Optional[datetime] = None
+        self.projects: Dict[int, timedelta] = {}
 
 
 class Counter:
     """
     The Counter class is used to track time spent on some activity (e.g. processing a replacement) for a project.
     To accomplish this, the `record_time_spent()` function captures some processing time range and splits it by a per
-    minute resolution (Bucket). The buckets older than COUNTER_WINDOW_SIZE are trimmed. Finally, the `get_bucket_totals_exceeding_limit()`
-    function returns all project ids who's total processing time has exceeded self.limit.
+    minute resolution (Bucket). Finally, the `get_projects_exceeding_limit()` function returns all project ids who's
+    total processing time over the last COUNTER_WINDOW_SIZE has exceeded self.limit.
+
+    The buckets are kept in a ring of one slot per minute of the window. The total of each project over the window is
+    updated when time is recorded and when a minute falls out of the window, so checking a project against the limit
+    does not need to sum the buckets.
     """
 
     def __init__(self, consumer_group: str) -> None:
         self.consumer_group: str = consumer_group
-        self.buckets: Buckets = {}
 
         percentage = state.get_config("project_quota_time_percentage", 1.0)
         assert isinstance(percentage, float)
@@ -45,14 +61,38 @@ class Counter:
         self.counter_window_size = timedelta(minutes=counter_window_size_minutes)
         self.limit = self.counter_window_size * percentage
 
+        # The window includes the current minute and the
+        # `counter_window_size_minutes` minutes before it.
+        self.__slots = [_Slot() for _ in range(counter_window_size_minutes + 1)]
+        self.__totals: Dict[int, timedelta] = {}
+
+    @property
+    def buckets(self) -> Buckets:
+        return {
+            slot.minute: slot.projects
+            for slot in self.__slots
+            if slot.minute is not None
+        }
+
+    def __slot_for(self, minute: datetime) -> _Slot:
+        index = minute.toordinal() * 1440 + minute.hour * 60 + minute.minute
+        return self.__slots[index % len(self.__slots)]
+
+    def __expire_slot(self, slot: _Slot) -> None:
+        for project_id, processing_time in slot.projects.items():
+            total = self.__totals[project_id] - processing_time
+            if total > _ZERO:
+                self.__totals[project_id] = total
+            else:
+                del self.__totals[project_id]
+        slot.minute = None
+        slot.projects = {}
+
     def __trim_expired_buckets(self, now: datetime) -> None:
-        current_minute = floor_minute(now)
-        window_start = current_minute - self.counter_window_size
-        new_buckets: Buckets = {}
-        for min, dict in self.buckets.items():
-            if min >= window_start:
-                new_buckets[min] = dict
-        self.buckets = new_buckets
+        window_start = floor_minute(now) - self.counter_window_size
+        for slot in self.__slots:
+            if slot.minute is not None and slot.minute < window_start:
+                self.__expire_slot(slot)
 
     def __add_to_bucket(
         self,
@@ -60,14 +100,20 @@ class Counter:
         start_minute: datetime,
         processing_time: timedelta,
     ) -> None:
-        if start_minute in self.buckets:
-            if project_id in self.buckets[start_minute]:
-                self.buckets[start_minute][project_id] += processing_time
-            else:
-                self.buckets[start_minute][project_id] = processing_time
-        else:
-            self.buckets[start_minute] = {}
-            self.buckets[start_minute][project_id] = processing_time
+        slot = self.__slot_for(start_minute)
+        if slot.minute != start_minute:
+            if slot.minute is not None and slot.minute > start_minute:
+                # The minute is older than the window of the time already
+                # recorded, it would be trimmed right away.
+                return
+            self.__expire_slot(slot)
+            slot.minute = start_minute
+        slot.projects[project_id] = (
+            slot.projects.get(project_id, _ZERO) + processing_time
+        )
+        self.__totals[project_id] = (
+            self.__totals.get(project_id, _ZERO) + processing_time
+        )
 
     def record_time_spent(
         self, project_id: int, start: datetime, end: datetime
@@ -81,24 +127,39 @@ class Counter:
             right += timedelta(minutes=1)
         self.__add_to_bucket(project_id, start_minute, end - left)
 
+    def get_project_total(
+        self, project_id: int, now: Optional[datetime] = None
+    ) -> timedelta:
+        """
+        Returns the time spent on the project over the window ending at `now`.
+        """
+        self.__trim_expired_buckets(now or datetime.now())
+        return self.__totals.get(project_id, _ZERO)
+
+    def __exceeds_limit(self, total_processing_time: timedelta) -> bool:
+        # A project is only over the limit if other projects are waiting
+        # behind it, unless skipping single projects is allowed.
+        return total_processing_time > self.limit and bool(
+            len(self.__totals) > 1
+            or get_int_config("allows_skipping_single_project_replacements", default=0)
+        )
+
+    def is_over_limit(self, project_id: int, now: Optional[datetime] = None) -> bool:
+        """
+        Whether `project_id` would be returned by `get_projects_exceeding_limit()`.
+        """
+        return self.__exceeds_limit(self.get_project_total(project_id, now))
+
     def get_projects_exceeding_limit(self) -> List[int]:
         now = datetime.now()
         self.__trim_expired_buckets(now)
-        project_groups: dict[int, timedelta] = defaultdict(lambda: timedelta(seconds=0))
-        for project_dict in list(self.buckets.values()):
-            for project_id, processing_time in project_dict.items():
-                project_groups[project_id] += processing_time
 
         # Compare the replacement total grouped by project_id with system time limit
-        projects_exceeding_time_limit = []
-        for project_id, total_processing_time in project_groups.items():
-            if total_processing_time > self.limit and (
-                len(project_groups) > 1
-                or get_int_config(
-                    "allows_skipping_single_project_replacements", default=0
-                )
-            ):
-                projects_exceeding_time_limit.append(project_id)
+        projects_exceeding_time_limit = [
+            project_id
+            for project_id, total_processing_time in self.__totals.items()
+            if self.__exceeds_limit(total_processing_time)
+        ]
 
         metrics.timing(
             "get_projects_exceeding_limit_duration",
@@ -0,0 +1,214 @@
+"""
+Cancellation of the work done on behalf of a request whose caller gave up.
+
+A ``Cancellation`` is created for each request and made current for the
+duration of its execution with ``cancellable``. The code running queries
+registers how to kill each of them while it runs, and the code waiting on
+the result of someone else's query polls the cancellation.
+
+The request can be cancelled in two ways:
+
+* The caller sends a deadline (``DEADLINE_HEADER``, a Unix timestamp in
+  seconds). Queries are not started past it and the remaining time caps
+  the time ClickHouse is allowed to spend on them.
+* The server notices the caller disconnected and calls ``cancel``, which
+  kills the queries in flight. Only the asyncio RPC server can notice it,
+  uWSGI does not tell the application.
+
+The time queries ran before being killed is recorded as wasted work.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Event, Lock
+from typing import Callable, Iterator, Mapping, MutableMapping, Optional, Tuple
+
+from snuba import environment
+from snuba.utils.metrics.wrapper import MetricsWrapper
+from snuba.utils.serializable_exception import SerializableException
+
+logger = logging.getLogger(__name__)
+metrics = MetricsWrapper(environment.metrics, "cancellation")
+
+DEADLINE_HEADER = "X-Snuba-Deadline"
+
+DEADLINE_EXCEEDED = "deadline_exceeded"
+CLIENT_DISCONNECTED = "client_disconnected"
+
+
+class RequestCancelled(SerializableException):
+    pass
+
+
+def _cancelled(reason: str) -> RequestCancelled:
+    # Nobody is waiting for the response, this is not worth reporting.
+    return RequestCancelled(
+        f"request cancelled: {reason}", should_report=False, reason=reason
+    )
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    """
+    Parses the value of the deadline header. An invalid deadline is
+    ignored rather than failing the request.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        metrics.increment("invalid_deadline")
+        return None
+
+
+class Cancellation:
+    def __init__(self, deadline: Optional[float] = None) -> None:
+        self.__deadline = deadline
+        self.__reason: Optional[str] = None
+        self.__cancelled = Event()
+        # The queries running for the request: how to kill each of them and
+        # when it started.
+        self.__running: MutableMapping[int, Tuple[Callable[[], None], float]] = {}
+        # The cancellations of the work split from the request.
+        self.__children: MutableMapping[int, Cancellation] = {}
+        self.__next_id = 0
+        self.__lock = Lock()
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self.__reason is None and self.remaining() == 0.0:
+            return DEADLINE_EXCEEDED
+        return self.__reason
+
+    def remaining(self) -> Optional[float]:
+        """
+        The number of seconds left before the deadline, or None if the
+        caller did not send one.
+        """
+        if self.__deadline is None:
+            return None
+        return max(self.__deadline - time.time(), 0.0)
+
+    def raise_if_cancelled(self) -> None:
+        reason = self.reason
+        if reason is not None:
+            raise _cancelled(reason)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleeps up to ``timeout`` seconds, returning early with True if the
+        request gets cancelled.
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining < timeout:
+            self.__cancelled.wait(remaining)
+            return True
+        return self.__cancelled.wait(timeout) or self.reason is not None
+
+    @contextmanager
+    def running(
+        self, kill: Callable[[], None], tags: Mapping[str, str]
+    ) -> Iterator[None]:
+        """
+        Registers the work done in the block so ``cancel`` can stop it with
+        ``kill``. Raises ``RequestCancelled`` without running the block if
+        the request is already cancelled, and in place of the error the
+        block fails with once it is.
+        """
+        try:
+            self.raise_if_cancelled()
+        except RequestCancelled:
+            metrics.increment("rejected", tags={**tags, "reason": self.reason or ""})
+            raise
+
+        started = time.time()
+        with self.__lock:
+            key = self.__next_id
+            self.__next_id += 1
+            self.__running[key] = (kill, started)
+        try:
+            yield
+        except Exception as e:
+            reason = self.reason
+            if reason is None:
+                raise
+            if reason == DEADLINE_EXCEEDED:
+                # Stopped by ClickHouse when it ran out of the time left,
+                # cancel only accounts for the work it kills.
+                metrics.timing(
+                    "wasted_ms", (time.time() - started) * 1000, tags={"reason": reason}
+                )
+            raise _cancelled(reason) from e
+        finally:
+            with self.__lock:
+                self.__running.pop(key, None)
+
+    @contextmanager
+    def linked(self, child: Cancellation) -> Iterator[None]:
+        """
+        Cancels ``child`` along with this cancellation while in the block,
+        for work split from the request that has a cancellation of its own.
+        """
+        with self.__lock:
+            key = self.__next_id
+            self.__next_id += 1
+            self.__children[key] = child
+            reason = self.__reason
+        if reason is not None:
+            child.cancel(reason)
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__children.pop(key, None)
+
+    def cancel(self, reason: str) -> None:
+        """
+        Cancels the request and kills the work still running for it. This
+        blocks until the kills are issued.
+        """
+        with self.__lock:
+            if self.__reason is not None:
+                return
+            self.__reason = reason
+            self.__cancelled.set()
+            running = list(self.__running.values())
+            children = list(self.__children.values())
+
+        for child in children:
+            child.cancel(reason)
+
+        now = time.time()
+        for kill, started in running:
+            metrics.increment("killed", tags={"reason": reason})
+            metrics.timing("wasted_ms", (now - started) * 1000, tags={"reason": reason})
+            try:
+                kill()
+            except Exception:
+                logger.warning(
+                    "Failed to kill the work of a cancelled request", exc_info=True
+                )
+
+
+_current_cancellation: ContextVar[Optional[Cancellation]] = ContextVar(
+    "cancellation", default=None
+)
+
+
+@contextmanager
+def cancellable(cancellation: Cancellation) -> Iterator[Cancellation]:
+    """
+    Makes the cancellation current for the work done in the block.
+    """
+    token = _current_cancellation.set(cancellation)
+    try:
+        yield cancellation
+    finally:
+        _current_cancellation.reset(token)
+
+
+def get_current_cancellation() -> Optional[Cancellation]:
+    return _current_cancellation.get()
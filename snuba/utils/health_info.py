@@ -2,10 +2,23 @@ from __future__ import annotations
 
 import logging
 import os
+import random
 import time
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Any, Dict, List, Mapping, MutableMapping, Optional, Set, Union, cast
+from threading import Lock, Thread
+from typing import (
+    Any,
+    Dict,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+    cast,
+)
 
 import simplejson as json
 
@@ -85,11 +98,20 @@ def get_health_info(thorough: Union[bool, str]) -> HealthInfo:
         "thorough": str(thorough),
     }
 
-    clickhouse_health = (
-        check_all_tables_present(metric_tags=metric_tags)
-        if thorough
-        else sanity_check_clickhouse_connections()
-    )
+    cached_health = get_cached_clickhouse_health()
+    metric_tags["cached"] = str(cached_health is not None)
+    if cached_health is not None:
+        if thorough:
+            clickhouse_health = cached_health.tables_present
+            metric_tags.update(cached_health.metric_tags)
+        else:
+            clickhouse_health = cached_health.connections_ok
+    else:
+        clickhouse_health = (
+            check_all_tables_present(metric_tags=metric_tags)
+            if thorough
+            else sanity_check_clickhouse_connections()
+        )
     metric_tags["clickhouse_ok"] = str(clickhouse_health)
 
     body: Mapping[str, Union[str, bool]]
@@ -125,6 +147,123 @@ def get_health_info(thorough: Union[bool, str]) -> HealthInfo:
     )
 
 
+@dataclass(frozen=True)
+class ClickhouseHealth:
+    """
+    Result of checking all the clusters, as served by /health.
+    """
+
+    # At least one cluster answered a query.
+    connections_ok: bool
+    # All the tables of all the storages exist.
+    tables_present: bool
+    metric_tags: Mapping[str, Any]
+    timestamp: float
+
+
+def probe_clickhouse_health() -> ClickhouseHealth:
+    metric_tags: Dict[str, Any] = {}
+    tables_present = check_all_tables_present(metric_tags=metric_tags)
+    # If all the tables were found every cluster is reachable.
+    connections_ok = tables_present or sanity_check_clickhouse_connections()
+    return ClickhouseHealth(
+        connections_ok=connections_ok,
+        tables_present=tables_present,
+        metric_tags=metric_tags,
+        timestamp=time.time(),
+    )
+
+
+class HealthProber:
+    """
+    Checks the ClickHouse clusters in a background thread every ``interval``
+    seconds, plus a random jitter so the pods of a deployment do not probe
+    in lockstep. /health is served from the last result instead of querying
+    every cluster on each request, as long as the result is not older than
+    ``max_staleness`` seconds.
+    """
+
+    def __init__(self, interval: float, jitter: float, max_staleness: float) -> None:
+        self.__interval = interval
+        self.__jitter = jitter
+        self.__max_staleness = max_staleness
+        self.__health: Optional[ClickhouseHealth] = None
+        self.__thread: Optional[Thread] = None
+        self.__lock = Lock()
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = Thread(
+                    target=self.__run, name="health-prober", daemon=True
+                )
+                self.__thread.start()
+
+    def __run(self) -> None:
+        while True:
+            try:
+                self.__health = probe_clickhouse_health()
+            except Exception as err:
+                # The last result is kept until it becomes stale.
+                logger.error(err)
+            time.sleep(self.__interval + random.uniform(0, self.__jitter))
+
+    def get_health(self) -> Optional[ClickhouseHealth]:
+        health = self.__health
+        if health is None:
+            return None
+        age = time.time() - health.timestamp
+        metrics.timing("healthcheck.probe_age", age)
+        if age > self.__max_staleness:
+            metrics.increment("healthcheck.probe_stale")
+            return None
+        return health
+
+
+_prober: Optional[HealthProber] = None
+
+
+def get_cached_clickhouse_health() -> Optional[ClickhouseHealth]:
+    """
+    Returns the result of the background prober, starting it on the first
+    call in the process. None if the prober is disabled or if it has no
+    recent result, in which case the caller checks ClickHouse directly.
+    """
+    global _prober
+    if settings.HEALTH_PROBE_INTERVAL_SEC <= 0:
+        return None
+    if _prober is None:
+        _prober = HealthProber(
+            settings.HEALTH_PROBE_INTERVAL_SEC,
+            settings.HEALTH_PROBE_JITTER_SEC,
+            settings.HEALTH_PROBE_MAX_STALENESS_SEC,
+        )
+    _prober.start()
+    return _prober.get_health()
+
+
+def _show_tables(
+    connection_id: ConnectionId, cluster: ClickhouseCluster
+) -> Sequence[Any]:
+    start = time.time()
+    ok = False
+    try:
+        clickhouse = cluster.get_query_connection(ClickhouseClientSettings.QUERY)
+        results = clickhouse.execute("show tables").results
+        ok = True
+        return results
+    finally:
+        metrics.timing(
+            "healthcheck.cluster_probe_latency",
+            time.time() - start,
+            tags={
+                "host": str(connection_id.hostname),
+                "database": str(connection_id.database_name),
+                "ok": str(ok),
+            },
+        )
+
+
 def filter_checked_storages(filtered_storages: List[Storage]) -> None:
     all_storage_keys = get_all_storage_keys()
     for storage_key in all_storage_keys:
@@ -156,10 +295,9 @@ def sanity_check_clickhouse_connections() -> bool:
             logger.error(err)
             continue
 
-    for cluster in unique_clusters.values():
+    for connection_id, cluster in unique_clusters.items():
         try:
-            clickhouse = cluster.get_query_connection(ClickhouseClientSettings.QUERY)
-            clickhouse.execute("show tables").results
+            _show_tables(connection_id, cluster)
             return True
         except Exception as err:
             logger.error(err)
@@ -195,8 +333,7 @@ def check_all_tables_present(metric_tags: dict[str, Any] | None = None) -> bool:
         }
 
         for cluster_key, cluster in unique_clusters.items():
-            clickhouse = cluster.get_query_connection(ClickhouseClientSettings.QUERY)
-            clickhouse_tables = clickhouse.execute("show tables").results
+            clickhouse_tables = _show_tables(cluster_key, cluster)
             known_table_names = connection_grouped_table_names[cluster_key]
             logger.debug(f"checking for {known_table_names} on {cluster_key}")
             for table in known_table_names:
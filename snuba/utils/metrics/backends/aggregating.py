@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import logging
+import os
+import weakref
+from multiprocessing.util import Finalize, register_after_fork
+from threading import Event, Lock, Thread
+from typing import (
+    FrozenSet,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from snuba.utils.clock import Clock, SystemClock
+from snuba.utils.metrics.backends.abstract import MetricsBackend
+from snuba.utils.metrics.types import Tags
+
+logger = logging.getLogger(__name__)
+
+TagsKey = Optional[FrozenSet[Tuple[str, str]]]
+
+
+class MetricKey(NamedTuple):
+    name: str
+    tags: TagsKey
+    unit: Optional[str]
+
+
+class _Buffer:
+    """
+    Holds all the values recorded since the last flush. Counters are summed,
+    gauges keep the last value recorded and timings keep every value.
+    """
+
+    def __init__(self) -> None:
+        self.counters: MutableMapping[MetricKey, Union[int, float]] = {}
+        self.gauges: MutableMapping[MetricKey, Union[int, float]] = {}
+        self.timings: MutableMapping[MetricKey, List[Union[int, float]]] = {}
+        self.size = 0
+
+
+def _tags_key(tags: Optional[Tags]) -> TagsKey:
+    if not tags:
+        return None
+    return frozenset(tags.items())
+
+
+def _tags_from_key(key: TagsKey) -> Optional[Tags]:
+    if key is None:
+        return None
+    return dict(key)
+
+
+class AggregatingMetricsBackend(MetricsBackend):
+    """
+    A metrics backend that pre-aggregates metrics in memory per
+    ``(name, tags, unit)`` and periodically flushes the aggregated values to
+    another backend.
+
+    Recording a metric only costs a dictionary update under a lock, the
+    expensive part (tag formatting, building and sending the statsd packet)
+    happens on flush, once per key rather than once per call for counters
+    and gauges:
+
+    * counters are summed and flushed as a single increment,
+    * gauges only flush the last value recorded,
+    * timings keep every value recorded and every value is flushed as a
+      timing. The statsd agent computes the percentiles of a timing per
+      host over every value it received, which aggregates computed in each
+      process could not be merged into, so timings are only buffered: their
+      packets are still sent one per value, but by whoever flushes rather
+      than by the caller recording them.
+
+    Distributions are merged server side into percentiles over every host,
+    which needs every value, so they are not buffered and are forwarded
+    immediately, like events.
+
+    The buffer is flushed every ``flush_interval_sec`` by a background
+    thread, and when a metric is recorded if ``max_buffer_size`` values are
+    buffered or the interval elapsed. The thread is started again in the
+    children of a fork, which start with an empty buffer since the parent
+    flushes what was buffered before the fork. The buffer is also flushed
+    when the process exits, including the processes started by
+    ``multiprocessing``, which skip the ``atexit`` handlers. ``autoflush``
+    disables the thread and the flush on exit, ``flush`` must then be called
+    explicitly.
+    """
+
+    def __init__(
+        self,
+        backend: MetricsBackend,
+        flush_interval_sec: float = 10.0,
+        max_buffer_size: int = 10000,
+        clock: Clock = SystemClock(),
+        autoflush: bool = True,
+    ) -> None:
+        assert flush_interval_sec > 0
+        assert max_buffer_size > 0
+        self.__backend = backend
+        self.__flush_interval_sec = flush_interval_sec
+        self.__max_buffer_size = max_buffer_size
+        self.__clock = clock
+        self.__autoflush = autoflush
+
+        self.__reset()
+        if autoflush:
+            ref = weakref.ref(self)
+
+            def after_fork_in_child() -> None:
+                backend = ref()
+                if backend is not None:
+                    backend.__reset()
+
+            os.register_at_fork(after_in_child=after_fork_in_child)
+            # multiprocessing drops the exit handlers of the parent after
+            # the fork hooks ran, register it again once it did.
+            register_after_fork(self, AggregatingMetricsBackend.__flush_on_exit)
+
+    def __reset(self) -> None:
+        self.__lock = Lock()
+        self.__buffer = _Buffer()
+        self.__last_flush = self.__clock.time()
+        self.__closed = Event()
+        if self.__autoflush:
+            Thread(
+                target=self.__run, name="metrics-aggregation-flush", daemon=True
+            ).start()
+            self.__flush_on_exit()
+
+    def __flush_on_exit(self) -> None:
+        Finalize(self, self.close, exitpriority=0)
+
+    def __run(self) -> None:
+        closed = self.__closed
+        while not closed.wait(self.__flush_interval_sec):
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("Failed to flush the metrics", exc_info=True)
+
+    def __should_flush(self) -> bool:
+        return (
+            self.__buffer.size >= self.__max_buffer_size
+            or self.__clock.time() - self.__last_flush >= self.__flush_interval_sec
+        )
+
+    def increment(
+        self,
+        name: str,
+        value: Union[int, float] = 1,
+        tags: Optional[Tags] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        key = MetricKey(name, _tags_key(tags), unit)
+        with self.__lock:
+            counters = self.__buffer.counters
+            counters[key] = counters.get(key, 0) + value
+            self.__buffer.size += 1
+            should_flush = self.__should_flush()
+
+        if should_flush:
+            self.flush()
+
+    def gauge(
+        self,
+        name: str,
+        value: Union[int, float],
+        tags: Optional[Tags] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        key = MetricKey(name, _tags_key(tags), unit)
+        with self.__lock:
+            self.__buffer.gauges[key] = value
+            self.__buffer.size += 1
+            should_flush = self.__should_flush()
+
+        if should_flush:
+            self.flush()
+
+    def timing(
+        self,
+        name: str,
+        value: Union[int, float],
+        tags: Optional[Tags] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        key = MetricKey(name, _tags_key(tags), unit)
+        with self.__lock:
+            values = self.__buffer.timings.get(key)
+            if values is None:
+                values = self.__buffer.timings[key] = []
+            values.append(value)
+            self.__buffer.size += 1
+            should_flush = self.__should_flush()
+
+        if should_flush:
+            self.flush()
+
+    def distribution(
+        self,
+        name: str,
+        value: Union[int, float],
+        tags: Optional[Tags] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        self.__backend.distribution(name, value, tags, unit)
+
+    def events(
+        self,
+        title: str,
+        text: str,
+        alert_type: str,
+        priority: str,
+        tags: Optional[Tags] = None,
+    ) -> None:
+        self.__backend.events(title, text, alert_type, priority, tags)
+
+    def flush(self) -> None:
+        """
+        Send all the buffered values to the underlying backend.
+        """
+        with self.__lock:
+            buffer = self.__buffer
+            self.__buffer = _Buffer()
+            self.__last_flush = self.__clock.time()
+
+        backend = self.__backend
+        for key, value in buffer.counters.items():
+            backend.increment(key.name, value, _tags_from_key(key.tags), key.unit)
+
+        for key, value in buffer.gauges.items():
+            backend.gauge(key.name, value, _tags_from_key(key.tags), key.unit)
+
+        for key, values in buffer.timings.items():
+            tags = _tags_from_key(key.tags)
+            for value in values:
+                backend.timing(key.name, value, tags, key.unit)
+
+    def close(self) -> None:
+        """
+        Stop the background flushes and flush what is buffered.
+        """
+        self.__closed.set()
+        self.flush()
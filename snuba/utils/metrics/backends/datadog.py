@@ -1,13 +1,28 @@
 from __future__ import annotations
 
 import threading
-from typing import Callable, Mapping, Optional, Sequence, Union
+from typing import (
+    Callable,
+    FrozenSet,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from datadog import DogStatsd
 
 from snuba.utils.metrics.backends.abstract import MetricsBackend
 from snuba.utils.metrics.types import Tags
 
+# Upper bound on the number of distinct tag sets whose normalized form is
+# cached. Tag sets are mostly static (referrer, dataset, storage...) so this
+# is only reached if a caller puts unbounded values in tags, in which case
+# the cache is reset rather than growing forever.
+MAX_NORMALIZED_TAGS_CACHE_SIZE = 10000
+
 
 class DatadogMetricsBackend(MetricsBackend):
     """
@@ -31,6 +46,9 @@ class DatadogMetricsBackend(MetricsBackend):
         self.__client_factory = client_factory
         self.__sample_rates = sample_rates if sample_rates is not None else {}
         self.__thread_state = threading.local()
+        self.__normalized_tags_cache: MutableMapping[
+            FrozenSet[Tuple[str, str]], Sequence[str]
+        ] = {}
 
     @property
     def __client(self) -> DogStatsd:
@@ -43,8 +61,17 @@ class DatadogMetricsBackend(MetricsBackend):
     def __normalize_tags(self, tags: Optional[Tags]) -> Optional[Sequence[str]]:
         if tags is None:
             return None
-        else:
-            return [f"{key}:{value.replace('|', '_')}" for key, value in tags.items()]
+
+        cache_key = frozenset(tags.items())
+        normalized = self.__normalized_tags_cache.get(cache_key)
+        if normalized is None:
+            normalized = [
+                f"{key}:{value.replace('|', '_')}" for key, value in tags.items()
+            ]
+            if len(self.__normalized_tags_cache) >= MAX_NORMALIZED_TAGS_CACHE_SIZE:
+                self.__normalized_tags_cache.clear()
+            self.__normalized_tags_cache[cache_key] = normalized
+        return normalized
 
     def increment(
         self,
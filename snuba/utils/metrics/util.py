@@ -41,7 +41,7 @@ def create_metrics(
     from snuba.utils.metrics.backends.dualwrite import SentryDatadogMetricsBackend
     from snuba.utils.metrics.backends.sentry import SentryMetricsBackend
 
-    return SentryDatadogMetricsBackend(
+    backend: MetricsBackend = SentryDatadogMetricsBackend(
         DatadogMetricsBackend(
             partial(
                 DogStatsd,
@@ -57,6 +57,17 @@ def create_metrics(
         SentryMetricsBackend(),
     )
 
+    if settings.METRICS_AGGREGATION_ENABLED:
+        from snuba.utils.metrics.backends.aggregating import AggregatingMetricsBackend
+
+        backend = AggregatingMetricsBackend(
+            backend,
+            flush_interval_sec=settings.METRICS_AGGREGATION_FLUSH_INTERVAL_SEC,
+            max_buffer_size=settings.METRICS_AGGREGATION_MAX_BUFFER_SIZE,
+        )
+
+    return backend
+
 
 F = TypeVar("F", bound=Callable[..., Any])
 
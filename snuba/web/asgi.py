@@ -0,0 +1,12 @@
+from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
+
+from snuba.core.initialize import initialize_snuba
+from snuba.environment import setup_logging, setup_sentry
+
+setup_logging()
+setup_sentry()
+initialize_snuba()
+
+from snuba.web.rpc.asgi import RPCApplication  # noqa
+
+application = SentryAsgiMiddleware(RPCApplication())
@@ -4,7 +4,8 @@ import logging
 import random
 import uuid
 from dataclasses import dataclass
-from functools import partial
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
 from hashlib import md5
 from threading import Lock
 from typing import Any, Mapping, MutableMapping, MutableSequence, Optional, Union, cast
@@ -17,12 +18,16 @@ from sentry_sdk.api import configure_scope
 
 from snuba import environment, settings, state
 from snuba.attribution.attribution_info import AttributionInfo
+from snuba.clickhouse.admission import Priority, get_priority
 from snuba.clickhouse.errors import ClickhouseError
 from snuba.clickhouse.formatter.nodes import FormattedQuery
 from snuba.clickhouse.formatter.query import format_query_anonymized
+from snuba.clickhouse.hedging import is_hedging_enabled
 from snuba.clickhouse.query import Query
 from snuba.clickhouse.query_dsl.accessors import get_time_range_estimate
 from snuba.clickhouse.query_profiler import generate_profile
+from snuba.datasets.schemas.tables import TableSchema
+from snuba.datasets.storages.factory import get_storage, get_writable_storages
 from snuba.datasets.storages.storage_key import StorageKey
 from snuba.query import ProcessableQuery
 from snuba.query.allocation_policies import (
@@ -48,8 +53,9 @@ from snuba.querylog.query_metadata import (
 )
 from snuba.reader import Reader, Result
 from snuba.redis import RedisClientKey, get_redis_client
-from snuba.state.cache.abstract import Cache, ExecutionTimeoutError
+from snuba.state.cache.abstract import Cache, CachePolicy, ExecutionTimeoutError
 from snuba.state.cache.redis.backend import (
+    RESULT_STALE,
     RESULT_VALUE,
     RESULT_WAIT,
     SIMPLE_READTHROUGH,
@@ -58,6 +64,7 @@ from snuba.state.cache.redis.backend import (
 from snuba.state.quota import ResourceQuota
 from snuba.state.rate_limit import RateLimitExceeded
 from snuba.util import force_bytes
+from snuba.utils.cancellation import RequestCancelled
 from snuba.utils.codecs import ExceptionAwareCodec
 from snuba.utils.metrics.timer import Timer
 from snuba.utils.metrics.util import with_span
@@ -66,7 +73,7 @@ from snuba.utils.serializable_exception import (
     SerializableException,
     SerializableExceptionDict,
 )
-from snuba.web import QueryException, QueryResult, constants
+from snuba.web import QueryException, QueryExtraData, QueryResult, constants
 
 metrics = MetricsWrapper(environment.metrics, "db_query")
 
@@ -169,6 +176,8 @@ def execute_query(
     stats: MutableMapping[str, Any],
     clickhouse_query_settings: MutableMapping[str, Any],
     robust: bool,
+    hedge_key: Optional[str] = None,
+    priority: Optional[Priority] = None,
 ) -> Result:
     """
     Execute a query and return a result.
@@ -181,6 +190,8 @@ def execute_query(
         clickhouse_query_settings,
         with_totals=clickhouse_query.has_totals(),
         robust=robust,
+        hedge_key=hedge_key,
+        priority=priority,
     )
 
     timer.mark("execute")
@@ -222,6 +233,142 @@ def _get_cache_partition(reader: Reader) -> Cache[Result]:
     ]
 
 
+def _get_local_table_name(storage_key: StorageKey) -> Optional[str]:
+    schema = get_storage(storage_key).get_schema()
+    return schema.get_local_table_name() if isinstance(schema, TableSchema) else None
+
+
+@lru_cache(maxsize=None)
+def _is_replaced(storage_key: StorageKey) -> bool:
+    """
+    Whether a replacer can rewrite the rows the storage reads, through the
+    storage or another one on the same table.
+    """
+    table_name = _get_local_table_name(storage_key)
+    # Storages without a replacer may have an empty one rather than None.
+    return table_name is not None and any(
+        storage.get_table_writer().get_replacer_processor()
+        and _get_local_table_name(storage.get_storage_key()) == table_name
+        for storage in get_writable_storages()
+    )
+
+
+def _get_cache_policy(
+    clickhouse_query: Union[Query, CompositeQuery[Table]],
+) -> Optional[CachePolicy]:
+    """
+    Derive how long the result of a query can be cached from its time range.
+
+    The results of queries whose time range ended long enough ago that no
+    more data can be ingested in it are immutable, so they can be cached for
+    much longer than queries that end "now". Replacements can change rows of
+    any age, so the results of the storages they rewrite are never
+    immutable. Returns None (use the cache default) unless
+    ``cache_policy_enabled`` is set.
+    """
+    if not state.get_int_config("cache_policy_enabled", 0):
+        return None
+
+    ttl_sec, immutable_ttl_sec, stale_ttl_sec, immutable_lag_sec = state.get_configs(
+        [
+            ("cache_expiry_sec", 1),
+            ("cache_policy_immutable_ttl_sec", 300),
+            ("cache_policy_stale_ttl_sec", 0),
+            # Ingestion lag.
+            ("cache_policy_immutable_lag_sec", 3600),
+        ]
+    )
+    default_policy = CachePolicy(
+        ttl_sec=cast(int, ttl_sec), stale_ttl_sec=cast(int, stale_ttl_sec)
+    )
+    if not isinstance(clickhouse_query, Query) or _is_replaced(
+        clickhouse_query.get_from_clause().storage_key
+    ):
+        return default_policy
+
+    _, end = get_time_range_estimate(clickhouse_query)
+    if end is None:
+        return default_policy
+
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) - end > timedelta(
+        seconds=cast(int, immutable_lag_sec)
+    ):
+        return CachePolicy(ttl_sec=cast(int, immutable_ttl_sec))
+
+    return default_policy
+
+
+def _revalidate(
+    clickhouse_query: Union[Query, CompositeQuery[Table]],
+    query_settings: QuerySettings,
+    formatted_query: FormattedQuery,
+    reader: Reader,
+    clickhouse_query_settings: MutableMapping[str, Any],
+    robust: bool,
+    attribution_info: AttributionInfo,
+    hedge_key: Optional[str],
+) -> Result:
+    """
+    Refreshes a stale cached result in the background. The refresh is
+    admitted and charged by the allocation policies of the query, which
+    include the concurrency rate limits, like the query itself. A refresh
+    they reject raises and the stale result is kept until it expires.
+    """
+    allocation_policies = _get_allocation_policies(clickhouse_query)
+    query_id = uuid.uuid4().hex
+    stats: MutableMapping[str, Any] = {}
+    _apply_allocation_policies_quota(
+        query_settings,
+        attribution_info,
+        formatted_query,
+        stats,
+        allocation_policies,
+        query_id,
+    )
+    resource_quota = query_settings.get_resource_quota()
+    if resource_quota is not None:
+        clickhouse_query_settings["max_threads"] = resource_quota.max_threads
+
+    extra: QueryExtraData = {
+        "stats": stats,
+        "sql": formatted_query.get_sql(),
+        "experiments": clickhouse_query.get_experiments(),
+    }
+    try:
+        result = execute_query(
+            clickhouse_query,
+            query_settings,
+            formatted_query,
+            reader,
+            Timer("db_query.revalidate"),
+            stats,
+            clickhouse_query_settings,
+            robust,
+            hedge_key,
+            Priority.BATCH,
+        )
+    except Exception as cause:
+        result_or_error = QueryResultOrError(
+            query_result=None,
+            error=QueryException.from_args(cause.__class__.__name__, str(cause), extra),
+        )
+        raise
+    else:
+        result_or_error = QueryResultOrError(
+            query_result=QueryResult(result, extra), error=None
+        )
+        return result
+    finally:
+        for allocation_policy in allocation_policies:
+            allocation_policy.update_quota_balance(
+                tenant_ids=attribution_info.tenant_ids,
+                query_id=query_id,
+                result_or_error=result_or_error,
+            )
+
+
 @with_span(op="function")
 def execute_query_with_query_id(
     clickhouse_query: Union[Query, CompositeQuery[Table]],
@@ -233,8 +380,15 @@ def execute_query_with_query_id(
     clickhouse_query_settings: MutableMapping[str, Any],
     robust: bool,
     referrer: str,
+    hedge_key: Optional[str] = None,
+    priority: Optional[Priority] = None,
+    attribution_info: Optional[AttributionInfo] = None,
 ) -> Result:
-    if state.get_config("randomize_query_id", False):
+    # Single flight coalesces queries on the cache key, so it needs the key to
+    # be derived from the query. The ClickHouse query id is randomized anyway.
+    if state.get_config("randomize_query_id", False) and not state.get_config(
+        "single_flight_enabled", 0
+    ):
         query_id = uuid.uuid4().hex
     else:
         query_id = get_query_cache_key(formatted_query)
@@ -251,6 +405,9 @@ def execute_query_with_query_id(
             robust,
             query_id,
             referrer,
+            hedge_key,
+            priority,
+            attribution_info,
         )
     except ClickhouseError as e:
         if (
@@ -277,6 +434,9 @@ def execute_query_with_query_id(
             robust,
             query_id,
             referrer,
+            hedge_key,
+            priority,
+            attribution_info,
         )
 
 
@@ -292,7 +452,15 @@ def execute_query_with_readthrough_caching(
     robust: bool,
     query_id: str,
     referrer: str,
+    hedge_key: Optional[str] = None,
+    priority: Optional[Priority] = None,
+    attribution_info: Optional[AttributionInfo] = None,
 ) -> Result:
+    """
+    Runs the query through the result cache. Stale results are only served,
+    and refreshed in the background, if the ``attribution_info`` of the
+    query is given to charge the refresh to its allocation policies.
+    """
     span = sentry_sdk.get_current_span()
 
     if referrer in settings.BYPASS_CACHE_REFERRERS and state.get_config(
@@ -311,6 +479,8 @@ def execute_query_with_readthrough_caching(
             stats,
             clickhouse_query_settings,
             robust=robust,
+            hedge_key=hedge_key,
+            priority=priority,
         )
 
     clickhouse_query_settings["query_id"] = f"randomized-{uuid.uuid4().hex}"
@@ -323,6 +493,10 @@ def execute_query_with_readthrough_caching(
         if hit_type == RESULT_VALUE:
             stats["cache_hit"] = 1
             span_tag = "cache_hit"
+        elif hit_type == RESULT_STALE:
+            stats["cache_hit"] = 1
+            stats["cache_stale"] = 1
+            span_tag = "cache_stale"
         elif hit_type == RESULT_WAIT:
             stats["is_duplicate"] = 1
             span_tag = "cache_wait"
@@ -332,6 +506,27 @@ def execute_query_with_readthrough_caching(
         if span:
             span.set_data("cache_status", span_tag)
 
+    policy = _get_cache_policy(clickhouse_query)
+    revalidate = None
+    if policy is not None and policy.stale_ttl_sec and attribution_info is not None:
+        # The refresh may run after this request returned, so it must not
+        # touch the stats, timer or settings of this request. Nobody waits
+        # for it, it goes after the queries of the callers.
+        revalidate = partial(
+            _revalidate,
+            clickhouse_query,
+            query_settings,
+            formatted_query,
+            reader,
+            {
+                **clickhouse_query_settings,
+                "query_id": f"randomized-{uuid.uuid4().hex}",
+            },
+            robust,
+            attribution_info,
+            hedge_key,
+        )
+
     cache_partition = _get_cache_partition(reader)
     metrics.increment(
         "cache_partition_loaded",
@@ -349,9 +544,13 @@ def execute_query_with_readthrough_caching(
             stats,
             clickhouse_query_settings,
             robust,
+            hedge_key,
+            priority,
         ),
         record_cache_hit_type=record_cache_hit_type,
         timer=timer,
+        policy=policy,
+        revalidate=revalidate,
     )
 
 
@@ -473,6 +672,13 @@ def _raw_query(
             clickhouse_query_settings,
             robust=robust,
             referrer=attribution_info.referrer,
+            hedge_key=(
+                attribution_info.referrer
+                if is_hedging_enabled(attribution_info.referrer, dataset_name)
+                else None
+            ),
+            priority=get_priority(attribution_info),
+            attribution_info=attribution_info,
         )
     except Exception as cause:
         error_code = None
@@ -493,7 +699,7 @@ def _raw_query(
                 scope.fingerprint = fingerprint
         elif isinstance(cause, TimeoutError):
             status = QueryStatus.TIMEOUT
-        elif isinstance(cause, ExecutionTimeoutError):
+        elif isinstance(cause, (ExecutionTimeoutError, RequestCancelled)):
             status = QueryStatus.TIMEOUT
 
         if request_status.slo == SLO.AGAINST:
@@ -726,6 +932,22 @@ def db_query(
             metrics.increment("cache_miss", tags={"dataset": dataset_name})
         if stats.get("cache_hit_simple"):
             metrics.increment("cache_hit_simple", tags={"dataset": dataset_name})
+        if "cache_hit_simple" in stats:
+            # Tracks the hit ratio of the queries that went through the cache
+            # per referrer.
+            metrics.increment(
+                "cache_lookup",
+                tags={
+                    "referrer": attribution_info.referrer,
+                    "status": (
+                        "stale"
+                        if stats.get("cache_stale")
+                        else "hit"
+                        if stats.get("cache_hit")
+                        else "miss"
+                    ),
+                },
+            )
         if result:
             return result
         raise error or Exception(
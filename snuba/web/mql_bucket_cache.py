@@ -0,0 +1,297 @@
+"""
+Cache of the time buckets of MQL timeseries queries.
+
+Dashboards refresh the same timeseries over a sliding window, aggregating
+the whole range again on every refresh although only its most recent
+buckets changed. This caches the rows of each bucket fully inside the
+range of a query once it is old enough not to receive data anymore, keyed
+by the query without its range, and answers the following queries by
+merging the cached buckets with the results of querying only the ranges
+they do not cover.
+
+The rows of a bucket only depend on the data in that bucket, so the cache
+holds the aggregated values of each bucket rather than aggregate states
+and merging them is concatenating them. The results are the ones of the
+whole query as long as the limit does not truncate them, queries returning
+as many rows as their limit are run again over the whole range. Queries
+are not cached when they are not a timeseries (no interval, or with
+totals), when they use an offset, or are run for debugging.
+
+The cache is opt-in and controlled by runtime config:
+
+* ``mql_bucket_cache_enabled`` set to 1 enables it.
+* ``mql_bucket_cache_settle_sec`` (default 300) is how long after its end
+  a bucket is cached, to let the late data arrive.
+* ``mql_bucket_cache_ttl_sec`` (default 3600) is how long buckets are kept.
+* ``mql_bucket_cache_max_buckets`` (default 1440): queries with more full
+  buckets than this are run as usual.
+* ``mql_bucket_cache_max_queries`` (default 2) bounds the number of queries
+  run for the ranges not covered by the cache, past it one query covers
+  them all.
+"""
+from __future__ import annotations
+
+import copy
+import logging
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from hashlib import md5
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import rapidjson
+
+from redis.exceptions import RedisError
+from snuba import environment, state
+from snuba.datasets.dataset import Dataset
+from snuba.datasets.factory import get_dataset_name
+from snuba.query.mql.context_population import limit_value
+from snuba.query.mql.mql_context import MQLContext
+from snuba.reader import Column, Result, Row
+from snuba.redis import RedisClientKey, get_redis_client
+from snuba.request import Request
+from snuba.util import force_bytes, parse_datetime
+from snuba.utils.metrics.timer import Timer
+from snuba.utils.metrics.wrapper import MetricsWrapper
+from snuba.web import QueryExtraData, QueryResult
+
+logger = logging.getLogger(__name__)
+metrics = MetricsWrapper(environment.metrics, "mql_bucket_cache")
+redis_client = get_redis_client(RedisClientKey.CACHE)
+
+KEY_PREFIX = "snuba-mql-bucket:"
+TIME_COLUMN = "time"
+
+# The fields of the body that do not change the results of the query.
+ATTRIBUTION_FIELDS = {"tenant_ids", "app_id", "parent_api", "team", "feature"}
+
+RunQuery = Callable[[Dataset, Request, Timer], QueryResult]
+
+
+def is_bucket_cache_enabled() -> bool:
+    return bool(state.get_int_config("mql_bucket_cache_enabled", 0))
+
+
+@dataclass(frozen=True)
+class _Range:
+    """
+    The range of a query in seconds since the epoch, split in buckets of
+    ``interval`` seconds aligned on the epoch like ``toStartOfInterval``.
+    """
+
+    start: int
+    end: int
+    interval: int
+
+    def full_buckets(self) -> Sequence[int]:
+        first = math.ceil(self.start / self.interval) * self.interval
+        last = (self.end // self.interval) * self.interval
+        return range(first, last, self.interval)
+
+    def uncovered(self, buckets: Sequence[int]) -> List[Tuple[int, int]]:
+        """
+        The ranges not covered by the sorted full buckets.
+        """
+        ranges = []
+        cursor = self.start
+        for bucket in buckets:
+            if bucket > cursor:
+                ranges.append((cursor, bucket))
+            cursor = bucket + self.interval
+        if cursor < self.end:
+            ranges.append((cursor, self.end))
+        return ranges
+
+
+def _get_range(request: Request, body: Mapping[str, Any]) -> Optional[_Range]:
+    """
+    The range of the query if it can be answered from the cache.
+    """
+    if request.query_settings.get_debug() or request.query_settings.get_dry_run():
+        return None
+    mql_context = body["mql_context"]
+    rollup = mql_context["rollup"]
+    if not rollup.get("interval") or rollup.get("with_totals") == "True":
+        return None
+    if mql_context.get("offset"):
+        return None
+    start = parse_datetime(mql_context["start"]).replace(tzinfo=timezone.utc)
+    end = parse_datetime(mql_context["end"]).replace(tzinfo=timezone.utc)
+    return _Range(int(start.timestamp()), int(end.timestamp()), rollup["interval"])
+
+
+def _get_key(dataset: Dataset, body: Mapping[str, Any]) -> str:
+    mql_context = {
+        name: value
+        for name, value in body["mql_context"].items()
+        if name not in ("start", "end")
+    }
+    query = {
+        name: value
+        for name, value in body.items()
+        if name not in ATTRIBUTION_FIELDS and name != "mql_context"
+    }
+    digest = md5(
+        force_bytes(
+            rapidjson.dumps(
+                [get_dataset_name(dataset), query, mql_context], sort_keys=True
+            )
+        )
+    ).hexdigest()
+    # The hash tag keeps the buckets of a query on the same node, so they
+    # can be fetched at once.
+    return f"{KEY_PREFIX}{{{digest}}}"
+
+
+def _get_bucket(row: Row) -> int:
+    time_value = parse_datetime(row[TIME_COLUMN]).replace(tzinfo=timezone.utc)
+    return int(time_value.timestamp())
+
+
+def _format_time(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _load(
+    key: str, buckets: Sequence[int]
+) -> Tuple[Optional[List[Column]], Dict[int, List[Row]]]:
+    try:
+        values = redis_client.mget(
+            [f"{key}:meta", *(f"{key}:{bucket}" for bucket in buckets)]
+        )
+    except RedisError:
+        logger.warning("Failed to read the MQL bucket cache", exc_info=True)
+        metrics.increment("error", tags={"operation": "read"})
+        return None, {}
+    if values[0] is None:
+        return None, {}
+    return rapidjson.loads(values[0]), {
+        bucket: rapidjson.loads(value)
+        for bucket, value in zip(buckets, values[1:])
+        if value is not None
+    }
+
+
+def _store(key: str, meta: List[Column], buckets: Mapping[int, List[Row]]) -> None:
+    ttl = state.get_int_config("mql_bucket_cache_ttl_sec", 3600)
+    assert ttl is not None
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.set(f"{key}:meta", rapidjson.dumps(meta), ex=ttl)
+        for bucket, rows in buckets.items():
+            pipeline.set(f"{key}:{bucket}", rapidjson.dumps(rows), ex=ttl)
+        pipeline.execute()
+    except RedisError:
+        logger.warning("Failed to write the MQL bucket cache", exc_info=True)
+        metrics.increment("error", tags={"operation": "write"})
+
+
+def run_query_with_bucket_cache(
+    dataset: Dataset,
+    request: Request,
+    body: Mapping[str, Any],
+    build: Callable[[Dict[str, Any]], Request],
+    run_query: RunQuery,
+    timer: Timer,
+) -> QueryResult:
+    """
+    Runs the MQL query ``request`` built from ``body``, answering it from
+    the cached buckets where possible. ``build`` builds the requests for the
+    ranges the cache does not cover from their body.
+    """
+    query_range = _get_range(request, body)
+    if query_range is None:
+        metrics.increment("bypassed")
+        return run_query(dataset, request, timer)
+
+    max_buckets = state.get_int_config("mql_bucket_cache_max_buckets", 1440)
+    settle = state.get_int_config("mql_bucket_cache_settle_sec", 300)
+    max_queries = state.get_int_config("mql_bucket_cache_max_queries", 2)
+    assert max_buckets is not None and settle is not None and max_queries is not None
+
+    full_buckets = query_range.full_buckets()
+    settled = time.time() - settle
+    cacheable = [
+        bucket for bucket in full_buckets if bucket + query_range.interval <= settled
+    ]
+    if not cacheable or len(full_buckets) > max_buckets:
+        metrics.increment("bypassed")
+        return run_query(dataset, request, timer)
+
+    key = _get_key(dataset, body)
+    meta, cached = _load(key, cacheable)
+    ranges = query_range.uncovered(sorted(cached))
+    if len(ranges) > max_queries:
+        start, end = ranges[0][0], ranges[-1][1]
+        ranges = [(start, end)]
+        cached = {
+            bucket: rows for bucket, rows in cached.items() if not start <= bucket < end
+        }
+
+    limit = limit_value(MQLContext.from_dict(body["mql_context"]))
+    results: List[QueryResult] = []
+    for start, end in ranges:
+        edge_body = copy.deepcopy(dict(body))
+        edge_body["mql_context"]["start"] = _format_time(start)
+        edge_body["mql_context"]["end"] = _format_time(end)
+        result = run_query(dataset, build(edge_body), timer)
+        if len(result.result["data"]) >= limit:
+            # The limit depends on the rows of the whole range.
+            metrics.increment("truncated")
+            return run_query(dataset, request, timer)
+        results.append(result)
+
+    rows = [row for bucket in sorted(cached) for row in cached[bucket]]
+    fetched: MutableMapping[int, List[Row]] = {}
+    for result in results:
+        for row in result.result["data"]:
+            fetched.setdefault(_get_bucket(row), []).append(row)
+            rows.append(row)
+    if len(rows) >= limit:
+        metrics.increment("truncated")
+        return run_query(dataset, request, timer)
+    rows.sort(key=_get_bucket)
+
+    if results:
+        meta = results[-1].result["meta"]
+        _store(
+            key,
+            meta,
+            {
+                bucket: fetched.get(bucket, [])
+                for bucket in cacheable
+                if bucket not in cached
+                and any(start <= bucket < end for start, end in ranges)
+            },
+        )
+    assert meta is not None
+
+    metrics.increment("hit_buckets", len(cached))
+    metrics.increment("queries", len(results))
+    stats: Dict[str, Any] = {**results[-1].extra["stats"]} if results else {}
+    stats["mql_bucket_cache"] = {"cached_buckets": len(cached), "queries": len(results)}
+    query_result: Result = {
+        "data": rows,
+        "meta": meta,
+        "profile": results[-1].result.get("profile") if results else None,
+        "trace_output": "",
+    }
+    return QueryResult(
+        result=query_result,
+        extra=QueryExtraData(
+            stats=stats,
+            sql="\n".join(result.extra["sql"] for result in results),
+            experiments={},
+        ),
+    )
@@ -1,20 +1,25 @@
 from __future__ import annotations
 
 import logging
+from functools import partial
 from typing import Any, Optional
 
 import sentry_sdk
 
 from snuba import environment, settings
 from snuba.datasets.dataset import Dataset
+from snuba.datasets.entities.factory import get_entity
 from snuba.datasets.factory import InvalidDatasetError, get_dataset, get_dataset_name
 from snuba.datasets.pluggable_dataset import PluggableDataset
+from snuba.datasets.pluggable_entity import PluggableEntity
+from snuba.pipeline.profiling import capture_cprofile, processor_profiling
 from snuba.pipeline.query_pipeline import QueryPipelineResult
 from snuba.pipeline.stages.query_execution import ExecutionStage
 from snuba.pipeline.stages.query_processing import (
     EntityProcessingStage,
     StorageProcessingStage,
 )
+from snuba.query.data_source.simple import Entity
 from snuba.query.exceptions import InvalidQueryException, QueryPlanException
 from snuba.query.query_settings import HTTPQuerySettings
 from snuba.querylog import record_invalid_request, record_query
@@ -27,6 +32,10 @@ from snuba.utils.metrics.timer import Timer
 from snuba.utils.metrics.util import with_span
 from snuba.utils.metrics.wrapper import MetricsWrapper
 from snuba.web import QueryException, QueryExtraData, QueryResult
+from snuba.web.mql_bucket_cache import (
+    is_bucket_cache_enabled,
+    run_query_with_bucket_cache,
+)
 
 logger = logging.getLogger("snuba.query")
 
@@ -41,22 +50,25 @@ def _run_query_pipeline(
     concurrent_queries_gauge: Optional[Gauge] = None,
     force_dry_run: bool = False,
 ) -> QueryResult:
-    clickhouse_query = EntityProcessingStage().execute(
-        QueryPipelineResult(
-            data=request,
-            query_settings=request.query_settings,
-            timer=timer,
-            error=None,
-        )
-    )
-    clickhouse_query = StorageProcessingStage().execute(clickhouse_query)
-
-    res = ExecutionStage(
-        request.attribution_info,
-        query_metadata=query_metadata,
-        robust=robust,
-        concurrent_queries_gauge=concurrent_queries_gauge,
-    ).execute(clickhouse_query)
+    with processor_profiling(request.attribution_info.referrer):
+        with capture_cprofile():
+            clickhouse_query = EntityProcessingStage().execute(
+                QueryPipelineResult(
+                    data=request,
+                    query_settings=request.query_settings,
+                    timer=timer,
+                    error=None,
+                )
+            )
+            clickhouse_query = StorageProcessingStage().execute(clickhouse_query)
+
+        res = ExecutionStage(
+            request.attribution_info,
+            query_metadata=query_metadata,
+            robust=robust,
+            concurrent_queries_gauge=concurrent_queries_gauge,
+            partition_key_column_name=_get_partition_key_column_name(request),
+        ).execute(clickhouse_query)
     if res.error:
         raise res.error
     elif res.data:
@@ -65,6 +77,18 @@ def _run_query_pipeline(
     raise Exception("No result or data, very bad exception")
 
 
+def _get_partition_key_column_name(request: Request) -> Optional[str]:
+    """
+    Returns the column the storages of the entity queried are sliced by.
+    """
+    from_clause = request.query.get_from_clause()
+    if isinstance(from_clause, Entity):
+        entity = get_entity(from_clause.key)
+        if isinstance(entity, PluggableEntity):
+            return entity.partition_key_column_name
+    return None
+
+
 @with_span()
 def run_query(
     dataset: Dataset,
@@ -160,6 +184,20 @@ def parse_and_run_query(
         body, parse_function, HTTPQuerySettings, schema, dataset, timer, referrer
     )
 
+    if is_mql and is_bucket_cache_enabled():
+        build = partial(
+            build_request,
+            parser=parse_function,
+            settings_class=HTTPQuerySettings,
+            schema=schema,
+            dataset=dataset,
+            timer=timer,
+            referrer=referrer,
+        )
+        return request, run_query_with_bucket_cache(
+            dataset, request, body, build, run_query, timer
+        )
+
     return request, run_query(dataset, request, timer)
 
 
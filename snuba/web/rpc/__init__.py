@@ -131,9 +131,13 @@ for v, module_path in _TO_IMPORT.items():
     import_submodules_in_directory(module_path, f"snuba.web.rpc.{v}")
 
 
-def run_rpc_handler(
+def parse_rpc_request(
     name: str, version: str, data: bytes
-) -> ProtobufMessage | ErrorProto:
+) -> Tuple[RPCEndpoint[ProtobufMessage, ProtobufMessage], ProtobufMessage] | ErrorProto:
+    """
+    Finds the endpoint of the request and deserializes its message, or
+    returns the error to respond with.
+    """
     try:
         endpoint = RPCEndpoint.get_from_name(name, version)()  # type: ignore
     except (AttributeError, InvalidConfigKeyError) as e:
@@ -153,9 +157,15 @@ def run_rpc_handler(
                 message=f"protobuf gave a decode error {e} (are all fields set and the correct types?)",
             )
         )
+    return endpoint, deserialized_protobuf
+
 
+def execute_rpc_request(
+    endpoint: RPCEndpoint[ProtobufMessage, ProtobufMessage],
+    in_msg: ProtobufMessage,
+) -> ProtobufMessage | ErrorProto:
     try:
-        return cast(ProtobufMessage, endpoint.execute(deserialized_protobuf))
+        return endpoint.execute(in_msg)
     except (RPCRequestException, QueryException) as e:
         return convert_rpc_exception_to_proto(e)
     except Exception as e:
@@ -166,3 +176,12 @@ def run_rpc_handler(
                 message=f"internal error occurred while executing this RPC call: {e}",
             )
         )
+
+
+def run_rpc_handler(
+    name: str, version: str, data: bytes
+) -> ProtobufMessage | ErrorProto:
+    request = parse_rpc_request(name, version, data)
+    if isinstance(request, ErrorProto):
+        return request
+    return execute_rpc_request(*request)
@@ -0,0 +1,239 @@
+"""
+An asyncio (ASGI) application serving the RPC endpoints, an alternative to
+the ``/rpc/<name>/<version>`` route of the Flask application.
+
+Under uWSGI a worker thread is held for the whole duration of a request,
+most of which is spent waiting on ClickHouse. Here the event loop receives
+the requests, finds the endpoint and parses the message inline, and only
+the execution of the endpoint runs on a bounded pool of threads. Each
+endpoint has a limit of requests in flight, past which requests are
+rejected with a 429 instead of queuing up. When the client disconnects
+before the response is ready, the request is abandoned: it does not run if
+it had not started yet, otherwise its queries are killed and its response
+is dropped.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Mapping, MutableMapping, Optional
+
+from google.protobuf.message import Message as ProtobufMessage
+from sentry_protos.snuba.v1.error_pb2 import Error as ErrorProto
+
+from snuba import environment, settings
+from snuba.utils.cancellation import (
+    CLIENT_DISCONNECTED,
+    DEADLINE_HEADER,
+    Cancellation,
+    cancellable,
+    parse_deadline,
+)
+from snuba.utils.health_info import get_health_info, shutdown_time
+from snuba.utils.metrics.wrapper import MetricsWrapper
+from snuba.web.rpc import RPCEndpoint, execute_rpc_request, parse_rpc_request
+
+metrics = MetricsWrapper(environment.metrics, "rpc_async")
+
+Scope = Mapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+
+class EndpointLimits:
+    """
+    Counts the requests in flight by endpoint. A request holds its slot
+    until its execution finishes, even if the client is gone by then, so
+    the limit bounds the work actually running.
+    """
+
+    def __init__(self, default_limit: int, overrides: Mapping[str, int]) -> None:
+        self.__default_limit = default_limit
+        self.__overrides = overrides
+        self.__in_flight: MutableMapping[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def try_acquire(self, endpoint: str) -> bool:
+        limit = self.__overrides.get(endpoint, self.__default_limit)
+        with self.__lock:
+            in_flight = self.__in_flight.get(endpoint, 0)
+            if in_flight >= limit:
+                return False
+            self.__in_flight[endpoint] = in_flight + 1
+            return True
+
+    def release(self, endpoint: str) -> None:
+        with self.__lock:
+            self.__in_flight[endpoint] -= 1
+
+    def in_flight(self, endpoint: str) -> int:
+        return self.__in_flight.get(endpoint, 0)
+
+
+class RPCApplication:
+    def __init__(
+        self,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limits: Optional[EndpointLimits] = None,
+    ) -> None:
+        self.__executor = executor or ThreadPoolExecutor(
+            max_workers=settings.RPC_ASYNC_THREADS, thread_name_prefix="rpc"
+        )
+        self.__limits = limits or EndpointLimits(
+            settings.RPC_ASYNC_ENDPOINT_CONCURRENCY,
+            settings.RPC_ASYNC_ENDPOINT_CONCURRENCY_OVERRIDES,
+        )
+        self.__started_at = time.time()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.__lifespan(receive, send)
+            return
+        assert scope["type"] == "http"
+
+        path = scope["path"].strip("/").split("/")
+        if path == ["health_envoy"]:
+            down_since = shutdown_time()
+            await _respond(
+                send,
+                200 if down_since is None or down_since < self.__started_at else 503,
+                b"{}",
+                b"application/json",
+            )
+        elif path == ["health"]:
+            thorough = b"thorough=" in scope.get("query_string", b"")
+            health_info = await asyncio.get_running_loop().run_in_executor(
+                self.__executor, get_health_info, thorough
+            )
+            await _respond(
+                send,
+                health_info.status,
+                health_info.body.encode("utf-8"),
+                b"application/json",
+            )
+        elif len(path) == 3 and path[0] == "rpc" and scope["method"] == "POST":
+            await self.__rpc(scope, path[1], path[2], receive, send)
+        else:
+            await _respond(send, 404, b"not found", b"text/plain")
+
+    async def __lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.__executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __rpc(
+        self, scope: Scope, name: str, version: str, receive: Receive, send: Send
+    ) -> None:
+        body = await _read_body(receive)
+        if body is None:
+            metrics.increment("client_disconnected", tags={"stage": "body"})
+            return
+
+        request = parse_rpc_request(name, version, body)
+        if isinstance(request, ErrorProto):
+            await _respond_proto(send, request)
+            return
+
+        if not self.__limits.try_acquire(name):
+            metrics.increment("endpoint_limit_exceeded", tags={"endpoint": name})
+            await _respond_proto(
+                send,
+                ErrorProto(
+                    code=429,
+                    message=f"too many requests in flight for endpoint {name}",
+                ),
+            )
+            return
+
+        cancellation = Cancellation(parse_deadline(_header(scope, DEADLINE_HEADER)))
+        future: Future[ProtobufMessage | ErrorProto] = self.__executor.submit(
+            _execute, cancellation, *request
+        )
+        future.add_done_callback(lambda _: self.__limits.release(name))
+        metrics.gauge(
+            "in_flight", self.__limits.in_flight(name), tags={"endpoint": name}
+        )
+
+        result: asyncio.Future[Any] = asyncio.wrap_future(future)
+        disconnected: asyncio.Future[Any] = asyncio.ensure_future(
+            _wait_for_disconnect(receive)
+        )
+        done, _ = await asyncio.wait(
+            [result, disconnected], return_when=asyncio.FIRST_COMPLETED
+        )
+        if result not in done:
+            # Stops the execution if it did not start yet, otherwise kills
+            # its queries. Killing blocks on ClickHouse so it does not run
+            # on the event loop.
+            if not future.cancel():
+                asyncio.get_running_loop().run_in_executor(
+                    None, cancellation.cancel, CLIENT_DISCONNECTED
+                )
+            result.cancel()
+            metrics.increment(
+                "client_disconnected",
+                tags={"stage": "execute", "endpoint": name},
+            )
+            return
+        disconnected.cancel()
+        await _respond_proto(send, result.result())
+
+
+def _execute(
+    cancellation: Cancellation,
+    endpoint: RPCEndpoint[ProtobufMessage, ProtobufMessage],
+    in_msg: ProtobufMessage,
+) -> ProtobufMessage | ErrorProto:
+    with cancellable(cancellation):
+        return execute_rpc_request(endpoint, in_msg)
+
+
+def _header(scope: Scope, name: str) -> Optional[str]:
+    encoded = name.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key == encoded:
+            return str(value.decode("latin-1"))
+    return None
+
+
+async def _read_body(receive: Receive) -> Optional[bytes]:
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body.extend(message.get("body", b""))
+        if not message.get("more_body", False):
+            return bytes(body)
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _respond_proto(send: Send, proto: ProtobufMessage | ErrorProto) -> None:
+    status = proto.code if isinstance(proto, ErrorProto) else 200
+    await _respond(send, status, proto.SerializeToString(), b"application/x-protobuf")
+
+
+async def _respond(send: Send, status: int, body: bytes, content_type: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,154 @@
+"""
+Index of the attribute names and values autocomplete searches.
+
+Autocomplete sends a request per keystroke, each searching for a substring
+in the distinct attribute names, or values of an attribute, of the same
+projects over the same time range. The index holds all of them for one
+scope (the organization, projects, time range and type of the attributes,
+plus the key of the attribute for its values), in the order the query
+returns them. The attributes tables only store the day of the attributes,
+so the endpoints widen the time range to whole days, and requests over the
+same days share the index. The first request of a scope builds it with a single query
+without the substring, it is kept in Redis and the following requests of
+the scope filter and page through it instead of querying ClickHouse.
+
+Scopes with more names or values than the index holds are not indexed,
+which is recorded for the lifetime of an index so that their requests keep
+querying ClickHouse without trying to build it again.
+
+The index is opt-in and controlled by runtime config:
+
+* ``eap_autocomplete_index_enabled`` set to 1 enables it.
+* ``eap_autocomplete_index_ttl_sec`` (default 300) is how long an index is
+  served before it is built again, the new attributes are missing from it
+  in the meantime.
+* ``eap_autocomplete_index_max_entries`` (default 10000) bounds the number
+  of names or values of an index.
+"""
+import logging
+import re
+import time
+from hashlib import md5
+from itertools import islice
+from typing import Callable, List, Optional, Sequence
+
+import rapidjson
+from sentry_protos.snuba.v1.request_common_pb2 import RequestMeta
+
+from redis.exceptions import RedisError
+from snuba import environment, state
+from snuba.redis import RedisClientKey, get_redis_client
+from snuba.util import force_bytes
+from snuba.utils.metrics.wrapper import MetricsWrapper
+
+logger = logging.getLogger(__name__)
+metrics = MetricsWrapper(environment.metrics, "rpc.autocomplete_index")
+redis_client = get_redis_client(RedisClientKey.CACHE)
+
+KEY_PREFIX = "snuba-eap-autocomplete:"
+
+# Builds the first entries of a scope, up to the given number.
+BuildEntries = Callable[[int], List[str]]
+
+
+def is_index_enabled() -> bool:
+    return bool(state.get_int_config("eap_autocomplete_index_enabled", 0))
+
+
+def _get_key(kind: str, meta: RequestMeta, scope: Sequence[str]) -> str:
+    digest = md5(
+        force_bytes(
+            rapidjson.dumps(
+                [
+                    kind,
+                    meta.organization_id,
+                    sorted(meta.project_ids),
+                    meta.start_timestamp.seconds,
+                    meta.end_timestamp.seconds,
+                    list(scope),
+                ]
+            )
+        )
+    ).hexdigest()
+    return f"{KEY_PREFIX}{digest}"
+
+
+def get_entries(
+    kind: str, meta: RequestMeta, scope: Sequence[str], build: BuildEntries
+) -> Optional[List[str]]:
+    """
+    The names or values of the scope of the request, building the index on
+    a miss. None when they are not indexed and must be queried.
+    """
+    tags = {"kind": kind}
+    key = _get_key(kind, meta, scope)
+    try:
+        cached = redis_client.get(key)
+    except RedisError:
+        logger.warning("Failed to read the autocomplete index", exc_info=True)
+        metrics.increment("error", tags={**tags, "operation": "read"})
+        return None
+    if cached is not None:
+        entries: Optional[List[str]] = rapidjson.loads(cached)
+        metrics.increment("hit" if entries is not None else "too_large", tags=tags)
+        return entries
+
+    max_entries = state.get_int_config("eap_autocomplete_index_max_entries", 10000)
+    ttl = state.get_int_config("eap_autocomplete_index_ttl_sec", 300)
+    assert max_entries is not None and ttl is not None
+
+    start = time.time()
+    entries = build(max_entries + 1)
+    metrics.timing("build", (time.time() - start) * 1000, tags=tags)
+    if len(entries) > max_entries:
+        metrics.increment("too_large", tags=tags)
+        entries = None
+    else:
+        metrics.distribution("entries", len(entries), tags=tags)
+    try:
+        redis_client.set(key, rapidjson.dumps(entries), ex=ttl)
+    except RedisError:
+        logger.warning("Failed to write the autocomplete index", exc_info=True)
+        metrics.increment("error", tags={**tags, "operation": "write"})
+    return entries
+
+
+def like_matcher(pattern: str) -> Callable[[str], bool]:
+    """
+    Matches the strings like ClickHouse's ``LIKE``, on their bytes.
+    """
+    parts: List[bytes] = []
+    escaped = False
+    for byte in force_bytes(pattern):
+        char = bytes([byte])
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == b"\\":
+            escaped = True
+        elif char == b"%":
+            parts.append(b".*")
+        elif char == b"_":
+            parts.append(b".")
+        else:
+            parts.append(re.escape(char))
+    regex = re.compile(b"".join(parts), re.DOTALL)
+    return lambda value: regex.fullmatch(force_bytes(value)) is not None
+
+
+def page(
+    entries: Sequence[str],
+    matches: Callable[[str], bool],
+    offset: int,
+    limit: int,
+    after: Optional[str] = None,
+) -> List[str]:
+    """
+    The page of the matching entries, following ``after`` if given.
+    """
+    matching = (
+        entry
+        for entry in entries
+        if matches(entry) and (after is None or entry > after)
+    )
+    return list(islice(matching, offset, offset + limit))
@@ -2,6 +2,7 @@ from typing import Union
 
 from sentry_protos.snuba.v1.error_pb2 import Error as ErrorProto
 
+from snuba.utils.cancellation import RequestCancelled
 from snuba.web import QueryException
 
 
@@ -27,5 +28,7 @@ def convert_rpc_exception_to_proto(
     inferred_status = 500
     if exc.exception_type == "RateLimitExceeded":
         inferred_status = 429
+    elif exc.exception_type == RequestCancelled.__name__:
+        inferred_status = 504
 
     return ErrorProto(code=inferred_status, message=str(exc))
@@ -1,12 +1,12 @@
 import uuid
-from typing import Type
+from typing import Optional, Type
 
 from google.protobuf.json_format import MessageToDict
 from sentry_protos.snuba.v1.endpoint_trace_item_attributes_pb2 import (
     TraceItemAttributeNamesRequest,
     TraceItemAttributeNamesResponse,
 )
-from sentry_protos.snuba.v1.request_common_pb2 import PageToken
+from sentry_protos.snuba.v1.request_common_pb2 import PageToken, RequestMeta
 from sentry_protos.snuba.v1.trace_item_attribute_pb2 import AttributeKey, AttributeValue
 from sentry_protos.snuba.v1.trace_item_filter_pb2 import (
     ComparisonFilter,
@@ -30,7 +30,17 @@ from snuba.request import Request as SnubaRequest
 from snuba.web import QueryResult
 from snuba.web.query import run_query
 from snuba.web.rpc import RPCEndpoint
-from snuba.web.rpc.common.common import base_conditions_and, treeify_or_and_conditions
+from snuba.web.rpc.common.autocomplete_index import (
+    get_entries,
+    is_index_enabled,
+    like_matcher,
+    page,
+)
+from snuba.web.rpc.common.common import (
+    base_conditions_and,
+    treeify_or_and_conditions,
+    truncate_request_meta_to_day,
+)
 from snuba.web.rpc.common.debug_info import extract_response_meta
 from snuba.web.rpc.common.exceptions import BadSnubaRPCRequestException
 
@@ -82,15 +92,20 @@ def convert_to_snuba_request(req: TraceItemAttributeNamesRequest) -> SnubaReques
             f"Attribute type '{req.type}' is not supported. Supported types are: TYPE_STRING, TYPE_FLOAT, TYPE_INT, TYPE_BOOLEAN"
         )
 
+    # The attributes tables store the day of the attributes, the names are
+    # the ones of the whole days of the request, like in the index.
+    meta = RequestMeta()
+    meta.CopyFrom(req.meta)
+    truncate_request_meta_to_day(meta)
     condition = (
         base_conditions_and(
-            req.meta,
+            meta,
             f.like(column("attr_key"), f"%{req.value_substring_match}%"),
             _convert_filter_offset(req.page_token.filter_offset),
         )
         if req.page_token.HasField("filter_offset")
         else base_conditions_and(
-            req.meta, f.like(column("attr_key"), f"%{req.value_substring_match}%")
+            meta, f.like(column("attr_key"), f"%{req.value_substring_match}%")
         )
     )
 
@@ -133,6 +148,40 @@ def convert_to_snuba_request(req: TraceItemAttributeNamesRequest) -> SnubaReques
     )
 
 
+def _build_index_request(
+    req: TraceItemAttributeNamesRequest, limit: int
+) -> SnubaRequest:
+    """
+    The request for the first ``limit`` attribute names of the scope of
+    ``req`` over its time range, whatever their name, to build the
+    autocomplete index.
+    """
+    index_req = TraceItemAttributeNamesRequest()
+    index_req.CopyFrom(req)
+    index_req.ClearField("page_token")
+    index_req.value_substring_match = ""
+    index_req.limit = 0
+    snuba_request = convert_to_snuba_request(index_req)
+    snuba_request.query.set_limit(limit)
+    return snuba_request
+
+
+def _can_use_index(req: TraceItemAttributeNamesRequest) -> bool:
+    if not is_index_enabled() or req.meta.debug:
+        return False
+    if not 0 < req.limit <= MAX_REQUEST_LIMIT:
+        return False
+    if req.page_token.HasField("filter_offset"):
+        comparison = req.page_token.filter_offset.comparison_filter
+        return (
+            req.page_token.filter_offset.HasField("comparison_filter")
+            and comparison.op == ComparisonFilter.OP_GREATER_THAN
+            and comparison.key.name == "attr_key"
+            and comparison.value.WhichOneof("value") == "val_str"
+        )
+    return True
+
+
 def convert_to_attributes(
     query_res: QueryResult, attribute_type: AttributeKey.Type.ValueType
 ) -> list[TraceItemAttributeNamesResponse.Attribute]:
@@ -149,6 +198,15 @@ def convert_to_attributes(
     return list(map(t, query_res.result["data"]))
 
 
+def names_to_attributes(
+    names: list[str], attribute_type: AttributeKey.Type.ValueType
+) -> list[TraceItemAttributeNamesResponse.Attribute]:
+    return [
+        TraceItemAttributeNamesResponse.Attribute(name=name, type=attribute_type)
+        for name in names
+    ]
+
+
 class EndpointTraceItemAttributeNames(
     RPCEndpoint[TraceItemAttributeNamesRequest, TraceItemAttributeNamesResponse]
 ):
@@ -167,9 +225,9 @@ class EndpointTraceItemAttributeNames(
     def _build_response(
         self,
         req: TraceItemAttributeNamesRequest,
-        res: QueryResult,
+        attributes: list[TraceItemAttributeNamesResponse.Attribute],
+        results: list[QueryResult],
     ) -> TraceItemAttributeNamesResponse:
-        attributes = convert_to_attributes(res, req.type)
         page_token = (
             PageToken(offset=req.page_token.offset + len(attributes))
             if req.page_token.HasField("offset") or len(attributes) == 0
@@ -189,7 +247,7 @@ class EndpointTraceItemAttributeNames(
             attributes=attributes,
             page_token=page_token,
             meta=extract_response_meta(
-                req.meta.request_id, req.meta.debug, [res], [self._timer]
+                req.meta.request_id, req.meta.debug, results, [self._timer]
             ),
         )
 
@@ -199,10 +257,50 @@ class EndpointTraceItemAttributeNames(
         if not req.meta.request_id:
             req.meta.request_id = str(uuid.uuid4())
 
+        if _can_use_index(req):
+            names = self._get_indexed_names(req)
+            if names is not None:
+                return self._build_response(
+                    req, names_to_attributes(names, req.type), []
+                )
+
         snuba_request = convert_to_snuba_request(req)
         res = run_query(
             dataset=PluggableDataset(name="eap", all_entities=[]),
             request=snuba_request,
             timer=self._timer,
         )
-        return self._build_response(req, res)
+        return self._build_response(req, convert_to_attributes(res, req.type), [res])
+
+    def _get_indexed_names(
+        self, req: TraceItemAttributeNamesRequest
+    ) -> Optional[list[str]]:
+        # The index holds the names of the whole days of the request, like
+        # the query, and is shared by the requests over the same days.
+        meta = RequestMeta()
+        meta.CopyFrom(req.meta)
+        truncate_request_meta_to_day(meta)
+
+        def build(limit: int) -> list[str]:
+            res = run_query(
+                dataset=PluggableDataset(name="eap", all_entities=[]),
+                request=_build_index_request(req, limit),
+                timer=self._timer,
+            )
+            return [row["attr_key"] for row in res.result["data"]]
+
+        names = get_entries("names", meta, [AttributeKey.Type.Name(req.type)], build)
+        if names is None:
+            return None
+        after = (
+            req.page_token.filter_offset.comparison_filter.value.val_str
+            if req.page_token.HasField("filter_offset")
+            else None
+        )
+        return page(
+            names,
+            like_matcher(f"%{req.value_substring_match}%"),
+            req.page_token.offset,
+            req.limit,
+            after,
+        )
@@ -1,12 +1,12 @@
 import uuid
-from typing import Type
+from typing import Optional, Type
 
 from google.protobuf.json_format import MessageToDict
 from sentry_protos.snuba.v1.endpoint_trace_item_attributes_pb2 import (
     TraceItemAttributeValuesRequest,
     TraceItemAttributeValuesResponse,
 )
-from sentry_protos.snuba.v1.request_common_pb2 import PageToken
+from sentry_protos.snuba.v1.request_common_pb2 import PageToken, RequestMeta
 
 from snuba.attribution.appid import AppID
 from snuba.attribution.attribution_info import AttributionInfo
@@ -22,6 +22,7 @@ from snuba.query.query_settings import HTTPQuerySettings
 from snuba.request import Request as SnubaRequest
 from snuba.web.query import run_query
 from snuba.web.rpc import RPCEndpoint
+from snuba.web.rpc.common.autocomplete_index import get_entries, is_index_enabled, page
 from snuba.web.rpc.common.common import (
     base_conditions_and,
     treeify_or_and_conditions,
@@ -101,6 +102,27 @@ def _build_snuba_request(
     )
 
 
+def _build_index_request(
+    request: TraceItemAttributeValuesRequest, limit: int
+) -> SnubaRequest:
+    """
+    The request for the first ``limit`` values of the attribute in the scope
+    of ``request``, whatever their value, to build the autocomplete index.
+    """
+    index_request = TraceItemAttributeValuesRequest()
+    index_request.CopyFrom(request)
+    index_request.page_token.offset = 0
+    index_request.value_substring_match = ""
+    index_request.limit = 0
+    snuba_request = _build_snuba_request(index_request)
+    snuba_request.query.set_limit(limit)
+    return snuba_request
+
+
+def _can_use_index(request: TraceItemAttributeValuesRequest) -> bool:
+    return is_index_enabled() and not request.meta.debug and 0 < request.limit <= 1000
+
+
 class AttributeValuesRequest(
     RPCEndpoint[TraceItemAttributeValuesRequest, TraceItemAttributeValuesResponse]
 ):
@@ -121,14 +143,42 @@ class AttributeValuesRequest(
             raise NotImplementedError(
                 "TraceItemAttributeValues does not currently support page_token.filter_offset, please use page_token.offset instead."
             )
-        snuba_request = _build_snuba_request(in_msg)
-        res = run_query(
-            dataset=PluggableDataset(name="eap", all_entities=[]),
-            request=snuba_request,
-            timer=self._timer,
-        )
-        values = [r["attr_value"] for r in res.result.get("data", [])]
+        values = self._get_indexed_values(in_msg) if _can_use_index(in_msg) else None
+        if values is None:
+            snuba_request = _build_snuba_request(in_msg)
+            res = run_query(
+                dataset=PluggableDataset(name="eap", all_entities=[]),
+                request=snuba_request,
+                timer=self._timer,
+            )
+            values = [r["attr_value"] for r in res.result.get("data", [])]
         return TraceItemAttributeValuesResponse(
             values=values,
             page_token=PageToken(offset=in_msg.page_token.offset + len(values)),
         )
+
+    def _get_indexed_values(
+        self, in_msg: TraceItemAttributeValuesRequest
+    ) -> Optional[list[str]]:
+        def build(limit: int) -> list[str]:
+            res = run_query(
+                dataset=PluggableDataset(name="eap", all_entities=[]),
+                request=_build_index_request(in_msg, limit),
+                timer=self._timer,
+            )
+            return [r["attr_value"] for r in res.result.get("data", [])]
+
+        # The values are queried over the whole days of the request.
+        meta = RequestMeta()
+        meta.CopyFrom(in_msg.meta)
+        truncate_request_meta_to_day(meta)
+        values = get_entries("values", meta, [in_msg.key.name], build)
+        if values is None:
+            return None
+        substring = in_msg.value_substring_match
+        return page(
+            values,
+            lambda value: substring in value,
+            in_msg.page_token.offset,
+            in_msg.limit,
+        )
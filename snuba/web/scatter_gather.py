@@ -0,0 +1,300 @@
+"""
+Merging of the results of a query that was split by slice.
+
+A query on a sliced storage set filtering on ids that live in several slices
+can either run on the mega cluster or run once per slice, restricted to the
+ids of that slice, with the results merged afterwards. The second option is
+only possible when the shape of the query allows to merge the results
+exactly. `build_merge_plan` decides that and `merge_results` applies it.
+
+Mergeable shapes are:
+
+* plain row sets, with ORDER BY and LIMIT/OFFSET applied again on the merged
+  rows,
+* aggregations grouped by the partition key column, since each group then
+  lives in a single slice,
+* other aggregations whose aggregates are all sum, count, min or max (or
+  their -If variants), possibly with a LIMIT if they are ordered by all
+  the grouping keys and nothing else.
+
+Everything else (e.g. uniq or quantiles across slices, HAVING, LIMIT BY,
+TOTALS) keeps running on the mega cluster.
+"""
+from __future__ import annotations
+
+import copy
+import operator
+from dataclasses import dataclass, replace
+from typing import Any, Callable, List, Mapping, MutableMapping, Optional, Sequence
+
+from snuba.clickhouse.query import Query
+from snuba.query import OrderByDirection, SelectedExpression
+from snuba.query.conditions import in_condition
+from snuba.query.dsl import count
+from snuba.query.expressions import (
+    Column,
+    CurriedFunctionCall,
+    Expression,
+    FunctionCall,
+    Literal,
+)
+from snuba.query.functions import is_aggregation_function
+from snuba.reader import Result, Row
+
+# The aggregates whose results on disjoint sets of rows can be merged.
+MERGEABLE_AGGREGATES: Mapping[str, Callable[[Any, Any], Any]] = {
+    "count": operator.add,
+    "countIf": operator.add,
+    "sum": operator.add,
+    "sumIf": operator.add,
+    "min": min,
+    "minIf": min,
+    "max": max,
+    "maxIf": max,
+}
+
+# Added to the slice queries of aggregations without GROUP BY. ClickHouse
+# returns a row even if the slice has no matching rows, with defaults that
+# cannot be merged (e.g. 0 for min).
+ROW_COUNT_ALIAS = "_scatter_gather_row_count"
+
+
+@dataclass(frozen=True)
+class MergePlan:
+    """
+    How to merge the results of the slices of a query. All the names are
+    aliases of the selected columns, which are the keys of the result rows.
+    """
+
+    # None for plain row sets, the aggregates by alias otherwise.
+    aggregates: Optional[Mapping[str, Callable[[Any, Any], Any]]]
+    # The aliases identifying a group of an aggregation.
+    group_keys: Sequence[str]
+    # The results are concatenated, no two slices return the same group.
+    concatenate: bool
+    order_by: Sequence[tuple[str, OrderByDirection]]
+    limit: Optional[int]
+    offset: int
+
+
+def _is_aggregate(expression: Expression) -> bool:
+    if isinstance(expression, FunctionCall):
+        return is_aggregation_function(expression.function_name)
+    if isinstance(expression, CurriedFunctionCall):
+        return is_aggregation_function(expression.internal_function.function_name)
+    return False
+
+
+def _contains_aggregate(expression: Expression) -> bool:
+    return any(_is_aggregate(e) for e in expression)
+
+
+def _find_alias(
+    expression: Expression, selected: Sequence[SelectedExpression]
+) -> Optional[str]:
+    unaliased = replace(expression, alias=None)
+    for column in selected:
+        if replace(column.expression, alias=None) == unaliased:
+            return column.expression.alias
+    return None
+
+
+def _groups_by_column(query: Query, column_name: str) -> bool:
+    return any(
+        isinstance(e, Column) and e.column_name == column_name
+        for e in query.get_groupby()
+    )
+
+
+def build_merge_plan(query: Query, partition_key_column: str) -> Optional[MergePlan]:
+    """
+    Returns how to merge the results of `query` ran on each slice, or None
+    if they cannot be merged exactly.
+    """
+    if query.has_totals() or query.get_limitby() is not None:
+        return None
+
+    selected = query.get_selected_columns()
+    if any(column.expression.alias is None for column in selected):
+        return None
+
+    order_by = []
+    for order in query.get_orderby():
+        alias = _find_alias(order.expression, selected)
+        if alias is None:
+            return None
+        order_by.append((alias, order.direction))
+
+    is_aggregation = bool(query.get_groupby()) or any(
+        _contains_aggregate(column.expression) for column in selected
+    )
+    if not is_aggregation:
+        return MergePlan(
+            None, [], True, order_by, query.get_limit(), query.get_offset()
+        )
+
+    aggregates: MutableMapping[str, Callable[[Any, Any], Any]] = {}
+    group_keys: List[str] = []
+    for column in selected:
+        alias = column.expression.alias
+        assert alias is not None
+        if _contains_aggregate(column.expression):
+            aggregates[alias] = operator.add
+        else:
+            group_keys.append(alias)
+
+    if _groups_by_column(query, partition_key_column):
+        return MergePlan(
+            aggregates,
+            group_keys,
+            True,
+            order_by,
+            query.get_limit(),
+            query.get_offset(),
+        )
+
+    if query.get_having() is not None:
+        return None
+    # Merging by the selected keys is only right if they are the groups.
+    if any(_find_alias(e, selected) is None for e in query.get_groupby()):
+        return None
+    for column in selected:
+        alias = column.expression.alias
+        assert alias is not None
+        if alias not in aggregates:
+            continue
+        expression = column.expression
+        if not (
+            isinstance(expression, FunctionCall)
+            and expression.function_name in MERGEABLE_AGGREGATES
+            and not any(_contains_aggregate(p) for p in expression.parameters)
+        ):
+            return None
+        aggregates[alias] = MERGEABLE_AGGREGATES[expression.function_name]
+
+    # The top groups of each slice are the top groups overall only if they
+    # are totally ordered by their keys: ties, or values the other slices
+    # change, could cut a group from the results of some slices only.
+    ordered = {alias for alias, _ in order_by}
+    group_by_aliases = {_find_alias(e, selected) for e in query.get_groupby()}
+    if query.get_limit() is not None and (
+        any(alias in aggregates for alias in ordered) or not group_by_aliases <= ordered
+    ):
+        return None
+
+    return MergePlan(
+        aggregates,
+        group_keys,
+        False,
+        order_by,
+        query.get_limit(),
+        query.get_offset(),
+    )
+
+
+def build_slice_query(
+    query: Query, plan: MergePlan, partition_key_column: str, ids: Sequence[int]
+) -> Query:
+    """
+    Returns a copy of `query` restricted to the ids of a slice. The OFFSET
+    is only applied on the merged rows, the LIMIT of the copy includes it.
+    """
+    slice_query = copy.deepcopy(query)
+    slice_query.add_condition_to_ast(
+        in_condition(
+            Column(None, None, partition_key_column),
+            [Literal(None, i) for i in ids],
+        )
+    )
+    limit = query.get_limit()
+    if limit is not None:
+        slice_query.set_limit(limit + query.get_offset())
+    slice_query.set_offset(0)
+    if plan.aggregates is not None and not plan.concatenate and not plan.group_keys:
+        slice_query.set_ast_selected_columns(
+            [
+                *slice_query.get_selected_columns(),
+                SelectedExpression(ROW_COUNT_ALIAS, count(alias=ROW_COUNT_ALIAS)),
+            ]
+        )
+    return slice_query
+
+
+def _sort_rows(
+    rows: List[Row], order_by: Sequence[tuple[str, OrderByDirection]]
+) -> List[Row]:
+    # Stable sorts from the last key to the first one. NULLs go last in both
+    # directions, like in ClickHouse.
+    for alias, direction in reversed(order_by):
+        if direction == OrderByDirection.ASC:
+            rows.sort(key=lambda row: (row[alias] is None, row[alias]))
+        else:
+            rows.sort(
+                key=lambda row: (row[alias] is not None, row[alias]), reverse=True
+            )
+    return rows
+
+
+def _merge_groups(plan: MergePlan, results: Sequence[Result]) -> List[Row]:
+    assert plan.aggregates is not None
+    rows = [row for result in results for row in result["data"]]
+    if not plan.group_keys:
+        non_empty = [row for row in rows if row[ROW_COUNT_ALIAS] > 0]
+        rows = non_empty or rows[:1]
+        for row in rows:
+            del row[ROW_COUNT_ALIAS]
+
+    groups: MutableMapping[tuple[Any, ...], Row] = {}
+    for row in rows:
+        key = tuple(row[alias] for alias in plan.group_keys)
+        merged = groups.get(key)
+        if merged is None:
+            groups[key] = row
+        else:
+            for alias, merge in plan.aggregates.items():
+                merged[alias] = merge(merged[alias], row[alias])
+    return list(groups.values())
+
+
+def merge_results(plan: MergePlan, results: Sequence[Result]) -> Result:
+    """
+    Merges the results of the slice queries into the result the query would
+    have had on the mega cluster.
+    """
+    assert results
+    if plan.concatenate:
+        rows = [row for result in results for row in result["data"]]
+    else:
+        rows = _merge_groups(plan, results)
+
+    rows = _sort_rows(rows, plan.order_by)
+    if plan.limit is not None:
+        rows = rows[plan.offset : plan.offset + plan.limit]
+    elif plan.offset:
+        rows = rows[plan.offset :]
+
+    merged = copy.copy(results[0])
+    merged["data"] = rows
+    merged["meta"] = [
+        column for column in results[0]["meta"] if column["name"] != ROW_COUNT_ALIAS
+    ]
+    return merged
+
+
+def merge_stats(
+    stats: Sequence[Mapping[str, Any]], merged: Result
+) -> MutableMapping[str, Any]:
+    """
+    Merges the stats of the slice queries into the stats of the query. A
+    stat all the slices agree on is kept as is, one they differ on becomes
+    the list of the values of the slices. The result rows are the ones of
+    the merged result.
+    """
+    merged_stats: MutableMapping[str, Any] = {}
+    for key in dict.fromkeys(key for slice_stats in stats for key in slice_stats):
+        values = [slice_stats.get(key) for slice_stats in stats]
+        merged_stats[key] = (
+            values[0] if all(value == values[0] for value in values) else values
+        )
+    merged_stats["result_rows"] = len(merged["data"])
+    return merged_stats
@@ -63,6 +63,13 @@ from snuba.state.rate_limit import RateLimitExceeded
 from snuba.subscriptions.codecs import SubscriptionDataCodec
 from snuba.subscriptions.data import PartitionId
 from snuba.subscriptions.subscription import SubscriptionCreator, SubscriptionDeleter
+from snuba.utils.cancellation import (
+    DEADLINE_HEADER,
+    Cancellation,
+    RequestCancelled,
+    cancellable,
+    parse_deadline,
+)
 from snuba.utils.health_info import (
     check_down_file_exists,
     get_health_info,
@@ -121,6 +128,10 @@ application.url_map.converters["entity"] = EntityConverter
 application.url_map.converters["storage"] = StorageConverter
 atexit.register(close_cogs_recorder)
 
+# Compile the request validators before the first request needs them.
+for is_mql, is_delete in ((False, False), (True, False), (False, True)):
+    RequestSchema.build(HTTPQuerySettings, is_mql=is_mql, is_delete=is_delete)
+
 
 @application.errorhandler(InvalidJsonRequestException)
 def handle_invalid_json(exception: InvalidJsonRequestException) -> Response:
@@ -252,6 +263,12 @@ def parse_request_body(http_request: Request) -> Dict[str, Any]:
             raise JsonDecodeException(str(error)) from error
 
 
+def _request_cancellation() -> Cancellation:
+    # uWSGI does not tell when the client disconnects, only the deadline
+    # sent by the caller can cancel the request.
+    return Cancellation(parse_deadline(http_request.headers.get(DEADLINE_HEADER)))
+
+
 def _trace_transaction(dataset_name: str) -> None:
     span = sentry_sdk.get_current_span()
     if span:
@@ -283,7 +300,8 @@ def unqualified_query_view(*, timer: Timer) -> Union[Response, str, WerkzeugResp
 
 @application.route("/rpc/<name>/<version>", methods=["POST"])
 def rpc(*, name: str, version: str) -> Response:
-    result_proto = run_rpc_handler(name, version, http_request.data)
+    with cancellable(_request_cancellation()):
+        result_proto = run_rpc_handler(name, version, http_request.data)
     if isinstance(result_proto, ErrorProto):
         return Response(result_proto.SerializeToString(), status=result_proto.code)
     else:
@@ -449,9 +467,10 @@ def dataset_query(
     check_shutdown({"dataset": dataset_name})
 
     try:
-        request, result = parse_and_run_query(
-            body, timer, is_mql, dataset_name, referrer
-        )
+        with cancellable(_request_cancellation()):
+            request, result = parse_and_run_query(
+                body, timer, is_mql, dataset_name, referrer
+            )
         assert result.extra["stats"]
     except InvalidQueryException as exception:
         details: Mapping[str, Any]
@@ -485,6 +504,9 @@ def dataset_query(
         elif isinstance(cause, QueryTooLongException):
             status = 400
             details = {"type": "query-too-long", "message": str(cause)}
+        elif isinstance(cause, RequestCancelled):
+            status = 504
+            details = {"type": "cancelled", "message": str(cause)}
         elif isinstance(cause, Exception):
             details = {
                 "type": "unknown",
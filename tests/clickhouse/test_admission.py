@@ -0,0 +1,131 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event
+from typing import List, Optional
+
+import pytest
+
+from snuba import state
+from snuba.attribution import AppID
+from snuba.attribution.attribution_info import AttributionInfo
+from snuba.clickhouse.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    Priority,
+    get_priority,
+)
+from snuba.clickhouse.errors import ClickhouseError
+from snuba.utils.cancellation import Cancellation
+
+
+def _attribution_info(referrer: str, parent_api: Optional[str]) -> AttributionInfo:
+    return AttributionInfo(
+        app_id=AppID(key="key"),
+        tenant_ids={"referrer": referrer, "organization_id": 1234},
+        referrer=referrer,
+        team=None,
+        feature=None,
+        parent_api=parent_api,
+    )
+
+
+@pytest.mark.redis_db
+def test_get_priority() -> None:
+    assert (
+        get_priority(_attribution_info("api.discover", "/api/0/organizations/"))
+        == Priority.INTERACTIVE
+    )
+    assert get_priority(_attribution_info("something", None)) == Priority.DEFAULT
+    assert (
+        get_priority(_attribution_info("tasks.weekly_report", "<unknown>"))
+        == Priority.BATCH
+    )
+    state.set_config("admission_priority:referrer:something", 2)
+    assert get_priority(_attribution_info("something", None)) == Priority.BATCH
+
+
+def _hold(controller: AdmissionController, priority: Priority) -> Event:
+    """
+    Runs a query that holds its slot until the returned event is set.
+    """
+    admitted, release = Event(), Event()
+
+    def run() -> None:
+        with controller.admit(priority):
+            admitted.set()
+            release.wait(5)
+
+    ThreadPoolExecutor(1).submit(run)
+    assert admitted.wait(5)
+    return release
+
+
+@pytest.mark.redis_db
+def test_priority_order() -> None:
+    controller = AdmissionController("cluster", 1, 1, 1)
+    release = _hold(controller, Priority.DEFAULT)
+
+    order: List[Priority] = []
+    executor = ThreadPoolExecutor(2)
+
+    def run(priority: Priority) -> None:
+        with controller.admit(priority):
+            order.append(priority)
+
+    futures: List[Future[None]] = []
+    for priority in (Priority.BATCH, Priority.INTERACTIVE):
+        futures.append(executor.submit(run, priority))
+        time.sleep(0.05)
+    release.set()
+    for future in futures:
+        future.result()
+    assert order == [Priority.INTERACTIVE, Priority.BATCH]
+
+
+@pytest.mark.redis_db
+def test_load_shedding() -> None:
+    controller = AdmissionController("cluster", 1, 1, 1)
+    release = _hold(controller, Priority.DEFAULT)
+
+    state.set_config("admission_max_queue_wait_ms", 10)
+    with pytest.raises(AdmissionRejected, match="queue_timeout"):
+        with controller.admit(Priority.DEFAULT):
+            pass
+
+    state.set_config("admission_max_queue_size:batch", 0)
+    with pytest.raises(AdmissionRejected, match="queue_full"):
+        with controller.admit(Priority.BATCH):
+            pass
+    release.set()
+
+
+@pytest.mark.redis_db
+def test_deadline_shedding() -> None:
+    controller = AdmissionController("cluster", 1, 1, 1)
+    with controller.admit(Priority.DEFAULT):
+        time.sleep(0.1)
+    release = _hold(controller, Priority.DEFAULT)
+
+    # The queries take about 100ms, this one cannot complete in time.
+    with pytest.raises(AdmissionRejected, match="deadline"):
+        with controller.admit(
+            Priority.DEFAULT, Cancellation(deadline=time.time() + 0.01)
+        ):
+            pass
+    release.set()
+
+
+@pytest.mark.redis_db
+def test_limit_adapts() -> None:
+    controller = AdmissionController("cluster", 4, 2, 8)
+    for _ in range(20):
+        with controller.admit(Priority.DEFAULT):
+            pass
+    assert controller.limit > 4
+
+    limit = controller.limit
+    with pytest.raises(ClickhouseError):
+        with controller.admit(Priority.DEFAULT):
+            raise ClickhouseError("too many", code=202)
+    assert controller.limit < limit
+    assert controller.in_flight == 0
@@ -0,0 +1,142 @@
+import time
+from threading import Event
+from typing import Any, Optional
+from unittest import mock
+
+import pytest
+
+from snuba import state
+from snuba.clickhouse.errors import ClickhouseError
+from snuba.clickhouse.hedging import (
+    MIN_LATENCY_SAMPLES,
+    HedgeBudget,
+    HedgedReadExecutor,
+    LatencyTracker,
+)
+from snuba.clickhouse.native import ClickhousePool, ClickhouseResult
+
+PRIMARY_HOST = "primary"
+HEDGE_HOST = "replica"
+PORT = 9000
+
+
+def test_latency_tracker() -> None:
+    tracker = LatencyTracker(window_size=100)
+    assert tracker.percentile("key", 0.5) is None
+
+    for i in range(MIN_LATENCY_SAMPLES):
+        tracker.record("key", float(i))
+    assert tracker.percentile("key", 0.5) == MIN_LATENCY_SAMPLES // 2
+    assert tracker.percentile("key", 1.0) == MIN_LATENCY_SAMPLES - 1
+    assert tracker.percentile("other", 0.5) is None
+
+
+def test_hedge_budget() -> None:
+    budget = HedgeBudget(burst=1.0)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+    budget.deposit(0.5)
+    assert not budget.try_spend()
+    budget.deposit(0.5)
+    assert budget.try_spend()
+
+
+def _configure() -> None:
+    state.set_config(f"hedge_hosts:{PRIMARY_HOST}:{PORT}", f"{HEDGE_HOST}:{PORT}")
+    state.set_config("hedged_reads_min_delay_ms", 10)
+    state.set_config("hedged_reads_max_delay_ms", 10)
+    state.set_config("hedged_reads_budget_ratio", 1.0)
+
+
+@pytest.mark.redis_db
+def test_hedge_wins() -> None:
+    _configure()
+    killed = Event()
+    primary = ClickhousePool(PRIMARY_HOST, PORT, "user", "password", "db")
+
+    def execute(pool: ClickhousePool, query_id: Optional[str]) -> ClickhouseResult:
+        if pool.host == PRIMARY_HOST:
+            assert query_id == "query"
+            # The primary query only returns once it is killed.
+            assert killed.wait(5)
+            raise ClickhouseError("Query was cancelled", code=394)
+        assert query_id == "query-hedge"
+        return ClickhouseResult(results=[["hedge"]])
+
+    def kill(self: ClickhousePool, query: str, **kwargs: Any) -> ClickhouseResult:
+        assert self.host == PRIMARY_HOST
+        assert query == "KILL QUERY WHERE query_id = 'query' ASYNC"
+        killed.set()
+        return ClickhouseResult()
+
+    with mock.patch.object(ClickhousePool, "execute", kill):
+        result = HedgedReadExecutor(2).execute("referrer", primary, execute, "query")
+        assert result.results == [["hedge"]]
+        assert killed.wait(5)
+
+
+@pytest.mark.redis_db
+def test_hedge_wins_over_unresponsive_primary() -> None:
+    _configure()
+    released = Event()
+    kills = []
+    primary = ClickhousePool(PRIMARY_HOST, PORT, "user", "password", "db")
+
+    def execute(pool: ClickhousePool, query_id: Optional[str]) -> ClickhouseResult:
+        if pool.host == PRIMARY_HOST:
+            # The replica does not answer, not even to the kills.
+            assert released.wait(5)
+            raise ClickhouseError("Query was cancelled", code=394)
+        return ClickhouseResult(results=[["hedge"]])
+
+    def kill(self: ClickhousePool, query: str, **kwargs: Any) -> ClickhouseResult:
+        kills.append(query)
+        if len(kills) == 2:
+            released.set()
+        return ClickhouseResult()
+
+    with mock.patch.object(ClickhousePool, "execute", kill), mock.patch(
+        "snuba.clickhouse.hedging.KILL_RETRY_INTERVAL_SEC", 0.05
+    ):
+        start = time.time()
+        result = HedgedReadExecutor(2).execute("referrer", primary, execute, "query")
+        assert time.time() - start < 1
+        assert result.results == [["hedge"]]
+        # The kill is sent again while the query is still running.
+        assert released.wait(5)
+    assert len(kills) >= 2
+    assert set(kills) == {"KILL QUERY WHERE query_id = 'query' ASYNC"}
+
+
+@pytest.mark.redis_db
+def test_primary_wins() -> None:
+    _configure()
+    state.set_config("hedged_reads_min_delay_ms", 5000)
+    state.set_config("hedged_reads_max_delay_ms", 5000)
+    primary = ClickhousePool(PRIMARY_HOST, PORT, "user", "password", "db")
+    hosts = []
+
+    def execute(pool: ClickhousePool, query_id: Optional[str]) -> ClickhouseResult:
+        hosts.append(pool.host)
+        return ClickhouseResult(results=[["primary"]])
+
+    with mock.patch.object(ClickhousePool, "execute") as kill:
+        start = time.time()
+        result = HedgedReadExecutor(2).execute("referrer", primary, execute, "query")
+        assert time.time() - start < 5
+
+    assert result.results == [["primary"]]
+    assert hosts == [PRIMARY_HOST]
+    kill.assert_not_called()
+
+
+@pytest.mark.redis_db
+def test_no_hedge_hosts() -> None:
+    primary = ClickhousePool("other", PORT, "user", "password", "db")
+
+    def execute(pool: ClickhousePool, query_id: Optional[str]) -> ClickhouseResult:
+        raise ClickhouseError("boom", code=1)
+
+    with pytest.raises(ClickhouseError):
+        HedgedReadExecutor(2).execute("referrer", primary, execute, None)
@@ -1,10 +1,22 @@
-from unittest.mock import Mock
+import gzip
+from threading import Event
+from typing import Any, List, Optional
+from unittest.mock import Mock, patch
 
 import pytest
 
-from snuba.clickhouse.http import HTTPWriteBatch, InsertStatement, ValuesRowEncoder
+from snuba import state
+from snuba.clickhouse.http import (
+    HTTPWriteBatch,
+    InsertExecutor,
+    InsertStatement,
+    ValuesRowEncoder,
+    _chunk_by_size,
+    get_insert_compression,
+)
 from snuba.query.expressions import FunctionCall, Literal
 from snuba.utils.metrics.backends.dummy import DummyMetricsBackend
+from tests.backends.metrics import TestingMetricsBackend, Timing
 
 
 @pytest.fixture
@@ -58,3 +70,125 @@ def test_http_write_batch_raises_exception_on_timeout() -> None:
 
     with pytest.raises(TimeoutError):
         batch.join(timeout=0.1)
+
+
+def test_http_write_batch_compresses_chunks() -> None:
+    executor = Mock()
+    metrics = TestingMetricsBackend()
+    batch = HTTPWriteBatch(
+        executor=executor,
+        pool=Mock(),
+        metrics=metrics,
+        user="user",
+        password="",
+        statement=InsertStatement(table_name="table"),
+        encoding=None,
+        options={},
+        chunk_size=100,
+        chunk_bytes=10,
+        compression="gzip",
+    )
+    rows = [b'{"a": 1}\n', b'{"a": 2}\n', b'{"a": 3}\n']
+    for row in rows:
+        batch.append(row)
+    batch.close()
+
+    request = executor.submit.call_args.kwargs
+    assert request["headers"]["Content-Encoding"] == "gzip"
+    body = list(request["body"])
+    assert gzip.decompress(b"".join(body)) == b"".join(rows)
+
+    batch._result = Mock()
+    batch._result.result = Mock(return_value=Mock(status=200))
+    batch.join()
+    assert (
+        Timing(
+            "http_batch.wire_size",
+            sum(len(chunk) for chunk in body),
+            {"table": "table", "compression": "gzip"},
+        )
+        in metrics.calls
+    )
+
+
+def _write_compressed(compression: str, rows: List[bytes]) -> bytes:
+    executor = Mock()
+    batch = HTTPWriteBatch(
+        executor=executor,
+        pool=Mock(),
+        metrics=DummyMetricsBackend(),
+        user="user",
+        password="",
+        statement=InsertStatement(table_name="table"),
+        encoding=None,
+        options={},
+        chunk_size=1,
+        compression=compression,
+    )
+    for row in rows:
+        batch.append(row)
+    batch.close()
+
+    request = executor.submit.call_args.kwargs
+    assert request["headers"]["Content-Encoding"] == compression
+    return b"".join(request["body"])
+
+
+def test_http_write_batch_compresses_lz4() -> None:
+    lz4_frame: Any = pytest.importorskip("lz4.frame")
+    rows = [b'{"a": 1}\n', b'{"a": 2}\n']
+    assert lz4_frame.decompress(_write_compressed("lz4", rows)) == b"".join(rows)
+    assert lz4_frame.decompress(_write_compressed("lz4", [])) == b""
+
+
+def test_http_write_batch_rejects_unsupported_compression() -> None:
+    with pytest.raises(ValueError):
+        _write_compressed("brotli", [b'{"a": 1}\n'])
+
+
+@pytest.mark.redis_db
+@pytest.mark.parametrize(
+    "config, expected",
+    [
+        pytest.param(None, None, id="disabled"),
+        pytest.param("gzip", "gzip", id="supported"),
+        pytest.param("brotli", None, id="unsupported"),
+    ],
+)
+def test_get_insert_compression(config: Optional[str], expected: Optional[str]) -> None:
+    state.set_config("http_insert_compression", config)
+    with patch("snuba.clickhouse.http._rejected_compressions", set()), patch(
+        "snuba.clickhouse.http.logger"
+    ) as logger:
+        assert get_insert_compression() == expected
+        assert get_insert_compression() == expected
+    assert logger.error.call_count == (1 if config == "brotli" else 0)
+
+
+def test_chunk_by_size() -> None:
+    values = [b"a" * 4, b"b" * 4, b"c" * 12, b"d", b"e", b"f"]
+    assert list(_chunk_by_size(values, chunk_bytes=8, max_values=2)) == [
+        b"aaaabbbb",
+        b"c" * 12,
+        b"de",
+        b"f",
+    ]
+
+
+@pytest.mark.redis_db
+def test_insert_executor_rejects_inserts_without_a_worker() -> None:
+    state.set_config("http_batch_join_timeout", 0.1)
+    executor = InsertExecutor(max_workers=1)
+    release = Event()
+    try:
+        running = executor.submit(release.wait)
+        # The insert would be queued behind the running one.
+        with pytest.raises(TimeoutError):
+            executor.submit(lambda: None)
+
+        release.set()
+        running.result()
+        assert executor.submit(lambda: 1).result() == 1
+    finally:
+        release.set()
+        executor.shutdown()
@@ -1,4 +1,5 @@
 import queue
+import time
 from datetime import datetime, timedelta
 from typing import Any, Callable
 from unittest import mock
@@ -9,7 +10,19 @@ from dateutil.tz import tz
 
 from snuba import state
 from snuba.clickhouse.errors import ClickhouseError
-from snuba.clickhouse.native import ClickhousePool, transform_datetime
+from snuba.clickhouse.formatter.nodes import FormattedQuery, StringNode
+from snuba.clickhouse.native import (
+    ClickhousePool,
+    ClickhouseResult,
+    NativeDriverReader,
+    transform_datetime,
+)
+from snuba.utils.cancellation import (
+    CLIENT_DISCONNECTED,
+    Cancellation,
+    RequestCancelled,
+    cancellable,
+)
 
 
 def test_transform_datetime() -> None:
@@ -164,3 +177,31 @@ def test_execute_retries(retryable: bool, expected: int) -> None:
     assert (
         socket_timeout_connection.execute.call_count == expected
     ), f"Expected {expected} (failed) attempts with main connection pool"
+
+
+def test_reader_cancellation() -> None:
+    pool = mock.Mock(spec=ClickhousePool)
+    pool.host, pool.port, pool.pool = "host", 9000, queue.LifoQueue(1)
+    reader = NativeDriverReader(None, pool, None)
+    query = FormattedQuery([StringNode("SELECT 1")])
+    cancellation = Cancellation(deadline=time.time() + 5.5)
+
+    def execute(sql: str, **kwargs: Any) -> ClickhouseResult:
+        if sql.startswith("KILL"):
+            return ClickhouseResult()
+        assert kwargs["query_id"] == "abc"
+        # Capped to the time left before the deadline.
+        assert kwargs["settings"]["max_execution_time"] == 6
+        cancellation.cancel(CLIENT_DISCONNECTED)
+        raise ClickhouseError("query was cancelled", code=394)
+
+    pool.execute.side_effect = execute
+    with cancellable(cancellation), pytest.raises(RequestCancelled):
+        reader.execute(query, {"query_id": "abc", "max_execution_time": "30"})
+    assert pool.execute.call_args.args[0] == "KILL QUERY WHERE query_id = 'abc' ASYNC"
+
+    # Once cancelled, no other query is sent.
+    pool.execute.reset_mock()
+    with cancellable(cancellation), pytest.raises(RequestCancelled):
+        reader.execute(query, {"query_id": "def"})
+    pool.execute.assert_not_called()
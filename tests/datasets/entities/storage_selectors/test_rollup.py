@@ -0,0 +1,192 @@
+from datetime import datetime
+from typing import Optional, Sequence
+
+import pytest
+
+from snuba.clickhouse.columns import ColumnSet, DateTime, String, UInt
+from snuba.clickhouse.translators.snuba.function_call_mappers import (
+    AggregateFunctionMapper,
+)
+from snuba.clickhouse.translators.snuba.mapping import TranslationMappers
+from snuba.clusters.storage_sets import StorageSetKey
+from snuba.datasets.entities.entity_key import EntityKey
+from snuba.datasets.entities.storage_selectors.rollup import (
+    ROLLUP_COVERAGE,
+    RollupQueryStorageSelector,
+)
+from snuba.datasets.readiness_state import ReadinessState
+from snuba.datasets.rollup_settings import RollupSettings
+from snuba.datasets.schemas.tables import TableSchema
+from snuba.datasets.storage import EntityStorageConnection, ReadableTableStorage
+from snuba.datasets.storages.storage_key import register_storage_key
+from snuba.query import SelectedExpression
+from snuba.query.data_source.simple import Entity as QueryEntity
+from snuba.query.dsl import and_cond, column, count, equals, literal
+from snuba.query.expressions import Expression, FunctionCall
+from snuba.query.logical import Query
+from snuba.query.query_settings import HTTPQuerySettings
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 1, 2)
+
+
+def _connection(
+    name: str, columns: ColumnSet, rollup: Optional[RollupSettings] = None
+) -> EntityStorageConnection:
+    return EntityStorageConnection(
+        ReadableTableStorage(
+            register_storage_key(name),
+            StorageSetKey.TRANSACTIONS,
+            TableSchema(
+                columns,
+                local_table_name=f"{name}_local",
+                dist_table_name=f"{name}_dist",
+                storage_set_key=StorageSetKey.TRANSACTIONS,
+            ),
+            ReadinessState.COMPLETE,
+            rollup=rollup,
+        ),
+        TranslationMappers(
+            functions=[
+                AggregateFunctionMapper("duration", "sum", "sum", "duration_sum"),
+                AggregateFunctionMapper("duration", "max", "max", "duration_max"),
+            ]
+            if rollup
+            else []
+        ),
+    )
+
+
+RAW = _connection(
+    "transactions_raw",
+    ColumnSet(
+        [
+            ("project_id", UInt(64)),
+            ("environment", String()),
+            ("timestamp", DateTime()),
+            ("duration", UInt(32)),
+        ]
+    ),
+)
+
+
+def _rollup(name: str, granularity: int) -> EntityStorageConnection:
+    return _connection(
+        name,
+        ColumnSet(
+            [
+                ("project_id", UInt(64)),
+                ("timestamp", DateTime()),
+                ("duration_sum", UInt(64)),
+                ("duration_max", UInt(32)),
+            ]
+        ),
+        RollupSettings("timestamp", granularity, ["sum", "max"]),
+    )
+
+
+HOURLY = _rollup("transactions_rollup_1h", 3600)
+DAILY = _rollup("transactions_rollup_1d", 86400)
+
+
+def _condition(start: datetime, condition: Optional[Expression]) -> Expression:
+    return and_cond(
+        equals(column("project_id"), literal(1)),
+        FunctionCall(None, "greaterOrEquals", (column("timestamp"), literal(start))),
+        FunctionCall(None, "less", (column("timestamp"), literal(END))),
+        *([condition] if condition is not None else []),
+    )
+
+
+def _query(
+    aggregate: Expression,
+    bucket: str = "toStartOfHour",
+    start: datetime = START,
+    condition: Optional[Expression] = None,
+) -> Query:
+    time = FunctionCall("_snuba_time", bucket, (column("timestamp"),))
+    return Query(
+        QueryEntity(EntityKey("transactions"), ColumnSet([])),
+        selected_columns=[
+            SelectedExpression("time", time),
+            SelectedExpression("value", aggregate),
+        ],
+        condition=_condition(start, condition),
+        groupby=[time],
+    )
+
+
+SUM = FunctionCall("_snuba_value", "sum", (column("duration"),))
+
+
+@pytest.mark.parametrize(
+    "query, expected, decisions",
+    [
+        pytest.param(
+            _query(SUM),
+            HOURLY,
+            "transactions_rollup_1d:granularity,transactions_rollup_1h:covered",
+            id="hourly buckets",
+        ),
+        pytest.param(
+            _query(SUM, bucket="toDate"),
+            DAILY,
+            "transactions_rollup_1d:covered",
+            id="coarsest rollup first",
+        ),
+        pytest.param(
+            _query(SUM, bucket="toStartOfMinute"),
+            RAW,
+            "transactions_rollup_1d:granularity,transactions_rollup_1h:granularity",
+            id="finer buckets",
+        ),
+        pytest.param(
+            _query(SUM, start=datetime(2024, 1, 1, 0, 30)),
+            RAW,
+            "transactions_rollup_1d:granularity,transactions_rollup_1h:granularity",
+            id="unaligned time range",
+        ),
+        pytest.param(
+            _query(count(alias="_snuba_value"), bucket="toDate"),
+            RAW,
+            "transactions_rollup_1d:aggregate=count,"
+            "transactions_rollup_1h:aggregate=count",
+            id="aggregate not declared",
+        ),
+        pytest.param(
+            _query(
+                SUM,
+                bucket="toDate",
+                condition=equals(column("environment"), literal("prod")),
+            ),
+            RAW,
+            "transactions_rollup_1d:column=environment,"
+            "transactions_rollup_1h:column=environment",
+            id="column not in rollup",
+        ),
+        pytest.param(
+            Query(
+                QueryEntity(EntityKey("transactions"), ColumnSet([])),
+                selected_columns=[
+                    SelectedExpression(
+                        "project_id", column("project_id", alias="_snuba_project_id")
+                    ),
+                ],
+                condition=_condition(START, None),
+            ),
+            RAW,
+            "transactions_rollup_1d:not_aggregated,"
+            "transactions_rollup_1h:not_aggregated",
+            id="not aggregated",
+        ),
+    ],
+)
+def test_rollup_selection(
+    query: Query, expected: EntityStorageConnection, decisions: str
+) -> None:
+    connections: Sequence[EntityStorageConnection] = [RAW, HOURLY, DAILY]
+    selected = RollupQueryStorageSelector().select_storage(
+        query, HTTPQuerySettings(referrer="r"), connections
+    )
+    assert selected is expected
+    assert query.get_experiment_value(ROLLUP_COVERAGE) == decisions
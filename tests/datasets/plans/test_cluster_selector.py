@@ -11,10 +11,11 @@ from snuba.datasets.plans.cluster_selector import (
     MEGA_CLUSTER_RUNTIME_CONFIG_PREFIX,
     ColumnBasedStorageSliceSelector,
     _should_use_mega_cluster,
+    group_org_ids_by_slice,
 )
 from snuba.datasets.slicing import map_org_id_to_logical_partition
 from snuba.datasets.storages.storage_key import StorageKey
-from snuba.query.conditions import binary_condition
+from snuba.query.conditions import binary_condition, in_condition
 from snuba.query.data_source.simple import Entity as QueryEntity
 from snuba.query.expressions import Column, Literal
 from snuba.query.logical import Query as LogicalQuery
@@ -177,3 +178,37 @@ def test_should_use_mega_cluster(
     assert _should_use_mega_cluster(storage_set, logical_partition) == expected
     if override_config:
         delete_config(f"MEGA_CLUSTER_RUNTIME_CONFIG_PREFIX_{storage_set}")
+
+
+@patch("snuba.settings.SLICED_STORAGE_SETS", {"generic_metrics_distributions": 2})
+@patch("snuba.settings.LOGICAL_PARTITION_MAPPING", MOCK_LOGICAL_PART_MAPPING)
+@patch("snuba.settings.SLICED_CLUSTERS", SLICED_CLUSTERS_CONFIG)
+@pytest.mark.redis_db
+def test_multiple_org_ids() -> None:
+    assert group_org_ids_by_slice(DISTS_STORAGE_SET_KEY, [3, 500, 1, 2]) == {
+        0: [2, 500],
+        1: [1, 3],
+    }
+
+    query = LogicalQuery(
+        QueryEntity(
+            DISTS_ENTITY_KEY,
+            get_entity(DISTS_ENTITY_KEY).get_data_model(),
+        ),
+        selected_columns=[],
+        condition=in_condition(
+            Column("_snuba_org_id", None, "org_id"),
+            [Literal(None, 1), Literal(None, 3)],
+        ),
+    )
+    selector = ColumnBasedStorageSliceSelector(
+        DISTS_STORAGE_KEY, DISTS_STORAGE_SET_KEY, "org_id"
+    )
+    cluster = selector.select_cluster(query, HTTPQuerySettings())
+    assert cluster.get_database() == SLICE_1_DATABASE_VALUE
+
+    set_config(
+        f"{MEGA_CLUSTER_RUNTIME_CONFIG_PREFIX}_generic_metrics_distributions", "[3]"
+    )
+    assert group_org_ids_by_slice(DISTS_STORAGE_SET_KEY, [1, 3]) is None
+    delete_config(f"{MEGA_CLUSTER_RUNTIME_CONFIG_PREFIX}_generic_metrics_distributions")
@@ -1,5 +1,7 @@
+import time
 from datetime import datetime, timedelta
 from typing import Sequence
+from unittest import mock
 
 import pytest
 
@@ -17,6 +19,10 @@ from snuba.query.processors.physical.replaced_groups import (
 from snuba.query.query_settings import HTTPQuerySettings, SubscriptionQuerySettings
 from snuba.redis import RedisClientKey, get_redis_client
 from snuba.replacers.projects_query_flags import ProjectsQueryFlags
+from snuba.replacers.replaced_groups_dictionary import (
+    get_groups_not_loaded,
+    sync_exclude_groups,
+)
 from snuba.replacers.replacer_processor import ReplacerState
 
 
@@ -140,7 +146,7 @@ def test_without_turbo_with_projects_needing_final(query: ClickhouseQuery) -> No
 
     query_settings = HTTPQuerySettings()
     PostReplacementConsistencyEnforcer(
-        "project_id", ReplacerState.ERRORS
+        "project_id", ReplacerState.ERRORS.value
     ).process_query(query, query_settings)
 
     assert query.get_condition() == build_in("project_id", [2])
@@ -172,14 +178,14 @@ def test_remove_final_subscriptions(query: ClickhouseQuery) -> None:
     )
 
     PostReplacementConsistencyEnforcer(
-        "project_id", ReplacerState.ERRORS
+        "project_id", ReplacerState.ERRORS.value
     ).process_query(query, SubscriptionQuerySettings())
     assert query.get_condition() == build_in("project_id", [2])
     assert query.get_from_clause().final
 
     state.set_config("skip_final_subscriptions_projects", "[2,3,4]")
     PostReplacementConsistencyEnforcer(
-        "project_id", ReplacerState.ERRORS
+        "project_id", ReplacerState.ERRORS.value
     ).process_query(query, SubscriptionQuerySettings())
     assert not query.get_from_clause().final
 
@@ -195,7 +201,7 @@ def test_not_many_groups_to_exclude(query: ClickhouseQuery) -> None:
     )
 
     PostReplacementConsistencyEnforcer(
-        "project_id", ReplacerState.ERRORS
+        "project_id", ReplacerState.ERRORS.value
     ).process_query(query, HTTPQuerySettings())
 
     assert query.get_condition() == build_and(
@@ -231,7 +237,7 @@ def test_too_many_groups_to_exclude(query: ClickhouseQuery) -> None:
     )
 
     PostReplacementConsistencyEnforcer(
-        "project_id", ReplacerState.ERRORS
+        "project_id", ReplacerState.ERRORS.value
     ).process_query(query, HTTPQuerySettings())
 
     assert query.get_condition() == build_in("project_id", [2])
@@ -244,7 +250,9 @@ def test_query_overlaps_replacements_processor(
     query_with_timestamp: ClickhouseQuery,
     query_with_future_timestamp: ClickhouseQuery,
 ) -> None:
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     # replacement time unknown, default to "overlaps" but no groups to exclude so shouldn't be final
     enforcer._set_query_final(query_with_timestamp, True)
@@ -280,7 +288,9 @@ def test_single_no_replacements(query_with_single_group_id: ClickhouseQuery) ->
     Query is looking for a group that has not been replaced, but the project itself
     has replacements.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -305,7 +315,9 @@ def test_single_too_many_exclude(query_with_single_group_id: ClickhouseQuery) ->
     Query is looking for a group that has been replaced, and there are too many
     groups to exclude.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -333,7 +345,9 @@ def test_single_not_too_many_exclude(
     Query is looking for a group that has been replaced, and there are not too many
     groups to exclude.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -361,7 +375,9 @@ def test_multiple_disjoint_replaced(
     Query is looking for multiple groups and there are replaced groups, but these
     sets of group ids are disjoint. (No queried groups have been replaced)
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -388,7 +404,9 @@ def test_multiple_fewer_exclude_than_queried(
     Query is looking for multiple groups and there are replaced groups, but there
     are fewer excluded groups than queried groups.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -416,7 +434,9 @@ def test_multiple_too_many_excludes(
     Query is looking for multiple groups and there are too many groups to exclude, but
     there are fewer groups queried for than replaced.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -445,7 +465,9 @@ def test_multiple_not_too_many_excludes(
     Query is looking for multiple groups and there are not too many groups to exclude, but
     there are fewer groups queried for than replaced.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -470,7 +492,9 @@ def test_no_groups_not_too_many_excludes(query: ClickhouseQuery) -> None:
     """
     Query has no groups, and not too many to exclude.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -495,7 +519,9 @@ def test_no_groups_too_many_excludes(query: ClickhouseQuery) -> None:
     """
     Query has no groups, and too many to exclude.
     """
-    enforcer = PostReplacementConsistencyEnforcer("project_id", ReplacerState.ERRORS)
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
 
     ProjectsQueryFlags.set_project_exclude_groups(
         2,
@@ -510,3 +536,158 @@ def test_no_groups_too_many_excludes(query: ClickhouseQuery) -> None:
     enforcer.process_query(query, HTTPQuerySettings())
     assert query.get_condition() == build_in("project_id", [2])
     assert query.get_from_clause().final
+
+
+def _replace_groups(group_ids: Sequence[int], synced: bool) -> None:
+    with mock.patch(
+        "snuba.replacers.replaced_groups_dictionary._write_groups",
+        side_effect=None if synced else Exception("unavailable"),
+    ):
+        sync_exclude_groups(2, group_ids, ReplacerState.ERRORS)
+    ProjectsQueryFlags.set_project_exclude_groups(
+        2,
+        group_ids,
+        ReplacerState.ERRORS,
+        ReplacementType.EXCLUDE_GROUPS,  # Arbitrary replacement type, no impact on tests
+    )
+
+
+def _process_exclusion(enforcer: PostReplacementConsistencyEnforcer) -> Expression:
+    query = ClickhouseQuery(
+        Table("my_table", ColumnSet([]), storage_key=StorageKey("mytable")),
+        condition=build_in("project_id", [2]),
+    )
+    enforcer.process_query(query, HTTPQuerySettings())
+    assert not query.get_from_clause().final
+    condition = query.get_condition()
+    assert isinstance(condition, FunctionCall)
+    return condition.parameters[0]
+
+
+def _assert_dictionary_exclusion(exclusion: Expression) -> None:
+    assert isinstance(exclusion, FunctionCall)
+    assert exclusion.function_name == "less"
+    lookup = exclusion.parameters[0]
+    assert isinstance(lookup, FunctionCall)
+    assert lookup.function_name == "dictGetOrDefault"
+    assert lookup.parameters[0] == Literal(None, "replaced_groups_dict")
+
+
+@pytest.mark.redis_db
+def test_dictionary_exclusion() -> None:
+    """
+    The groups are looked up in the dictionary while it holds all of them.
+    """
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
+    state.set_config("max_group_ids_exclude", 5)
+    state.set_config("replaced_groups_dictionary_enabled", 1)
+    state.set_config("replaced_groups_dictionary_min_groups", 2)
+    state.set_config("replaced_groups_dictionary_load_delay_sec", 0)
+
+    _replace_groups([100, 101], synced=True)
+    _assert_dictionary_exclusion(_process_exclusion(enforcer))
+
+    # The groups of a replacement that could not be synced are inlined.
+    _replace_groups([102], synced=False)
+    assert _process_exclusion(enforcer) == build_not_in("group_id", [100, 101, 102])
+    _replace_groups([103], synced=True)
+    assert _process_exclusion(enforcer) == build_not_in(
+        "group_id", [100, 101, 102, 103]
+    )
+
+
+@pytest.mark.redis_db
+def test_dictionary_exclusion_past_max_groups() -> None:
+    """
+    The dictionary is used rather than FINAL past the limit, while Redis
+    holds all the groups to exclude.
+    """
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
+    state.set_config("replaced_groups_dictionary_enabled", 1)
+    state.set_config("replaced_groups_dictionary_min_groups", 2)
+    state.set_config("replaced_groups_dictionary_load_delay_sec", 0)
+    state.set_config("max_group_ids_exclude", 2)
+
+    _replace_groups([100, 101, 102], synced=True)
+    _assert_dictionary_exclusion(_process_exclusion(enforcer))
+
+    # Redis dropped the oldest groups, which could predate the sync.
+    _replace_groups([103, 104, 105], synced=True)
+    query = ClickhouseQuery(
+        Table("my_table", ColumnSet([]), storage_key=StorageKey("mytable")),
+        condition=build_in("project_id", [2]),
+    )
+    enforcer.process_query(query, HTTPQuerySettings())
+    assert query.get_condition() == build_in("project_id", [2])
+    assert query.get_from_clause().final
+
+
+@pytest.mark.redis_db
+def test_dictionary_exclusion_inlines_groups_not_loaded() -> None:
+    """
+    The groups written since the dictionary may have last been reloaded are
+    inlined next to the dictionary lookup.
+    """
+    enforcer = PostReplacementConsistencyEnforcer(
+        "project_id", ReplacerState.ERRORS.value
+    )
+    state.set_config("max_group_ids_exclude", 5)
+    state.set_config("replaced_groups_dictionary_enabled", 1)
+    state.set_config("replaced_groups_dictionary_min_groups", 2)
+
+    _replace_groups([100, 101], synced=True)
+    with mock.patch("time.time", return_value=time.time() + 60):
+        _replace_groups([102], synced=True)
+        assert get_groups_not_loaded([2], ReplacerState.ERRORS) == {102}
+
+        query = ClickhouseQuery(
+            Table("my_table", ColumnSet([]), storage_key=StorageKey("mytable")),
+            condition=build_in("project_id", [2]),
+        )
+        enforcer.process_query(query, HTTPQuerySettings())
+
+    condition = query.get_condition()
+    assert isinstance(condition, FunctionCall)
+    inlined, conditions = condition.parameters
+    assert inlined == build_not_in("group_id", [102])
+    assert isinstance(conditions, FunctionCall)
+    _assert_dictionary_exclusion(conditions.parameters[0])
+
+
+@pytest.mark.redis_db
+def test_dictionary_sync_timeout() -> None:
+    """
+    A sync that takes longer than the timeout fails and the groups are
+    inlined.
+    """
+    state.set_config("replaced_groups_dictionary_enabled", 1)
+    state.set_config("replaced_groups_dictionary_sync_timeout_sec", 1)
+
+    cluster = mock.Mock()
+    cluster.is_single_node.return_value = True
+    cluster.get_database.return_value = "default"
+    connection = cluster.get_query_connection.return_value
+    connection.execute.side_effect = TimeoutError("Timeout exceeded")
+
+    with mock.patch(
+        "snuba.replacers.replaced_groups_dictionary.get_cluster",
+        return_value=cluster,
+    ):
+        sync_exclude_groups(2, [100, 101], ReplacerState.ERRORS)
+
+    [insert] = connection.execute.call_args_list
+    assert insert.kwargs["settings"]["max_execution_time"] == 1
+    assert insert.kwargs["settings"]["insert_distributed_timeout"] == 1
+    assert insert.kwargs["retryable"] is False
+
+    ProjectsQueryFlags.set_project_exclude_groups(
+        2,
+        [100, 101],
+        ReplacerState.ERRORS,
+        ReplacementType.EXCLUDE_GROUPS,  # Arbitrary replacement type, no impact on tests
+    )
+    assert get_groups_not_loaded([2], ReplacerState.ERRORS) is None
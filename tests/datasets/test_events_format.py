@@ -0,0 +1,50 @@
+from unittest import mock
+
+from snuba.datasets import events_format
+from snuba.datasets.events_format import (
+    extract_extra_contexts,
+    extract_extra_tags,
+    intern_key,
+)
+
+
+def test_intern_key() -> None:
+    key = "".join(["sentry:", "release"])
+    assert intern_key(key) == "sentry:release"
+    assert intern_key(key) is intern_key("".join(["sentry", ":release"]))
+    assert intern_key(1) == "1"
+    assert intern_key("bad\ud83d") == "bad\\ud83d"
+
+
+def test_rows_share_keys() -> None:
+    first_keys, first_values = extract_extra_tags({"browser": "Chrome", "os": "Mac"})
+    second_keys, second_values = extract_extra_tags(
+        {"browser": "Firefox", "os": "Linux", "empty": ""}
+    )
+    assert first_keys == second_keys == ["browser", "os"]
+    assert all(a is b for a, b in zip(first_keys, second_keys))
+    assert second_values == ["Firefox", "Linux"]
+
+    first_keys, _ = extract_extra_contexts({"os": {"name": "Mac", "type": "os"}})
+    second_keys, second_values = extract_extra_contexts(
+        {"os": {"name": "Linux", "build": 1, "kernel": None}}, sort=True
+    )
+    assert second_keys == ["os.build", "os.name"]
+    assert second_values == ["1", "Linux"]
+    assert first_keys[0] is second_keys[1]
+
+
+def test_interned_keys_are_bounded() -> None:
+    with mock.patch.object(events_format, "_INTERNED_KEYS_MAX_SIZE", 4), mock.patch(
+        "snuba.datasets.events_format._interned_keys", {}
+    ), mock.patch("snuba.datasets.events_format._interned_context_keys", {}):
+        extract_extra_tags({"a": "1", "b": "1"})
+        for ctx in range(10):
+            keys, _ = extract_extra_contexts({f"ctx{ctx}": {"x": "1", "y": "1"}})
+            assert keys == [f"ctx{ctx}.x", f"ctx{ctx}.y"]
+        assert len(events_format._interned_keys) == 2
+        assert len(events_format._interned_context_keys) == 2
+
+        keys, _ = extract_extra_tags({"c": "1"})
+        assert keys == ["c"]
+        assert "c" not in events_format._interned_keys
@@ -1,7 +1,11 @@
 import pytest
 
 from snuba.manual_jobs import JobSpec
-from snuba.manual_jobs.redis import _acquire_job_lock
+from snuba.manual_jobs.redis import (
+    _acquire_job_lock,
+    _refresh_job_lock,
+    _release_job_lock,
+)
 from snuba.manual_jobs.runner import JobLockedException, run_job
 
 JOB_ID = "abc1234"
@@ -13,3 +17,18 @@ def test_job_lock() -> None:
     _acquire_job_lock(JOB_ID)
     with pytest.raises(JobLockedException):
         run_job(test_job_spec)
+
+
+@pytest.mark.redis_db
+def test_job_lock_is_only_refreshed_and_released_by_its_owner() -> None:
+    assert _acquire_job_lock(JOB_ID, "owner")
+    assert _refresh_job_lock(JOB_ID, "owner")
+    assert not _refresh_job_lock(JOB_ID, "other")
+
+    # The lock of another runner is left alone.
+    _release_job_lock(JOB_ID, "other")
+    assert not _acquire_job_lock(JOB_ID, "other")
+
+    _release_job_lock(JOB_ID, "owner")
+    assert not _refresh_job_lock(JOB_ID, "owner")
+    assert _acquire_job_lock(JOB_ID, "other")
@@ -0,0 +1,273 @@
+import re
+from datetime import datetime, timedelta
+from typing import Any, List, Mapping, MutableMapping, Optional, Sequence, cast
+from unittest.mock import MagicMock
+
+import pytest
+
+from snuba.clickhouse.native import ClickhousePool, ClickhouseResult
+from snuba.manual_jobs import Job, JobLogger, JobSpec
+from snuba.manual_jobs.job_status import JobStatus
+from snuba.manual_jobs.mutations import (
+    MutationChunk,
+    MutationExecutor,
+    MutationLostException,
+    split_into_chunks,
+)
+from snuba.manual_jobs.redis import (
+    _acquire_job_lock,
+    _get_completed_chunks,
+    _release_job_lock,
+    _set_job_status,
+)
+from snuba.manual_jobs.runner import JobLockedException, JobStatusException, run_job
+from snuba.utils.serializable_exception import SerializableException
+
+
+def test_split_into_chunks() -> None:
+    chunks = split_into_chunks(
+        [5, 3, 1, 4, 2],
+        datetime(2024, 12, 1, 12),
+        datetime(2024, 12, 3, 6),
+        ids_per_chunk=2,
+    )
+    assert [(chunk.ids, chunk.start, chunk.end) for chunk in chunks] == [
+        ([1, 2], datetime(2024, 12, 1, 12), datetime(2024, 12, 2)),
+        ([3, 4], datetime(2024, 12, 1, 12), datetime(2024, 12, 2)),
+        ([5], datetime(2024, 12, 1, 12), datetime(2024, 12, 2)),
+        ([1, 2], datetime(2024, 12, 2), datetime(2024, 12, 3)),
+        ([3, 4], datetime(2024, 12, 2), datetime(2024, 12, 3)),
+        ([5], datetime(2024, 12, 2), datetime(2024, 12, 3)),
+        ([1, 2], datetime(2024, 12, 3), datetime(2024, 12, 3, 6)),
+        ([3, 4], datetime(2024, 12, 3), datetime(2024, 12, 3, 6)),
+        ([5], datetime(2024, 12, 3), datetime(2024, 12, 3, 6)),
+    ]
+    assert len({chunk.key for chunk in chunks}) == len(chunks)
+
+
+def test_split_into_chunks_all_ids() -> None:
+    chunks = split_into_chunks(
+        [1, 2, 3],
+        datetime(2024, 12, 1, 1),
+        datetime(2024, 12, 1, 5),
+        ids_per_chunk=None,
+        window=timedelta(hours=2),
+    )
+    assert [(chunk.ids, chunk.start, chunk.end) for chunk in chunks] == [
+        ([1, 2, 3], datetime(2024, 12, 1, 1), datetime(2024, 12, 1, 2)),
+        ([1, 2, 3], datetime(2024, 12, 1, 2), datetime(2024, 12, 1, 4)),
+        ([1, 2, 3], datetime(2024, 12, 1, 4), datetime(2024, 12, 1, 5)),
+    ]
+
+
+class FakeConnection:
+    """
+    Mutations are done once they were waited for ``polls_until_done``
+    times. The table starts with a mutation of another job that is never
+    done.
+    """
+
+    def __init__(self, polls_until_done: int = 1) -> None:
+        self.polls_until_done = polls_until_done
+        self.mutations: List[str] = []
+        self.remaining_polls: MutableMapping[str, int] = {
+            "ALTER TABLE spans_local DELETE WHERE project_id = 0": 1000
+        }
+        self.sleeps: List[float] = []
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        for command, polls in self.remaining_polls.items():
+            self.remaining_polls[command] = max(polls - 1, 0)
+
+    def execute(
+        self, query: str, settings: Optional[Mapping[str, Any]] = None
+    ) -> ClickhouseResult:
+        if "FROM system.mutations" in query:
+            [marker] = re.findall(r"position\(command, '([^']*)'\)", query)
+            matching = [
+                polls
+                for command, polls in self.remaining_polls.items()
+                if marker in command
+            ]
+            pending = len([polls for polls in matching if polls > 0])
+            return ClickhouseResult([[pending, len(matching) - pending, ""]])
+        if query.startswith("SELECT count() FROM system.merges"):
+            return ClickhouseResult([[0]])
+        if query.startswith("SELECT count() FROM"):
+            return ClickhouseResult([[10]])
+        self.mutations.append(query)
+        self.remaining_polls[query] = self.polls_until_done
+        return ClickhouseResult([])
+
+
+def _conditions(chunk: MutationChunk) -> str:
+    return f"project_id IN {list(chunk.ids)}"
+
+
+def _mutation(conditions: str) -> str:
+    return f"ALTER TABLE spans_local DELETE WHERE {conditions}"
+
+
+def _executor(
+    connection: FakeConnection, max_pending_mutations: int = 1
+) -> MutationExecutor:
+    return MutationExecutor(
+        "job",
+        cast(ClickhousePool, connection),
+        "spans_local",
+        MagicMock(spec=JobLogger),
+        max_pending_mutations=max_pending_mutations,
+        sleep=connection.sleep,
+    )
+
+
+def _chunks() -> Sequence[MutationChunk]:
+    return split_into_chunks(
+        [1, 2, 3], datetime(2024, 12, 1), datetime(2024, 12, 2), ids_per_chunk=1
+    )
+
+
+@pytest.mark.redis_db
+def test_executor_throttles_and_resumes() -> None:
+    chunks = _chunks()
+    connection = FakeConnection()
+    executor = _executor(connection)
+
+    def fail_on_third_chunk(conditions: str) -> str:
+        if "[3]" in conditions:
+            raise Exception("crashed")
+        return _mutation(conditions)
+
+    with pytest.raises(Exception):
+        executor.run(chunks, fail_on_third_chunk, _conditions, count_rows=True)
+
+    # Each chunk waited for the mutation of the previous one, the mutation
+    # of the other job did not count.
+    assert connection.sleeps == [1.0, 1.0]
+    assert connection.mutations == [
+        "ALTER TABLE spans_local DELETE WHERE (project_id IN [1])\n"
+        f"AND 'snuba_manual_job:job/{chunks[0].key}' != ''",
+        "ALTER TABLE spans_local DELETE WHERE (project_id IN [2])\n"
+        f"AND 'snuba_manual_job:job/{chunks[1].key}' != ''",
+    ]
+    assert _get_completed_chunks("job") == {chunks[0].key: 10, chunks[1].key: 10}
+
+    connection.mutations = []
+    rows = executor.run(chunks, _mutation, _conditions, count_rows=True)
+    assert rows == 30
+    assert len(connection.mutations) == 1
+    assert "project_id IN [3]" in connection.mutations[0]
+    assert _get_completed_chunks("job")[chunks[2].key] == 10
+
+
+@pytest.mark.redis_db
+def test_executor_submits_up_to_max_pending_mutations() -> None:
+    chunks = _chunks()
+    connection = FakeConnection(polls_until_done=2)
+
+    assert (
+        _executor(connection, max_pending_mutations=2).run(
+            chunks, _mutation, _conditions
+        )
+        is None
+    )
+    assert len(connection.mutations) == 3
+    # The first two chunks were submitted at once, the third once the first
+    # two were done.
+    assert connection.sleeps == [1.0, 1.0, 1.0, 1.0]
+    assert _get_completed_chunks("job") == {chunk.key: None for chunk in chunks}
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.mark.redis_db
+def test_chunk_completed_once_mutation_done() -> None:
+    chunks = _chunks()[:1]
+    connection = FakeConnection(polls_until_done=3)
+
+    def interrupt(seconds: float) -> None:
+        raise Interrupted()
+
+    executor = MutationExecutor(
+        "job",
+        cast(ClickhousePool, connection),
+        "spans_local",
+        MagicMock(spec=JobLogger),
+        sleep=interrupt,
+    )
+    with pytest.raises(Interrupted):
+        executor.run(chunks, _mutation, _conditions)
+    assert len(connection.mutations) == 1
+    assert _get_completed_chunks("job") == {}
+
+    # The job is resumed while the mutation is still running, it waits for
+    # it instead of submitting it again.
+    _executor(connection).run(chunks, _mutation, _conditions)
+    assert len(connection.mutations) == 1
+    assert _get_completed_chunks("job") == {chunks[0].key: None}
+
+
+@pytest.mark.redis_db
+def test_killed_mutation_fails_the_job() -> None:
+    chunks = _chunks()[:1]
+    connection = FakeConnection(polls_until_done=3)
+
+    def kill(seconds: float) -> None:
+        connection.remaining_polls = {}
+
+    executor = MutationExecutor(
+        "job",
+        cast(ClickhousePool, connection),
+        "spans_local",
+        MagicMock(spec=JobLogger),
+        sleep=kill,
+    )
+    with pytest.raises(MutationLostException):
+        executor.run(chunks, _mutation, _conditions)
+    assert _get_completed_chunks("job") == {}
+
+
+class FlakyResumableJob(Job):
+    attempts = 0
+
+    @classmethod
+    def is_resumable(cls) -> bool:
+        return True
+
+    def execute(self, logger: JobLogger) -> None:
+        FlakyResumableJob.attempts += 1
+        if FlakyResumableJob.attempts == 1:
+            raise SerializableException("crashed")
+
+
+@pytest.mark.redis_db
+def test_failed_resumable_job_runs_again() -> None:
+    job_spec = JobSpec("flaky", "FlakyResumableJob")
+    assert run_job(job_spec) == JobStatus.FAILED
+    assert run_job(job_spec) == JobStatus.FINISHED
+
+
+@pytest.mark.redis_db
+def test_stale_running_job_is_resumed() -> None:
+    job_spec = JobSpec("stale", "FlakyResumableJob")
+    FlakyResumableJob.attempts = 1
+    _set_job_status("stale", JobStatus.RUNNING)
+
+    # Still running, its runner keeps the lock.
+    _acquire_job_lock("stale", "other-runner")
+    with pytest.raises(JobLockedException):
+        run_job(job_spec)
+
+    # The runner is gone and the lock expired.
+    _release_job_lock("stale", "other-runner")
+    assert run_job(job_spec) == JobStatus.FINISHED
+
+
+@pytest.mark.redis_db
+def test_running_job_is_not_resumed_if_not_resumable() -> None:
+    _set_job_status("toy", JobStatus.RUNNING)
+    with pytest.raises(JobStatusException):
+        run_job(JobSpec("toy", "ToyJob"))
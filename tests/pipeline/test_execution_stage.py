@@ -1,8 +1,12 @@
 import uuid
+from threading import Event
+from typing import Any
+from unittest import mock
 
 import pytest
 
 from snuba import settings as snubasettings
+from snuba import state
 from snuba.attribution import get_app_id
 from snuba.attribution.attribution_info import AttributionInfo
 from snuba.clickhouse.columns import ColumnSet
@@ -10,7 +14,10 @@ from snuba.clickhouse.query import Query
 from snuba.datasets.entities.entity_key import EntityKey
 from snuba.datasets.storages.storage_key import StorageKey
 from snuba.pipeline.query_pipeline import QueryPipelineResult
-from snuba.pipeline.stages.query_execution import ExecutionStage
+from snuba.pipeline.stages.query_execution import (
+    ExecutionStage,
+    _scatter_gather_and_run,
+)
 from snuba.query import SelectedExpression
 from snuba.query.allocation_policies import (
     MAX_THRESHOLD,
@@ -33,8 +40,11 @@ from snuba.querylog.query_metadata import (
     SnubaQueryMetadata,
 )
 from snuba.request import Request
+from snuba.utils.cancellation import get_current_cancellation
 from snuba.utils.metrics.timer import Timer
 from snuba.utils.schemas import UUID, String, UInt
+from snuba.web import QueryResult
+from snuba.web.scatter_gather import build_merge_plan
 
 
 class MockAllocationPolicy(AllocationPolicy):
@@ -220,3 +230,77 @@ def test_turbo(ch_query: Query) -> None:
         and "avg(duration)" in res.data.result["data"][0]
     )
     assert ch_query.get_from_clause().sampling_rate == snubasettings.TURBO_SAMPLE_RATE
+
+
+@pytest.mark.redis_db
+def test_scatter_gather_kills_slices_past_the_deadline() -> None:
+    state.set_config("scatter_gather_slice_timeout_sec", 1)
+    state.set_config("scatter_gather_allow_partial_results", 1)
+    query = Query(
+        Table(
+            "transactions_local", ColumnSet([]), storage_key=StorageKey("transactions")
+        ),
+        selected_columns=[
+            SelectedExpression(
+                "project_id", column("project_id", alias="_snuba_project_id")
+            )
+        ],
+        condition=equals(column("project_id"), literal(1)),
+    )
+    plan = build_merge_plan(query, "project_id")
+    assert plan is not None
+    killed = Event()
+
+    def run_slice(*args: Any, cluster_name: str) -> QueryResult:
+        cancellation = get_current_cancellation()
+        assert cancellation is not None
+        remaining = cancellation.remaining()
+        assert remaining is not None and remaining <= 1
+        if cluster_name == "slow":
+            with cancellation.running(killed.set, {}):
+                killed.wait(10)
+                raise ValueError("query was killed")
+        return QueryResult(
+            {
+                "meta": [{"name": "_snuba_project_id", "type": "UInt64"}],
+                "data": [{"_snuba_project_id": 1}],
+                "totals": {},
+                "profile": None,
+                "trace_output": "",
+            },
+            {
+                "stats": {"cluster_name": cluster_name, "final": False},
+                "sql": "",
+                "experiments": {},
+            },
+        )
+
+    fast = mock.Mock(**{"get_clickhouse_cluster_name.return_value": "fast"})
+    slow = mock.Mock(**{"get_clickhouse_cluster_name.return_value": "slow"})
+    with mock.patch(
+        "snuba.pipeline.stages.query_execution._format_storage_query_and_run",
+        side_effect=run_slice,
+    ):
+        result = _scatter_gather_and_run(
+            Timer("test"),
+            get_fake_metadata(),
+            AttributionInfo(get_app_id("blah"), {}, "blah", None, None, None),
+            False,
+            query,
+            HTTPQuerySettings(),
+            plan,
+            "project_id",
+            [(0, fast, [1]), (1, slow, [2])],
+        )
+
+    # The slow slice was killed at the deadline instead of left running.
+    assert killed.is_set()
+    assert result.result["data"] == [{"project_id": 1}]
+    stats = result.extra["stats"]
+    assert stats["cluster_name"] == "fast"
+    assert stats["result_rows"] == 1
+    assert stats["scatter_gather"] == {
+        "slices": [0, 1],
+        "failed_slices": [1],
+        "partial": True,
+    }
@@ -0,0 +1,73 @@
+import pytest
+
+from snuba import state
+from snuba.pipeline.profiling import (
+    ProcessorProfiler,
+    capture_cprofile,
+    get_current_profiler,
+    get_profiling_stats,
+    processor_profiling,
+    profile_processor,
+)
+
+
+class DummyProcessor:
+    pass
+
+
+def test_profiler_accumulates() -> None:
+    profiler = ProcessorProfiler()
+    profiler.record("entity", "DummyProcessor", 1.0)
+    profiler.record("entity", "DummyProcessor", 2.5)
+    profiler.record("storage", "DummyProcessor", 0.5)
+
+    assert profiler.to_stats() == {
+        "processor_timings_ms": {
+            "entity.DummyProcessor": 3.5,
+            "storage.DummyProcessor": 0.5,
+        }
+    }
+
+
+def test_not_profiled_outside_of_context() -> None:
+    assert get_current_profiler() is None
+    with profile_processor("entity", DummyProcessor()):
+        pass
+    with capture_cprofile():
+        pass
+    assert get_profiling_stats() == {}
+
+
+@pytest.mark.redis_db
+def test_sampling_disabled_by_default() -> None:
+    with processor_profiling("some_referrer") as profiler:
+        assert profiler is None
+        with profile_processor("entity", DummyProcessor()):
+            pass
+        assert get_profiling_stats() == {}
+
+
+@pytest.mark.redis_db
+def test_profiled_referrer() -> None:
+    state.set_config("processor_profiling:referrer:some_referrer", 1)
+    state.set_config("processor_cprofile_sample_rate", 1.0)
+
+    with processor_profiling("some_referrer") as profiler:
+        assert profiler is not None
+        assert get_current_profiler() is profiler
+        with capture_cprofile():
+            with profile_processor("entity", DummyProcessor()):
+                sum(range(1000))
+            with profile_processor("storage", DummyProcessor()):
+                pass
+        stats = get_profiling_stats()
+
+    assert get_current_profiler() is None
+    assert set(stats["processor_timings_ms"]) == {
+        "entity.DummyProcessor",
+        "storage.DummyProcessor",
+    }
+    assert "cumulative" in stats["processor_cprofile"]
+
+    with processor_profiling("other_referrer") as profiler:
+        assert profiler is None
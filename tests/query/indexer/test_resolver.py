@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from copy import deepcopy
+
 import pytest
 
 from snuba.datasets.entities.entity_key import EntityKey
@@ -11,8 +13,14 @@ from snuba.query.conditions import binary_condition
 from snuba.query.data_source.simple import Entity as QueryEntity
 from snuba.query.dsl import divide
 from snuba.query.expressions import Column, CurriedFunctionCall, FunctionCall, Literal
-from snuba.query.indexer.resolver import resolve_mappings
+from snuba.query.indexer.resolver import (
+    resolve_mappings,
+    resolve_metric_id_mapping,
+    resolve_tag_key_mappings,
+    resolve_tag_value_mappings,
+)
 from snuba.query.logical import Query as LogicalQuery
+from snuba.query.mql.parser import parse_mql_query_body, populate_query_from_mql_context
 
 """
 NOTES ABOUT THESE TESTS
@@ -863,3 +871,46 @@ def test_resolve_tag_key_mappings_processor(
 
     resolve_mappings(query, mappings, dataset)
     assert query == expected_query
+
+
+@pytest.mark.parametrize("dataset_name", ["generic_metrics", "metrics"])
+def test_single_traversal_matches_separate_passes(dataset_name: str) -> None:
+    dataset = get_dataset(dataset_name)
+    mri = (
+        "d:transactions/duration@millisecond"
+        if dataset_name == "generic_metrics"
+        else "c:sessions/session@none"
+    )
+    mappings: dict[str, str | int] = {
+        "duration": mri,
+        mri: 123456,
+        "transaction": 111111,
+        "status_code": 222222,
+        "t1": 333333,
+    }
+    mql_context = {
+        "start": "2024-01-01T00:00:00",
+        "end": "2024-01-02T00:00:00",
+        "rollup": {"granularity": 60, "interval": 60, "with_totals": "False"},
+        "scope": {"org_ids": [1], "project_ids": [1], "use_case_id": "transactions"},
+        "indexer_mappings": mappings,
+        "limit": None,
+        "offset": None,
+    }
+    body = (
+        f'sum(`{mri}`){{transaction:"t1"}} by (transaction, status_code) / '
+        f"(max(`{mri}`) by (transaction, status_code) + "
+        f'min(`{mri}`){{status_code:["200", "t1"]}} by (transaction, status_code))'
+    )
+    query, _ = populate_query_from_mql_context(
+        parse_mql_query_body(body, dataset), mql_context
+    )
+    assert isinstance(query, CompositeQuery)
+    separate = deepcopy(query)
+
+    resolve_mappings(query, mappings, dataset)
+    resolve_tag_key_mappings(separate, mappings, dataset)
+    resolve_metric_id_mapping(separate, mappings)
+    if dataset_name == "metrics":
+        resolve_tag_value_mappings(separate, mappings)
+    assert query == separate
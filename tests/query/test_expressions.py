@@ -1,3 +1,4 @@
+import pickle
 import uuid
 from dataclasses import replace
 from datetime import datetime
@@ -14,6 +15,7 @@ from snuba.query.expressions import (
     Lambda,
     Literal,
     SubscriptableReference,
+    fuse_transforms,
 )
 
 
@@ -200,6 +202,59 @@ def test_hash() -> None:
 
     assert len(s) == 6
 
+    # The hash of intermediate nodes is cached but it must not survive pickling
+    # since string hashes are different in other processes.
+    assert hash(function_2) == hash(CurriedFunctionCall(None, function_1, (column1,)))
+    unpickled = pickle.loads(pickle.dumps(function_2))
+    assert unpickled == function_2
+    assert "_cached_hash" not in unpickled.__dict__
+
+
+def test_transform_preserves_unchanged_subtrees() -> None:
+    column1 = Column(None, "t1", "c1")
+    column2 = Column(None, "t1", "c2")
+    tags = SubscriptableReference(None, Column(None, None, "tags"), Literal(None, "a"))
+    function_1 = FunctionCall(None, "f1", (column1, tags))
+    function_2 = FunctionCall(None, "f2", (column2, Literal(None, 1)))
+    lm = Lambda(None, ("x",), FunctionCall(None, "f3", (Argument(None, "x"),)))
+    root = CurriedFunctionCall(None, function_1, (function_2, lm))
+    assert root.subtree_size == 12
+
+    assert root.transform(lambda e: e) is root
+
+    def replace_c2(e: Expression) -> Expression:
+        if isinstance(e, Column) and e.column_name == "c2":
+            return Column(None, "t1", "c3")
+        return e
+
+    transformed = root.transform(replace_c2)
+    assert isinstance(transformed, CurriedFunctionCall)
+    assert transformed == CurriedFunctionCall(
+        None,
+        function_1,
+        (FunctionCall(None, "f2", (Column(None, "t1", "c3"), Literal(None, 1))), lm),
+    )
+    # Only the path to the replaced column is copied.
+    assert transformed.internal_function is function_1
+    assert transformed.parameters[1] is lm
+
+
+def test_fuse_transforms() -> None:
+    def rename(e: Expression) -> Expression:
+        if isinstance(e, Column) and e.column_name == "c1":
+            return Column(None, None, "c2")
+        return e
+
+    def wrap(e: Expression) -> Expression:
+        if isinstance(e, Column):
+            return FunctionCall(None, "assumeNotNull", (e,))
+        return e
+
+    exp = FunctionCall(None, "f", (Column(None, None, "c1"), Column(None, None, "c3")))
+    assert exp.transform(fuse_transforms(rename, wrap)) == exp.transform(
+        rename
+    ).transform(wrap)
+
 
 TEST_CASES = [
     (Column(None, "t1", "c1"), "t1.c1"),
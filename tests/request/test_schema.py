@@ -1,5 +1,18 @@
+import copy
+from typing import Any, MutableMapping
+
+import jsonschema
+import pytest
+
 from snuba.query.query_settings import HTTPQuerySettings
-from snuba.request.schema import RequestSchema
+from snuba.query.schema import SNQL_QUERY_SCHEMA
+from snuba.request.exceptions import JsonSchemaValidationException
+from snuba.request.schema import (
+    ATTRIBUTION_INFO_SCHEMA,
+    SETTINGS_SCHEMAS,
+    RequestSchema,
+)
+from snuba.schemas import validate_jsonschema
 
 
 def test_split_request() -> None:
@@ -34,3 +47,58 @@ def test_split_request() -> None:
         "referrer",
     }
     assert set(parts.query.keys()) == {"query"}
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        pytest.param({"query": "MATCH (e)"}, id="defaults"),
+        pytest.param(
+            {"query": "MATCH (e)", "turbo": True, "tenant_ids": {"org": 1}},
+            id="overridden defaults",
+        ),
+        pytest.param({"query": "MATCH (e)", "turbo": "yes"}, id="wrong type"),
+        pytest.param({"query": "MATCH (e)", "unknown": 1}, id="unknown property"),
+        pytest.param({"query": 1, "legacy": 0}, id="several errors"),
+    ],
+)
+def test_same_result_as_jsonschema(payload: MutableMapping[str, Any]) -> None:
+    schema = RequestSchema.build(HTTPQuerySettings)
+    properties: MutableMapping[str, Any] = {}
+    part: Any
+    for part in (
+        SNQL_QUERY_SCHEMA,
+        SETTINGS_SCHEMAS[HTTPQuerySettings],
+        ATTRIBUTION_INFO_SCHEMA,
+    ):
+        properties.update(part["properties"])
+    composite_schema = {
+        "type": "object",
+        "properties": properties,
+        "required": set(),
+        "definitions": {},
+        "additionalProperties": False,
+    }
+    original = copy.deepcopy(payload)
+
+    try:
+        expected = validate_jsonschema(payload, composite_schema)
+    except jsonschema.ValidationError as error:
+        with pytest.raises(JsonSchemaValidationException) as excinfo:
+            schema.validate(payload)
+        assert excinfo.value.message == str(error)
+    else:
+        parts = schema.validate(payload)
+        assert {**parts.query, **parts.query_settings, **parts.attribution_info} == (
+            expected
+        )
+    assert payload == original
+
+
+def test_build_reuses_schemas() -> None:
+    assert RequestSchema.build(HTTPQuerySettings) is RequestSchema.build(
+        HTTPQuerySettings
+    )
+    assert RequestSchema.build(HTTPQuerySettings, is_mql=True) is not (
+        RequestSchema.build(HTTPQuerySettings)
+    )
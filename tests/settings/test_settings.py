@@ -127,3 +127,29 @@ def test_validation_catches_unmapped_topic_pair() -> None:
         validate_slicing_settings(all_settings)
 
     del sliced_topics[("events", 1)]
+
+
+@pytest.mark.parametrize(
+    "compression, valid",
+    [
+        pytest.param(None, True, id="disabled"),
+        pytest.param("gzip", True, id="gzip"),
+        pytest.param("brotli", False, id="unsupported"),
+    ],
+)
+def test_validate_insert_compression(compression: Any, valid: bool) -> None:
+    all_settings = build_settings_dict()
+    all_settings["CLICKHOUSE_HTTP_INSERT_COMPRESSION"] = compression
+    if valid:
+        validate_settings(all_settings)
+    else:
+        with pytest.raises(ValueError):
+            validate_settings(all_settings)
+
+
+def test_validate_insert_compression_needs_package() -> None:
+    all_settings = build_settings_dict()
+    all_settings["CLICKHOUSE_HTTP_INSERT_COMPRESSION"] = "zstd"
+    with patch.object(validation, "find_spec", return_value=None):
+        with pytest.raises(ValueError, match="zstandard"):
+            validate_settings(all_settings)
@@ -1,4 +1,6 @@
 from pathlib import Path
+from typing import List
+from unittest import mock
 
 import pytest
 
@@ -6,6 +8,7 @@ from snuba.snapshots import (  # NOQA
     ColumnConfig,
     DateFormatPrecision,
     DateTimeFormatterConfig,
+    SnapshotTableRow,
 )
 from snuba.snapshots.postgres_snapshot import PostgresSnapshot
 
@@ -120,3 +123,61 @@ class TestPostgresSnapshot:
             snapshot = PostgresSnapshot.load("snuba", snapshot_base)
             with snapshot.get_parsed_table_file("sentry_groupedmessage") as table:
                 next(table)
+
+    def test_parse_chunks(self, tmp_path: Path) -> None:
+        rows = [{"id": str(i), "status": str(i % 3)} for i in range(100)]
+        snapshot_base = self.__prepare_directory(
+            tmp_path,
+            "id,status\n" + "".join(f"{r['id']},{r['status']}\n" for r in rows),
+        )
+        snapshot = PostgresSnapshot.load("snuba", snapshot_base)
+
+        chunks = snapshot.get_table_chunks("sentry_groupedmessage", 64)
+        assert len(chunks) > 1
+        assert chunks[0][0] == len("id,status\n")
+        assert all(prev[1] == nxt[0] for prev, nxt in zip(chunks, chunks[1:]))
+
+        parsed: List[SnapshotTableRow] = []
+        for chunk in chunks:
+            with snapshot.get_parsed_table_chunk("sentry_groupedmessage", chunk) as t:
+                parsed.extend(t)
+        assert parsed == rows
+
+    @pytest.mark.parametrize("block_size", [7, 1 << 20])
+    def test_chunks_do_not_split_quoted_values(
+        self, tmp_path: Path, block_size: int
+    ) -> None:
+        rows = [
+            {"id": str(i), "status": "a\n" * (i % 4) + '""x"",\n\n' * (i % 3)}
+            for i in range(50)
+        ]
+        content = "id,status\n" + "".join(f'{r["id"]},"{r["status"]}"\n' for r in rows)
+        snapshot_base = self.__prepare_directory(tmp_path, content)
+        snapshot = PostgresSnapshot.load("snuba", snapshot_base)
+
+        with mock.patch(
+            "snuba.snapshots.postgres_snapshot._SCAN_BLOCK_SIZE", block_size
+        ):
+            chunks = snapshot.get_table_chunks("sentry_groupedmessage", 16)
+        assert len(chunks) > 1
+        assert chunks[-1][1] == len(content)
+
+        parsed: List[SnapshotTableRow] = []
+        for chunk in chunks:
+            with snapshot.get_parsed_table_chunk("sentry_groupedmessage", chunk) as t:
+                parsed.extend(t)
+        with snapshot.get_parsed_table_file("sentry_groupedmessage") as table:
+            assert parsed == list(table)
+        assert len(parsed) == len(rows)
+
+    def test_parse_misaligned_chunk(self, tmp_path: Path) -> None:
+        snapshot_base = self.__prepare_directory(
+            tmp_path,
+            'id,status\n0,"multi\nline"\n',
+        )
+        snapshot = PostgresSnapshot.load("snuba", snapshot_base)
+        with pytest.raises(ValueError, match="has 1 values, expected 2"):
+            with snapshot.get_parsed_table_chunk(
+                "sentry_groupedmessage", (len('id,status\n0,"multi\n'), 26)
+            ) as table:
+                list(table)
@@ -3,7 +3,7 @@ from __future__ import annotations
 import random
 import time
 from concurrent.futures import Future
-from threading import Thread
+from threading import Event, Thread
 from typing import Any, Callable
 from unittest import mock
 
@@ -14,8 +14,15 @@ from sentry_redis_tools.failover_redis import FailoverRedis
 from redis.exceptions import ReadOnlyError
 from snuba.redis import RedisClientKey, get_redis_client
 from snuba.state import set_config
-from snuba.state.cache.abstract import Cache
-from snuba.state.cache.redis.backend import RedisCache
+from snuba.state.cache.abstract import Cache, CachePolicy
+from snuba.state.cache.redis.backend import (
+    RESULT_EXECUTE,
+    RESULT_STALE,
+    RESULT_VALUE,
+    RESULT_WAIT,
+    RedisCache,
+)
+from snuba.utils.cancellation import Cancellation, RequestCancelled, cancellable
 from snuba.utils.codecs import ExceptionAwareCodec
 from snuba.utils.serializable_exception import (
     SerializableException,
@@ -247,3 +254,162 @@ def test_transient_error(backend: Cache[bytes]) -> None:
         setter.result()
 
     assert waiter.result() == b"hello"
+
+
+@pytest.mark.redis_db
+def test_stale_while_revalidate(backend: Cache[bytes]) -> None:
+    key = "key"
+    policy = CachePolicy(ttl_sec=1, stale_ttl_sec=60)
+    function = mock.MagicMock(return_value=b"value")
+    revalidate = mock.MagicMock(return_value=b"new value")
+    hit_types: list[int] = []
+
+    assert (
+        backend.get_readthrough(
+            key, function, hit_types.append, policy=policy, revalidate=revalidate
+        )
+        == b"value"
+    )
+    assert function.call_count == 1
+
+    # The value is fresh, it is returned as is.
+    assert (
+        backend.get_readthrough(
+            key, function, hit_types.append, policy=policy, revalidate=revalidate
+        )
+        == b"value"
+    )
+    assert hit_types[-1] == RESULT_VALUE
+    assert revalidate.call_count == 0
+
+    time.sleep(1.1)
+
+    # The value is stale, it is still returned but refreshed in the background.
+    assert (
+        backend.get_readthrough(
+            key, function, hit_types.append, policy=policy, revalidate=revalidate
+        )
+        == b"value"
+    )
+    assert hit_types[-1] == RESULT_STALE
+    deadline = time.time() + 5
+    while backend.get(key) != b"new value" and time.time() < deadline:
+        time.sleep(0.05)
+    assert revalidate.call_count == 1
+    assert function.call_count == 1
+
+    assert (
+        backend.get_readthrough(
+            key, function, hit_types.append, policy=policy, revalidate=revalidate
+        )
+        == b"new value"
+    )
+    assert hit_types[-1] == RESULT_VALUE
+
+
+@pytest.mark.redis_db
+def test_single_flight_local(backend: Cache[bytes]) -> None:
+    set_config("single_flight_enabled", 1)
+    key = "key"
+    hit_types: list[int] = []
+
+    def function() -> bytes:
+        time.sleep(0.5)
+        return b"value"
+
+    single_call = SingleCallFunction(function)
+
+    def worker() -> bytes:
+        return backend.get_readthrough(key, single_call, hit_types.append)
+
+    futures = [execute(worker) for _ in range(5)]
+    assert [future.result() for future in futures] == [b"value"] * 5
+    assert hit_types.count(RESULT_EXECUTE) == 1
+    assert hit_types.count(RESULT_WAIT) == 4
+
+
+@pytest.mark.redis_db
+def test_single_flight_local_error(backend: Cache[bytes]) -> None:
+    set_config("single_flight_enabled", 1)
+    key = "key"
+    hit_types: list[int] = []
+    calls: list[int] = []
+
+    class CustomException(Exception):
+        pass
+
+    def function() -> bytes:
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            raise CustomException("error")
+        return b"value"
+
+    def worker() -> bytes:
+        return backend.get_readthrough(key, function, hit_types.append)
+
+    leader = execute(worker)
+    time.sleep(0.1)
+    followers = [execute(worker) for _ in range(2)]
+    with pytest.raises(CustomException):
+        leader.result()
+    # The followers do not get the error of the leader, they run the query.
+    assert [future.result() for future in followers] == [b"value"] * 2
+    assert len(calls) == 3
+    assert hit_types.count(RESULT_EXECUTE) == 2
+
+
+@pytest.mark.redis_db
+def test_single_flight_follower_cancelled(backend: Cache[bytes]) -> None:
+    set_config("single_flight_enabled", 1)
+    set_config("single_flight_poll_interval_ms", 10)
+    key = "key"
+    leader_started = Event()
+
+    def function() -> bytes:
+        leader_started.set()
+        time.sleep(1)
+        return b"value"
+
+    leader = execute(lambda: backend.get_readthrough(key, function, noop))
+    leader_started.wait()
+
+    def follower() -> bytes:
+        with cancellable(Cancellation(deadline=time.time() + 0.1)):
+            return backend.get_readthrough(key, function, noop)
+
+    start = time.time()
+    with pytest.raises(RequestCancelled):
+        execute(follower).result()
+    assert time.time() - start < 0.5
+    assert leader.result() == b"value"
+
+
+@pytest.mark.redis_db
+def test_single_flight_redis(backend: Cache[bytes]) -> None:
+    set_config("single_flight_enabled", 1)
+    set_config("single_flight_poll_interval_ms", 10)
+    key = "key"
+    hit_types: list[int] = []
+    function = mock.MagicMock(return_value=b"local")
+
+    # Another process is running the query.
+    redis_client.set(f"test{{{key}}}/executing", 1, ex=5)
+
+    def other_process() -> None:
+        time.sleep(0.2)
+        redis_client.set(f"test{{{key}}}", b"remote", ex=5)
+        redis_client.delete(f"test{{{key}}}/executing")
+
+    execute(other_process)
+    assert backend.get_readthrough(key, function, hit_types.append) == b"remote"
+    assert hit_types[-1] == RESULT_WAIT
+    function.assert_not_called()
+
+    # The other process gave up without a result, the query runs here.
+    redis_client.delete(f"test{{{key}}}")
+    redis_client.set(f"test{{{key}}}/executing", 1, ex=5)
+    execute(lambda: redis_client.delete(f"test{{{key}}}/executing"))
+    assert backend.get_readthrough(key, function, hit_types.append) == b"local"
+    assert hit_types[-1] == RESULT_EXECUTE
+    function.assert_called_once()
@@ -31,6 +31,7 @@ from snuba.datasets.factory import get_dataset
 from snuba.reader import Result
 from snuba.subscriptions.codecs import (
     SubscriptionDataCodec,
+    SubscriptionScheduledTaskBatchEncoder,
     SubscriptionScheduledTaskEncoder,
     SubscriptionTaskResultEncoder,
 )
@@ -490,3 +491,38 @@ def test_subscription_task_encoder_rpc() -> None:
 
     decoded = encoder.decode(encoded)
     assert decoded == task
+
+
+def test_subscription_task_batch_encoder() -> None:
+    encoder = SubscriptionScheduledTaskBatchEncoder()
+    entity = get_entity(EntityKey.EVENTS)
+    epoch = datetime(1970, 1, 1)
+
+    tasks = [
+        ScheduledSubscriptionTask(
+            timestamp=epoch,
+            task=SubscriptionWithMetadata(
+                EntityKey.EVENTS,
+                Subscription(
+                    SubscriptionIdentifier(PartitionId(1), uuid.uuid1()),
+                    SnQLSubscriptionData(
+                        project_id=project_id,
+                        query="MATCH events SELECT count()",
+                        time_window_sec=60,
+                        resolution_sec=60,
+                        entity=entity,
+                        metadata={},
+                    ),
+                ),
+                5,
+            ),
+        )
+        for project_id in range(1, 4)
+    ]
+
+    encoded = encoder.encode(tasks)
+
+    assert encoded.key == str(tasks[0].task.subscription.identifier).encode("utf-8")
+    assert encoder.is_batch(encoded)
+    assert not encoder.is_batch(SubscriptionScheduledTaskEncoder().encode(tasks[0]))
+    assert encoder.decode(encoded) == tasks
@@ -20,7 +20,10 @@ from snuba import state
 from snuba.datasets.entities.entity_key import EntityKey
 from snuba.datasets.entities.factory import get_entity
 from snuba.datasets.factory import get_dataset
-from snuba.subscriptions.codecs import SubscriptionScheduledTaskEncoder
+from snuba.subscriptions.codecs import (
+    SubscriptionScheduledTaskBatchEncoder,
+    SubscriptionScheduledTaskEncoder,
+)
 from snuba.subscriptions.data import (
     PartitionId,
     ScheduledSubscriptionTask,
@@ -252,6 +255,60 @@ def test_execute_query_strategy() -> None:
     strategy.join()
 
 
+@pytest.mark.redis_db
+@pytest.mark.clickhouse_db
+def test_execute_query_strategy_batch() -> None:
+    next_step = mock.Mock()
+
+    strategy = ExecuteQuery(
+        dataset=get_dataset("events"),
+        entity_names=["events"],
+        max_concurrent_queries=2,
+        stale_threshold_seconds=None,
+        metrics=TestingMetricsBackend(),
+        next_step=next_step,
+    )
+
+    codec = SubscriptionScheduledTaskEncoder()
+    make_message = generate_message(EntityKey.EVENTS)
+    tasks = [codec.decode(next(make_message).payload) for _ in range(3)]
+    tasks = [
+        ScheduledSubscriptionTask(
+            task.timestamp,
+            SubscriptionWithMetadata(task.task.entity, task.task.subscription, 1),
+        )
+        for task in tasks
+    ]
+    message = Message(
+        BrokerValue(
+            SubscriptionScheduledTaskBatchEncoder().encode(tasks),
+            Partition(Topic("test"), 0),
+            0,
+            datetime(1970, 1, 1),
+        )
+    )
+
+    strategy.submit(message)
+
+    while next_step.submit.call_count < 3:
+        time.sleep(0.1)
+        strategy.poll()
+
+    # Results are produced in order and only the last one commits the offset.
+    results = [call[0][0] for call in next_step.submit.call_args_list]
+    assert [result.payload.key for result in results] == [
+        str(task.task.subscription.identifier).encode("utf-8") for task in tasks
+    ]
+    assert [result.committable for result in results] == [
+        {},
+        {},
+        message.committable,
+    ]
+
+    strategy.close()
+    strategy.join()
+
+
 @pytest.mark.redis_db
 @pytest.mark.clickhouse_db
 def test_too_many_concurrent_queries() -> None:
@@ -278,6 +335,83 @@ def test_too_many_concurrent_queries() -> None:
     strategy.join()
 
 
+@pytest.mark.redis_db
+@pytest.mark.clickhouse_db
+def test_batch_exceeding_queue_size() -> None:
+    state.set_config("executor_queue_size_factor", 1)
+
+    strategy = ExecuteQuery(
+        dataset=get_dataset("events"),
+        entity_names=["events"],
+        max_concurrent_queries=4,
+        stale_threshold_seconds=None,
+        metrics=TestingMetricsBackend(),
+        next_step=mock.Mock(),
+    )
+
+    codec = SubscriptionScheduledTaskEncoder()
+    make_message = generate_message(EntityKey.EVENTS)
+
+    def make_batch(size: int) -> Message[KafkaPayload]:
+        tasks = [
+            ScheduledSubscriptionTask(
+                task.timestamp,
+                SubscriptionWithMetadata(task.task.entity, task.task.subscription, 1),
+            )
+            for task in (codec.decode(next(make_message).payload) for _ in range(size))
+        ]
+        return Message(
+            BrokerValue(
+                SubscriptionScheduledTaskBatchEncoder().encode(tasks),
+                Partition(Topic("test"), 0),
+                0,
+                datetime(1970, 1, 1),
+            )
+        )
+
+    # A batch larger than the queue is accepted when the queue is empty.
+    strategy.submit(make_batch(5))
+    strategy.close()
+    strategy.join()
+
+    strategy = ExecuteQuery(
+        dataset=get_dataset("events"),
+        entity_names=["events"],
+        max_concurrent_queries=4,
+        stale_threshold_seconds=None,
+        metrics=TestingMetricsBackend(),
+        next_step=mock.Mock(),
+    )
+    for _ in range(3):
+        strategy.submit(next(make_message))
+
+    # The batch would not fit in the queue, it is only decoded once however
+    # many times it is submitted again.
+    batch = make_batch(2)
+    with mock.patch.object(
+        SubscriptionScheduledTaskBatchEncoder,
+        "decode",
+        autospec=True,
+        side_effect=SubscriptionScheduledTaskBatchEncoder.decode,
+    ) as decode:
+        for _ in range(3):
+            with pytest.raises(MessageRejected):
+                strategy.submit(batch)
+    assert decode.call_count == 1
+
+    # A full queue rejects the messages without decoding them.
+    strategy.submit(next(make_message))
+    with mock.patch.object(
+        SubscriptionScheduledTaskEncoder, "decode", autospec=True
+    ) as decode:
+        with pytest.raises(MessageRejected):
+            strategy.submit(next(make_message))
+    decode.assert_not_called()
+
+    strategy.close()
+    strategy.join()
+
+
 @pytest.mark.clickhouse_db
 @pytest.mark.redis_db
 def test_skip_execution_for_entity() -> None:
@@ -13,11 +13,15 @@ from arroyo.backends.local.storages.memory import MemoryMessageStorage
 from arroyo.types import BrokerValue
 from arroyo.utils.clock import TestingClock
 
+from snuba import state
 from snuba.datasets.entities.entity_key import EntityKey
 from snuba.datasets.entities.factory import get_entity
 from snuba.datasets.table_storage import KafkaTopicSpec
 from snuba.redis import RedisClientKey, get_redis_client
-from snuba.subscriptions.codecs import SubscriptionScheduledTaskEncoder
+from snuba.subscriptions.codecs import (
+    SubscriptionScheduledTaskBatchEncoder,
+    SubscriptionScheduledTaskEncoder,
+)
 from snuba.subscriptions.data import PartitionId, SnQLSubscriptionData
 from snuba.subscriptions.scheduler import SubscriptionScheduler
 from snuba.subscriptions.scheduler_processing_strategy import (
@@ -653,6 +657,107 @@ def test_produce_scheduled_subscription_message() -> None:
     strategy.join()
 
 
+@pytest.mark.redis_db
+def test_produce_scheduled_subscription_message_batched() -> None:
+    state.set_config("scheduled_subscription_batch_size", 2)
+    epoch = datetime(1970, 1, 1)
+    metrics_backend = TestingMetricsBackend()
+    partition_index = 0
+    entity_key = EntityKey.EVENTS
+    topic = Topic("scheduled-subscriptions-events")
+    partition = Partition(topic, partition_index)
+
+    clock = TestingClock()
+    broker_storage: MemoryMessageStorage[KafkaPayload] = MemoryMessageStorage()
+    broker: Broker[KafkaPayload] = Broker(broker_storage, clock)
+    broker.create_topic(topic, partitions=1)
+    producer = broker.get_producer()
+
+    store = RedisSubscriptionDataStore(
+        get_redis_client(RedisClientKey.SUBSCRIPTION_STORE),
+        entity_key,
+        PartitionId(partition_index),
+    )
+    entity = get_entity(EntityKey.EVENTS)
+    for project_id in (1, 2):
+        store.create(
+            uuid.uuid4(),
+            SnQLSubscriptionData(
+                project_id=project_id,
+                time_window_sec=60,
+                resolution_sec=60,
+                query="MATCH events SELECT count()",
+                entity=entity,
+                metadata={},
+            ),
+        )
+
+    schedulers = {
+        partition_index: SubscriptionScheduler(
+            entity_key,
+            store,
+            PartitionId(partition_index),
+            cache_ttl=timedelta(seconds=300),
+            metrics=metrics_backend,
+        )
+    }
+
+    commit = mock.Mock()
+
+    strategy = ProduceScheduledSubscriptionMessage(
+        schedulers,
+        producer,
+        KafkaTopicSpec(SnubaTopic.SUBSCRIPTION_SCHEDULED_EVENTS),
+        commit,
+        None,
+        metrics_backend,
+    )
+
+    message = Message(
+        BrokerValue(
+            CommittableTick(
+                Tick(
+                    0,
+                    offsets=Interval(1, 3),
+                    timestamps=Interval(epoch.timestamp(), epoch.timestamp() + 120),
+                ),
+                2,
+            ),
+            partition,
+            1,
+            epoch,
+        )
+    )
+
+    strategy.submit(message)
+
+    # 4 subscriptions are scheduled (2 per subscription), in batches of 2
+    codec = SubscriptionScheduledTaskBatchEncoder()
+    first_message = broker_storage.consume(partition, 0)
+    assert first_message is not None
+    second_message = broker_storage.consume(partition, 1)
+    assert second_message is not None
+    assert broker_storage.consume(partition, 2) is None
+
+    tasks = [
+        *codec.decode(first_message.payload),
+        *codec.decode(second_message.payload),
+    ]
+    assert sorted(task.timestamp for task in tasks) == [
+        epoch,
+        epoch,
+        epoch + timedelta(minutes=1),
+        epoch + timedelta(minutes=1),
+    ]
+
+    strategy.poll()
+    assert commit.call_count == 1
+    assert commit.call_args == mock.call(message.committable)
+
+    strategy.close()
+    strategy.join()
+
+
 @pytest.mark.redis_db
 def test_produce_stale_message() -> None:
     stale_threshold_seconds = 90
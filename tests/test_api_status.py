@@ -13,6 +13,11 @@ from snuba.state.rate_limit import (
     TABLE_RATE_LIMIT_NAME,
     RateLimitExceeded,
 )
+from snuba.utils.cancellation import (
+    CLIENT_DISCONNECTED,
+    DEADLINE_EXCEEDED,
+    RequestCancelled,
+)
 from tests.base import BaseApiTest
 from tests.fixtures import get_raw_event
 
@@ -104,6 +109,16 @@ class TestApiCodes(BaseApiTest):
             ),
             (TimeoutError("test"), "query-timeout", "for"),
             (ExecutionTimeoutError("test"), "cache-wait-timeout", "against"),
+            (
+                RequestCancelled("test", reason=DEADLINE_EXCEEDED),
+                "deadline-exceeded",
+                "against",
+            ),
+            (
+                RequestCancelled("test", reason=CLIENT_DISCONNECTED),
+                "cancelled",
+                "for",
+            ),
             (
                 ClickhouseError(
                     "DB::Exception: There is no supertype for types UInt32, String because some of them are String/FixedString and some of them are not: While processing has(exception_frames.colno AS `_snuba_exception_frames.colno`, '300'). Stack trace:",
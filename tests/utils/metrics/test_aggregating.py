@@ -0,0 +1,98 @@
+import time
+
+from snuba.utils.clock import TestingClock
+from snuba.utils.metrics.backends.aggregating import AggregatingMetricsBackend
+from tests.backends.metrics import Distribution, Events
+from tests.backends.metrics import Gauge as GaugeCall
+from tests.backends.metrics import Increment, TestingMetricsBackend, Timing
+
+
+def test_aggregates_until_flush() -> None:
+    inner = TestingMetricsBackend()
+    backend = AggregatingMetricsBackend(inner, clock=TestingClock(), autoflush=False)
+
+    backend.increment("counter", 1, {"a": "1", "b": "2"})
+    backend.increment("counter", 2, {"b": "2", "a": "1"})
+    backend.increment("counter", 5, {"a": "other"})
+    backend.gauge("gauge", 1.0)
+    backend.gauge("gauge", 3.0)
+    for value in [20.5, 10.25, 10.25, 40.0]:
+        backend.timing("timing", value, {"a": "1"})
+
+    assert inner.calls == []
+
+    backend.flush()
+
+    assert inner.calls == [
+        Increment("counter", 3, {"a": "1", "b": "2"}),
+        Increment("counter", 5, {"a": "other"}),
+        GaugeCall("gauge", 3.0, None),
+        Timing("timing", 20.5, {"a": "1"}),
+        Timing("timing", 10.25, {"a": "1"}),
+        Timing("timing", 10.25, {"a": "1"}),
+        Timing("timing", 40.0, {"a": "1"}),
+    ]
+
+    inner.calls.clear()
+    backend.flush()
+    assert inner.calls == []
+
+
+def test_flush_on_interval() -> None:
+    inner = TestingMetricsBackend()
+    clock = TestingClock()
+    backend = AggregatingMetricsBackend(
+        inner, flush_interval_sec=10, clock=clock, autoflush=False
+    )
+
+    backend.increment("counter")
+    clock.sleep(5)
+    backend.increment("counter")
+    assert inner.calls == []
+
+    clock.sleep(5)
+    backend.increment("counter")
+    assert inner.calls == [Increment("counter", 3, None)]
+
+
+def test_flush_on_size() -> None:
+    inner = TestingMetricsBackend()
+    backend = AggregatingMetricsBackend(
+        inner, max_buffer_size=3, clock=TestingClock(), autoflush=False
+    )
+
+    backend.increment("counter")
+    backend.increment("counter")
+    assert inner.calls == []
+
+    backend.gauge("gauge", 1)
+    assert inner.calls == [Increment("counter", 2, None), GaugeCall("gauge", 1, None)]
+
+
+def test_flush_in_background() -> None:
+    inner = TestingMetricsBackend()
+    backend = AggregatingMetricsBackend(inner, flush_interval_sec=0.05)
+    try:
+        backend.increment("counter")
+        deadline = time.time() + 5
+        while not inner.calls and time.time() < deadline:
+            time.sleep(0.01)
+        assert inner.calls == [Increment("counter", 1, None)]
+    finally:
+        backend.close()
+
+    backend.increment("counter", 2)
+    backend.close()
+    assert inner.calls[-1] == Increment("counter", 2, None)
+
+
+def test_distributions_and_events_are_not_buffered() -> None:
+    inner = TestingMetricsBackend()
+    backend = AggregatingMetricsBackend(inner, clock=TestingClock(), autoflush=False)
+
+    backend.distribution("distribution", 1.5, {"a": "b"})
+    backend.events("title", "text", "info", "low", {"a": "b"})
+    assert inner.calls == [
+        Distribution("distribution", 1.5, {"a": "b"}),
+        Events("title", "text", "info", "low", {"a": "b"}),
+    ]
@@ -46,3 +46,32 @@ def test_get_projects_exceeding_limit() -> None:
     exceeded_projects = counter.get_projects_exceeding_limit()
     assert len(exceeded_projects) == 1
     assert exceeded_projects[0] == 2
+
+
+def test_expired_minutes_are_removed_from_totals() -> None:
+    counter = Counter("test-consumer-group")
+    counter.limit = timedelta(seconds=30)
+
+    now = datetime.now()
+    counter.record_time_spent(
+        1, now - timedelta(minutes=20, seconds=40), now - timedelta(minutes=20)
+    )
+    counter.record_time_spent(2, now - timedelta(seconds=40), now)
+    assert counter.get_project_total(1, now) == timedelta(0)
+    assert counter.get_project_total(2, now) == timedelta(seconds=40)
+    assert not counter.is_over_limit(1, now)
+    assert counter.get_projects_exceeding_limit() == []
+
+    counter.record_time_spent(1, now - timedelta(seconds=35), now)
+    assert counter.is_over_limit(1, now)
+    assert counter.is_over_limit(2, now)
+    assert sorted(counter.get_projects_exceeding_limit()) == [1, 2]
+
+    # Minutes wrap around the ring and replace the ones that left the window.
+    later = floor_minute(now + TEST_COUNTER_WINDOW_SIZE) + timedelta(
+        minutes=2, seconds=30
+    )
+    counter.record_time_spent(1, later - timedelta(seconds=10), later)
+    assert counter.get_project_total(1, later) == timedelta(seconds=10)
+    assert counter.get_project_total(2, later) == timedelta(0)
+    assert len(counter.buckets) == 1
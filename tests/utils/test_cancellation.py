@@ -0,0 +1,113 @@
+import time
+from unittest import mock
+
+import pytest
+
+from snuba.utils.cancellation import (
+    CLIENT_DISCONNECTED,
+    DEADLINE_EXCEEDED,
+    Cancellation,
+    RequestCancelled,
+    cancellable,
+    get_current_cancellation,
+    parse_deadline,
+)
+
+
+def test_parse_deadline() -> None:
+    assert parse_deadline(None) is None
+    assert parse_deadline("") is None
+    assert parse_deadline("not a time") is None
+    assert parse_deadline("1700000000.5") == 1700000000.5
+
+
+def test_deadline() -> None:
+    assert Cancellation().remaining() is None
+    assert Cancellation().reason is None
+
+    cancellation = Cancellation(deadline=time.time() + 60)
+    remaining = cancellation.remaining()
+    assert remaining is not None and 0 < remaining <= 60
+    cancellation.raise_if_cancelled()
+
+    cancellation = Cancellation(deadline=time.time() - 1)
+    assert cancellation.remaining() == 0.0
+    assert cancellation.reason == DEADLINE_EXCEEDED
+    with pytest.raises(RequestCancelled):
+        cancellation.raise_if_cancelled()
+
+
+def test_cancel_kills_running_work() -> None:
+    cancellation = Cancellation()
+    kill = mock.Mock()
+    with pytest.raises(RequestCancelled) as error:
+        with cancellation.running(kill, {}):
+            cancellation.cancel(CLIENT_DISCONNECTED)
+            # The killed work fails with its own error.
+            raise ValueError("query was cancelled")
+    kill.assert_called_once()
+    assert isinstance(error.value.__cause__, ValueError)
+    assert not error.value.should_report
+
+    # Cancelling twice, or after the work finished, kills nothing.
+    cancellation.cancel(CLIENT_DISCONNECTED)
+    kill.assert_called_once()
+
+
+def test_linked() -> None:
+    cancellation = Cancellation()
+    child = Cancellation()
+    kill = mock.Mock()
+    with cancellation.linked(child), pytest.raises(RequestCancelled):
+        with child.running(kill, {}):
+            cancellation.cancel(CLIENT_DISCONNECTED)
+            raise ValueError("query was cancelled")
+    kill.assert_called_once()
+    assert child.reason == CLIENT_DISCONNECTED
+
+    # A child linked once the request is cancelled is cancelled right away,
+    # cancelling a child does not cancel the request.
+    late = Cancellation()
+    with cancellation.linked(late):
+        assert late.reason == CLIENT_DISCONNECTED
+    parent = Cancellation()
+    child = Cancellation()
+    with parent.linked(child):
+        child.cancel(DEADLINE_EXCEEDED)
+    assert parent.reason is None
+
+
+def test_running_after_cancel() -> None:
+    cancellation = Cancellation()
+    cancellation.cancel(CLIENT_DISCONNECTED)
+    kill = mock.Mock()
+    with pytest.raises(RequestCancelled):
+        with cancellation.running(kill, {}):
+            assert False, "the work should not run"
+    kill.assert_not_called()
+
+
+def test_errors_without_cancel() -> None:
+    cancellation = Cancellation()
+    with pytest.raises(ValueError):
+        with cancellation.running(mock.Mock(), {}):
+            raise ValueError("unrelated")
+
+
+def test_wait() -> None:
+    cancellation = Cancellation()
+    assert cancellation.wait(0.01) is False
+    cancellation.cancel(CLIENT_DISCONNECTED)
+    assert cancellation.wait(10) is True
+
+    start = time.time()
+    assert Cancellation(deadline=time.time() + 0.05).wait(10) is True
+    assert time.time() - start < 1
+
+
+def test_cancellable() -> None:
+    assert get_current_cancellation() is None
+    cancellation = Cancellation()
+    with cancellable(cancellation):
+        assert get_current_cancellation() is cancellation
+    assert get_current_cancellation() is None
@@ -0,0 +1,66 @@
+import time
+from unittest import mock
+
+from snuba.utils.health_info import ClickhouseHealth, HealthProber, get_health_info
+
+
+def _wait_for_health(prober: HealthProber) -> ClickhouseHealth:
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        health = prober.get_health()
+        if health is not None:
+            return health
+        time.sleep(0.01)
+    raise AssertionError("the prober did not produce a result")
+
+
+def test_prober_refreshes_in_background() -> None:
+    results = iter(
+        [
+            ClickhouseHealth(True, False, {"table_not_present": "a"}, time.time()),
+            ClickhouseHealth(True, True, {}, time.time()),
+        ]
+    )
+    with mock.patch(
+        "snuba.utils.health_info.probe_clickhouse_health",
+        side_effect=lambda: next(results),
+    ) as probe:
+        prober = HealthProber(interval=0.05, jitter=0, max_staleness=60)
+        assert prober.get_health() is None
+        prober.start()
+        prober.start()
+
+        health = _wait_for_health(prober)
+        assert health.connections_ok
+        while not health.tables_present:
+            health = _wait_for_health(prober)
+            time.sleep(0.01)
+        assert probe.call_count >= 2
+
+
+def test_stale_result_is_not_served() -> None:
+    with mock.patch(
+        "snuba.utils.health_info.probe_clickhouse_health",
+        return_value=ClickhouseHealth(True, True, {}, time.time() - 120),
+    ):
+        prober = HealthProber(interval=60, jitter=0, max_staleness=60)
+        prober.start()
+        time.sleep(0.1)
+        assert prober.get_health() is None
+
+
+def test_health_served_from_cache() -> None:
+    with mock.patch(
+        "snuba.utils.health_info.get_cached_clickhouse_health",
+        return_value=ClickhouseHealth(
+            True, False, {"table_not_present": "a"}, time.time()
+        ),
+    ), mock.patch(
+        "snuba.utils.health_info.check_all_tables_present"
+    ) as check_tables, mock.patch(
+        "snuba.utils.health_info.sanity_check_clickhouse_connections"
+    ) as check_connections:
+        assert get_health_info(thorough=False).status == 200
+        assert get_health_info(thorough=True).status == 502
+        check_tables.assert_not_called()
+        check_connections.assert_not_called()
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, MutableMapping, Sequence, Type
+
+from google.protobuf.timestamp_pb2 import Timestamp
+from sentry_protos.snuba.v1.error_pb2 import Error as ErrorProto
+
+from snuba.web.rpc import RPCEndpoint
+from snuba.web.rpc.asgi import EndpointLimits, RPCApplication
+
+release = threading.Event()
+
+# Annotated so the helpers do not return Any when protobuf has no stubs.
+TIMESTAMP: Type[Timestamp] = Timestamp
+
+
+class AsgiTestRPC(RPCEndpoint[Timestamp, Timestamp]):
+    @classmethod
+    def request_class(cls) -> Type[Timestamp]:
+        return TIMESTAMP
+
+    @classmethod
+    def response_class(cls) -> Type[Timestamp]:
+        return TIMESTAMP
+
+    @classmethod
+    def version(cls) -> str:
+        return "v1"
+
+    def _execute(self, in_msg: Timestamp) -> Timestamp:
+        release.wait(timeout=5)
+        return Timestamp(seconds=in_msg.seconds + 1)
+
+
+def _call(
+    app: RPCApplication,
+    path: str,
+    messages: Sequence[MutableMapping[str, Any]],
+    method: str = "POST",
+) -> List[MutableMapping[str, Any]]:
+    sent: List[MutableMapping[str, Any]] = []
+
+    async def run() -> None:
+        pending = list(messages)
+
+        async def receive() -> MutableMapping[str, Any]:
+            if pending:
+                return pending.pop(0)
+            # Keeps the connection open until the response is sent.
+            await asyncio.sleep(10)
+            return {"type": "http.disconnect"}
+
+        async def send(message: MutableMapping[str, Any]) -> None:
+            sent.append(message)
+
+        await app(
+            {"type": "http", "path": path, "method": method, "query_string": b""},
+            receive,
+            send,
+        )
+
+    asyncio.run(run())
+    return sent
+
+
+def _request(seconds: int) -> MutableMapping[str, Any]:
+    return {
+        "type": "http.request",
+        "body": Timestamp(seconds=seconds).SerializeToString(),
+        "more_body": False,
+    }
+
+
+def test_execute() -> None:
+    release.set()
+    app = RPCApplication(ThreadPoolExecutor(1), EndpointLimits(1, {}))
+    sent = _call(app, "/rpc/AsgiTestRPC/v1", [_request(41)])
+    assert sent[0]["status"] == 200
+    response = Timestamp()
+    response.ParseFromString(sent[1]["body"])
+    assert response.seconds == 42
+
+
+def test_not_found() -> None:
+    app = RPCApplication(ThreadPoolExecutor(1), EndpointLimits(1, {}))
+    assert _call(app, "/rpc/SomeWeirdRequest/v1", [_request(1)])[0]["status"] == 404
+    assert _call(app, "/snql", [], method="GET")[0]["status"] == 404
+
+
+def test_endpoint_limit() -> None:
+    app = RPCApplication(ThreadPoolExecutor(1), EndpointLimits(1, {"AsgiTestRPC": 0}))
+    sent = _call(app, "/rpc/AsgiTestRPC/v1", [_request(1)])
+    assert sent[0]["status"] == 429
+    error = ErrorProto()
+    error.ParseFromString(sent[1]["body"])
+    assert error.code == 429
+
+
+def test_client_disconnect() -> None:
+    release.clear()
+    limits = EndpointLimits(1, {})
+    executor = ThreadPoolExecutor(1)
+    app = RPCApplication(executor, limits)
+    sent = _call(app, "/rpc/AsgiTestRPC/v1", [_request(1), {"type": "http.disconnect"}])
+    assert sent == []
+    release.set()
+    executor.shutdown(wait=True)
+    # The slot is given back once the abandoned execution finishes.
+    assert limits.in_flight("AsgiTestRPC") == 0
+
+
+def test_health_envoy() -> None:
+    app = RPCApplication(ThreadPoolExecutor(1), EndpointLimits(1, {}))
+    assert _call(app, "/health_envoy", [], method="GET")[0]["status"] == 200
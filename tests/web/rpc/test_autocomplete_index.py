@@ -0,0 +1,47 @@
+from typing import List
+
+import pytest
+from sentry_protos.snuba.v1.request_common_pb2 import RequestMeta
+
+from snuba import state
+from snuba.web.rpc.common.autocomplete_index import get_entries, like_matcher, page
+
+META = RequestMeta(project_ids=[1, 2], organization_id=1)
+
+
+def test_like_matcher() -> None:
+    matches = like_matcher("%a_c%")
+    assert matches("abc")
+    assert matches("xxabcxx")
+    assert not matches("ac")
+    assert like_matcher("%100\\%%")("100%")
+    assert not like_matcher("%100\\%%")("1000")
+    # Like ClickHouse, _ matches a byte rather than a character.
+    assert not like_matcher("_")("é")
+    assert like_matcher("__")("é")
+
+
+def test_page() -> None:
+    entries = ["a1", "a2", "b1", "b2", "b3"]
+    assert page(entries, lambda entry: "b" in entry, 1, 5) == ["b2", "b3"]
+    assert page(entries, lambda entry: True, 0, 2, after="a2") == ["b1", "b2"]
+
+
+@pytest.mark.redis_db
+def test_get_entries() -> None:
+    builds: List[int] = []
+
+    def build(limit: int) -> List[str]:
+        builds.append(limit)
+        return ["a", "b", "c"][:limit]
+
+    state.set_config("eap_autocomplete_index_max_entries", 3)
+    assert get_entries("names", META, ["string"], build) == ["a", "b", "c"]
+    assert get_entries("names", META, ["string"], build) == ["a", "b", "c"]
+    assert builds == [4]
+
+    # Too many to be indexed, which is not built again.
+    state.set_config("eap_autocomplete_index_max_entries", 2)
+    assert get_entries("names", META, ["float"], build) is None
+    assert get_entries("names", META, ["float"], build) is None
+    assert builds == [4, 3]
@@ -1,6 +1,7 @@
 import uuid
 from datetime import UTC, datetime, timedelta
 from typing import Any, Mapping
+from unittest import mock
 
 import pytest
 from google.protobuf.timestamp_pb2 import Timestamp
@@ -11,10 +12,14 @@ from sentry_protos.snuba.v1.endpoint_trace_item_attributes_pb2 import (
 from sentry_protos.snuba.v1.request_common_pb2 import PageToken, RequestMeta
 from sentry_protos.snuba.v1.trace_item_attribute_pb2 import AttributeKey
 
+from snuba import state
 from snuba.datasets.storages.factory import get_storage
 from snuba.datasets.storages.storage_key import StorageKey
+from snuba.query.expressions import FunctionCall, Literal
+from snuba.request import Request as SnubaRequest
 from snuba.web.rpc.v1.endpoint_trace_item_attribute_names import (
     EndpointTraceItemAttributeNames,
+    convert_to_snuba_request,
 )
 from tests.base import BaseApiTest
 from tests.helpers import write_raw_unprocessed_events
@@ -293,3 +298,82 @@ class TestTraceItemAttributeNames(BaseApiTest):
         )
         res = EndpointTraceItemAttributeNames().execute(req)
         assert res.meta.query_info != []
+
+    def test_with_autocomplete_index(self) -> None:
+        state.set_config("eap_autocomplete_index_enabled", 1)
+        for substring, expected in [
+            ("", ["a_tag_000", "a_tag_001"]),
+            ("2_", ["a_tag_020", "a_tag_021"]),
+            ("28", ["a_tag_028"]),
+        ]:
+            req = TraceItemAttributeNamesRequest(
+                meta=RequestMeta(
+                    project_ids=[1, 2, 3],
+                    organization_id=1,
+                    cogs_category="something",
+                    referrer="something",
+                    start_timestamp=Timestamp(
+                        seconds=int((BASE_TIME - timedelta(days=1)).timestamp())
+                    ),
+                    end_timestamp=Timestamp(
+                        seconds=int((BASE_TIME + timedelta(days=1)).timestamp())
+                    ),
+                ),
+                limit=2,
+                type=AttributeKey.Type.TYPE_STRING,
+                value_substring_match=substring,
+            )
+            res = EndpointTraceItemAttributeNames().execute(req)
+            assert [attribute.name for attribute in res.attributes] == expected
+
+
+@pytest.mark.redis_db
+def test_autocomplete_index_is_shared_by_the_day() -> None:
+    state.set_config("eap_autocomplete_index_enabled", 1)
+    day = datetime(2024, 1, 10, tzinfo=UTC)
+    result = mock.Mock(result={"data": [{"attr_key": "a"}, {"attr_key": "b"}]})
+    with mock.patch(
+        "snuba.web.rpc.v1.endpoint_trace_item_attribute_names.run_query",
+        return_value=result,
+    ) as run_query:
+        for start, end in [(2, 4), (10, 20)]:
+            req = TraceItemAttributeNamesRequest(
+                meta=RequestMeta(
+                    project_ids=[1],
+                    organization_id=1,
+                    referrer="something",
+                    start_timestamp=Timestamp(
+                        seconds=int((day + timedelta(hours=start)).timestamp())
+                    ),
+                    end_timestamp=Timestamp(
+                        seconds=int((day + timedelta(hours=end)).timestamp())
+                    ),
+                ),
+                limit=10,
+                type=AttributeKey.Type.TYPE_STRING,
+            )
+            res = EndpointTraceItemAttributeNames().execute(req)
+            assert [attribute.name for attribute in res.attributes] == ["a", "b"]
+
+    # The index is built once, over the whole days around the request, which
+    # the query without the index also reads.
+    [call] = run_query.call_args_list
+    days = [
+        int(datetime(2024, 1, 9, tzinfo=UTC).timestamp()),
+        int(datetime(2024, 1, 11, tzinfo=UTC).timestamp()),
+    ]
+    assert _time_range(call.kwargs["request"]) == days
+    assert _time_range(convert_to_snuba_request(req)) == days
+
+
+def _time_range(request: SnubaRequest) -> list[int]:
+    condition = request.query.get_condition()
+    assert condition is not None
+    return sorted(
+        e.parameters[0].value
+        for e in condition
+        if isinstance(e, FunctionCall)
+        and e.function_name == "toDateTime"
+        and isinstance(e.parameters[0], Literal)
+        and isinstance(e.parameters[0].value, int)
+    )
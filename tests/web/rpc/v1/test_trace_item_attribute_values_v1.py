@@ -11,6 +11,7 @@ from sentry_protos.snuba.v1.request_common_pb2 import PageToken, RequestMeta
 from sentry_protos.snuba.v1.trace_item_attribute_pb2 import AttributeKey
 from sentry_protos.snuba.v1.trace_item_filter_pb2 import TraceItemFilter
 
+from snuba import state
 from snuba.datasets.storages.factory import get_storage
 from snuba.datasets.storages.storage_key import StorageKey
 from snuba.web.rpc.v1.trace_item_attribute_values import AttributeValuesRequest
@@ -166,3 +167,19 @@ class TestTraceItemAttributes(BaseApiTest):
         )
         response = AttributeValuesRequest().execute(message)
         assert response.values == ["derpderp", "herp", "herpderp"]
+
+    def test_with_autocomplete_index(self, setup_teardown: Any) -> None:
+        state.set_config("eap_autocomplete_index_enabled", 1)
+        for substring, expected in [
+            ("", ["blah", "derpderp", "durp"]),
+            ("erp", ["derpderp", "herp", "herpderp"]),
+            ("herp", ["herp", "herpderp"]),
+        ]:
+            message = TraceItemAttributeValuesRequest(
+                meta=COMMON_META,
+                limit=3,
+                key=AttributeKey(name="tag1", type=AttributeKey.TYPE_STRING),
+                value_substring_match=substring,
+            )
+            response = AttributeValuesRequest().execute(message)
+            assert response.values == expected
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from datetime import datetime, timedelta
 from typing import Any, Mapping, MutableMapping, Optional
 from unittest import mock
 
@@ -25,17 +26,26 @@ from snuba.query.allocation_policies import (
     QueryResultOrError,
     QuotaAllowance,
 )
+from snuba.query.conditions import (
+    ConditionFunctions,
+    binary_condition,
+    combine_and_conditions,
+)
 from snuba.query.data_source.simple import Table
+from snuba.query.expressions import Column, Literal
 from snuba.query.parser.expressions import parse_clickhouse_function
 from snuba.query.query_settings import HTTPQuerySettings
 from snuba.querylog.query_metadata import ClickhouseQueryMetadata
+from snuba.state.cache.abstract import CachePolicy
 from snuba.state.quota import ResourceQuota
 from snuba.utils.metrics.backends.testing import get_recorded_metric_calls
 from snuba.utils.metrics.timer import Timer
 from snuba.web import QueryException
 from snuba.web.db_query import (
     _apply_allocation_policies_quota,
+    _get_cache_policy,
     _get_query_settings_from_config,
+    _revalidate,
     db_query,
 )
 
@@ -212,9 +222,11 @@ def test_query_settings_from_config(
 
 
 def _build_test_query(
-    select_expression: str, allocation_policies: list[AllocationPolicy] | None = None
+    select_expression: str,
+    allocation_policies: list[AllocationPolicy] | None = None,
+    storage_key: StorageKey = StorageKey("errors_ro"),
 ) -> tuple[ClickhouseQuery, Storage, AttributionInfo]:
-    storage = get_storage(StorageKey("errors_ro"))
+    storage = get_storage(storage_key)
     return (
         ClickhouseQuery(
             from_clause=Table(
@@ -1072,3 +1084,153 @@ def test_cache_metrics_with_simple_readthrough() -> None:
                 mock.call.increment("cache_hit_simple", tags={"dataset": "events"}),
             ]
         )
+
+
+def _set_time_range(query: ClickhouseQuery, start: datetime, end: datetime) -> None:
+    timestamp = Column(None, None, "timestamp")
+    query.set_ast_condition(
+        combine_and_conditions(
+            [
+                binary_condition(
+                    ConditionFunctions.GTE, timestamp, Literal(None, start)
+                ),
+                binary_condition(ConditionFunctions.LT, timestamp, Literal(None, end)),
+            ]
+        )
+    )
+
+
+@pytest.mark.redis_db
+def test_cache_policy_from_time_range() -> None:
+    query, _, _ = _build_test_query(
+        "count(distinct(project_id))", storage_key=StorageKey("transactions")
+    )
+    state.set_config("cache_expiry_sec", 1)
+    state.set_config("cache_policy_stale_ttl_sec", 10)
+    state.set_config("cache_policy_immutable_ttl_sec", 600)
+    state.set_config("cache_policy_immutable_lag_sec", 3600)
+
+    # Disabled by default
+    assert _get_cache_policy(query) is None
+
+    state.set_config("cache_policy_enabled", 1)
+    assert _get_cache_policy(query) == CachePolicy(ttl_sec=1, stale_ttl_sec=10)
+
+    now = datetime.utcnow()
+    _set_time_range(query, now - timedelta(hours=1), now)
+    assert _get_cache_policy(query) == CachePolicy(ttl_sec=1, stale_ttl_sec=10)
+
+    _set_time_range(query, now - timedelta(days=2), now - timedelta(days=1))
+    assert _get_cache_policy(query) == CachePolicy(ttl_sec=600)
+
+
+@pytest.mark.redis_db
+def test_replaced_storage_is_never_immutable() -> None:
+    # The errors replacer rewrites the table errors_ro reads.
+    query, _, _ = _build_test_query("count(distinct(project_id))")
+    state.set_config("cache_expiry_sec", 1)
+    state.set_config("cache_policy_stale_ttl_sec", 10)
+    state.set_config("cache_policy_enabled", 1)
+
+    now = datetime.utcnow()
+    _set_time_range(query, now - timedelta(days=2), now - timedelta(days=1))
+    assert _get_cache_policy(query) == CachePolicy(ttl_sec=1, stale_ttl_sec=10)
+
+
+class RecordingPolicy(AllocationPolicy):
+    def __init__(self, can_run: bool) -> None:
+        super().__init__(StorageKey("doesntmatter"), ["a", "b", "c"], {})
+        self.can_run = can_run
+        self.allowance_query_ids: list[str] = []
+        self.balance_updates: list[tuple[str, QueryResultOrError]] = []
+
+    def _additional_config_definitions(self) -> list[AllocationPolicyConfig]:
+        return []
+
+    def _get_quota_allowance(
+        self, tenant_ids: dict[str, str | int], query_id: str
+    ) -> QuotaAllowance:
+        self.allowance_query_ids.append(query_id)
+        return QuotaAllowance(
+            can_run=self.can_run,
+            max_threads=3,
+            explanation={},
+            is_throttled=True,
+            throttle_threshold=MAX_THRESHOLD,
+            rejection_threshold=MAX_THRESHOLD,
+            quota_used=0,
+            quota_unit=NO_UNITS,
+            suggestion=NO_SUGGESTION,
+        )
+
+    def _update_quota_balance(
+        self,
+        tenant_ids: dict[str, str | int],
+        query_id: str,
+        result_or_error: QueryResultOrError,
+    ) -> None:
+        self.balance_updates.append((query_id, result_or_error))
+
+
+@pytest.mark.redis_db
+def test_revalidate_is_charged_to_allocation_policies() -> None:
+    policy = RecordingPolicy(can_run=True)
+    query, _, attribution_info = _build_test_query(
+        "count(distinct(project_id))", [policy]
+    )
+    reader = mock.Mock()
+    reader.execute.return_value = {"data": [{"a": 1}], "meta": [], "profile": {}}
+
+    result = _revalidate(
+        query,
+        HTTPQuerySettings(),
+        format_query(query),
+        reader,
+        {"query_id": "refresh"},
+        False,
+        attribution_info,
+        None,
+    )
+
+    assert result["data"] == [{"a": 1}]
+    assert reader.execute.call_args.args[1]["max_threads"] == 3
+    [query_id] = policy.allowance_query_ids
+    [(updated_query_id, result_or_error)] = policy.balance_updates
+    assert updated_query_id == query_id
+    assert result_or_error.query_result is not None
+
+    reader.execute.side_effect = Exception("boom")
+    with pytest.raises(Exception):
+        _revalidate(
+            query,
+            HTTPQuerySettings(),
+            format_query(query),
+            reader,
+            {"query_id": "refresh"},
+            False,
+            attribution_info,
+            None,
+        )
+    assert policy.balance_updates[-1][1].error is not None
+
+
+@pytest.mark.redis_db
+def test_revalidate_rejected_by_allocation_policies() -> None:
+    policy = RecordingPolicy(can_run=False)
+    query, _, attribution_info = _build_test_query(
+        "count(distinct(project_id))", [policy]
+    )
+    reader = mock.Mock()
+
+    with pytest.raises(AllocationPolicyViolations):
+        _revalidate(
+            query,
+            HTTPQuerySettings(),
+            format_query(query),
+            reader,
+            {"query_id": "refresh"},
+            False,
+            attribution_info,
+            None,
+        )
+    reader.execute.assert_not_called()
@@ -0,0 +1,151 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+from unittest import mock
+
+import pytest
+
+from snuba import state
+from snuba.datasets.dataset import Dataset
+from snuba.datasets.factory import get_dataset
+from snuba.query.query_settings import HTTPQuerySettings
+from snuba.request import Request
+from snuba.util import parse_datetime
+from snuba.utils.metrics.timer import Timer
+from snuba.web import QueryResult
+from snuba.web.mql_bucket_cache import _Range, run_query_with_bucket_cache
+
+HOUR = 3600
+# A time far enough in the past for all its buckets to be settled.
+T0 = 1700000000 // HOUR * HOUR
+
+
+def test_range() -> None:
+    query_range = _Range(T0 + 1800, T0 + 4 * HOUR + 900, HOUR)
+    assert list(query_range.full_buckets()) == [
+        T0 + HOUR,
+        T0 + 2 * HOUR,
+        T0 + 3 * HOUR,
+    ]
+    assert query_range.uncovered([]) == [(T0 + 1800, T0 + 4 * HOUR + 900)]
+    assert query_range.uncovered([T0 + HOUR, T0 + 3 * HOUR]) == [
+        (T0 + 1800, T0 + HOUR),
+        (T0 + 2 * HOUR, T0 + 3 * HOUR),
+        (T0 + 4 * HOUR, T0 + 4 * HOUR + 900),
+    ]
+
+
+def _format(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _timestamp(value: str) -> int:
+    return int(parse_datetime(value).replace(tzinfo=timezone.utc).timestamp())
+
+
+def _body(start: int, end: int) -> Dict[str, Any]:
+    return {
+        "query": "sum(c:transactions/count_per_root_project@none)",
+        "dataset": "generic_metrics",
+        "tenant_ids": {"referrer": "tests", "organization_id": 101},
+        "mql_context": {
+            "start": _format(start),
+            "end": _format(end),
+            "rollup": {"granularity": 60, "interval": HOUR, "with_totals": None},
+            "scope": {"org_ids": [101], "project_ids": [1], "use_case_id": "t"},
+            "indexer_mappings": {},
+            "limit": None,
+            "offset": None,
+        },
+    }
+
+
+def _request(body: Dict[str, Any]) -> Request:
+    request = mock.Mock(spec=Request)
+    request.original_body = body
+    request.query_settings = HTTPQuerySettings()
+    return request
+
+
+class FakeStorage:
+    """
+    Answers the queries with one row per bucket, recording their range.
+    """
+
+    def __init__(self) -> None:
+        self.queries: List[Tuple[int, int]] = []
+
+    def run_query(
+        self, dataset: Dataset, request: Request, timer: Timer
+    ) -> QueryResult:
+        mql_context = request.original_body["mql_context"]
+        start = _timestamp(mql_context["start"])
+        end = _timestamp(mql_context["end"])
+        self.queries.append((start, end))
+        rows = [
+            {
+                "time": _format(bucket),
+                "aggregate_value": min(end, bucket + HOUR) - max(start, bucket),
+            }
+            for bucket in range(start // HOUR * HOUR, end, HOUR)
+        ]
+        return QueryResult(
+            result={"data": rows, "meta": [{"name": "time", "type": "DateTime"}]},
+            extra={"stats": {"final": False}, "sql": "SELECT", "experiments": {}},
+        )
+
+
+@pytest.mark.redis_db
+def test_bucket_cache() -> None:
+    state.set_config("mql_bucket_cache_settle_sec", 0)
+    dataset = get_dataset("generic_metrics")
+    storage = FakeStorage()
+
+    def run(start: int, end: int) -> QueryResult:
+        body = _body(start, end)
+        return run_query_with_bucket_cache(
+            dataset,
+            _request(body),
+            body,
+            _request,
+            storage.run_query,
+            Timer("test"),
+        )
+
+    start, end = T0 + 1800, T0 + 6 * HOUR + 900
+    expected = FakeStorage().run_query(dataset, _request(_body(start, end)), Timer(""))
+
+    result = run(start, end)
+    assert result.result["data"] == expected.result["data"]
+    assert storage.queries == [(start, end)]
+
+    storage.queries.clear()
+    result = run(start, end)
+    assert result.result["data"] == expected.result["data"]
+    assert result.result["meta"] == expected.result["meta"]
+    assert result.extra["stats"]["mql_bucket_cache"] == {
+        "cached_buckets": 5,
+        "queries": 2,
+    }
+    assert storage.queries == [(start, T0 + HOUR), (T0 + 6 * HOUR, end)]
+
+    # Fully covered by the cache.
+    storage.queries.clear()
+    result = run(T0 + 2 * HOUR, T0 + 4 * HOUR)
+    assert [row["aggregate_value"] for row in result.result["data"]] == [HOUR, HOUR]
+    assert storage.queries == []
+
+
+@pytest.mark.redis_db
+def test_bucket_cache_limit() -> None:
+    state.set_config("mql_bucket_cache_settle_sec", 0)
+    dataset = get_dataset("generic_metrics")
+    storage = FakeStorage()
+    body = _body(T0, T0 + 6 * HOUR)
+    body["mql_context"]["limit"] = 3
+
+    result = run_query_with_bucket_cache(
+        dataset, _request(body), body, _request, storage.run_query, Timer("test")
+    )
+    # The limit keeps the first rows of the whole range, it is run again.
+    assert len(result.result["data"]) == 6
+    assert storage.queries == [(T0, T0 + 6 * HOUR), (T0, T0 + 6 * HOUR)]
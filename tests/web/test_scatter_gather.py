@@ -0,0 +1,278 @@
+from typing import Any, List, Optional, Sequence
+
+import pytest
+
+from snuba.clickhouse.columns import ColumnSet
+from snuba.clickhouse.query import Query
+from snuba.datasets.storages.storage_key import StorageKey
+from snuba.query import OrderBy, OrderByDirection, SelectedExpression
+from snuba.query.data_source.simple import Table
+from snuba.query.dsl import column, count, equals, literal
+from snuba.query.expressions import Expression, FunctionCall
+from snuba.reader import Result
+from snuba.web.scatter_gather import (
+    ROW_COUNT_ALIAS,
+    build_merge_plan,
+    build_slice_query,
+    merge_results,
+    merge_stats,
+)
+
+ORG_ID = column("org_id", alias="_snuba_org_id")
+PROJECT_ID = column("project_id", alias="_snuba_project_id")
+VALUE = column("value", alias="_snuba_value")
+
+
+def _query(
+    selected: Sequence[Expression],
+    groupby: Optional[Sequence[Expression]] = None,
+    order_by: Optional[Sequence[OrderBy]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    having: Optional[Expression] = None,
+) -> Query:
+    return Query(
+        Table(
+            "generic_metric_distributions_aggregated_local",
+            ColumnSet([]),
+            storage_key=StorageKey("generic_metrics_distributions"),
+        ),
+        selected_columns=[
+            SelectedExpression(e.alias[len("_snuba_") :] if e.alias else None, e)
+            for e in selected
+        ],
+        condition=equals(literal(1), literal(1)),
+        groupby=groupby,
+        order_by=order_by,
+        limit=limit,
+        offset=offset,
+        having=having,
+    )
+
+
+def _result(rows: List[dict[str, Any]]) -> Result:
+    return {
+        "meta": [{"name": name, "type": "UInt64"} for name in rows[0]],
+        "data": rows,
+        "totals": {},
+        "profile": None,
+        "trace_output": "",
+    }
+
+
+def _agg(function: str, alias: str) -> FunctionCall:
+    return FunctionCall(alias, function, (column("value"),))
+
+
+def test_plain_rows_are_sorted_and_limited_again() -> None:
+    query = _query(
+        [ORG_ID, VALUE],
+        order_by=[OrderBy(OrderByDirection.DESC, VALUE)],
+        limit=2,
+        offset=1,
+    )
+    plan = build_merge_plan(query, "org_id")
+    assert plan is not None
+
+    slice_query = build_slice_query(query, plan, "org_id", [1, 3])
+    assert slice_query.get_limit() == 3
+    assert slice_query.get_offset() == 0
+    assert query.get_limit() == 2
+
+    merged = merge_results(
+        plan,
+        [
+            _result([{"_snuba_org_id": 1, "_snuba_value": 9}]),
+            _result(
+                [
+                    {"_snuba_org_id": 2, "_snuba_value": 10},
+                    {"_snuba_org_id": 2, "_snuba_value": None},
+                    {"_snuba_org_id": 2, "_snuba_value": 5},
+                ]
+            ),
+        ],
+    )
+    assert merged["data"] == [
+        {"_snuba_org_id": 1, "_snuba_value": 9},
+        {"_snuba_org_id": 2, "_snuba_value": 5},
+    ]
+
+
+def test_aggregates_are_merged_by_group() -> None:
+    query = _query(
+        [PROJECT_ID, _agg("sum", "_snuba_total"), _agg("max", "_snuba_max")],
+        groupby=[PROJECT_ID],
+        order_by=[OrderBy(OrderByDirection.ASC, PROJECT_ID)],
+    )
+    plan = build_merge_plan(query, "org_id")
+    assert plan is not None
+    merged = merge_results(
+        plan,
+        [
+            _result(
+                [
+                    {"_snuba_project_id": 1, "_snuba_total": 3, "_snuba_max": 2},
+                    {"_snuba_project_id": 2, "_snuba_total": 1, "_snuba_max": 1},
+                ]
+            ),
+            _result([{"_snuba_project_id": 1, "_snuba_total": 4, "_snuba_max": 4}]),
+        ],
+    )
+    assert merged["data"] == [
+        {"_snuba_project_id": 1, "_snuba_total": 7, "_snuba_max": 4},
+        {"_snuba_project_id": 2, "_snuba_total": 1, "_snuba_max": 1},
+    ]
+
+
+def test_empty_slices_are_ignored_without_group_by() -> None:
+    query = _query([_agg("min", "_snuba_min"), count(alias="_snuba_count")])
+    plan = build_merge_plan(query, "org_id")
+    assert plan is not None
+    slice_query = build_slice_query(query, plan, "org_id", [1])
+    assert slice_query.get_selected_columns()[-1].name == ROW_COUNT_ALIAS
+
+    merged = merge_results(
+        plan,
+        [
+            _result(
+                [{"_snuba_min": 0, "_snuba_count": 0, ROW_COUNT_ALIAS: 0}],
+            ),
+            _result(
+                [{"_snuba_min": 5, "_snuba_count": 2, ROW_COUNT_ALIAS: 2}],
+            ),
+        ],
+    )
+    assert merged["data"] == [{"_snuba_min": 5, "_snuba_count": 2}]
+    assert [c["name"] for c in merged["meta"]] == ["_snuba_min", "_snuba_count"]
+
+
+def test_any_aggregate_is_concatenated_when_grouped_by_partition_key() -> None:
+    uniq = _agg("uniq", "_snuba_uniq")
+    query = _query(
+        [ORG_ID, uniq],
+        groupby=[ORG_ID],
+        order_by=[OrderBy(OrderByDirection.DESC, uniq)],
+        limit=1,
+    )
+    plan = build_merge_plan(query, "org_id")
+    assert plan is not None and plan.concatenate
+    merged = merge_results(
+        plan,
+        [
+            _result([{"_snuba_org_id": 1, "_snuba_uniq": 3}]),
+            _result([{"_snuba_org_id": 2, "_snuba_uniq": 8}]),
+        ],
+    )
+    assert merged["data"] == [{"_snuba_org_id": 2, "_snuba_uniq": 8}]
+
+
+def test_top_groups_with_tied_leading_keys() -> None:
+    query = _query(
+        [PROJECT_ID, VALUE, _agg("sum", "_snuba_total")],
+        groupby=[PROJECT_ID, VALUE],
+        order_by=[
+            OrderBy(OrderByDirection.ASC, PROJECT_ID),
+            OrderBy(OrderByDirection.DESC, VALUE),
+        ],
+        limit=2,
+    )
+    plan = build_merge_plan(query, "org_id")
+    assert plan is not None
+
+    def row(project_id: int, value: int, total: int) -> dict[str, Any]:
+        return {
+            "_snuba_project_id": project_id,
+            "_snuba_value": value,
+            "_snuba_total": total,
+        }
+
+    # Every slice returns its first two groups of project 1.
+    merged = merge_results(
+        plan,
+        [
+            _result([row(1, 9, 1), row(1, 8, 1)]),
+            _result([row(1, 9, 2), row(1, 7, 2)]),
+        ],
+    )
+    assert merged["data"] == [row(1, 9, 3), row(1, 8, 1)]
+
+
+def test_offset_is_only_applied_on_the_merged_rows() -> None:
+    query = _query(
+        [ORG_ID, VALUE],
+        order_by=[OrderBy(OrderByDirection.ASC, VALUE)],
+        offset=1,
+    )
+    plan = build_merge_plan(query, "org_id")
+    assert plan is not None
+    slice_query = build_slice_query(query, plan, "org_id", [1])
+    assert slice_query.get_limit() is None
+    assert slice_query.get_offset() == 0
+
+    merged = merge_results(
+        plan,
+        [
+            _result([{"_snuba_org_id": 1, "_snuba_value": 1}]),
+            _result([{"_snuba_org_id": 2, "_snuba_value": 2}]),
+        ],
+    )
+    assert merged["data"] == [{"_snuba_org_id": 2, "_snuba_value": 2}]
+
+
+def test_stats_are_merged() -> None:
+    stats = merge_stats(
+        [
+            {"final": False, "cluster_name": "a", "result_rows": 2},
+            {"final": False, "cluster_name": "b", "result_rows": 3, "cache_hit": 1},
+        ],
+        _result([{"_snuba_org_id": 1}]),
+    )
+    assert stats == {
+        "final": False,
+        "cluster_name": ["a", "b"],
+        "result_rows": 1,
+        "cache_hit": [None, 1],
+    }
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param(
+            _query([PROJECT_ID, _agg("uniq", "_snuba_uniq")], groupby=[PROJECT_ID]),
+            id="uniq across slices",
+        ),
+        pytest.param(
+            _query(
+                [PROJECT_ID, _agg("sum", "_snuba_total")],
+                groupby=[PROJECT_ID],
+                order_by=[OrderBy(OrderByDirection.DESC, _agg("sum", "_snuba_total"))],
+                limit=10,
+            ),
+            id="top groups by aggregate",
+        ),
+        pytest.param(
+            _query(
+                [PROJECT_ID, VALUE, _agg("sum", "_snuba_total")],
+                groupby=[PROJECT_ID, VALUE],
+                order_by=[OrderBy(OrderByDirection.ASC, PROJECT_ID)],
+                limit=10,
+            ),
+            id="top groups by some of their keys",
+        ),
+        pytest.param(
+            _query([_agg("sum", "_snuba_total")], groupby=[PROJECT_ID]),
+            id="group not selected",
+        ),
+        pytest.param(
+            _query(
+                [PROJECT_ID, _agg("sum", "_snuba_total")],
+                groupby=[PROJECT_ID],
+                having=equals(_agg("sum", "_snuba_total"), literal(1)),
+            ),
+            id="having",
+        ),
+    ],
+)
+def test_unmergeable_queries(query: Query) -> None:
+    assert build_merge_plan(query, "org_id") is None